@@ -0,0 +1,194 @@
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+AGE_BANDS = ('13-17', '18-24', '25-34', '35+')
+GENDERS = ('male', 'female')
+DEFAULT_CATEGORY = 'General'
+
+# Each rule table is checked in order and the first rule with a keyword
+# contained in the (lowercased) text wins; the last row is the default.
+CPM_RULES = (
+    (('finance', 'money', 'business', 'tech'), 12.00),
+    (('education', 'news', 'auto'), 6.50),
+    (('gaming', 'game'), 1.50),
+    (('music', 'dance'), 1.20),
+    (('beauty', 'vlog', 'entertainment'), 3.00),
+)
+DEFAULT_CPM = 2.50
+
+# Base audience per category: age weights over AGE_BANDS and gender weights over GENDERS.
+CATEGORY_RULES = (
+    (('gaming', 'game'), (35, 40, 20, 5), (80, 20)),
+    (('beauty', 'style', 'makeup'), (20, 45, 25, 10), (10, 90)),
+    (('tech', 'science', 'gadget'), (15, 35, 40, 10), (85, 15)),
+    (('news', 'politics', 'finance'), (5, 15, 35, 45), (60, 40)),
+    (('kids', 'cartoon', 'animation'), (60, 20, 10, 10), (50, 50)),
+    (('music',), (20, 30, 30, 20), (50, 50)),
+)
+DEFAULT_AGE = (25, 35, 25, 15)
+DEFAULT_GENDER = (50, 50)
+
+# Title keywords shift the base audience.
+TITLE_RULES = (
+    (('tutorial', 'how to', 'guide'), (0, 0, 5, 0), (5, 0)),
+    (('asmr', 'routine', 'haul'), (0, 0, 0, 0), (0, 15)),
+    (('football', 'soccer', 'fight', 'boxing'), (0, 0, 0, 0), (20, 0)),
+)
+
+# Short videos draw younger viewers, long ones (podcasts, documentaries) older ones.
+SHORT_VIDEO_SECONDS = 180
+LONG_VIDEO_SECONDS = 900
+DURATION_SHIFTS = np.array([(0, 0, 0, 0), (15, 10, 0, -10), (-10, 0, 10, 10)])  # none, short, long
+
+# Engagement is (likes + comments) / views; active communities skew younger.
+HIGH_ENGAGEMENT = 0.05
+LOW_ENGAGEMENT = 0.01
+ENGAGEMENT_SHIFTS = np.array([(0, 0, 0, 0), (10, 10, 0, 0), (0, 0, 5, 10)])  # normal, high, low
+
+
+class KeywordIndex:
+    """Finds the first rule (in priority order) any of whose keywords a text
+    contains, with one pass of a single precompiled regex over the text."""
+
+    def __init__(self, keyword_groups):
+        self._rule_of = {}
+        for rule, keywords in enumerate(keyword_groups):
+            for keyword in keywords:
+                self._rule_of.setdefault(keyword, rule)
+        self.default = len(keyword_groups)
+        # A lookahead so keywords overlapping another match are still found.
+        alternatives = '|'.join(re.escape(k) for k in sorted(self._rule_of, key=len, reverse=True))
+        self._pattern = re.compile(f"(?=({alternatives}))")
+
+    def match(self, text):
+        return min((self._rule_of[m.group(1)] for m in self._pattern.finditer(text.lower())), default=self.default)
+
+    def match_many(self, texts):
+        """Rule index of every text; each distinct text is matched once."""
+        unique, inverse = np.unique(np.asarray(texts, dtype=str), return_inverse=True)
+        return np.fromiter((self.match(text) for text in unique), dtype=np.intp, count=len(unique))[inverse]
+
+
+def _table(rules, column, default):
+    return np.array([rule[column] for rule in rules] + [default], dtype=float)
+
+
+def _percentages(weights):
+    """Rows scaled to percentages and rounded half up, like the old Math.round() code."""
+    weights = np.maximum(weights, 1)
+    return np.floor(weights / weights.sum(axis=1, keepdims=True) * 100 + 0.5).astype(int)
+
+
+class AnalyticsEngine:
+    """Estimated CPM, revenue and audience (age and gender split) of videos.
+
+    ``score()`` takes many videos at once: the rules are lookup tables indexed
+    by each video's matched category and title rules, duration bucket and
+    engagement bucket, so scoring is a handful of NumPy operations over the
+    whole batch. Results are memoized per video ID for as long as the video's
+    inputs (views, likes, ...) stay the same.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._memo = OrderedDict()  # video_id -> (inputs, result), least recently used first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self._cpm_index = KeywordIndex([keywords for keywords, _ in CPM_RULES])
+        self._cpm = _table(CPM_RULES, 1, DEFAULT_CPM)
+        self._category_index = KeywordIndex([keywords for keywords, _, _ in CATEGORY_RULES])
+        self._category_age = _table(CATEGORY_RULES, 1, DEFAULT_AGE)
+        self._category_gender = _table(CATEGORY_RULES, 2, DEFAULT_GENDER)
+        self._title_index = KeywordIndex([keywords for keywords, _, _ in TITLE_RULES])
+        self._title_age = _table(TITLE_RULES, 1, (0, 0, 0, 0))
+        self._title_gender = _table(TITLE_RULES, 2, (0, 0))
+
+    def score(self, videos):
+        """Returns one result dict per video (yt-dlp info dicts or anything with
+        ``title``, ``categories``/``category``, ``duration``, ``view_count``,
+        ``like_count`` and ``comment_count``), in order. Videos with an ``id``
+        are memoized.
+        """
+        inputs = [video_inputs(video) for video in videos]
+        ids = [video.get('id') if isinstance(video.get('id'), (str, int)) else None for video in videos]
+        results = [None] * len(inputs)
+        missing = []
+        with self._lock:
+            for i, (video_id, fields) in enumerate(zip(ids, inputs)):
+                cached = self._memo.get(video_id) if video_id is not None else None
+                if cached is not None and cached[0] == fields:
+                    self._memo.move_to_end(video_id)
+                    results[i] = cached[1]
+                    self.hits += 1
+                else:
+                    missing.append(i)
+            self.misses += len(missing)
+
+        if missing:
+            scored = self._score([inputs[i] for i in missing])
+            with self._lock:
+                for i, result in zip(missing, scored):
+                    results[i] = result
+                    video_id = ids[i]
+                    if video_id is not None:
+                        self._memo[video_id] = (inputs[i], result)
+                        self._memo.move_to_end(video_id)
+                while len(self._memo) > self.max_entries:
+                    self._memo.popitem(last=False)
+        return results
+
+    def _score(self, inputs):
+        categories, titles, duration, views, likes, comments = zip(*inputs)
+        duration = np.array(duration, dtype=float)
+        views = np.array(views, dtype=float)
+        engagement = np.divide(np.add(likes, comments, dtype=float), views,
+                               out=np.zeros(len(views)), where=views > 0)
+
+        cpm = self._cpm[self._cpm_index.match_many(categories)]
+        revenue = views / 1000 * cpm
+
+        category_rule = self._category_index.match_many(categories)
+        title_rule = self._title_index.match_many(titles)
+        duration_bucket = np.select([(duration > 0) & (duration < SHORT_VIDEO_SECONDS), duration > LONG_VIDEO_SECONDS],
+                                    [1, 2], 0)
+        engagement_bucket = np.select([engagement > HIGH_ENGAGEMENT, engagement < LOW_ENGAGEMENT], [1, 2], 0)
+
+        shifts = DURATION_SHIFTS[duration_bucket] + ENGAGEMENT_SHIFTS[engagement_bucket]
+        age = _percentages(self._category_age[category_rule] + shifts + self._title_age[title_rule])
+        gender = _percentages(self._category_gender[category_rule] + self._title_gender[title_rule])
+
+        return [
+            {
+                'category': categories[i],
+                'cpm': float(cpm[i]),
+                'estimated_revenue': round(float(revenue[i]), 2),
+                'engagement_rate': round(float(engagement[i]), 4),
+                'audience': {
+                    'age': dict(zip(AGE_BANDS, age[i].tolist())),
+                    'gender': dict(zip(GENDERS, gender[i].tolist())),
+                },
+            }
+            for i in range(len(inputs))
+        ]
+
+    def stats(self):
+        with self._lock:
+            return {'memoized': len(self._memo), 'hits': self.hits, 'misses': self.misses}
+
+
+def video_inputs(video):
+    """The fields scoring depends on, as a hashable tuple."""
+    categories = video.get('categories')
+    category = (categories[0] if categories else None) or video.get('category') or DEFAULT_CATEGORY
+
+    def number(name):
+        value = video.get(name)
+        return value if isinstance(value, (int, float)) and value > 0 else 0
+
+    return (str(category), str(video.get('title') or ''), number('duration'), number('view_count'),
+            number('like_count'), number('comment_count'))
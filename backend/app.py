@@ -1,20 +1,54 @@
+import asyncio
+import concurrent.futures
+import glob
+import hmac
 import json
 import logging
+import mimetypes
 import os
 import re
-import subprocess
 import threading
 import time
 import uuid
 import requests
-from flask import Flask, jsonify, render_template, request, send_from_directory
+from flask import Flask, Response, jsonify, redirect, render_template, request, send_file, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from itsdangerous import BadSignature, URLSafeSerializer
 from flask_wtf.csrf import CSRFProtect, generate_csrf, validate_csrf
-from urllib.parse import urlparse
-from datetime import datetime
+from wtforms.validators import ValidationError
+from kombu.exceptions import OperationalError
+from urllib.parse import quote, urlparse
+from werkzeug.security import safe_join
+import redis
+from analytics import AnalyticsEngine
+from artifacts import ArtifactStore, StorageFull, artifact_key
+from bandwidth import BandwidthGovernor, mbps_to_bytes, parse_tiers, parse_user_tiers
+from batch import BatchRunner, domain_key, is_playlist_url
+from delivery import FileDelivery, content_disposition
+from downloaders import DOWNLOADER_NATIVE, DownloaderPolicy, ThroughputStats
+from celery_worker import AUDIO_QUEUE, VIDEO_QUEUE
+from extractor import MODE_POOL, ExtractionEngine, ExtractionError
+from info_cache import InfoCache, canonical_video_id
+from journal import JobJournal
+from metrics import (count_rejection, count_ytdlp_failure, observe_download, observe_queue_wait, observe_served,
+                     register_gauge, render_metrics, time_extraction)
+from passthrough import PassthroughStream, passthrough_format
+from postprocess import (TRANSCODE_EXT, PostprocessError, merge_command, merge_extension, part_template,
+                         split_format)
+from progress import ProgressParser, ytdlp_progress_args
+from quota import create_quota_backend, today_str
+from rate_limit import TieredRedisStorage  # noqa: F401  registers the tiered+redis limiter storage
+from redis_client import REDIS_URL, get_redis, redis_configured
+from scheduler import FairScheduler, QueueFull
+from singleflight import SingleFlight
+from supervisor import DownloadSupervisor
+from task_events import TaskEventBus
+from task_store import TERMINAL_STATUSES, create_task_store
+from thumbnails import ThumbnailError, ThumbnailStore
+from zip_stream import stream_zip, unique_names
 
 # Load environment variables from .env file
 load_dotenv(dotenv_path='backend/.env')
@@ -46,12 +80,25 @@ CORS(app)
 # Initialize CSRF protection
 csrf = CSRFProtect(app)
 
-# Set up Rate Limiter
+# Set up Rate Limiter. "tiered" keeps the counters in Redis, so the limits hold
+# across gunicorn workers, web nodes and restarts, and lets each process decide
+# most hits from a local token lease (see rate_limit.py); "redis" goes to Redis
+# on every hit; "memory" counts per process. Hits fall back to memory while
+# Redis is down.
+RATE_LIMIT_STORAGE = os.environ.get('RATE_LIMIT_STORAGE', 'tiered' if redis_configured() else 'memory')
+RATE_LIMIT_STORAGE_URIS = {'memory': 'memory://', 'redis': REDIS_URL, 'tiered': f"tiered+{REDIS_URL}"}
 limiter = Limiter(
     key_func=get_remote_address,
     app=app,
     default_limits=["200 per day", "50 per hour"],
-    storage_uri="memory://" 
+    strategy='sliding-window-counter',
+    storage_uri=RATE_LIMIT_STORAGE_URIS[RATE_LIMIT_STORAGE],
+    storage_options={
+        'lease_fraction': float(os.environ.get('RATE_LIMIT_LEASE_FRACTION', 0.1)),
+        'deny_seconds': float(os.environ.get('RATE_LIMIT_DENY_SECONDS', 1)),
+    } if RATE_LIMIT_STORAGE == 'tiered' else {},
+    in_memory_fallback_enabled=RATE_LIMIT_STORAGE != 'memory',
+    on_breach=lambda limit: count_rejection('rate_limit')
 )
 
 # --- Application-specific Configuration ---
@@ -62,73 +109,218 @@ if not os.path.exists(DOWNLOADS_DIR):
 SAFE_EXTENSIONS = {'.mp4', '.mkv', '.webm', '.mp3', '.m4a', '.wav', '.flac', '.jpg', '.jpeg', '.png', '.webp'}
 MAX_FILESIZE = 5 * 1024 * 1024 * 1024
 TIMEOUT_SECONDS = 3600
+# Upper bound on task-record updates per download per second.
+PROGRESS_UPDATES_PER_SECOND = float(os.environ.get('PROGRESS_UPDATES_PER_SECOND', 2))
+# Byte counts, speeds (bytes/s) and ETA (s) reported by /api/status when known.
+PROGRESS_FIELDS = ('downloaded_bytes', 'total_bytes', 'speed', 'eta',
+                   'fragment_index', 'fragment_count', 'average_speed', 'downloader', 'rate_limit')
+# Marks the line yt-dlp prints with the final file path of a download.
+ARTIFACT_PATH_PREFIX = '[artifact] '
+
+# Daily quota per user. "redis" keeps one INCRBY counter per user and day and is
+# the default whenever Redis is configured; "file" is a JSON file for local dev.
+QUOTA_BACKEND = os.environ.get('QUOTA_BACKEND', 'redis' if redis_configured() else 'file')
+quota_manager = create_quota_backend(QUOTA_BACKEND, os.path.join(DOWNLOADS_DIR, 'quota_tracker.json'))
+
+# Enables the admin endpoints (X-Admin-Token header); they are disabled when unset.
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
 
-# Quota Manager implementation using a local JSON file.
-class QuotaManager:
-    def __init__(self, filepath='quota_tracker.json'):
-        self.filepath = filepath
-        self.DAILY_LIMIT = 15 * 1024 * 1024 * 1024 # 15 GB
-        self._load()
-
-    def _load(self):
-        if os.path.exists(self.filepath):
-            try:
-                with open(self.filepath, 'r') as f:
-                    self.data = json.load(f)
-            except json.JSONDecodeError:
-                self.data = {} 
-        else:
-            self.data = {}
-
-    def _save(self):
-        with open(self.filepath, 'w') as f:
-            json.dump(self.data, f)
-
-    def _get_today_date_str(self):
-        return datetime.now().strftime('%Y-%m-%d')
-
-    def check_quota(self, user_id):
-        self._load()
-        today_date = self._get_today_date_str()
-        user_data = self.data.get(user_id, {})
-
-        if user_data.get('date') != today_date:
-            user_data = {'date': today_date, 'bytes_used': 0}
-            self.data[user_id] = user_data
-            self._save()
-        
-        return user_data['bytes_used'] < self.DAILY_LIMIT
+ARIA2C_PATH = os.environ.get('ARIA2C_PATH', 'aria2c')
+# "auto" uses aria2c (when installed) for progressive files of at least
+# ARIA2C_MIN_FILESIZE_MB and yt-dlp's native downloader otherwise;
+# "aria2c" / "native" force one of them.
+DOWNLOADER_MODE = os.environ.get('DOWNLOADER_MODE', 'auto')
+downloader_policy = DownloaderPolicy(
+    aria2c_path=ARIA2C_PATH,
+    mode=DOWNLOADER_MODE,
+    connections=int(os.environ.get('ARIA2C_CONNECTIONS', 16)),
+    split=int(os.environ.get('ARIA2C_SPLIT', 16)),
+    min_split_size=os.environ.get('ARIA2C_MIN_SPLIT_SIZE', '1M'),
+    min_size=int(float(os.environ.get('ARIA2C_MIN_FILESIZE_MB', 50)) * 1024 * 1024)
+)
+throughput_stats = ThroughputStats()
+
+# Shares BANDWIDTH_LIMIT_MBPS (Mbit/s, 0 = unlimited) among this process' running
+# downloads and passthrough streams by tier weight. BANDWIDTH_TIERS is
+# "name:weight[:max Mbit/s per user],..." and BANDWIDTH_USER_TIERS maps users to tiers.
+BANDWIDTH_LIMIT_MBPS = float(os.environ.get('BANDWIDTH_LIMIT_MBPS', 0))
+bandwidth_governor = BandwidthGovernor(
+    limit=mbps_to_bytes(BANDWIDTH_LIMIT_MBPS),
+    tiers=parse_tiers(os.environ.get('BANDWIDTH_TIERS', 'default:1')),
+    user_tiers=parse_user_tiers(os.environ.get('BANDWIDTH_USER_TIERS')),
+    restart_interval=float(os.environ.get('BANDWIDTH_RESTART_INTERVAL', 30))
+)
+YTDLP_PATH = os.environ.get('YTDLP_PATH', 'yt-dlp')
+
+# Metadata cache in front of `yt-dlp --dump-json`. The Redis tier is only used
+# when REDIS_BROKER_URL is configured, so local dev keeps working without Redis.
+INFO_CACHE_TTL = int(os.environ.get('INFO_CACHE_TTL', 1800))
+INFO_CACHE_MAX_ENTRIES = int(os.environ.get('INFO_CACHE_MAX_ENTRIES', 512))
+info_cache = InfoCache(
+    max_entries=INFO_CACHE_MAX_ENTRIES,
+    ttl=INFO_CACHE_TTL,
+    redis_client=get_redis() if redis_configured() else None
+)
+# Coalesces concurrent lookups of the same video into a single yt-dlp run,
+# across gunicorn workers too when Redis is configured.
+info_flight = SingleFlight(redis_client=get_redis() if redis_configured() else None)
+
+# "thread" runs downloads on this process' scheduler; "celery" hands them to the
+# worker tier (see celery_worker.py).
+DOWNLOAD_BACKEND = os.environ.get('DOWNLOAD_BACKEND', 'thread')
+
+# Task records (status, progress, files). "redis" shares them between gunicorn
+# workers, web nodes and Celery workers, so any of them can answer /api/status;
+# it is the default whenever Redis is configured and required in celery mode.
+# "memory" keeps at most TASK_STORE_MAX_TASKS records in this process. Records
+# expire TASK_TTL_SECONDS after their last update.
+TASK_STORE = os.environ.get('TASK_STORE', 'redis' if redis_configured() or DOWNLOAD_BACKEND == 'celery' else 'memory')
+SHARE_TASK_STATE = TASK_STORE == 'redis'
+TASK_TTL_SECONDS = int(os.environ.get('TASK_TTL_SECONDS', 24 * 3600))
+task_store = create_task_store(
+    TASK_STORE,
+    ttl=TASK_TTL_SECONDS,
+    max_tasks=int(os.environ.get('TASK_STORE_MAX_TASKS', 10000)),
+    flush_interval=1 / PROGRESS_UPDATES_PER_SECOND if PROGRESS_UPDATES_PER_SECOND > 0 else 0
+)
 
-    def add_usage(self, user_id, bytes_used):
-        self._load()
-        today_date = self._get_today_date_str()
-        user_data = self.data.get(user_id, {'date': today_date, 'bytes_used': 0})
+# Wakes /api/status streams and long-polls when a task's status or percentage
+# changes; with shared task state events from other processes arrive over Redis pub/sub.
+task_events = TaskEventBus(redis_client=get_redis() if SHARE_TASK_STATE else None)
+SSE_HEARTBEAT_SECONDS = 15
+SSE_MAX_SECONDS = 600
+LONG_POLL_MAX_SECONDS = 25
+
+# Content-addressed index of finished downloads, keyed by (video ID, format_id).
+# Files are deleted FILE_EXPIRATION_TIME seconds after their last access, and
+# least recently used ones are evicted to keep the directory under the budget.
+FILE_EXPIRATION_TIME = int(os.environ.get('FILE_EXPIRATION_TIME', 3600))
+DOWNLOADS_DISK_BUDGET_GB = float(os.environ.get('DOWNLOADS_DISK_BUDGET_GB', 20))
+artifact_store = ArtifactStore(DOWNLOADS_DIR, max_bytes=int(DOWNLOADS_DISK_BUDGET_GB * 1024 ** 3) or None)
+artifact_store.start_sweeper(max_age=FILE_EXPIRATION_TIME, interval=min(60, FILE_EXPIRATION_TIME))
+
+# "none" streams files from Python (Range, 304s, sendfile under gunicorn);
+# "x-accel" (nginx) and "x-sendfile" only return headers and let the proxy send the bytes.
+FILE_OFFLOAD = os.environ.get('FILE_OFFLOAD', 'none')
+X_ACCEL_PREFIX = os.environ.get('X_ACCEL_PREFIX', '/internal-downloads/')
+file_delivery = FileDelivery(DOWNLOADS_DIR, offload=FILE_OFFLOAD, accel_prefix=X_ACCEL_PREFIX)
+
+# Info responses point thumbnails at /api/thumbnail/<token>, which fetches the
+# platform image once and serves small WebP variants made by ffmpeg, cached
+# under a THUMBNAIL_CACHE_MB budget. Tokens are signed, so only thumbnail URLs
+# that came from yt-dlp are ever fetched, and only from the platforms' image
+# hosts. With the public default SECRET_KEY anyone could sign a token, so the
+# proxy stays off and info responses carry the platform's URL instead.
+THUMBNAIL_PROXY = app.config['SECRET_KEY'] != 'default-dev-key'
+if not THUMBNAIL_PROXY:
+    app.logger.warning("SECRET_KEY is not set; the thumbnail proxy is disabled.")
+FFMPEG_PATH = os.environ.get('FFMPEG_PATH', 'ffmpeg')
+THUMBNAIL_DIR = os.environ.get('THUMBNAIL_DIR', './backend/thumbnails')
+THUMBNAIL_WIDTH = 320
+THUMBNAIL_MAX_AGE = 30 * 24 * 3600
+thumbnail_store = ThumbnailStore(
+    THUMBNAIL_DIR,
+    max_bytes=int(float(os.environ.get('THUMBNAIL_CACHE_MB', 256)) * 1024 * 1024),
+    ffmpeg_path=FFMPEG_PATH
+)
+thumbnail_signer = URLSafeSerializer(app.config['SECRET_KEY'], salt='thumbnail')
+
+# Lets /api/process-video answer {"passthrough": true} requests for single-file
+# formats with a stream URL that pipes yt-dlp's stdout to the client. A stream URL
+# not fetched within STREAM_READY_TTL seconds is cancelled and its quota released.
+PASSTHROUGH_ENABLED = os.environ.get('PASSTHROUGH_ENABLED', '1') == '1'
+STREAM_READY_TTL = int(os.environ.get('STREAM_READY_TTL', 300))
+
+# Downloads wait in a fair queue (round-robin per user) for one of the worker slots.
+# Running downloads are watched by the supervisor's event loop, so the slots cost
+# no threads; the scheduler's two threads only hand jobs over.
+MAX_CONCURRENT_DOWNLOADS = int(os.environ.get('MAX_CONCURRENT_DOWNLOADS', 3))
+DOWNLOAD_QUEUE_SIZE = int(os.environ.get('DOWNLOAD_QUEUE_SIZE', 50))
+DOWNLOAD_QUEUE_PER_USER = int(os.environ.get('DOWNLOAD_QUEUE_PER_USER', 5))
+download_supervisor = DownloadSupervisor()
+download_scheduler = FairScheduler(
+    workers=MAX_CONCURRENT_DOWNLOADS,
+    max_queued=DOWNLOAD_QUEUE_SIZE,
+    max_queued_per_user=DOWNLOAD_QUEUE_PER_USER,
+    on_start=lambda job: observe_queue_wait(job.started_at - job.enqueued_at),
+    threads=min(MAX_CONCURRENT_DOWNLOADS, 2)
+)
 
-        if user_data.get('date') != today_date:
-            user_data = {'date': today_date, 'bytes_used': 0}
-        
-        user_data['bytes_used'] += bytes_used
-        self.data[user_id] = user_data
-        self._save()
-
-    def get_remaining(self, user_id):
-        self._load()
-        today_date = self._get_today_date_str()
-        user_data = self.data.get(user_id, {'date': today_date, 'bytes_used': 0})
-        
-        if user_data.get('date') != today_date:
-            return self.DAILY_LIMIT
-        
-        return max(0, self.DAILY_LIMIT - user_data['bytes_used'])
-    
-quota_manager = QuotaManager(filepath=os.path.join(DOWNLOADS_DIR, 'quota_tracker.json'))
+# Merged formats ("137+140") are downloaded as separate parts, so a download slot
+# only moves bytes and is free as soon as they are in. Muxing them (ffmpeg stream
+# copy, a transcode when copying fails) waits in its own fair queue for one of
+# POSTPROCESS_WORKERS slots, by default one per CPU core.
+POSTPROCESS_WORKERS = int(os.environ.get('POSTPROCESS_WORKERS', os.cpu_count() or 2))
+postprocess_scheduler = FairScheduler(
+    workers=POSTPROCESS_WORKERS,
+    max_queued=DOWNLOAD_QUEUE_SIZE,
+    max_queued_per_user=DOWNLOAD_QUEUE_PER_USER,
+    name='postprocess',
+    threads=1
+)
 
-ARIA2C_PATH = os.environ.get('ARIA2C_PATH', 'aria2c')
+# Downloads are journaled in SQLite (JOB_JOURNAL_PATH, shared by all processes of
+# the app) from the moment they are queued until they finished. Jobs of a process
+# that crashed or restarted are taken over, at most JOB_MAX_RESUMES times, and
+# continue from their partial files; partial files no job owns any more are
+# deleted after PARTIAL_MAX_AGE seconds without writes. A yt-dlp run that hits
+# TIMEOUT_SECONDS is resumed in place up to DOWNLOAD_TIMEOUT_RETRIES times.
+JOB_JOURNAL_PATH = os.environ.get('JOB_JOURNAL_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                   'jobs.db'))
+JOB_MAX_RESUMES = int(os.environ.get('JOB_MAX_RESUMES', 3))
+PARTIAL_MAX_AGE = int(os.environ.get('PARTIAL_MAX_AGE', 600))
+DOWNLOAD_TIMEOUT_RETRIES = int(os.environ.get('DOWNLOAD_TIMEOUT_RETRIES', 1))
+job_journal = JobJournal(JOB_JOURNAL_PATH)
+
+# /api/process-collection downloads up to COLLECTION_MAX_ITEMS items under one task,
+# COLLECTION_PARALLEL_ITEMS at a time, and delivers them as one streamed ZIP.
+COLLECTION_MAX_ITEMS = int(os.environ.get('COLLECTION_MAX_ITEMS', 50))
+COLLECTION_PARALLEL_ITEMS = int(os.environ.get('COLLECTION_PARALLEL_ITEMS', 3))
+
+# "pool" keeps yt_dlp.YoutubeDL warm in worker processes, "subprocess" runs the
+# yt-dlp CLI per request. "auto" picks pool when the yt_dlp package is importable.
+EXTRACTOR_MODE = os.environ.get('EXTRACTOR_MODE', 'auto')
+EXTRACTOR_POOL_SIZE = int(os.environ.get('EXTRACTOR_POOL_SIZE', 2))
+extraction_engine = ExtractionEngine(
+    mode=EXTRACTOR_MODE,
+    pool_size=EXTRACTOR_POOL_SIZE,
+    download_pool_size=MAX_CONCURRENT_DOWNLOADS,
+    ytdlp_bin=YTDLP_PATH,
+    kill_grace=download_supervisor.kill_grace
+)
 
-download_tasks = {}
+# Estimated CPM, revenue and audience of a video (see analytics.py); part of
+# every info response and available for many videos at once from /api/analytics.
+ANALYTICS_MAX_VIDEOS = int(os.environ.get('ANALYTICS_MAX_VIDEOS', 5000))
+analytics_engine = AnalyticsEngine()
+
+# /api/download/batch: at most BATCH_MAX_URLS links per request, looked up
+# BATCH_CONCURRENCY at a time and at most BATCH_PER_DOMAIN per platform.
+BATCH_MAX_URLS = int(os.environ.get('BATCH_MAX_URLS', 50))
+batch_runner = BatchRunner(
+    max_workers=int(os.environ.get('BATCH_CONCURRENCY', 4)),
+    per_domain=int(os.environ.get('BATCH_PER_DOMAIN', 2))
+)
 
-MAX_CONCURRENT_DOWNLOADS = 3
-download_semaphore = threading.BoundedSemaphore(value=MAX_CONCURRENT_DOWNLOADS)
+# Live gauges for /metrics, read on every scrape.
+register_gauge('download_slots', 'Download worker slots.', lambda: download_scheduler.workers)
+register_gauge('download_slots_occupied', 'Download slots running a job.', lambda: download_scheduler.stats()['running'])
+register_gauge('downloads_queued', 'Downloads waiting for a slot.', lambda: download_scheduler.stats()['queued'])
+register_gauge('postprocess_slots_occupied', 'Post-processing slots running ffmpeg.',
+               lambda: postprocess_scheduler.stats()['running'])
+register_gauge('postprocess_queued', 'Downloads waiting for a post-processing slot.',
+               lambda: postprocess_scheduler.stats()['queued'])
+register_gauge('streams_active', 'Passthrough streams in progress.',
+               lambda: sum(1 for job in bandwidth_governor.allocation()['jobs'] if job['kind'] == 'stream'))
+register_gauge('downloads_dir_bytes', 'Bytes of finished downloads in DOWNLOADS_DIR.',
+               lambda: artifact_store.stats()['bytes'])
+register_gauge('downloads_dir_budget_bytes', 'Disk budget of DOWNLOADS_DIR.', lambda: artifact_store.max_bytes)
+
+# Only reported with RATE_LIMIT_STORAGE=tiered.
+register_gauge('rate_limit_local_hits', 'Rate-limit hits decided from the local token lease.',
+               lambda: getattr(limiter.storage, 'local_hits', None))
+register_gauge('rate_limit_redis_round_trips', 'Rate-limit round trips to Redis.',
+               lambda: getattr(limiter.storage, 'round_trips', None))
 
 ALLOWED_DOMAINS = [
     'youtube.com', 'www.youtube.com', 'm.youtube.com', 'youtu.be',
@@ -140,6 +332,47 @@ ALLOWED_DOMAINS = [
     'x.com', 'www.x.com'
 ]
 
+def is_admin_request():
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+def csrf_header_valid():
+    """Checks the X-CSRFToken header; validate_csrf() raises on a bad token and returns None otherwise."""
+    if not app.config.get('WTF_CSRF_ENABLED', True):
+        return True
+    try:
+        validate_csrf(request.headers.get('X-CSRFToken'))
+    except ValidationError:
+        return False
+    return True
+
+def verify_captcha(data, user_identifier):
+    """Verifies the request's reCAPTCHA token when reCAPTCHA is configured.
+    Returns an error response to send back, or None when the check passed.
+    """
+    captcha_response = data.get('g-recaptcha-response')
+    if RECAPTCHA_SECRET_KEY:
+        if not captcha_response:
+            count_rejection('captcha')
+            return jsonify({"error": "Please complete the captcha."}), 400
+        
+        verify_payload = {
+            'secret': RECAPTCHA_SECRET_KEY,
+            'response': captcha_response,
+            'remoteip': request.remote_addr
+        }
+        try:
+            verify_req = requests.post('https://www.google.com/recaptcha/api/siteverify', data=verify_payload, timeout=10)
+            verify_resp = verify_req.json()
+            if not verify_resp.get('success'):
+                app.logger.warning(f"Failed Captcha verification for {user_identifier}: {verify_resp.get('error-codes')}")
+                count_rejection('captcha')
+                return jsonify({"error": "Captcha verification failed. Please try again."}), 400
+        except requests.exceptions.RequestException as e:
+            app.logger.error(f"Captcha verification request error: {e}")
+            return jsonify({"error": "Captcha verification service unavailable."}), 500
+    return None
+
 def is_safe_url(url):
     if not url:
         return False
@@ -159,122 +392,790 @@ def is_safe_url(url):
     except Exception:
         return False
 
-def run_download_thread(task_id, url, format_id, user_identifier="unknown", custom_filename=None):
-    app.logger.info(f"[{task_id}] Thread started for URL: {url}")
-    download_tasks[task_id] = {
-        'status': 'Starting...', 
-        'percentage': 0,
-        'message': 'Initializing download...'
-    }
+def fetch_video_info(url):
+    """Returns yt-dlp metadata for a URL, using the info cache when the entry is still fresh.
+    Concurrent misses for the same video share a single extraction.
+    """
+    video_info = info_cache.get(url)
+    if video_info is not None:
+        return video_info
+    return info_flight.do(canonical_video_id(url), lambda: extract_video_info(url))
 
-    process = None
+def extract_video_info(url):
     try:
-        if not download_semaphore.acquire(blocking=False):
-            download_tasks[task_id]['status'] = 'Failed'
-            download_tasks[task_id]['message'] = f"Max concurrent downloads ({MAX_CONCURRENT_DOWNLOADS}) reached. Please try again later."
-            return 
-
-        if custom_filename:
-            sanitized_filename = re.sub(r'[\\/:*?"<>|]', '', custom_filename)
-            output_template = os.path.join(DOWNLOADS_DIR, f"{sanitized_filename}.%(ext)s")
-        else:
-            output_template = os.path.join(DOWNLOADS_DIR, f"{task_id}.%(ext)s")
-
-        command = [
-            "yt-dlp",
-            "-f", format_id,
-            "--max-filesize", f"{MAX_FILESIZE // (1024 * 1024 * 1024)}G",
-            "-o", output_template,
-            url
-        ]
+        with time_extraction(domain_key(url)):
+            video_info = extraction_engine.extract_info(url)
+    except ExtractionError as e:
+        count_ytdlp_failure('extract', e.stderr)
+        raise
+    info_cache.set(url, video_info)
+    return video_info
+
+def expand_playlist(url):
+    """Lists a playlist's (or channel's) entries with --flat-playlist; see describe_playlist()."""
+    try:
+        with time_extraction(domain_key(url), kind='playlist'):
+            return describe_playlist(extraction_engine.extract_flat(url))
+    except ExtractionError as e:
+        count_ytdlp_failure('extract', e.stderr)
+        raise
+
+def thumbnail_url(source, width=THUMBNAIL_WIDTH):
+    return f"/api/thumbnail/{thumbnail_signer.dumps(source)}?w={width}"
+
+def describe_video(video_info):
+    """Shapes yt-dlp metadata into the /api/download payload: summary fields plus
+    the downloadable formats, best first.
+    """
+    formats = video_info.get('formats', [])
+    relevant_formats = []
+    
+    for f in formats:
+        ext = f.get('ext')
+        if f".{ext}" not in SAFE_EXTENSIONS: # Use established SAFE_EXTENSIONS for filtering
+            continue
         
-        app.logger.info(f"[{task_id}] EXECUTING CMD: {' '.join(command)}")
+        resolution = f.get('resolution')
+        if not resolution or resolution == '0x0':
+            resolution = 'N/A'
 
-        start_time = time.time()
+        filesize = f.get('filesize')
+        format_id_str = f.get('format_id')
         
-        process = subprocess.Popen(
-            command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT, 
-            text=True,
-            encoding='utf-8',
-            errors='ignore',
-            bufsize=1, 
-            creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-        )
-
-        last_lines = []
+        relevant_formats.append({
+            'format_id': format_id_str,
+            'ext': ext,
+            'priority': f.get('preference', 0) if f.get('preference') is not None else 0, # Add priority for sorting
+            'resolution': resolution,
+            'note': f.get('format_note', ''),
+            'filesize': filesize,
+        })
+    
+    # Sort formats: by priority (desc), resolution (desc), then file size (desc)
+    def sort_key(f):
+        res_val = 0
+        if f['resolution'] != 'N/A':
+            try:
+                res_val = int(f['resolution'].split('x')[0])
+            except ValueError:
+                pass
+        return (f['priority'], res_val, f['filesize'] or 0)
+    
+    relevant_formats.sort(key=sort_key, reverse=True)
+
+    thumbnail = video_info.get('thumbnail')
+    thumbnail_srcset = None
+    if THUMBNAIL_PROXY and thumbnail and thumbnail_store.allows(thumbnail):
+        thumbnail_srcset = ', '.join(f"{thumbnail_url(thumbnail, w)} {w}w" for w in thumbnail_store.widths)
+        thumbnail = thumbnail_url(thumbnail)
+    elif not (thumbnail and thumbnail.startswith(('http://', 'https://'))):
+        thumbnail = None
+
+    return {
+        "title": video_info.get('title', 'Untitled'),
+        "thumbnail": thumbnail,
+        "thumbnail_srcset": thumbnail_srcset,
+        "uploader": video_info.get('uploader', 'Unknown Creator'),
+        "view_count": video_info.get('view_count', 0),
+        "like_count": video_info.get('like_count', 0),
+        "comment_count": video_info.get('comment_count', 0),
+        "duration": video_info.get('duration', 0),
+        "categories": video_info.get('categories', []),
+        "upload_date": video_info.get('upload_date', None),
+        "analytics": analytics_engine.score([dict(video_info, id=analytics_key(video_info))])[0],
+        "formats": relevant_formats
+    }
 
-        while True:
-            if time.time() - start_time > TIMEOUT_SECONDS:
-                if process.poll() is None:
-                    process.kill()
-                raise TimeoutError("Download timed out (exceeded 1 hour)")
+def analytics_key(video_info):
+    if not video_info.get('id'):
+        return None
+    return f"{(video_info.get('extractor_key') or 'video').lower()}:{video_info['id']}"
 
-            line = process.stdout.readline()
-            if not line and process.poll() is not None:
-                break
-            
-            if not line:
-                time.sleep(0.1)
-                continue
-            
-            line = line.strip()
-            app.logger.info(f"[{task_id}] yt-dlp: {line}")
-            
-            last_lines.append(line)
-            if len(last_lines) > 5:
-                last_lines.pop(0)
-            
-            match = re.search(r'download]  (\d+\.\d+)%', line)
-            if match:
-                percent = float(match.group(1))
-                download_tasks[task_id]['status'] = 'Downloading'
-                download_tasks[task_id]['percentage'] = percent
-                download_tasks[task_id]['message'] = f"{percent}% completed"
-            
-        process.wait()
-
-        if process.returncode == 0:
-            search_prefix = task_id
-            if custom_filename:
-                search_prefix = re.sub(r'[\\/:*?"<>|]', '', custom_filename)
-
-            files = [f for f in os.listdir(DOWNLOADS_DIR) if f.startswith(search_prefix)]
-            if files:
-                final_filename = files[0]
-                file_path = os.path.join(DOWNLOADS_DIR, final_filename)
-                
-                if os.path.exists(file_path):
-                    file_size = os.path.getsize(file_path)
-                    quota_manager.add_usage(user_identifier, file_size)
-
-                    download_tasks[task_id]['status'] = 'Completed'
-                    download_tasks[task_id]['percentage'] = 100
-                    download_tasks[task_id]['filename'] = final_filename
-                    download_tasks[task_id]['message'] = 'Download Finished!'
-                else:
-                    download_tasks[task_id]['status'] = 'Failed'
-                    download_tasks[task_id]['message'] = 'Download finished, but file not found on disk.'
-            else:
-                download_tasks[task_id]['status'] = 'Failed'
-                download_tasks[task_id]['message'] = 'File not found after download.'
+def describe_playlist(playlist_info):
+    """Shapes a --flat-playlist result: the playlist and its entries' URLs and titles,
+    without formats (each entry would otherwise need its own full extraction).
+    """
+    entries = []
+    for entry in playlist_info.get('entries') or []:
+        entry_url = entry.get('url') or entry.get('webpage_url')
+        if not is_safe_url(entry_url):
+            continue
+        entries.append({
+            "id": entry.get('id'),
+            "url": entry_url,
+            "title": entry.get('title') or 'Untitled',
+            "duration": entry.get('duration'),
+            "uploader": entry.get('uploader') or entry.get('channel'),
+        })
+    return {
+        "title": playlist_info.get('title', 'Untitled'),
+        "uploader": playlist_info.get('uploader') or playlist_info.get('channel'),
+        "entry_count": len(entries),
+        "entries": entries
+    }
+
+def lookup_batch_url(url):
+    if is_playlist_url(url):
+        return dict(expand_playlist(url), type='playlist')
+    return dict(describe_video(fetch_video_info(url)), type='video')
+
+def update_task(task_id, **fields):
+    """Updates a task record. Status watchers are notified when the status or percentage changes."""
+    if task_store.update(task_id, fields):
+        task_events.publish(task_id)
+
+def update_task_if(task_id, statuses, **fields):
+    """update_task() applied only while the task's status is one of ``statuses``,
+    checked atomically in the task store. Returns whether it was applied.
+    """
+    if not task_store.update_if_status(task_id, statuses, fields):
+        return False
+    task_events.publish(task_id)
+    return True
+
+def update_active_task(task_id, **fields):
+    """update_task() for a task under way; refused (returns False) once the task
+    already ended, e.g. when another process cancelled it in the meantime.
+    """
+    if not task_store.update_if_status(task_id, TERMINAL_STATUSES, fields, exclude=True):
+        return False
+    task_events.publish(task_id)
+    return True
+
+def finish_task(task_id, **fields):
+    """update_task() for the final status; refused (returns False) once the task
+    already ended, e.g. when it was cancelled while the download finished.
+    """
+    return update_active_task(task_id, **fields)
+
+def update_task_progress(task_id, **fields):
+    """update_task() for progress samples; the Redis store writes them in batches.
+    Samples arriving after the task ended are dropped.
+    """
+    if task_store.update(task_id, fields, defer=True):
+        task_events.publish(task_id)
+
+def get_task(task_id):
+    return task_store.get(task_id)
+
+def forget_task(task_id):
+    task_store.delete(task_id)
+
+def settle_quota(task_id, user_identifier, actual_bytes=None):
+    """Commits the task's quota reservation at ``actual_bytes``, or refunds it when None.
+    Tasks started without a reservation are charged directly.
+    """
+    task = get_task(task_id) or {}
+    if task.get('parent'):
+        # Collection items are charged together when the collection finishes.
+        return
+    reservation = task.get('quota_reservation')
+    if reservation:
+        update_task(task_id, quota_reservation=None)
+        if actual_bytes is None:
+            quota_manager.refund(reservation)
+        else:
+            quota_manager.commit(reservation, actual_bytes)
+    elif actual_bytes is not None:
+        quota_manager.add_usage(user_identifier, actual_bytes)
+
+def fail_task(task_id, user_identifier, message):
+    if finish_task(task_id, status='Failed', message=message):
+        settle_quota(task_id, user_identifier)
+    job_journal.finish(task_id)
+
+def estimate_filesize(url, format_id):
+    """Size of ``format_id`` (``a+b`` for merged formats) from cached metadata, 0 when unknown."""
+    video_info = info_cache.get(url) or {}
+    formats = {f.get('format_id'): f for f in video_info.get('formats') or []}
+    total = 0
+    for part in format_id.split('+'):
+        f = formats.get(part) or {}
+        size = f.get('filesize') or f.get('filesize_approx')
+        if not size:
+            return 0
+        total += size
+    return int(total)
+
+def complete_download(task_id, artifact, user_identifier, custom_filename=None):
+    """Charges quota for a finished artifact and points the task at it.
+    A custom filename is served through a hardlink alias when possible, otherwise
+    through the Content-Disposition name of the download link. A task cancelled in
+    the meantime stays cancelled and is not charged.
+    """
+    filename = artifact.filename
+    if custom_filename:
+        sanitized_filename = re.sub(r'[\\/:*?"<>|]', '', custom_filename)
+        alias = artifact_store.alias(artifact, sanitized_filename)
+        if alias:
+            filename = alias
+        else:
+            update_task(task_id, download_name=sanitized_filename + os.path.splitext(artifact.filename)[1])
+
+    if finish_task(task_id, status='Completed', percentage=100, filename=filename, message='Download Finished!'):
+        settle_quota(task_id, user_identifier, artifact.size)
+    else:
+        app.logger.info(f"[{task_id}] Download finished after the task ended; not charged")
+    job_journal.finish(task_id)
+
+def attach_to_download(task_id, flight, user_identifier, custom_filename=None):
+    """Lets a task share an identical download that is already queued or running."""
+    app.logger.info(f"[{task_id}] Attached to in-flight download {flight.task_id}")
+    update_task(task_id, attached_to=flight.task_id, message='Sharing an identical download in progress...')
+
+    def on_done(flight):
+        if (get_task(task_id) or {}).get('status') == 'Cancelled':
+            return
+        if flight.artifact is None:
+            fail_task(task_id, user_identifier, f"Error: {flight.error}")
+            return
+        complete_download(task_id, flight.artifact, user_identifier, custom_filename)
+
+    artifact_store.on_done(flight, on_done)
+
+def track_progress(task_id):
+    """Returns a ProgressParser that writes throttled progress samples into the task record."""
+    def on_progress(fields):
+        if fields['percentage'] is None:
+            # Live streams and unsized HLS: keep the last percentage, report bytes instead.
+            del fields['percentage']
+            message = f"{fields['downloaded_bytes'] / (1024 * 1024):.1f} MB downloaded"
         else:
-            error_msg = " | ".join(last_lines)
-            if "File is larger than" in error_msg or "Abort" in error_msg: 
-                error_msg = "File exceeded maximum allowed size (5GB)."
-            download_tasks[task_id]['status'] = 'Failed'
-            download_tasks[task_id]['message'] = f"Error: {error_msg}"
+            message = f"{fields['percentage']}% completed"
+        update_task_progress(task_id, status='Downloading', message=message, **fields)
+
+    return ProgressParser(on_progress, max_rate=PROGRESS_UPDATES_PER_SECOND)
+
+def finish_progress(task_id, parser):
+    """Delivers the last progress sample and records the download's mean throughput."""
+    parser.flush()
+    average_speed = parser.average_speed()
+    update_task(task_id, average_speed=average_speed)
+    app.logger.info(f"[{task_id}] Average download speed: {average_speed} B/s")
+
+def apply_rate_limit(task_id, lease):
+    """Returns the bandwidth share the next transfer of ``task_id`` should run with."""
+    if lease is None:
+        return None
+    rate = lease.apply()
+    update_task(task_id, rate_limit=rate)
+    return rate
+
+def run_pool_download(task_id, url, format_id, output_template, downloader=DOWNLOADER_NATIVE, lease=None,
+                      cancel_event=None):
+    """Downloads through the warm extractor pool instead of spawning the yt-dlp CLI.
+    Returns the final file paths reported by yt-dlp, one per format of an ``a,b``
+    selection. The bandwidth share is fixed for the whole download since a pool
+    worker cannot be restarted mid-transfer. Setting ``cancel_event`` terminates it.
+    """
+    parser = track_progress(task_id)
+    ydl_opts = {
+        'format': format_id,
+        'max_filesize': MAX_FILESIZE,
+        'outtmpl': output_template,
+        **downloader_policy.ydl_opts(downloader, apply_rate_limit(task_id, lease)),
+    }
+    if ',' in format_id:
+        # Parts are remuxed by the post-processing stage anyway.
+        ydl_opts['fixup'] = 'never'
+    file_paths = extraction_engine.download(url, ydl_opts, progress_callback=parser.update, timeout=TIMEOUT_SECONDS,
+                                            cancel_event=cancel_event)
+    finish_progress(task_id, parser)
+    if not file_paths:
+        # yt-dlp skips (rather than fails) formats above max_filesize.
+        raise ExtractionError("File not found after download.")
+    return file_paths
+
+async def supervise_pool_download(task_id, url, format_id, output_template, downloader, lease):
+    """Runs ``run_pool_download`` off the event loop. A cancelled download has its
+    worker process terminated before the cancel propagates.
+    """
+    cancel_event = threading.Event()
+    pending = asyncio.get_running_loop().run_in_executor(
+        None, run_pool_download, task_id, url, format_id, output_template, downloader, lease, cancel_event)
+    try:
+        return await asyncio.shield(pending)
+    except asyncio.CancelledError:
+        cancel_event.set()
+        await asyncio.wait([pending])
+        raise
+
+def ytdlp_download_command(url, format_id, output_template, downloader, rate_limit):
+    return [
+        YTDLP_PATH,
+        "-f", format_id,
+        "--max-filesize", f"{MAX_FILESIZE // (1024 * 1024 * 1024)}G",
+        "-o", output_template,
+        *ytdlp_progress_args(),
+        # Report the final path (after merging/moving) instead of scanning the directory.
+        # --print implies --quiet, so progress output is re-enabled explicitly.
+        "--print", f"after_move:{ARTIFACT_PATH_PREFIX}%(filepath)s",
+        "--progress",
+        # Pick up .part files of an interrupted run (timeout, crash, restart).
+        "--continue",
+        # Parts are remuxed by the post-processing stage anyway.
+        *(["--fixup", "never"] if ',' in format_id else []),
+        *downloader_policy.cli_args(downloader, rate_limit),
+        url
+    ]
+
+async def supervise_ytdlp(task_id, url, format_id, output_template, downloader=DOWNLOADER_NATIVE, lease=None):
+    """Downloads with the yt-dlp CLI on the supervisor's event loop and returns the
+    paths of the produced files, one per format of an ``a,b`` selection. When the
+    task's bandwidth share moves, yt-dlp is restarted with the new --limit-rate
+    and resumes from its .part files; so it is after a timeout, up to
+    DOWNLOAD_TIMEOUT_RETRIES times.
+    """
+    deadline = asyncio.get_running_loop().time() + TIMEOUT_SECONDS
+    timeouts = 0
+    parser = track_progress(task_id)
+    last_lines = []
+    produced = []
+
+    def on_line(line):
+        if parser.feed(line):
+            # Only restart while bytes are flowing, never during merging/post-processing.
+            return lease is not None and lease.should_restart()
+        if line.startswith(ARTIFACT_PATH_PREFIX):
+            path = line[len(ARTIFACT_PATH_PREFIX):]
+            if path not in produced:
+                # A restarted yt-dlp reports parts finished before the restart again.
+                produced.append(path)
+            return False
+        app.logger.info(f"[{task_id}] yt-dlp: {line}")
+        last_lines.append(line)
+        if len(last_lines) > 5:
+            last_lines.pop(0)
+        return False
+
+    while True:
+        command = ytdlp_download_command(url, format_id, output_template, downloader, apply_rate_limit(task_id, lease))
+        app.logger.info(f"[{task_id}] EXECUTING CMD: {' '.join(command)}")
+        try:
+            result = await download_supervisor.run_process(command, on_line, deadline)
+        except TimeoutError:
+            if timeouts >= DOWNLOAD_TIMEOUT_RETRIES:
+                raise TimeoutError(f"Download timed out (exceeded {TIMEOUT_SECONDS // 3600} hour)") from None
+            timeouts += 1
+            deadline = asyncio.get_running_loop().time() + TIMEOUT_SECONDS
+            app.logger.warning(f"[{task_id}] Download timed out; resuming from the partial file")
+            update_task(task_id, message='Timed out, resuming the download...')
+            continue
+        if not result.stopped:
+            break
+        app.logger.info(f"[{task_id}] Bandwidth share changed to {lease.rate} B/s; restarting yt-dlp")
+
+    finish_progress(task_id, parser)
+
+    if result.returncode != 0:
+        error_msg = " | ".join(last_lines)
+        if "File is larger than" in error_msg or "Abort" in error_msg:
+            error_msg = "File exceeded maximum allowed size (5GB)."
+        raise ExtractionError(error_msg)
+
+    if not produced or not all(os.path.isfile(path) for path in produced):
+        # yt-dlp skips (rather than fails) formats above --max-filesize.
+        raise ExtractionError("File not found after download.")
+    return produced
+
+def run_subprocess_download(task_id, url, format_id, output_template, downloader=DOWNLOADER_NATIVE, lease=None):
+    """supervise_ytdlp() for callers on a thread; blocks until the download finished."""
+    return download_supervisor.run(task_id, supervise_ytdlp(task_id, url, format_id, output_template, downloader, lease))
+
+def claim_download(task_id, url, format_id, user_identifier, custom_filename=None, key=None):
+    """Reuses an existing artifact or attaches to an identical download when possible.
+    Returns the Flight the caller must download, or None when the task is already served.
+    Raises StorageFull when a new download does not fit the disk budget. A resumed job
+    passes the ``key`` its partial files are named after.
+    """
+    # Identical (video, format) requests share one file on disk.
+    key = key or artifact_key(info_cache.video_key(url), format_id)
+    claim, claimed = artifact_store.claim(key, task_id, estimate_filesize(url, format_id))
+    if claim == ArtifactStore.CLAIM_READY:
+        app.logger.info(f"[{task_id}] Reusing existing artifact {claimed.filename}")
+        complete_download(task_id, claimed, user_identifier, custom_filename)
+        return None
+    if claim == ArtifactStore.CLAIM_ATTACH:
+        attach_to_download(task_id, claimed, user_identifier, custom_filename)
+        return None
+    return claimed
+
+def cached_format(url, format_id):
+    """The format dict for ``format_id`` from cached metadata, or None."""
+    video_info = info_cache.get(url) or {}
+    for f in video_info.get('formats') or []:
+        if f.get('format_id') == format_id:
+            return f
+    return None
+
+def choose_downloader(url, format_id):
+    """Downloader for ``format_id``. The parts of a merged selection ("137+140") are
+    fetched in one run with one downloader, chosen for the largest of them.
+    """
+    parts = split_format(format_id) or [format_id]
+    size, info = max(((estimate_filesize(url, part), cached_format(url, part)) for part in parts),
+                     key=lambda candidate: candidate[0])
+    return downloader_policy.choose(info, size)
+
+def choose_download_queue(url, format_id):
+    """Routes audio-only formats to the audio worker pool and everything else to the video pool."""
+    f = cached_format(url, format_id)
+    if f is not None:
+        return AUDIO_QUEUE if f.get('vcodec') == 'none' else VIDEO_QUEUE
+    # Format selectors such as "bestaudio" or "bestaudio[ext=m4a]" never carry video.
+    if format_id.startswith(('bestaudio', 'worstaudio')) and '+' not in format_id:
+        return AUDIO_QUEUE
+    return VIDEO_QUEUE
+
+def start_download(task_id, url, format_id, user_identifier="unknown", custom_filename=None, quota_reservation=None,
+                   parent=None):
+    """Creates the task record and either reuses an artifact, attaches to an identical
+    download, or queues a new one. Raises QueueFull when the job cannot be queued and
+    StorageFull when it does not fit the disk budget. ``parent`` is the collection
+    the task is an item of.
+    """
+    update_task(task_id, status='Queued', percentage=0, message='Waiting for a free download slot...',
+                user=user_identifier, quota_reservation=quota_reservation, parent=parent)
+
+    if DOWNLOAD_BACKEND == 'celery':
+        from celery_worker import download_video_task
+        queue = choose_download_queue(url, format_id)
+        download_video_task.apply_async(args=(url, format_id, task_id, user_identifier, custom_filename), queue=queue,
+                                          task_id=task_id)
+        app.logger.info(f"[{task_id}] Enqueued on Celery queue '{queue}'")
+        return
+
+    claimed = claim_download(task_id, url, format_id, user_identifier, custom_filename)
+    if claimed is None:
+        return
+
+    if parent is None:
+        # Collection items are not resumed on their own; the collection is gone with its process.
+        job_journal.record(task_id, claimed.key, url=url, format_id=format_id, user=user_identifier,
+                           custom_filename=custom_filename, quota_reservation=quota_reservation)
+    try:
+        download_scheduler.submit(task_id, user_identifier, dispatch_download,
+                                  task_id, url, format_id, user_identifier, custom_filename, claimed)
+    except QueueFull as e:
+        artifact_store.fail(claimed, str(e))
+        job_journal.finish(task_id)
+        forget_task(task_id)
+        raise
+
+def resume_download(job):
+    """Re-queues a journaled download taken over from a process that went away; yt-dlp
+    continues from the partial files it left behind.
+    """
+    task_id, params = job.task_id, job.params
+    user_identifier = params['user']
+    update_task(task_id, status='Queued', percentage=0, message='Resuming interrupted download...',
+                user=user_identifier, quota_reservation=params['quota_reservation'])
+    if job.attempts > JOB_MAX_RESUMES:
+        fail_task(task_id, user_identifier, 'Download was interrupted too many times.')
+        return
+    try:
+        claimed = claim_download(task_id, params['url'], params['format_id'], user_identifier,
+                                 params['custom_filename'], key=job.key)
+    except StorageFull as e:
+        fail_task(task_id, user_identifier, str(e))
+        return
+    if claimed is None:
+        return
+    try:
+        download_scheduler.submit(task_id, user_identifier, dispatch_download, task_id, params['url'],
+                                  params['format_id'], user_identifier, params['custom_filename'], claimed)
+    except QueueFull as e:
+        artifact_store.fail(claimed, str(e))
+        fail_task(task_id, user_identifier, str(e))
+
+def run_worker_download(task_id, url, format_id, user_identifier="unknown", custom_filename=None):
+    """Body of the Celery download task; returns the final task status."""
+    try:
+        claimed = claim_download(task_id, url, format_id, user_identifier, custom_filename)
+    except StorageFull as e:
+        fail_task(task_id, user_identifier, str(e))
+        return 'Failed'
+    if claimed is not None:
+        # A Celery worker is the slot itself, so it also merges the parts.
+        future = download_supervisor.submit(task_id, supervise_download(task_id, url, format_id, user_identifier,
+                                                                        custom_filename, claimed, handoff=False))
+        # revoke(terminate=True) cannot stop a job on a thread-pool worker; the web
+        # process marks the task Cancelled instead and the download is stopped here.
+        seq = task_events.seq
+        while not future.done():
+            seq = task_events.wait({task_id}, seq, timeout=1)
+            if (get_task(task_id) or {}).get('status') == 'Cancelled':
+                download_supervisor.cancel(task_id, timeout=download_supervisor.kill_grace + 1)
+                break
+        try:
+            future.result()
+        except (asyncio.CancelledError, concurrent.futures.CancelledError):
+            pass
+    return get_task(task_id)['status']
+
+def dispatch_download(task_id, url, format_id, user_identifier, custom_filename, flight):
+    """Scheduler job: hands the download to the supervisor. The returned future keeps
+    the scheduler slot taken until the download finished, without holding a thread.
+    """
+    return download_supervisor.submit(task_id, supervise_download(task_id, url, format_id, user_identifier,
+                                                                  custom_filename, flight))
 
+async def supervise_download(task_id, url, format_id, user_identifier, custom_filename, flight, handoff=True):
+    """Downloads the artifact claimed by ``flight``; runs on the supervisor's event loop.
+    The parts of a merged format are handed to the post-processing queue, or with
+    ``handoff=False`` merged right here.
+    """
+    app.logger.info(f"[{task_id}] Download started for URL: {url}")
+    update_active_task(task_id, status='Starting...', message='Initializing download...')
+    job_journal.transition(task_id, 'downloading')
+
+    parts = split_format(format_id)
+    if parts:
+        fetch_format, output_template = ','.join(parts), part_template(DOWNLOADS_DIR, flight.key)
+    else:
+        fetch_format, output_template = format_id, os.path.join(DOWNLOADS_DIR, f"{flight.key}.%(ext)s")
+    try:
+        downloader = choose_downloader(url, format_id)
+        update_task(task_id, downloader=downloader)
+        lease = bandwidth_governor.acquire(task_id, user_identifier)
+        started = time.monotonic()
+        try:
+            if extraction_engine.mode == MODE_POOL:
+                file_paths = await supervise_pool_download(task_id, url, fetch_format, output_template, downloader,
+                                                           lease)
+            else:
+                file_paths = await supervise_ytdlp(task_id, url, fetch_format, output_template, downloader, lease)
+        finally:
+            bandwidth_governor.release(lease)
+        elapsed = time.monotonic() - started
+
+        size = sum(os.path.getsize(path) for path in file_paths)
+        throughput_stats.record(downloader, size, elapsed)
+        observe_download(downloader, size, elapsed)
+        app.logger.info(f"[{task_id}] {downloader}: {size} bytes in {elapsed:.1f}s")
+        if not parts:
+            complete_download(task_id, artifact_store.publish(flight, file_paths[0]), user_identifier,
+                              custom_filename)
+            return
+        if len(file_paths) != len(parts):
+            # yt-dlp skips (rather than fails) parts above --max-filesize.
+            raise ExtractionError("File not found after download.")
+
+    except asyncio.CancelledError:
+        app.logger.info(f"[{task_id}] Download cancelled")
+        abandon_download(task_id, user_identifier, flight)
+        raise
+    except ExtractionError as e:
+        app.logger.error(f"[{task_id}] yt-dlp error: {e}")
+        count_ytdlp_failure('download', str(e))
+        artifact_store.fail(flight, str(e))
+        fail_task(task_id, user_identifier, f"Error: {e}")
     except Exception as e:
         app.logger.error(f"[{task_id}] Subprocess error: {e}", exc_info=True)
-        if process and process.poll() is None:
-            process.kill()
-        download_tasks[task_id]['status'] = 'Failed'
-        download_tasks[task_id]['message'] = str(e)
+        count_ytdlp_failure('download', str(e))
+        artifact_store.fail(flight, str(e))
+        fail_task(task_id, user_identifier, str(e))
+    else:
+        if not (handoff and queue_postprocess(task_id, file_paths, user_identifier, custom_filename, flight)):
+            await supervise_postprocess(task_id, file_paths, user_identifier, custom_filename, flight)
     finally:
-        download_semaphore.release()
-        app.logger.info(f"[{task_id}] Semaphore released. Available: {download_semaphore._value}")
+        app.logger.info(f"[{task_id}] Download slot released. Queue: {download_scheduler.stats()}")
+
+def queue_postprocess(task_id, paths, user_identifier, custom_filename, flight):
+    """Queues the merge of a download's parts. Returns False when the queue is full;
+    the caller then merges them itself rather than failing a finished download.
+    """
+    update_active_task(task_id, status='Queued for processing', message='Waiting for a free processing slot...',
+                       speed=None, eta=None)
+    job_journal.transition(task_id, 'queued_for_processing')
+    try:
+        postprocess_scheduler.submit(task_id, user_identifier, dispatch_postprocess,
+                                     task_id, paths, user_identifier, custom_filename, flight)
+    except QueueFull:
+        return False
+    return True
+
+def dispatch_postprocess(task_id, paths, user_identifier, custom_filename, flight):
+    """Scheduler job: runs the merge on the supervisor, keeping the processing slot until it finished."""
+    return download_supervisor.submit(task_id, supervise_postprocess(task_id, paths, user_identifier,
+                                                                     custom_filename, flight))
+
+async def supervise_postprocess(task_id, paths, user_identifier, custom_filename, flight):
+    """Merges the downloaded parts into the artifact claimed by ``flight``."""
+    app.logger.info(f"[{task_id}] Processing {len(paths)} parts")
+    update_active_task(task_id, status='Processing', message='Merging video and audio...', speed=None, eta=None)
+    job_journal.transition(task_id, 'processing')
+    started = time.monotonic()
+    try:
+        file_path = await merge_parts(task_id, paths, flight.key)
+        artifact = artifact_store.publish(flight, file_path)
+        app.logger.info(f"[{task_id}] Processed in {time.monotonic() - started:.1f}s")
+        complete_download(task_id, artifact, user_identifier, custom_filename)
+    except asyncio.CancelledError:
+        app.logger.info(f"[{task_id}] Processing cancelled")
+        abandon_download(task_id, user_identifier, flight)
+        raise
+    except Exception as e:
+        app.logger.error(f"[{task_id}] Processing error: {e}")
+        artifact_store.fail(flight, str(e))
+        fail_task(task_id, user_identifier, f"Error: {e}")
+    finally:
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+async def merge_parts(task_id, paths, key):
+    """Muxes the parts into ``key``'s file with ffmpeg and returns its path. Streams are
+    copied as-is when the container allows; re-encoding is the fallback.
+    """
+    deadline = asyncio.get_running_loop().time() + TIMEOUT_SECONDS
+    last_lines = []
+
+    def on_line(line):
+        app.logger.info(f"[{task_id}] ffmpeg: {line}")
+        last_lines.append(line)
+        if len(last_lines) > 5:
+            last_lines.pop(0)
+        return False
+
+    for ext, copy in ((merge_extension(paths), True), (TRANSCODE_EXT, False)):
+        output = os.path.join(DOWNLOADS_DIR, f"{key}.{ext}")
+        command = merge_command(FFMPEG_PATH, paths, output, copy=copy)
+        app.logger.info(f"[{task_id}] EXECUTING CMD: {' '.join(command)}")
+        try:
+            result = await download_supervisor.run_process(command, on_line, deadline)
+            if result.returncode == 0:
+                os.replace(f"{output}.part", output)
+                return output
+        except TimeoutError:
+            raise PostprocessError(f"Processing timed out (exceeded {TIMEOUT_SECONDS // 3600} hour)") from None
+        finally:
+            if os.path.exists(f"{output}.part"):
+                os.remove(f"{output}.part")
+        if copy:
+            app.logger.warning(f"[{task_id}] Stream copy failed, transcoding: {' | '.join(last_lines)}")
+            update_task(task_id, message='Converting video...')
+    raise PostprocessError(" | ".join(last_lines) or "ffmpeg failed")
+
+def cancel_task(task_id, user_identifier):
+    if finish_task(task_id, status='Cancelled', message='Download cancelled.'):
+        settle_quota(task_id, user_identifier)
+    job_journal.finish(task_id)
+
+def cancel_ready_stream(task_id, user_identifier, message='Download cancelled.'):
+    """Cancels a stream nobody fetched yet and refunds its quota; False once it started."""
+    if not update_task_if(task_id, ('Ready',), status='Cancelled', message=message):
+        return False
+    settle_quota(task_id, user_identifier)
+    return True
+
+def abandon_download(task_id, user_identifier, flight):
+    """Cancels a download that was queued or running and removes its partial files."""
+    artifact_store.fail(flight, 'Download was cancelled.')
+    for path in glob.glob(os.path.join(DOWNLOADS_DIR, glob.escape(flight.key) + '.*')):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    cancel_task(task_id, user_identifier)
+
+def cancel_download(task_id, user_identifier):
+    """Cancels a queued or running download. Returns False when the task is past
+    the point where it can be cancelled (finished, or a stream being sent).
+    """
+    task = get_task(task_id) or {}
+    if task.get('status') in TERMINAL_STATUSES:
+        return False
+    if task.get('attached_to'):
+        # Nothing runs on this task's behalf; the shared download goes on for the others.
+        cancel_task(task_id, user_identifier)
+        return True
+    if task.get('mode') == 'stream':
+        return cancel_ready_stream(task_id, user_identifier)
+    if DOWNLOAD_BACKEND == 'celery':
+        from celery_worker import celery_app
+        # Drops the job if it is still queued; a running one sees the status and stops.
+        celery_app.control.revoke(task_id)
+        cancel_task(task_id, user_identifier)
+        return True
+    job = download_scheduler.cancel(task_id) or postprocess_scheduler.cancel(task_id)
+    if job is not None:
+        abandon_download(task_id, user_identifier, job.args[-1])
+        return True
+    return download_supervisor.cancel(task_id, timeout=download_supervisor.kill_grace + 1)
+
+def collection_items_status(items):
+    """Per-item status payloads of a collection; items not queued yet report 'Pending'."""
+    statuses = []
+    for index, item in enumerate(items):
+        status = build_status(item['task_id'])[0] or {"status": 'Pending', "percentage": 0, "message": ''}
+        statuses.append(dict(status, index=index, task_id=item['task_id'], url=item['url'], title=item['title']))
+    return statuses
+
+def update_collection_progress(task_id, items):
+    statuses = collection_items_status(items)
+    finished = sum(1 for s in statuses if s['status'] in TERMINAL_STATUSES)
+    # Finished items count as done whether or not they succeeded.
+    percentage = sum(100 if s['status'] in TERMINAL_STATUSES else s['percentage'] or 0 for s in statuses)
+    update_active_task(task_id, status='Downloading', percentage=round(percentage / len(items), 1),
+                       message=f"{finished}/{len(items)} items finished")
+
+def item_file_path(item_task):
+    """Path of a finished collection item's file, or None once it is gone."""
+    filename = (item_task or {}).get('filename')
+    if not filename or item_task.get('status') != 'Completed':
+        return None
+    path = safe_join(DOWNLOADS_DIR, filename)
+    return path if path and os.path.isfile(path) else None
+
+def finish_collection(task_id, items, user_identifier):
+    """Charges the whole collection's quota in one go and marks it ready for the ZIP download."""
+    paths = [item_file_path(get_task(item['task_id'])) for item in items]
+    done = [path for path in paths if path]
+    if not done:
+        fail_task(task_id, user_identifier, 'Error: none of the items could be downloaded.')
+        return
+    settle_quota(task_id, user_identifier, sum(os.path.getsize(path) for path in done))
+    update_task(task_id, status='Completed', percentage=100, archive=True,
+                message=f"{len(done)}/{len(items)} items ready. Download the ZIP archive.")
+
+def run_collection(task_id, items, user_identifier):
+    """Feeds a collection's items to the download queue COLLECTION_PARALLEL_ITEMS at a
+    time and keeps the collection's aggregate progress up to date until all finished.
+    """
+    pending = list(items)
+    running = set()
+    seq = task_events.seq
+    try:
+        while pending or running:
+            if (get_task(task_id) or {}).get('cancel_requested'):
+                for child in running:
+                    cancel_download(child, user_identifier)
+                cancel_task(task_id, user_identifier)
+                return
+            while pending and len(running) < COLLECTION_PARALLEL_ITEMS:
+                item = pending[0]
+                try:
+                    start_download(item['task_id'], item['url'], item['format_id'], user_identifier, parent=task_id)
+                except QueueFull:
+                    # The user's queue share is taken by other downloads; retry after the next event.
+                    break
+                except (StorageFull, OperationalError) as e:
+                    update_task(item['task_id'], status='Failed', message=f"Error: {e}", parent=task_id)
+                pending.pop(0)
+                running.add(item['task_id'])
+
+            seq = task_events.wait(running | {task_id}, seq, timeout=5)
+            running = {child for child in running
+                       if (get_task(child) or {}).get('status') not in TERMINAL_STATUSES}
+            update_collection_progress(task_id, items)
+
+        finish_collection(task_id, items, user_identifier)
+    except Exception as e:
+        app.logger.error(f"[{task_id}] Collection error: {e}", exc_info=True)
+        fail_task(task_id, user_identifier, str(e))
 
 
 @app.route('/')
@@ -303,70 +1204,141 @@ def download_info():
         return jsonify({"error": "Invalid or restricted URL domain"}), 400
 
     try:
-        command_ytdesc = ["yt-dlp", "--dump-json", "--no-warnings", url]
-        result = subprocess.run(command_ytdesc, capture_output=True, text=True, check=True, encoding='utf-8')
-        video_info = json.loads(result.stdout)
-
-        formats = video_info.get('formats', [])
-        relevant_formats = []
-        
-        for f in formats:
-            ext = f.get('ext')
-            if ext not in SAFE_EXTENSIONS: # Use established SAFE_EXTENSIONS for filtering
-                continue
-            
-            resolution = f.get('resolution')
-            if not resolution or resolution == '0x0':
-                resolution = 'N/A'
-
-            filesize = f.get('filesize')
-            format_id_str = f.get('format_id')
-            
-            relevant_formats.append({
-                'format_id': format_id_str,
-                'ext': ext,
-                'priority': f.get('preference', 0) if f.get('preference') is not None else 0, # Add priority for sorting
-                'resolution': resolution,
-                'note': f.get('format_note', ''),
-                'filesize': filesize,
-            })
-        
-        # Sort formats: by priority (desc), resolution (desc), then file size (desc)
-        def sort_key(f):
-            res_val = 0
-            if f['resolution'] != 'N/A':
-                try:
-                    res_val = int(f['resolution'].split('x')[0])
-                except ValueError:
-                    pass
-            return (f['priority'], res_val, f['filesize'] or 0)
-        
-        relevant_formats.sort(key=sort_key, reverse=True)
-
-        return jsonify({
-            "title": video_info.get('title', 'Untitled'),
-            "thumbnail": video_info.get('thumbnail'),
-            "uploader": video_info.get('uploader', 'Unknown Creator'),
-            "view_count": video_info.get('view_count', 0),
-            "like_count": video_info.get('like_count', 0),
-            "comment_count": video_info.get('comment_count', 0),
-            "duration": video_info.get('duration', 0),
-            "categories": video_info.get('categories', []),
-            "upload_date": video_info.get('upload_date', None),
-            "formats": relevant_formats
-        })
+        return jsonify(describe_video(fetch_video_info(url)))
 
-    except subprocess.CalledProcessError as e:
+    except ExtractionError as e:
         app.logger.error(f"Failed to fetch video info for URL {url}: {e.stderr}")
         return jsonify({"error": "Failed to fetch video info", "details": e.stderr}), 500
-    except json.JSONDecodeError:
-        app.logger.error(f"Failed to parse video info for URL {url}. Raw output: {result.stdout}")
+    except json.JSONDecodeError as e:
+        app.logger.error(f"Failed to parse video info for URL {url}. Raw output: {e.doc}")
         return jsonify({"error": "Failed to parse video info from yt-dlp"}), 500
     except Exception as e:
         app.logger.error(f"Unexpected error fetching video info for URL {url}: {e}")
         return jsonify({"error": "Failed to fetch video info", "details": str(e)}), 500
 
 
+@app.route('/api/download/batch', methods=['POST'])
+@limiter.limit("5 per minute")
+@csrf.exempt # Read-only, exempt for the same reason as /api/download.
+def download_info_batch():
+    """Looks up a list of URLs concurrently and streams one JSON object per line
+    (NDJSON) as each result is ready, in completion order; ``index`` refers to the
+    position in the request. Playlists are expanded into their entries' URLs.
+    """
+    data = request.get_json(silent=True) or {}
+    urls = data.get('urls')
+    if not isinstance(urls, list) or not urls:
+        return jsonify({"error": "No URLs provided"}), 400
+    if len(urls) > BATCH_MAX_URLS:
+        return jsonify({"error": f"At most {BATCH_MAX_URLS} URLs per batch"}), 400
+
+    valid = [(index, url) for index, url in enumerate(urls) if isinstance(url, str) and is_safe_url(url)]
+
+    def line(payload):
+        return json.dumps(payload) + '\n'
+
+    def generate():
+        valid_indexes = {index for index, _ in valid}
+        for index, url in enumerate(urls):
+            if index not in valid_indexes:
+                yield line({"index": index, "url": url, "error": "Invalid or restricted URL domain"})
+
+        for position, url, result, error in batch_runner.run(lookup_batch_url, [url for _, url in valid]):
+            index = valid[position][0]
+            if error is None:
+                yield line(dict(result, index=index, url=url))
+            elif isinstance(error, ExtractionError):
+                app.logger.error(f"Failed to fetch video info for URL {url}: {error.stderr}")
+                yield line({"index": index, "url": url, "error": "Failed to fetch video info", "details": error.stderr})
+            else:
+                app.logger.error(f"Unexpected error fetching video info for URL {url}: {error}")
+                yield line({"index": index, "url": url, "error": "Failed to fetch video info", "details": str(error)})
+        yield line({"done": True, "count": len(urls)})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/api/analytics', methods=['POST'])
+@limiter.limit("30 per minute")
+@csrf.exempt # Read-only, exempt for the same reason as /api/download.
+def bulk_analytics():
+    """Scores many videos at once, e.g. a channel export: ``{"videos": [...]}`` with
+    yt-dlp style fields (``id``, ``title``, ``categories``, ``duration``, ``view_count``,
+    ``like_count``, ``comment_count``). Results are returned in request order.
+    """
+    data = request.get_json(silent=True) or {}
+    videos = data.get('videos')
+    if not isinstance(videos, list) or not videos or not all(isinstance(video, dict) for video in videos):
+        return jsonify({"error": "No videos provided"}), 400
+    if len(videos) > ANALYTICS_MAX_VIDEOS:
+        return jsonify({"error": f"At most {ANALYTICS_MAX_VIDEOS} videos per request"}), 400
+
+    results = analytics_engine.score(videos)
+    return jsonify({"results": [dict(result, id=video.get('id')) for video, result in zip(videos, results)]})
+
+
+@app.route('/api/cache/stats')
+def cache_stats():
+    """Hit/miss counters of the video info cache, the lookup coalescing layer and analytics."""
+    stats = info_cache.stats()
+    stats['single_flight'] = info_flight.stats()
+    stats['analytics'] = analytics_engine.stats()
+    return jsonify(stats)
+
+
+@app.route('/api/quota/report')
+def quota_report():
+    """Per-user usage for one day (``?day=YYYY-MM-DD``, default today). Admin only."""
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    day = request.args.get('day') or today_str()
+    if not re.match(r'^\d{4}-\d{2}-\d{2}$', day):
+        return jsonify({"error": "Invalid day"}), 400
+
+    usage = quota_manager.usage_report(day)
+    return jsonify({
+        "day": day,
+        "daily_limit": quota_manager.daily_limit,
+        "users": len(usage),
+        "total_bytes": sum(usage.values()),
+        "usage": usage
+    })
+
+
+@app.route('/api/downloads/stats')
+def download_stats():
+    """Queue, disk and per-downloader throughput statistics."""
+    return jsonify({
+        "queue": download_scheduler.stats(),
+        "postprocess": postprocess_scheduler.stats(),
+        "journal": job_journal.stats(),
+        "tasks": task_store.stats(),
+        "supervisor": download_supervisor.stats(),
+        "artifacts": artifact_store.stats(),
+        "downloaders": throughput_stats.stats()
+    })
+
+
+@app.route('/api/bandwidth')
+def bandwidth_allocation():
+    """Current bandwidth budget and each running job's share (bytes/s). Admin only."""
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify(bandwidth_governor.allocation())
+
+
+@app.route('/metrics')
+@limiter.exempt
+def prometheus_metrics():
+    """Prometheus scrape endpoint."""
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+
 @app.route('/api/process-video', methods=['POST'])
 @limiter.limit("3 per minute")
 def process_video():
@@ -377,75 +1349,379 @@ def process_video():
     filename = data.get('filename')
 
     # Validate CSRF token
-    if not validate_csrf(request.headers.get('X-CSRFToken')):
+    if not csrf_header_valid():
         return jsonify({"error": "CSRF token missing or incorrect"}), 403
 
     user_identifier = request.remote_addr
 
-    if not quota_manager.check_quota(user_identifier):
-        return jsonify({"error": "Daily download quota exceeded (15GB limit)."}), 429
-
     if not url or not format_id:
         return jsonify({"error": "Missing data"}), 400
 
-    # Verify reCAPTCHA
-    captcha_response = data.get('g-recaptcha-response')
-    if RECAPTCHA_SECRET_KEY:
-        if not captcha_response:
-             return jsonify({"error": "Please complete the captcha."}),
- 400
-        
-        verify_payload = {
-            'secret': RECAPTCHA_SECRET_KEY,
-            'response': captcha_response,
-            'remoteip': request.remote_addr
-        }
-        try:
-            verify_req = requests.post('https://www.google.com/recaptcha/api/siteverify', data=verify_payload, timeout=10)
-            verify_resp = verify_req.json()
-            if not verify_resp.get('success'):
-                app.logger.warning(f"Failed Captcha verification for {user_identifier}: {verify_resp.get('error-codes')}")
-                return jsonify({"error": "Captcha verification failed. Please try again."}),
- 400
-        except requests.exceptions.RequestException as e:
-            app.logger.error(f"Captcha verification request error: {e}")
-            return jsonify({"error": "Captcha verification service unavailable."}),
- 500
+    captcha_error = verify_captcha(data, user_identifier)
+    if captcha_error:
+        return captcha_error
 
     if not is_safe_url(url):
         return jsonify({"error": "Invalid or restricted URL domain"}), 400
 
+    # Reserve the estimated size up front so parallel downloads cannot overrun the quota.
+    reservation = quota_manager.reserve(user_identifier, estimate_filesize(url, format_id))
+    if reservation is None:
+        count_rejection('quota')
+        return jsonify({"error": "Daily download quota exceeded (15GB limit)."}), 429
+
     task_id = str(uuid.uuid4())
-    
-    if not download_semaphore.acquire(blocking=False):
-        return jsonify({"error": f"Too many concurrent downloads. Please wait for an active download to finish (max {MAX_CONCURRENT_DOWNLOADS})."}), 429
 
-    thread = threading.Thread(target=run_download_thread, args=(task_id, url, format_id, user_identifier, filename))
-    thread.daemon = True 
-    thread.start()
+    # Single-file formats can skip the disk entirely; merged formats fall through.
+    passthrough = PASSTHROUGH_ENABLED and data.get('passthrough') and passthrough_format(info_cache.get(url), format_id)
+    if passthrough:
+        video_info = info_cache.get(url) or {}
+        name = re.sub(r'[\\/:*?"<>|]', '', filename or video_info.get('title') or '') or 'download'
+        update_task(task_id, status='Ready', percentage=0, message='Stream ready', mode='stream',
+                    url=url, format_id=format_id, user=user_identifier, quota_reservation=reservation,
+                    download_name=f"{name}.{passthrough.get('ext') or 'bin'}")
+        expiry = threading.Timer(STREAM_READY_TTL, cancel_ready_stream,
+                                 args=(task_id, user_identifier, 'Stream link expired.'))
+        expiry.daemon = True
+        expiry.start()
+        return jsonify({"task_id": task_id, "status": "Ready", "stream_url": f"/api/stream/{task_id}"})
 
-    return jsonify({"task_id": task_id, "status": "started"})
+    try:
+        start_download(task_id, url, format_id, user_identifier, filename, quota_reservation=reservation)
+    except QueueFull as e:
+        count_rejection('queue_full')
+        quota_manager.refund(reservation)
+        return jsonify({"error": str(e)}), 429
+    except StorageFull as e:
+        count_rejection('storage_full')
+        quota_manager.refund(reservation)
+        forget_task(task_id)
+        return jsonify({"error": str(e)}), 507
+    except OperationalError as e:
+        app.logger.error(f"[{task_id}] Could not reach the Celery broker: {e}")
+        quota_manager.refund(reservation)
+        forget_task(task_id)
+        return jsonify({"error": "Download queue unavailable. Please try again later."}), 503
+
+    return jsonify({"task_id": task_id, "status": get_task(task_id)['status']})
+
+
+@app.route('/api/process-collection', methods=['POST'])
+@limiter.limit("3 per minute")
+def process_collection():
+    """Downloads several items under one task: either ``items`` (a list of
+    ``{"url", "format_id"}``) or the first ``limit`` entries of the playlist or
+    channel at ``url``, each with ``format_id``. Quota is reserved for the whole set
+    and the result is delivered as a single ZIP archive.
+    """
+    data = request.get_json(silent=True) or {}
+
+    # Validate CSRF token
+    if not csrf_header_valid():
+        return jsonify({"error": "CSRF token missing or incorrect"}), 403
 
+    user_identifier = request.remote_addr
+    captcha_error = verify_captcha(data, user_identifier)
+    if captcha_error:
+        return captcha_error
+
+    format_id = data.get('format_id') or 'best'
+    name = data.get('filename')
+    if data.get('items'):
+        if not isinstance(data['items'], list):
+            return jsonify({"error": "items must be a list"}), 400
+        items = []
+        for item in data['items']:
+            url = item.get('url') if isinstance(item, dict) else None
+            if not is_safe_url(url):
+                return jsonify({"error": f"Invalid or restricted URL domain: {url}"}), 400
+            title = (info_cache.get(url) or {}).get('title')
+            items.append({'url': url, 'format_id': item.get('format_id') or format_id, 'title': title})
+    elif data.get('url'):
+        url = data['url']
+        if not is_safe_url(url):
+            return jsonify({"error": "Invalid or restricted URL domain"}), 400
+        try:
+            limit = int(data.get('limit') or COLLECTION_MAX_ITEMS)
+        except (TypeError, ValueError):
+            return jsonify({"error": "limit must be an integer"}), 400
+        limit = max(1, min(limit, COLLECTION_MAX_ITEMS))
+        try:
+            playlist = expand_playlist(url)
+        except ExtractionError as e:
+            app.logger.error(f"Failed to expand playlist {url}: {e.stderr}")
+            return jsonify({"error": "Failed to fetch playlist", "details": e.stderr}), 500
+        items = [{'url': entry['url'], 'format_id': format_id, 'title': entry['title']}
+                 for entry in playlist['entries'][:limit]]
+        name = name or playlist['title']
+    else:
+        return jsonify({"error": "Missing data"}), 400
 
-@app.route('/api/status/<task_id>')
-def get_status(task_id):
-    """Cek status download dari memory"""
-    task = download_tasks.get(task_id)
+    if not items:
+        return jsonify({"error": "No items to download"}), 400
+    if len(items) > COLLECTION_MAX_ITEMS:
+        return jsonify({"error": f"At most {COLLECTION_MAX_ITEMS} items per collection"}), 400
+
+    # One reservation covers every item; it is settled once all items finished.
+    estimate = sum(estimate_filesize(item['url'], item['format_id']) for item in items)
+    reservation = quota_manager.reserve(user_identifier, estimate)
+    if reservation is None:
+        count_rejection('quota')
+        return jsonify({"error": "Daily download quota exceeded (15GB limit)."}), 429
+
+    task_id = str(uuid.uuid4())
+    for index, item in enumerate(items):
+        item['task_id'] = f"{task_id}-{index + 1}"
+        item['title'] = re.sub(r'[\\/:*?"<>|]', '', item['title'] or '') or f"Item {index + 1}"
+    name = re.sub(r'[\\/:*?"<>|]', '', name or '') or 'collection'
+    update_task(task_id, status='Queued', percentage=0, message=f"0/{len(items)} items finished",
+                mode='collection', items=items, user=user_identifier, quota_reservation=reservation,
+                download_name=f"{name}.zip")
+    threading.Thread(target=run_collection, args=(task_id, items, user_identifier),
+                     name=f"collection-{task_id}", daemon=True).start()
+    return jsonify({"task_id": task_id, "status": "Queued", "items": len(items)})
+
+
+@app.route('/api/collection/<task_id>/zip')
+def download_collection(task_id):
+    """Streams a finished collection as a ZIP built on the fly from the items' files
+    (stored, not recompressed); nothing is assembled on disk first.
+    """
+    task = get_task(task_id)
+    if not task or task.get('mode') != 'collection':
+        return jsonify({"error": "Collection not found"}), 404
+    if task['status'] != 'Completed':
+        return jsonify({"error": "Collection is not ready yet"}), 409
+
+    names, paths, held = [], [], []
+    for index, item in enumerate(task['items']):
+        item_task = get_task(item['task_id'])
+        path = item_file_path(item_task)
+        if path is None:
+            continue
+        # Hold the artifacts so cleanup cannot delete them mid-archive.
+        artifact = artifact_store.acquire(item_task['filename'])
+        if artifact is not None:
+            held.append(artifact)
+        ext = os.path.splitext(path)[1]
+        names.append(f"{index + 1:02d} - {item_task.get('download_name') or item['title'] + ext}")
+        paths.append(path)
+    if not paths:
+        return jsonify({"error": "The collection's files have expired"}), 410
+
+    def release_all():
+        for artifact in held:
+            artifact_store.release(artifact)
+
+    def archive():
+        sent = 0
+        try:
+            for chunk in stream_zip(zip(unique_names(names), paths)):
+                sent += len(chunk)
+                yield chunk
+        finally:
+            observe_served('zip', sent)
+
+    response = Response(
+        archive(),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': content_disposition(task['download_name']),
+            'Cache-Control': 'no-store',
+            'X-Accel-Buffering': 'no'
+        },
+        direct_passthrough=True
+    )
+    response.call_on_close(release_all)
+    return response
+
+
+@app.route('/api/stream/<task_id>')
+def stream_download(task_id):
+    """Pipes ``yt-dlp -o -`` to the client as a chunked response; nothing touches disk.
+    The quota reservation is settled with the bytes actually sent.
+    """
+    task = get_task(task_id)
+    if not task or task.get('mode') != 'stream':
+        return jsonify({"error": "Stream not found"}), 404
+    # Only one request may start yt-dlp for a stream.
+    if not update_task_if(task_id, ('Ready',), status='Streaming', message='Streaming to client...'):
+        return jsonify({"error": "Stream already started or expired"}), 409
+    user_identifier = task['user']
+    lease = bandwidth_governor.acquire(task_id, user_identifier, kind='stream')
+
+    def on_close(bytes_sent, ok, error):
+        bandwidth_governor.release(lease)
+        settle_quota(task_id, user_identifier, bytes_sent)
+        observe_served('stream', bytes_sent)
+        if ok:
+            update_task(task_id, status='Completed', percentage=100, downloaded_bytes=bytes_sent,
+                        message='Stream finished!')
+        else:
+            app.logger.warning(f"[{task_id}] Stream ended after {bytes_sent} bytes: {error}")
+            count_ytdlp_failure('stream', error)
+            update_task(task_id, status='Failed', downloaded_bytes=bytes_sent, message=f"Error: {error}")
+
+    stream = PassthroughStream(YTDLP_PATH, task['url'], task['format_id'], on_close,
+                               max_filesize=MAX_FILESIZE, pace=lease.pace)
+    mimetype = mimetypes.guess_type(task['download_name'])[0] or 'application/octet-stream'
+    response = Response(
+        stream,
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': content_disposition(task['download_name']),
+            'Cache-Control': 'no-store',
+            'X-Accel-Buffering': 'no'
+        },
+        direct_passthrough=True
+    )
+    # The generator's cleanup never runs if the client goes away before the first chunk.
+    response.call_on_close(stream.close)
+    return response
+
+def build_status(task_id):
+    """Returns ``(status payload, ID of the job doing the work)``, or ``(None, None)`` for unknown tasks."""
+    task = get_task(task_id)
     if not task:
-        return jsonify({"status": "Not Found"}), 404
-    
+        return None, None
+
     response = {
         "status": task['status'],
         "percentage": task['percentage'],
         "message": task['message']
     }
-    
+
+    job_id = task_id
+    progress = task
+    leader = get_task(task['attached_to']) if task.get('attached_to') else None
+    if leader and task['status'] not in TERMINAL_STATUSES:
+        # Attached tasks report the progress of the download they share.
+        job_id = task['attached_to']
+        progress = leader
+        response['status'] = leader['status']
+        response['percentage'] = leader['percentage']
+
+    for name in PROGRESS_FIELDS:
+        if progress.get(name) is not None:
+            response[name] = progress[name]
+
+    for scheduler in (download_scheduler, postprocess_scheduler):
+        # One locked read: the job may start between two separate calls.
+        estimate = scheduler.queue_estimate(job_id)
+        if estimate is not None:
+            position, start = estimate
+            response['queue_position'] = position + 1
+            response['estimated_start'] = int(start)
+            break
+
+    if task.get('mode') == 'collection':
+        response['items'] = collection_items_status(task['items'])
+        if task.get('archive'):
+            response['download_link'] = f"/api/collection/{task_id}/zip"
+
     if task.get('filename'):
         response['download_link'] = f"/downloads/{task['filename']}"
-        
+        if task.get('download_name'):
+            response['download_link'] += f"?name={quote(task['download_name'])}"
+
+    return response, job_id
+
+def status_changed(response, seen):
+    return (response['status'], response['percentage'], response.get('queue_position')) != seen
+
+
+@app.route('/api/status/<task_id>')
+def get_status(task_id):
+    """Cek status download. With ``?wait=<seconds>`` this is a long-poll: the request
+    blocks until the status differs from the client's ``status``/``percentage``.
+    """
+    seq = task_events.seq
+    response, job_id = build_status(task_id)
+    if response is None:
+        return jsonify({"status": "Not Found"}), 404
+
+    wait = min(request.args.get('wait', 0, type=float), LONG_POLL_MAX_SECONDS)
+    if wait > 0:
+        seen = (request.args.get('status'), request.args.get('percentage', type=float),
+                request.args.get('queue_position', type=int))
+        deadline = time.monotonic() + wait
+        while response is not None and not status_changed(response, seen):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            seq = task_events.wait({task_id, job_id}, seq, remaining)
+            response, job_id = build_status(task_id)
+        if response is None:
+            return jsonify({"status": "Not Found"}), 404
+
     return jsonify(response)
 
 
+@app.route('/api/status/<task_id>/stream')
+def stream_status(task_id):
+    """Server-Sent Events: pushes the status payload whenever it changes and
+    closes after the download finished or failed.
+    """
+    def generate():
+        seq = task_events.seq
+        seen = None
+        deadline = time.monotonic() + SSE_MAX_SECONDS
+        while True:
+            response, job_id = build_status(task_id)
+            if response is None:
+                yield f"event: error\ndata: {json.dumps({'status': 'Not Found'})}\n\n"
+                return
+            if status_changed(response, seen):
+                seen = (response['status'], response['percentage'], response.get('queue_position'))
+                yield f"data: {json.dumps(response)}\n\n"
+            else:
+                yield ": keep-alive\n\n"
+            if response['status'] in TERMINAL_STATUSES or time.monotonic() > deadline:
+                # EventSource reconnects on its own after a deadline close.
+                return
+            seq = task_events.wait({task_id, job_id}, seq, SSE_HEARTBEAT_SECONDS)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/api/tasks')
+def list_tasks():
+    """The caller's tasks that are queued or running, oldest first."""
+    tasks = []
+    for task_id in task_store.active_tasks(request.remote_addr):
+        response, _ = build_status(task_id)
+        if response is not None:
+            tasks.append(dict(response, task_id=task_id))
+    return jsonify({"tasks": tasks})
+
+
+@app.route('/api/tasks/<task_id>', methods=['DELETE'])
+def cancel_task_request(task_id):
+    """Cancels one of the caller's queued or running tasks (any task with the admin token).
+    Collections are cancelled asynchronously and answer 202.
+    """
+    task = get_task(task_id)
+    if task is None:
+        return jsonify({"status": "Not Found"}), 404
+    user_identifier = task.get('user')
+    if user_identifier != request.remote_addr and not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    if task['status'] in TERMINAL_STATUSES:
+        return jsonify({"error": f"Task already {task['status'].lower()}"}), 409
+
+    if task.get('mode') == 'collection':
+        update_task(task_id, cancel_requested=True)
+        task_events.publish(task_id)
+        return jsonify({"task_id": task_id, "status": "Cancelling"}), 202
+    if not cancel_download(task_id, user_identifier):
+        return jsonify({"error": "Task cannot be cancelled at this point"}), 409
+    return jsonify({"task_id": task_id, "status": get_task(task_id)['status']})
+
+
 @app.route('/downloads/<path:filename>')
 def download_file(filename):
     """Serves downloaded files after checking their extensions for safety."""
@@ -455,8 +1731,67 @@ def download_file(filename):
     _, ext = os.path.splitext(filename)
     if ext.lower() not in SAFE_EXTENSIONS:
         return jsonify({"error": "File type not allowed"}), 403
-        
-    return send_from_directory(DOWNLOADS_DIR, filename, as_attachment=True)
+
+    download_name = request.args.get('name')
+    if download_name:
+        download_name = re.sub(r'[\\/:*?"<>|]', '', download_name)
+
+    # Hold a reference while the file is streamed so cleanup cannot delete it.
+    # In offload mode the proxy streams after this returns; the artifact's
+    # last_access timestamp still keeps it from being expired mid-transfer.
+    artifact = artifact_store.acquire(filename)
+    try:
+        response = file_delivery.serve(filename, download_name=download_name or None)
+    except Exception:
+        if artifact is not None:
+            artifact_store.release(artifact)
+        raise
+    if artifact is not None:
+        response.call_on_close(lambda: artifact_store.release(artifact))
+    if response.content_length:
+        # Proxy-offloaded responses carry no body here and are not counted.
+        observe_served('file', response.content_length)
+    return response
+
+
+@app.route('/api/thumbnail/<token>')
+@limiter.exempt
+def thumbnail(token):
+    """Serves a WebP variant of a video's thumbnail at least ``w`` pixels wide.
+    Falls back to redirecting to the platform's image when it cannot be converted.
+    """
+    if not THUMBNAIL_PROXY:
+        return jsonify({"error": "Invalid thumbnail"}), 404
+    try:
+        source = thumbnail_signer.loads(token)
+    except BadSignature:
+        return jsonify({"error": "Invalid thumbnail"}), 404
+    if not thumbnail_store.allows(source):
+        return jsonify({"error": "Invalid thumbnail"}), 404
+    try:
+        path = thumbnail_store.get(source, request.args.get('w', THUMBNAIL_WIDTH, type=int))
+    except ThumbnailError:
+        return redirect(source)
+    # A variant's bytes never change, so browsers may keep it as long as they like.
+    response = send_file(os.path.abspath(path), mimetype='image/webp', max_age=THUMBNAIL_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
+
+# Set up last since resuming jobs needs the functions above. Celery workers keep
+# their own partial files and jobs are redelivered by the broker instead.
+if DOWNLOAD_BACKEND != 'celery':
+    job_journal.watch(resume_download, directory=DOWNLOADS_DIR, partial_max_age=PARTIAL_MAX_AGE)
+    # Under gunicorn this module may run in the master (--preload), which must not
+    # resume jobs; the post_worker_init hook in gunicorn.conf.py starts the watcher
+    # in each worker instead. Anywhere else the importing process serves requests.
+    if 'gunicorn' not in os.environ.get('SERVER_SOFTWARE', ''):
+        job_journal.ensure_watcher()
+
+
+@app.before_request
+def ensure_job_watcher():
+    # Fallback for servers that fork after importing the app without such a hook.
+    job_journal.ensure_watcher()
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
@@ -0,0 +1,567 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: key locks only coordinate the threads of this process.
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Content-addressed artifacts are named <32 hex chars>.<ext>.
+ARTIFACT_NAME_RE = re.compile(r'^([0-9a-f]{32})(\.[A-Za-z0-9]+)$')
+
+# Per-key lock files shared by every process using the directory (gunicorn and
+# Celery workers). A download holds its key's lock exclusively, serving a file
+# holds it shared, and only a process that gets it exclusively may delete the
+# file. The kernel drops the locks of a process that dies. Without fcntl
+# (Windows) the locks only hold within one process, so run a single worker there.
+LOCK_DIR = '.locks'
+
+
+def artifact_key(video_key, format_id):
+    """Stable key for one (canonical video ID, format_id) pair."""
+    return hashlib.sha1(f"{video_key}|{format_id}".encode('utf-8')).hexdigest()[:32]
+
+
+class KeyLock:
+    """A shared or exclusive lock on a key's lock file: flock() where fcntl exists,
+    otherwise a lock among the threads of this process with the same semantics."""
+
+    _local = threading.Condition()
+    _holders = {}  # path -> number of shared holders, or -1 while held exclusively (without fcntl)
+
+    def __init__(self, path, exclusive, fd=None):
+        self.path = path
+        self.exclusive = exclusive
+        self.fd = fd
+
+    @classmethod
+    def acquire(cls, path, exclusive, blocking=False):
+        """Returns the lock, or None when another holder is in the way and
+        ``blocking`` is False."""
+        if fcntl is None:
+            return cls._acquire_local(path, exclusive, blocking)
+        mode = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, mode if blocking else mode | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return None
+            try:
+                # Removing an artifact unlinks its lock file; a lock on the old file guards nothing.
+                if os.fstat(fd).st_ino == os.stat(path).st_ino:
+                    return cls(path, exclusive, fd)
+            except FileNotFoundError:
+                pass
+            os.close(fd)
+
+    @classmethod
+    def _acquire_local(cls, path, exclusive, blocking):
+        with cls._local:
+            while True:
+                held = cls._holders.get(path, 0)
+                if held == 0 or (held > 0 and not exclusive):
+                    # Created like the flock() path does, so removal finds it.
+                    open(path, 'a').close()
+                    cls._holders[path] = -1 if exclusive else held + 1
+                    return cls(path, exclusive)
+                if not blocking:
+                    return None
+                cls._local.wait()
+
+    def write(self, data):
+        """Replaces the lock file's content (the holder's reservation)."""
+        if self.fd is None:
+            with open(self.path, 'w') as f:
+                f.write(data)
+            return
+        os.ftruncate(self.fd, 0)
+        os.pwrite(self.fd, data.encode(), 0)
+
+    def release(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            return
+        with self._local:
+            held = self._holders.get(self.path, 0)
+            held = 0 if self.exclusive else held - 1
+            if held > 0:
+                self._holders[self.path] = held
+            else:
+                self._holders.pop(self.path, None)
+            self._local.notify_all()
+
+
+class StorageFull(Exception):
+    """Admitting a download would exceed the disk budget, even after eviction."""
+
+
+class Artifact:
+    __slots__ = ('key', 'filename', 'size', 'created_at', 'last_access', 'refcount', 'aliases', 'key_lock')
+
+    def __init__(self, key, filename, size):
+        self.key = key
+        self.filename = filename
+        self.size = size
+        self.created_at = time.time()
+        self.last_access = self.created_at
+        self.refcount = 0
+        self.aliases = set()
+        self.key_lock = None
+
+
+class Flight:
+    """A download of one artifact key that is still running, in this process or
+    (``task_id`` then names the other process's task, if known) in another one."""
+    __slots__ = ('key', 'task_id', 'event', 'artifact', 'error', 'callbacks', 'reserved', 'key_lock')
+
+    def __init__(self, key, task_id, reserved=0):
+        self.key = key
+        self.task_id = task_id
+        self.reserved = reserved
+        self.event = threading.Event()
+        self.artifact = None
+        self.error = None
+        self.callbacks = []
+        self.key_lock = None
+
+
+class ArtifactStore:
+    """Index of downloaded files keyed by (canonical video ID, format_id).
+
+    A repeat request for the same key reuses the file on disk; a request that
+    arrives while the key is still downloading attaches to that download.
+    Files are reference counted while they are being written or served so
+    cleanup never removes an artifact that is in use.
+
+    With ``max_bytes`` the directory is kept under a disk budget: a new
+    download is admitted only if its estimated size fits next to the stored
+    artifacts and the downloads in flight, evicting least recently used
+    artifacts to make room.
+
+    Several processes may share the directory: claims, the budget and removal
+    are coordinated through per-key lock files (see ``LOCK_DIR``), and each
+    process picks up the files the others published or removed.
+    """
+
+    CLAIM_READY = 'ready'
+    CLAIM_ATTACH = 'attach'
+    CLAIM_LEAD = 'lead'
+
+    def __init__(self, directory, max_bytes=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._artifacts = {}   # key -> Artifact
+        self._by_name = {}     # artifact or alias filename -> key
+        self._flights = {}     # key -> Flight
+        self._lock = threading.Lock()
+        self.reuse_hits = 0
+        self.attached = 0
+        self.evictions = 0
+        self.expired = 0
+        self.rejected = 0
+        self._stored_bytes = 0
+        self._lock_dir = os.path.join(directory, LOCK_DIR)
+        os.makedirs(self._lock_dir, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        """Syncs the index with the directory: adds artifacts and their hardlink
+        aliases left by a previous run or made by another process, drops those
+        another process removed."""
+        on_disk = {}
+        unknown = []
+        for name in os.listdir(self.directory):
+            match = ARTIFACT_NAME_RE.match(name)
+            if match:
+                on_disk[match.group(1)] = name
+            elif name not in self._by_name and not name.startswith('.'):
+                unknown.append(name)
+        for artifact in list(self._artifacts.values()):
+            if on_disk.get(artifact.key) != artifact.filename:
+                self._forget(artifact)
+        for key, name in on_disk.items():
+            artifact = self._artifacts.get(key) or self._adopt_file(key, name)
+            if artifact is not None:
+                try:
+                    # Other processes touch the files they serve.
+                    artifact.last_access = max(artifact.last_access, os.path.getmtime(self.path(artifact)))
+                except OSError:
+                    pass
+        if unknown:
+            self._scan_aliases(unknown)
+
+    def _scan_aliases(self, names):
+        """Indexes those of ``names`` that are hardlinks of an artifact."""
+        inodes = {}
+        for artifact in self._artifacts.values():
+            try:
+                stat = os.stat(self.path(artifact))
+            except OSError:
+                continue
+            if stat.st_nlink > 1:
+                inodes[stat.st_dev, stat.st_ino] = artifact
+        if not inodes:
+            return
+        for name in names:
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            artifact = inodes.get((stat.st_dev, stat.st_ino))
+            if artifact is not None:
+                artifact.aliases.add(name)
+                self._by_name[name] = artifact.key
+
+    def _adopt(self, key):
+        """The artifact of ``key`` if its file is on disk, e.g. published by another process."""
+        artifact = self._artifacts.get(key)
+        if artifact is not None:
+            return artifact
+        for path in glob.glob(os.path.join(glob.escape(self.directory), glob.escape(key) + '.*')):
+            if ARTIFACT_NAME_RE.match(os.path.basename(path)):
+                return self._adopt_file(key, os.path.basename(path))
+        return None
+
+    def _adopt_file(self, key, filename):
+        try:
+            stat = os.stat(os.path.join(self.directory, filename))
+        except FileNotFoundError:
+            return None
+        artifact = self._register(key, filename, stat.st_size)
+        artifact.last_access = stat.st_mtime
+        return artifact
+
+    def _register(self, key, filename, size):
+        artifact = Artifact(key, filename, size)
+        self._artifacts[key] = artifact
+        self._by_name[filename] = key
+        self._stored_bytes += size
+        return artifact
+
+    def path(self, artifact):
+        return os.path.join(self.directory, artifact.filename)
+
+    def _lock_path(self, key):
+        return os.path.join(self._lock_dir, key)
+
+    def _touch(self, artifact):
+        artifact.last_access = time.time()
+        try:
+            # The modification time carries the last access to the other processes.
+            os.utime(self.path(artifact))
+        except OSError:
+            pass
+
+    def claim(self, key, task_id, estimated_size=0):
+        """Decides how a new task obtains ``key``.
+
+        Returns ``(CLAIM_READY, Artifact)`` when the file already exists,
+        ``(CLAIM_ATTACH, Flight)`` when another task is downloading it, or
+        ``(CLAIM_LEAD, Flight)`` when the caller must download it and then call
+        :meth:`publish` or :meth:`fail`. Raises StorageFull when a new
+        download of ``estimated_size`` bytes does not fit the disk budget.
+        """
+        with self._lock:
+            artifact = self._artifacts.get(key)
+            if artifact is not None:
+                if os.path.exists(self.path(artifact)):
+                    return self._reuse(artifact)
+                self._forget(artifact)
+
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.attached += 1
+                return self.CLAIM_ATTACH, flight
+
+            lock_path = self._lock_path(key)
+            while True:
+                lock = KeyLock.acquire(lock_path, exclusive=True)
+                if lock is not None:
+                    break
+                shared = KeyLock.acquire(lock_path, exclusive=False)
+                if shared is None:
+                    return self.CLAIM_ATTACH, self._attach_remote(key)
+                # Only readers hold the lock: the file is there and in use elsewhere.
+                artifact = self._adopt(key)
+                shared.release()
+                if artifact is not None:
+                    return self._reuse(artifact)
+
+            try:
+                # Another process may have published the file before this one got the lock.
+                artifact = self._adopt(key)
+                if artifact is not None:
+                    lock.release()
+                    return self._reuse(artifact)
+                self._admit(estimated_size)
+            except BaseException:
+                lock.release()
+                raise
+            lock.write(json.dumps({'task_id': task_id, 'reserved': estimated_size}))
+            flight = self._flights[key] = Flight(key, task_id, estimated_size)
+            flight.key_lock = lock
+            return self.CLAIM_LEAD, flight
+
+    def _reuse(self, artifact):
+        self._touch(artifact)
+        self.reuse_hits += 1
+        return self.CLAIM_READY, artifact
+
+    def _read_lock(self, key):
+        try:
+            with open(self._lock_path(key)) as f:
+                return json.loads(f.read() or '{}')
+        except (OSError, ValueError):
+            return {}
+
+    def _attach_remote(self, key):
+        """Follows another process's download of ``key`` until it releases the lock."""
+        flight = self._flights[key] = Flight(key, self._read_lock(key).get('task_id'))
+        self.attached += 1
+
+        def wait():
+            lock = KeyLock.acquire(self._lock_path(key), exclusive=False, blocking=True)
+            try:
+                with self._lock:
+                    flight.artifact = self._adopt(key)
+                    if flight.artifact is None:
+                        flight.error = 'The download failed in another worker.'
+                    if self._flights.get(key) is flight:
+                        del self._flights[key]
+            finally:
+                lock.release()
+            self._finish(flight)
+
+        threading.Thread(target=wait, name=f'artifact-{key[:8]}', daemon=True).start()
+        return flight
+
+    def _remote_reserved(self):
+        """Bytes reserved by downloads other processes are running."""
+        reserved = 0
+        for key in os.listdir(self._lock_dir):
+            if key in self._flights:
+                continue
+            lock = KeyLock.acquire(self._lock_path(key), exclusive=False)
+            if lock is not None:
+                lock.release()
+                continue
+            reserved += self._read_lock(key).get('reserved') or 0
+        return reserved
+
+    def _admit(self, size):
+        if self.max_bytes is None:
+            return
+        self._scan()
+        reserved = sum(f.reserved for f in self._flights.values()) + self._remote_reserved()
+        excess = self._stored_bytes + reserved + size - self.max_bytes
+        if excess <= 0:
+            return
+        # Eviction skips files other processes are serving, so it may still fall short.
+        if size + reserved > self.max_bytes or excess > self._evictable_bytes() or self._evict(excess) < excess:
+            self.rejected += 1
+            raise StorageFull("Server storage is full. Please try again later.")
+
+    def _evictable_bytes(self):
+        return sum(a.size for a in self._artifacts.values() if a.refcount == 0)
+
+    def _evict(self, needed):
+        """Removes least recently used, unreferenced artifacts until ``needed`` bytes are freed."""
+        freed = 0
+        for artifact in sorted(self._artifacts.values(), key=lambda a: a.last_access):
+            if freed >= needed:
+                break
+            if artifact.refcount > 0 or not self._delete(artifact):
+                continue
+            freed += artifact.size
+            self.evictions += 1
+            logger.info(f"Evicted artifact {artifact.filename} ({artifact.size} bytes) to stay within the disk budget")
+        return freed
+
+    def publish(self, flight, file_path):
+        """Registers the leader's finished file and releases attached tasks."""
+        _, ext = os.path.splitext(file_path)
+        filename = f"{flight.key}{ext}"
+        final_path = os.path.join(self.directory, filename)
+        if os.path.abspath(file_path) != os.path.abspath(final_path):
+            os.replace(file_path, final_path)
+
+        with self._lock:
+            flight.artifact = self._register(flight.key, filename, os.path.getsize(final_path))
+            del self._flights[flight.key]
+            self._unlock(flight)
+        self._finish(flight)
+        return flight.artifact
+
+    def fail(self, flight, message):
+        with self._lock:
+            flight.error = message
+            self._flights.pop(flight.key, None)
+            self._unlock(flight)
+        self._finish(flight)
+
+    @staticmethod
+    def _unlock(holder):
+        if holder.key_lock is not None:
+            holder.key_lock.release()
+            holder.key_lock = None
+
+    def on_done(self, flight, callback):
+        """Calls ``callback(flight)`` once the flight is published or failed."""
+        with self._lock:
+            if not flight.event.is_set():
+                flight.callbacks.append(callback)
+                return
+        callback(flight)
+
+    def _finish(self, flight):
+        with self._lock:
+            flight.event.set()
+            callbacks, flight.callbacks = flight.callbacks, []
+        for callback in callbacks:
+            try:
+                callback(flight)
+            except Exception:
+                logger.exception(f"Artifact {flight.key} completion callback failed")
+
+    def alias(self, artifact, name):
+        """Exposes ``artifact`` under a custom file name via a hardlink.
+
+        Returns the alias file name, or None when a hardlink is not possible
+        (unsupported filesystem, or the name is taken by another file); the
+        caller then serves the artifact with a Content-Disposition name.
+        """
+        _, ext = os.path.splitext(artifact.filename)
+        alias_name = f"{name}{ext}"
+        alias_path = os.path.join(self.directory, alias_name)
+        with self._lock:
+            if alias_name in artifact.aliases or alias_name == artifact.filename:
+                return alias_name
+            if os.path.exists(alias_path):
+                return None
+            try:
+                os.link(self.path(artifact), alias_path)
+            except OSError as e:
+                logger.info(f"Hardlink alias {alias_name} not possible: {e}")
+                return None
+            artifact.aliases.add(alias_name)
+            self._by_name[alias_name] = artifact.key
+            return alias_name
+
+    def acquire(self, filename):
+        """Marks the artifact behind ``filename`` as in use; returns it or None."""
+        with self._lock:
+            if filename not in self._by_name:
+                # Possibly published by another process.
+                self._scan()
+            artifact = self._artifacts.get(self._by_name.get(filename))
+            if artifact is None:
+                return None
+            if artifact.refcount == 0:
+                lock = KeyLock.acquire(self._lock_path(artifact.key), exclusive=False)
+                if lock is None or not os.path.exists(self.path(artifact)):
+                    # Removed, or being removed, by another process.
+                    if lock is not None:
+                        lock.release()
+                    self._forget(artifact)
+                    return None
+                artifact.key_lock = lock
+            artifact.refcount += 1
+            self._touch(artifact)
+            return artifact
+
+    def release(self, artifact):
+        with self._lock:
+            artifact.refcount = max(0, artifact.refcount - 1)
+            if artifact.refcount == 0:
+                self._unlock(artifact)
+
+    def remove(self, key):
+        """Deletes an artifact and its aliases unless it is still referenced here or
+        in another process."""
+        with self._lock:
+            artifact = self._artifacts.get(key)
+            if artifact is None or artifact.refcount > 0 or key in self._flights:
+                return False
+            return self._delete(artifact)
+
+    def _delete(self, artifact):
+        lock_path = self._lock_path(artifact.key)
+        lock = KeyLock.acquire(lock_path, exclusive=True)
+        if lock is None:
+            return False
+        try:
+            self._forget(artifact)
+            for name in [artifact.filename, *artifact.aliases]:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+            os.remove(lock_path)
+        finally:
+            lock.release()
+        return True
+
+    def expire(self, max_age):
+        """Removes unreferenced artifacts not accessed for ``max_age`` seconds."""
+        cutoff = time.time() - max_age
+        with self._lock:
+            self._scan()
+            candidates = [a.key for a in self._artifacts.values() if a.last_access < cutoff]
+        removed = [key for key in candidates if self.remove(key)]
+        with self._lock:
+            self.expired += len(removed)
+        return removed
+
+    def enforce_budget(self):
+        """Evicts LRU artifacts while stored bytes exceed the budget (e.g. after a
+        download turned out larger than estimated)."""
+        if self.max_bytes is None:
+            return 0
+        with self._lock:
+            excess = self._stored_bytes - self.max_bytes
+            return self._evict(excess) if excess > 0 else 0
+
+    def start_sweeper(self, max_age, interval=60):
+        """Runs :meth:`expire` and :meth:`enforce_budget` every ``interval`` seconds."""
+        def sweep():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.expire(max_age)
+                    self.enforce_budget()
+                except Exception:
+                    logger.exception("Artifact sweep failed")
+
+        threading.Thread(target=sweep, name='artifact-sweeper', daemon=True).start()
+
+    def _forget(self, artifact):
+        if self._artifacts.pop(artifact.key, None) is not None:
+            self._stored_bytes -= artifact.size
+        self._by_name.pop(artifact.filename, None)
+        for name in artifact.aliases:
+            self._by_name.pop(name, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'artifacts': len(self._artifacts),
+                'bytes': self._stored_bytes,
+                'max_bytes': self.max_bytes,
+                'reserved_bytes': sum(f.reserved for f in self._flights.values()),
+                'in_flight': len(self._flights),
+                'reuse_hits': self.reuse_hits,
+                'attached': self.attached,
+                'evictions': self.evictions,
+                'expired': self.expired,
+                'rejected': self.rejected,
+            }
@@ -0,0 +1,167 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIER = 'default'
+# Jobs are never throttled below this, however many share the budget.
+MIN_RATE = 64 * 1024
+
+Tier = namedtuple('Tier', ['weight', 'max_rate'])  # max_rate: bytes/s per user, 0 = uncapped
+
+
+def mbps_to_bytes(mbps):
+    return int(float(mbps) * 1_000_000 / 8)
+
+
+def parse_tiers(spec):
+    """Parses ``"default:1,premium:3:100"`` (name:weight[:max Mbit/s per user])."""
+    tiers = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        name, _, rest = item.partition(':')
+        weight, _, max_mbps = rest.partition(':')
+        tiers[name] = Tier(float(weight or 1), mbps_to_bytes(max_mbps or 0))
+    tiers.setdefault(DEFAULT_TIER, Tier(1.0, 0))
+    return tiers
+
+
+def parse_user_tiers(spec):
+    """Parses ``"203.0.113.7=premium,..."``; users not listed are in the default tier."""
+    users = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        user, _, tier = item.partition('=')
+        users[user.strip()] = tier.strip()
+    return users
+
+
+class Lease:
+    """One job's share of the budget. ``rate`` (bytes/s, None = unlimited) changes
+    whenever jobs start or finish; callers either pace themselves with ``pace()``
+    or restart their transfer when ``should_restart()`` says the share moved enough.
+    """
+
+    def __init__(self, governor, job_id, user, tier, kind):
+        self.governor = governor
+        self.job_id = job_id
+        self.user = user
+        self.tier = tier
+        self.kind = kind
+        self.rate = None
+        self.applied_rate = None
+        self.applied_at = 0.0
+        self.started_at = time.time()
+        self._next_send = 0.0
+
+    def apply(self):
+        """Marks the current rate as the one the transfer runs with and returns it."""
+        self.applied_rate = self.rate
+        self.applied_at = time.monotonic()
+        return self.applied_rate
+
+    def should_restart(self):
+        rate, applied = self.rate, self.applied_rate
+        if rate == applied or time.monotonic() - self.applied_at < self.governor.restart_interval:
+            return False
+        if rate is None or applied is None:
+            return True
+        return abs(rate - applied) >= self.governor.restart_threshold * applied
+
+    def pace(self, nbytes):
+        """Sleeps long enough that ``nbytes`` more stay within the current rate."""
+        rate = self.applied_rate = self.rate
+        now = time.monotonic()
+        if not rate:
+            self._next_send = now
+            return
+        # Allow at most one second of burst after an idle period.
+        self._next_send = max(self._next_send, now - 1.0) + nbytes / rate
+        if self._next_send > now:
+            time.sleep(self._next_send - now)
+
+
+class BandwidthGovernor:
+    """Splits a global transfer budget among active downloads and passthrough streams.
+
+    Each user with active jobs gets a share proportional to their tier's
+    weight (weighted max-min fairness: a user capped by their tier below that
+    share leaves the rest to the others), split evenly over that user's jobs.
+    Shares are recomputed whenever a job starts or finishes. With no global
+    limit only the per-tier caps apply.
+    """
+
+    def __init__(self, limit=0, tiers=None, user_tiers=None, restart_threshold=0.25, restart_interval=30.0):
+        self.limit = limit
+        self.tiers = tiers or {DEFAULT_TIER: Tier(1.0, 0)}
+        self.user_tiers = user_tiers or {}
+        self.restart_threshold = restart_threshold
+        self.restart_interval = restart_interval
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def tier_for(self, user):
+        tier = self.user_tiers.get(user, DEFAULT_TIER)
+        return tier if tier in self.tiers else DEFAULT_TIER
+
+    def acquire(self, job_id, user, kind='download'):
+        lease = Lease(self, job_id, user, self.tier_for(user), kind)
+        with self._lock:
+            self._leases[job_id] = lease
+            self._rebalance()
+        return lease
+
+    def release(self, lease):
+        with self._lock:
+            if self._leases.get(lease.job_id) is lease:
+                del self._leases[lease.job_id]
+                self._rebalance()
+
+    def _user_rates(self, users):
+        """Water-fills the budget over ``users`` (user -> Tier); returns user -> bytes/s or None."""
+        if not self.limit:
+            return {user: tier.max_rate or None for user, tier in users.items()}
+        rates = {}
+        pending = dict(users)
+        remaining = self.limit
+        while pending:
+            total_weight = sum(tier.weight for tier in pending.values()) or 1
+            capped = {user: tier for user, tier in pending.items()
+                      if tier.max_rate and tier.max_rate <= remaining * tier.weight / total_weight}
+            if not capped:
+                for user, tier in pending.items():
+                    rates[user] = remaining * tier.weight / total_weight
+                break
+            for user, tier in capped.items():
+                rates[user] = tier.max_rate
+                remaining -= tier.max_rate
+                del pending[user]
+        return rates
+
+    def _rebalance(self):
+        jobs = {}
+        for lease in self._leases.values():
+            jobs.setdefault(lease.user, []).append(lease)
+        rates = self._user_rates({user: self.tiers[leases[0].tier] for user, leases in jobs.items()})
+        for user, leases in jobs.items():
+            rate = rates[user]
+            for lease in leases:
+                lease.rate = max(MIN_RATE, int(rate / len(leases))) if rate else None
+
+    def allocation(self):
+        with self._lock:
+            leases = list(self._leases.values())
+        return {
+            'limit': self.limit or None,
+            'allocated': sum(lease.rate or 0 for lease in leases),
+            'tiers': {name: tier._asdict() for name, tier in self.tiers.items()},
+            'jobs': [{
+                'job_id': lease.job_id,
+                'user': lease.user,
+                'tier': lease.tier,
+                'kind': lease.kind,
+                'rate': lease.rate,
+                'applied_rate': lease.applied_rate,
+                'running_for': round(time.time() - lease.started_at, 1),
+            } for lease in leases],
+        }
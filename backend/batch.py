@@ -0,0 +1,85 @@
+import queue
+import threading
+from urllib.parse import parse_qs, urlparse
+
+# Hosts that are aliases of one platform share that platform's concurrency limit.
+DOMAIN_ALIASES = {
+    'youtu.be': 'youtube.com',
+    'fb.watch': 'facebook.com',
+    'x.com': 'twitter.com',
+}
+HOST_PREFIXES = ('www.', 'm.', 'mobile.', 'web.', 'vm.', 'vt.')
+
+
+def domain_key(url):
+    host = (urlparse(url).hostname or '').lower()
+    for prefix in HOST_PREFIXES:
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    return DOMAIN_ALIASES.get(host, host)
+
+
+def is_playlist_url(url):
+    """True for URLs that name a playlist/set rather than a single video."""
+    parsed = urlparse(url)
+    domain = domain_key(url)
+    if domain == 'youtube.com':
+        # watch?v=...&list=... is a video opened from a playlist; only /playlist expands.
+        return parsed.path.rstrip('/') == '/playlist' and 'list' in parse_qs(parsed.query)
+    if domain == 'soundcloud.com':
+        return '/sets/' in parsed.path
+    return False
+
+
+class BatchRunner:
+    """Runs ``fn(item)`` for many items on a bounded set of threads.
+
+    At most ``max_workers`` calls run at once and at most ``per_domain`` of
+    them for the same platform, so a batch of 50 YouTube links cannot hog
+    every slot (or trip the platform's own rate limiting) while links from
+    other sites wait. ``run()`` yields ``(index, item, result, error)`` in
+    completion order.
+    """
+
+    def __init__(self, max_workers=4, per_domain=2, key=domain_key):
+        self.max_workers = max_workers
+        self.per_domain = per_domain
+        self.key = key
+
+    def run(self, fn, items):
+        done = queue.Queue()
+        pending = list(enumerate(items))
+        active = {}  # domain -> running calls
+        running = 0
+
+        def call(index, item, domain):
+            try:
+                done.put((index, item, domain, fn(item), None))
+            except Exception as e:
+                done.put((index, item, domain, None, e))
+
+        def start_ready():
+            nonlocal running
+            for position in range(len(pending) - 1, -1, -1):
+                if running >= self.max_workers:
+                    return
+                index, item = pending[position]
+                domain = self.key(item)
+                if active.get(domain, 0) >= self.per_domain:
+                    continue
+                del pending[position]
+                active[domain] = active.get(domain, 0) + 1
+                running += 1
+                threading.Thread(target=call, args=(index, item, domain), name='batch-worker', daemon=True).start()
+
+        pending.reverse()  # start_ready() scans from the end; keep submission order
+        start_ready()
+        # New calls only start while the consumer keeps reading, so a client that
+        # disconnects (the generator is closed) stops the batch after the running calls.
+        while running:
+            index, item, domain, result, error = done.get()
+            running -= 1
+            active[domain] -= 1
+            start_ready()
+            yield index, item, result, error
@@ -0,0 +1,88 @@
+"""Compares info-lookup latency of the subprocess and warm-pool extraction modes.
+
+Both modes run against the stub yt_dlp in ``benchmarks/stub`` so the numbers
+reflect process/import overhead rather than platform latency:
+
+    python benchmarks/bench_extractor.py --requests 100 --concurrency 4
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stub')
+sys.path.insert(0, BACKEND_DIR)
+# Pool workers inherit sys.path, so they import the stub instead of real yt_dlp.
+sys.path.insert(0, STUB_DIR)
+
+from extractor import MODE_POOL, MODE_SUBPROCESS, ExtractionEngine  # noqa: E402
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run_mode(mode, requests, concurrency, pool_size):
+    engine = ExtractionEngine(mode=mode, pool_size=pool_size,
+                              ytdlp_bin=os.path.join(STUB_DIR, 'yt-dlp'))
+    engine.warm_up()
+    urls = [f"https://www.youtube.com/watch?v=bench{i:06d}" for i in range(requests)]
+
+    def timed(url):
+        start = time.perf_counter()
+        engine.extract_info(url)
+        return time.perf_counter() - start
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(timed, urls))
+    elapsed = time.perf_counter() - started
+    engine.shutdown()
+
+    return {
+        'mode': mode,
+        'requests': requests,
+        'concurrency': concurrency,
+        'p50_ms': round(statistics.median(latencies) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 1),
+        'throughput_rps': round(requests / elapsed, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=2)
+    parser.add_argument('--pool-size', type=int, default=2)
+    parser.add_argument('--import-seconds', type=float, default=None,
+                        help='simulated yt_dlp import cost (STUB_YTDLP_IMPORT_SECONDS)')
+    parser.add_argument('--extract-seconds', type=float, default=None,
+                        help='simulated extractor time (STUB_YTDLP_EXTRACT_SECONDS)')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    if args.import_seconds is not None:
+        os.environ['STUB_YTDLP_IMPORT_SECONDS'] = str(args.import_seconds)
+    if args.extract_seconds is not None:
+        os.environ['STUB_YTDLP_EXTRACT_SECONDS'] = str(args.extract_seconds)
+
+    results = [run_mode(mode, args.requests, args.concurrency, args.pool_size)
+               for mode in (MODE_SUBPROCESS, MODE_POOL)]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'mode':<12}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}{'req/s':>10}")
+    for r in results:
+        print(f"{r['mode']:<12}{r['p50_ms']:>10}{r['p99_ms']:>10}{r['mean_ms']:>10}{r['throughput_rps']:>10}")
+
+
+if __name__ == '__main__':
+    main()
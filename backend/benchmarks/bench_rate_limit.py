@@ -0,0 +1,114 @@
+"""Measures the per-request overhead of the rate limiter on each storage.
+
+Every hit goes through the same limits strategy Flask-Limiter uses
+(sliding window counter), spread over ``--clients`` client keys:
+
+- ``memory``: per-process counters (no sharing, the baseline)
+- ``redis``: the Redis tier alone, one pipelined round trip per hit
+- ``tiered``: the Redis tier behind the local token lease
+
+The Redis modes need a Redis server (``--redis-url``, default REDIS_BROKER_URL):
+
+    python benchmarks/bench_rate_limit.py --hits 20000 --concurrency 8
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from limits import parse  # noqa: E402
+from limits.storage import MemoryStorage  # noqa: E402
+from limits.strategies import SlidingWindowCounterRateLimiter  # noqa: E402
+
+from rate_limit import TieredRedisStorage  # noqa: E402
+
+MODES = ('memory', 'redis', 'tiered')
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def make_storage(mode, redis_url, lease_fraction):
+    if mode == 'memory':
+        return MemoryStorage()
+    return TieredRedisStorage(f"tiered+{redis_url}", lease_fraction=0 if mode == 'redis' else lease_fraction)
+
+
+def run_mode(mode, hits, concurrency, clients, limit, redis_url, lease_fraction):
+    storage = make_storage(mode, redis_url, lease_fraction)
+    limiter = SlidingWindowCounterRateLimiter(storage)
+    item = parse(limit)
+    # A fresh namespace per run, so earlier runs' counters do not refuse hits.
+    run_id = uuid.uuid4().hex[:8]
+
+    def timed(i):
+        start = time.perf_counter()
+        allowed = limiter.hit(item, run_id, f"client-{i % clients}")
+        return time.perf_counter() - start, allowed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed, range(hits)))
+    elapsed = time.perf_counter() - started
+    latencies = [latency for latency, _ in results]
+
+    result = {
+        'mode': mode,
+        'hits': hits,
+        'concurrency': concurrency,
+        'allowed': sum(1 for _, allowed in results if allowed),
+        'p50_us': round(statistics.median(latencies) * 1e6, 1),
+        'p99_us': round(percentile(latencies, 99) * 1e6, 1),
+        'mean_us': round(statistics.mean(latencies) * 1e6, 1),
+        'throughput_hps': round(hits / elapsed),
+        'round_trips_per_hit': None,
+    }
+    if isinstance(storage, TieredRedisStorage):
+        result['round_trips_per_hit'] = round(storage.stats()['redis_round_trips'] / hits, 3)
+        storage.reset()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', default=','.join(MODES), help=f"comma-separated subset of {MODES}")
+    parser.add_argument('--hits', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=50, help='distinct client keys the hits are spread over')
+    parser.add_argument('--limit', default='1000 per hour', help='limit per client, in Flask-Limiter notation')
+    parser.add_argument('--lease-fraction', type=float, default=0.1, help='RATE_LIMIT_LEASE_FRACTION of tiered')
+    parser.add_argument('--redis-url', default=os.environ.get('REDIS_BROKER_URL', 'redis://localhost:6379/0'))
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(sorted(unknown))}")
+
+    results = [run_mode(mode, args.hits, args.concurrency, args.clients, args.limit, args.redis_url,
+                        args.lease_fraction)
+               for mode in modes]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'mode':<10}{'p50 us':>10}{'p99 us':>10}{'mean us':>10}{'hits/s':>10}{'RTT/hit':>10}{'allowed':>10}")
+    for r in results:
+        round_trips = '-' if r['round_trips_per_hit'] is None else r['round_trips_per_hit']
+        print(f"{r['mode']:<10}{r['p50_us']:>10}{r['p99_us']:>10}{r['mean_us']:>10}{r['throughput_hps']:>10}"
+              f"{round_trips:>10}{r['allowed']:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,379 @@
+"""Offline load test of the web API against the stub yt-dlp and a local media server.
+
+The app runs in this process on a threaded werkzeug server with the stub
+yt_dlp from ``benchmarks/stub`` (CLI and pool mode), whose formats point at
+``benchmarks/media_server.py``; nothing leaves the machine. Each scenario runs
+``--concurrency`` clients for ``--duration`` seconds:
+
+- ``info``: POST /api/download over ``--distinct-urls`` videos (misses, then cache hits)
+- ``download``: POST /api/process-video, long-poll /api/status, then fetch the file
+- ``status``: GET /api/status of a finished task
+- ``file``: GET /downloads/<file> of a finished task
+
+Reports requests/s and p50/p95/p99 latency per endpoint plus peak RSS and
+thread count, as a table or JSON (``--json``, ``--output``, ``--append`` to
+keep a history for regression tracking):
+
+    python benchmarks/loadtest.py --duration 20 --concurrency 8 --append loadtest-history.jsonl
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARKS_DIR)
+STUB_DIR = os.path.join(BENCHMARKS_DIR, 'stub')
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+# Pool workers inherit sys.path, so they import the stub instead of real yt_dlp.
+sys.path.insert(0, STUB_DIR)
+
+from media_server import MediaServer  # noqa: E402
+
+SCENARIOS = ('info', 'download', 'status', 'file')
+SAMPLE_INTERVAL = 0.1
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Recorder:
+    """Latencies, status codes and bytes per endpoint for one scenario."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, endpoint, seconds, status, nbytes=0):
+        with self._lock:
+            entry = self._endpoints.setdefault(endpoint, {'latencies': [], 'codes': {}, 'errors': 0, 'bytes': 0})
+            entry['latencies'].append(seconds)
+            entry['codes'][str(status)] = entry['codes'].get(str(status), 0) + 1
+            entry['bytes'] += nbytes
+            if not isinstance(status, int) or status >= 400:
+                entry['errors'] += 1
+
+    def summary(self, elapsed):
+        with self._lock:
+            endpoints = dict(self._endpoints)
+        result = {}
+        for endpoint, entry in endpoints.items():
+            latencies = entry['latencies']
+            result[endpoint] = {
+                'requests': len(latencies),
+                'errors': entry['errors'],
+                'status_codes': entry['codes'],
+                'throughput_rps': round(len(latencies) / elapsed, 2),
+                'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+                'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+                'mean_ms': round(sum(latencies) / len(latencies) * 1000, 1),
+                'max_ms': round(max(latencies) * 1000, 1),
+                'bytes': entry['bytes'],
+            }
+        return result
+
+
+def proc_status(pid='self'):
+    """``(VmRSS bytes, thread count)`` from /proc, or None where /proc is unavailable."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+    except OSError:
+        return None
+    return int(fields['VmRSS'].split()[0]) * 1024, int(fields['Threads'])
+
+
+def child_pids():
+    try:
+        tasks = os.listdir('/proc/self/task')
+    except OSError:
+        return []
+    pids = []
+    for task in tasks:
+        try:
+            with open(f'/proc/self/task/{task}/children') as f:
+                pids.extend(f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+class ResourceSampler:
+    """Samples RSS and thread counts of this process (the app server) and of its
+    children (extractor pool workers, yt-dlp subprocesses) every 100 ms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._reset()
+
+    def _reset(self):
+        self._peaks = {'peak_rss_bytes': 0, 'peak_threads': 0, 'peak_children': 0, 'peak_children_rss_bytes': 0}
+
+    def start(self):
+        threading.Thread(target=self._run, name='resource-sampler', daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            self._sample()
+
+    def _sample(self):
+        own = proc_status() or (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+                                threading.active_count())
+        children = [status for status in map(proc_status, child_pids()) if status]
+        sample = {
+            'peak_rss_bytes': own[0],
+            'peak_threads': own[1],
+            'peak_children': len(children),
+            'peak_children_rss_bytes': sum(rss for rss, _ in children),
+        }
+        with self._lock:
+            for name, value in sample.items():
+                self._peaks[name] = max(self._peaks[name], value)
+
+    def mark(self):
+        """Returns the peaks since the previous mark and starts a new window.
+        Samples once more first, so a window shorter than the interval (or one in
+        which the sampler thread got no CPU) still reports its end state.
+        """
+        self._sample()
+        with self._lock:
+            peaks = dict(self._peaks)
+            self._reset()
+        return peaks
+
+
+class LoadTest:
+    def __init__(self, base_url, args):
+        self.base_url = base_url
+        self.args = args
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def next_number(self):
+        with self._lock:
+            self._counter += 1
+            return self._counter
+
+    def timed(self, recorder, endpoint, session, method, path, consume=False, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = session.request(method, self.base_url + path, stream=consume, timeout=60, **kwargs)
+            nbytes = sum(len(chunk) for chunk in response.iter_content(256 * 1024)) if consume else 0
+        except requests.RequestException as e:
+            recorder.record(endpoint, time.perf_counter() - started, type(e).__name__)
+            return None
+        recorder.record(endpoint, time.perf_counter() - started, response.status_code, nbytes)
+        return response
+
+    def download_once(self, session, recorder):
+        """Runs one download end to end; returns the final status payload or None."""
+        url = f"https://www.youtube.com/watch?v=lt{self.next_number():09d}"
+        started = time.perf_counter()
+        # The info lookup primes the cache the quota estimate is read from, like the frontend does.
+        self.timed(recorder, 'POST /api/download', session, 'POST', '/api/download', json={'url': url})
+        response = self.timed(recorder, 'POST /api/process-video', session, 'POST', '/api/process-video',
+                              json={'url': url, 'format_id': self.args.format_id})
+        if response is None or response.status_code != 200:
+            return None
+        task_id = response.json()['task_id']
+
+        status = {'status': None, 'percentage': None}
+        while status['status'] not in ('Completed', 'Failed'):
+            params = {'wait': 10, 'status': status['status'] or '', 'percentage': status['percentage'] or ''}
+            response = self.timed(recorder, 'GET /api/status (long-poll)', session, 'GET',
+                                  f'/api/status/{task_id}', params=params)
+            if response is None or response.status_code != 200:
+                return None
+            status = response.json()
+        if status['status'] == 'Completed':
+            self.timed(recorder, 'GET /downloads/', session, 'GET', status['download_link'], consume=True)
+        recorder.record('download end-to-end', time.perf_counter() - started,
+                        200 if status['status'] == 'Completed' else 500)
+        return dict(status, task_id=task_id)
+
+    def scenario_info(self, session, recorder, worker):
+        number = self.next_number()
+        if self.args.distinct_urls:
+            number %= self.args.distinct_urls
+        self.timed(recorder, 'POST /api/download', session, 'POST', '/api/download',
+                   json={'url': f"https://www.youtube.com/watch?v=in{number:09d}"})
+
+    def scenario_download(self, session, recorder, worker):
+        self.download_once(session, recorder)
+
+    def scenario_status(self, session, recorder, worker):
+        self.timed(recorder, 'GET /api/status', session, 'GET', f"/api/status/{self.finished['task_id']}")
+
+    def scenario_file(self, session, recorder, worker):
+        self.timed(recorder, 'GET /downloads/', session, 'GET', self.finished['download_link'], consume=True)
+
+    def prepare(self, name):
+        if name in ('status', 'file') and not getattr(self, 'finished', None):
+            with requests.Session() as session:
+                self.finished = self.download_once(session, Recorder())
+            if not self.finished or self.finished['status'] != 'Completed':
+                raise RuntimeError(f"Setup download for the {name} scenario failed: {self.finished}")
+
+    def run(self, name, sampler):
+        self.prepare(name)
+        step = getattr(self, f'scenario_{name}')
+        recorder = Recorder()
+        deadline = time.monotonic() + self.args.duration
+        sampler.mark()
+
+        def client(worker):
+            with requests.Session() as session:
+                while time.monotonic() < deadline:
+                    step(session, recorder, worker)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(i,), name=f'client-{i}') for i in range(self.args.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        return {
+            'duration_s': round(elapsed, 2),
+            'endpoints': recorder.summary(elapsed),
+            'resources': sampler.mark(),
+        }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def configure_environment(args, media_url):
+    """App and stub settings; must run before ``app`` is imported."""
+    os.environ.update({
+        'YTDLP_PATH': os.path.join(STUB_DIR, 'yt-dlp'),
+        'EXTRACTOR_MODE': args.extractor_mode,
+        'DOWNLOADER_MODE': 'native',
+        'DOWNLOAD_BACKEND': 'thread',
+        'QUOTA_BACKEND': 'file',
+        'RECAPTCHA_SECRET_KEY': '',
+        'STUB_YTDLP_MEDIA_URL': media_url,
+        'STUB_YTDLP_SPEED': str(args.speed),
+        'STUB_YTDLP_SIZE_SCALE': str(args.size_scale),
+        'STUB_YTDLP_IMPORT_SECONDS': str(args.import_seconds),
+        'STUB_YTDLP_EXTRACT_SECONDS': str(args.extract_seconds),
+    })
+    # Every client is 127.0.0.1, so the per-user queue limit would cap the load.
+    os.environ.setdefault('DOWNLOAD_QUEUE_SIZE', str(max(50, args.concurrency * 4)))
+    os.environ.setdefault('DOWNLOAD_QUEUE_PER_USER', str(max(5, args.concurrency * 4)))
+    os.environ.pop('REDIS_BROKER_URL', None)
+
+
+def print_table(result):
+    print(f"{'scenario / endpoint':<40}{'req':>7}{'err':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, scenario in result['scenarios'].items():
+        res = scenario['resources']
+        print(f"{name} ({scenario['duration_s']}s, peak RSS {res['peak_rss_bytes'] / 1024 ** 2:.0f} MiB"
+              f" + children {res['peak_children_rss_bytes'] / 1024 ** 2:.0f} MiB, {res['peak_threads']} threads)")
+        for endpoint, s in scenario['endpoints'].items():
+            print(f"  {endpoint:<38}{s['requests']:>7}{s['errors']:>6}{s['throughput_rps']:>9}"
+                  f"{s['p50_ms']:>9}{s['p95_ms']:>9}{s['p99_ms']:>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f"comma-separated subset of {SCENARIOS}")
+    parser.add_argument('--duration', type=float, default=10, help='seconds per scenario')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--extractor-mode', choices=('pool', 'subprocess'), default='pool')
+    parser.add_argument('--distinct-urls', type=int, default=20,
+                        help='videos the info scenario cycles through (0 = every lookup is a cache miss)')
+    parser.add_argument('--format-id', default='18')
+    parser.add_argument('--speed', type=float, default=20 * 1024 * 1024, help='stub download speed, bytes/s')
+    parser.add_argument('--size-scale', type=float, default=0.01, help='multiplier of the stub formats\' sizes')
+    parser.add_argument('--media-rate', type=float, default=0, help='media server rate per connection, bytes/s')
+    parser.add_argument('--import-seconds', type=float, default=0.25, help='simulated yt_dlp import cost')
+    parser.add_argument('--extract-seconds', type=float, default=0.05, help='simulated extractor time')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    parser.add_argument('--output', help='write the JSON result to this file')
+    parser.add_argument('--append', help='append the JSON result as one line to this history file')
+    args = parser.parse_args(argv)
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    media_server = MediaServer(rate=args.media_rate)
+    configure_environment(args, media_server.start())
+    # DOWNLOADS_DIR and the log file are relative to the working directory.
+    workdir = tempfile.mkdtemp(prefix='creator-tools-loadtest-')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import app as backend
+        from werkzeug.serving import make_server
+
+        backend.app.config['WTF_CSRF_ENABLED'] = False
+        backend.limiter.enabled = False
+        server = make_server('127.0.0.1', 0, backend.app, threaded=True)
+        threading.Thread(target=server.serve_forever, name='app-server', daemon=True).start()
+
+        sampler = ResourceSampler()
+        sampler.start()
+        load_test = LoadTest(f"http://127.0.0.1:{server.server_port}", args)
+        result = {
+            'meta': {
+                'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'git_commit': git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'config': vars(args),
+            },
+            'scenarios': {name: load_test.run(name, sampler) for name in scenarios},
+            'max_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            'max_child_rss_bytes': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024,
+        }
+        sampler.stop()
+        server.shutdown()
+        backend.extraction_engine.shutdown()
+    finally:
+        os.chdir(cwd)
+        media_server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.append:
+        with open(args.append, 'a') as f:
+            f.write(json.dumps(result) + '\n')
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_table(result)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""Local HTTP server with synthetic media files for offline benchmarks.
+
+``GET /media/<name>-<size>.<ext>`` returns ``size`` deterministic bytes (with
+Range support), optionally throttled to ``--rate`` bytes/s per connection. The
+stub yt_dlp points its format URLs here when STUB_YTDLP_MEDIA_URL is set:
+
+    python benchmarks/media_server.py --port 8765 --rate 5000000
+"""
+import argparse
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHUNK_SIZE = 64 * 1024
+PATTERN = bytes(range(256)) * (CHUNK_SIZE // 256)
+MEDIA_PATH = re.compile(r'^/media/[\w.-]+-(\d+)\.(\w+)$')
+CONTENT_TYPES = {'mp4': 'video/mp4', 'm4a': 'audio/mp4', 'webm': 'video/webm', 'mp3': 'audio/mpeg'}
+
+
+def media_bytes(start, end):
+    """Yields the synthetic content of byte range [start, end)."""
+    position = start
+    while position < end:
+        offset = position % len(PATTERN)
+        chunk = PATTERN[offset:offset + min(CHUNK_SIZE, end - position)]
+        position += len(chunk)
+        yield chunk
+
+
+class MediaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self):
+        self.handle_media(send_body=False)
+
+    def do_GET(self):
+        self.handle_media(send_body=True)
+
+    def handle_media(self, send_body):
+        match = MEDIA_PATH.match(self.path.split('?', 1)[0])
+        if not match:
+            self.send_error(404)
+            return
+        size = int(match.group(1))
+        start, end = 0, size
+        range_match = re.match(r'bytes=(\d*)-(\d*)$', self.headers.get('Range', ''))
+        if range_match and (range_match.group(1) or range_match.group(2)):
+            if range_match.group(1):
+                start = int(range_match.group(1))
+                end = min(size, int(range_match.group(2)) + 1) if range_match.group(2) else size
+            else:
+                start = max(0, size - int(range_match.group(2)))
+            if start >= end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end - 1}/{size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPES.get(match.group(2), 'application/octet-stream'))
+        self.send_header('Content-Length', str(end - start))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        if not send_body:
+            return
+
+        rate = self.server.rate
+        started = time.monotonic()
+        sent = 0
+        try:
+            for chunk in media_bytes(start, end):
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                if rate:
+                    ahead = sent / rate - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MediaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, rate=0):
+        super().__init__((host, port), MediaHandler)
+        self.rate = rate
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serves on a background thread; returns the base URL."""
+        threading.Thread(target=self.serve_forever, name='media-server', daemon=True).start()
+        return self.url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--rate', type=float, default=0, help='bytes/s per connection, 0 = unthrottled')
+    args = parser.parse_args()
+
+    server = MediaServer(args.host, args.port, args.rate)
+    print(f"Serving synthetic media on {server.url}/media/<name>-<size>.<ext>")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
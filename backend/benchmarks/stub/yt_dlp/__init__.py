@@ -0,0 +1,264 @@
+"""Local stand-in for the yt_dlp package used by the benchmarks.
+
+It exposes the small part of the API the backend uses (``YoutubeDL`` and the
+CLI: ``--dump-json``, ``--flat-playlist --dump-single-json`` and downloads
+with ``-o``/``--progress-template``/``--print``) and never touches the
+internet. Knobs, all environment variables:
+
+- ``STUB_YTDLP_IMPORT_SECONDS``: one-off cost of importing yt_dlp and loading
+  its extractor registry (paid by every CLI invocation, once per pool worker).
+- ``STUB_YTDLP_EXTRACT_SECONDS``: per-lookup extractor time (network I/O).
+- ``STUB_YTDLP_MEDIA_URL``: base URL of ``benchmarks/media_server.py``. When
+  set, downloads fetch the format's bytes from it; otherwise they are generated.
+- ``STUB_YTDLP_SPEED``: download speed in bytes/s (default 20 MiB/s).
+- ``STUB_YTDLP_SIZE_SCALE``: multiplies every format's file size, so load tests
+  can use realistic format lists with small files.
+- ``STUB_YTDLP_PLAYLIST_SIZE``: number of entries of a playlist URL.
+"""
+import json
+import os
+import re
+import sys
+import time
+import urllib.request
+
+IMPORT_SECONDS = float(os.environ.get('STUB_YTDLP_IMPORT_SECONDS', '0.25'))
+EXTRACT_SECONDS = float(os.environ.get('STUB_YTDLP_EXTRACT_SECONDS', '0.05'))
+MEDIA_URL = os.environ.get('STUB_YTDLP_MEDIA_URL', '').rstrip('/')
+SPEED = float(os.environ.get('STUB_YTDLP_SPEED', 20 * 1024 * 1024))
+SIZE_SCALE = float(os.environ.get('STUB_YTDLP_SIZE_SCALE', '1'))
+PLAYLIST_SIZE = int(os.environ.get('STUB_YTDLP_PLAYLIST_SIZE', '25'))
+
+CHUNK_SIZE = 64 * 1024
+PROGRESS_INTERVAL = 0.1
+
+time.sleep(IMPORT_SECONDS)
+
+FORMATS = (
+    {'format_id': '140', 'ext': 'm4a', 'resolution': 'audio only', 'format_note': 'medium',
+     'filesize': 3_900_000, 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'protocol': 'https'},
+    {'format_id': '18', 'ext': 'mp4', 'resolution': '640x360', 'format_note': '360p',
+     'filesize': 14_000_000, 'vcodec': 'avc1.42001E', 'acodec': 'mp4a.40.2', 'protocol': 'https'},
+    {'format_id': '137', 'ext': 'mp4', 'resolution': '1920x1080', 'format_note': '1080p',
+     'filesize': 88_000_000, 'vcodec': 'avc1.640028', 'acodec': 'none', 'protocol': 'https'},
+)
+
+
+class DownloadError(Exception):
+    pass
+
+
+def video_id_of(url):
+    return url.rstrip('/').rsplit('/', 1)[-1].split('v=')[-1][:11] or 'stubvideo00'
+
+
+def fake_info(url):
+    video_id = video_id_of(url)
+    formats = []
+    for f in FORMATS:
+        f = dict(f, filesize=max(1, int(f['filesize'] * SIZE_SCALE)))
+        if MEDIA_URL:
+            f['url'] = f"{MEDIA_URL}/media/{video_id}-{f['format_id']}-{f['filesize']}.{f['ext']}"
+        formats.append(f)
+    return {
+        'id': video_id,
+        'extractor_key': 'Youtube',
+        'webpage_url': url,
+        'title': f'Stub video {video_id}',
+        'uploader': 'Stub Creator',
+        'thumbnail': f'https://i.ytimg.com/vi/{video_id}/maxresdefault.jpg',
+        'view_count': 123456,
+        'like_count': 4321,
+        'comment_count': 210,
+        'duration': 245,
+        'categories': ['Education'],
+        'upload_date': '20240101',
+        'formats': formats,
+    }
+
+
+def fake_playlist(url):
+    list_id = url.split('list=')[-1][:34] or 'stublist'
+    return {
+        '_type': 'playlist',
+        'id': list_id,
+        'title': f'Stub playlist {list_id}',
+        'uploader': 'Stub Creator',
+        'entries': [{
+            '_type': 'url',
+            'id': f'{list_id[:6]}{i:05d}',
+            'url': f'https://www.youtube.com/watch?v={list_id[:6]}{i:05d}',
+            'title': f'Stub entry {i}',
+            'duration': 245,
+        } for i in range(PLAYLIST_SIZE)],
+    }
+
+
+def select_formats(info, selector):
+    """Resolves ``-f``: format IDs joined by ``+``; anything else picks format 18."""
+    by_id = {f['format_id']: f for f in info['formats']}
+    picked = [by_id.get(part) for part in selector.split('+')]
+    if not all(picked):
+        picked = [by_id['18']]
+    return picked
+
+
+def _chunks(fmt, rate_limit):
+    """Yields the format's bytes at the configured speed (or ``rate_limit`` if lower)."""
+    speed = min(SPEED, rate_limit) if rate_limit else SPEED
+    source = urllib.request.urlopen(fmt['url'], timeout=30) if fmt.get('url') else None
+    remaining = fmt['filesize']
+    started = time.monotonic()
+    sent = 0
+    try:
+        while remaining > 0:
+            size = min(CHUNK_SIZE, remaining)
+            chunk = source.read(size) if source else b'\0' * size
+            if not chunk:
+                raise DownloadError('ERROR: unable to download video data: connection closed')
+            remaining -= len(chunk)
+            sent += len(chunk)
+            ahead = sent / speed - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+            yield chunk
+    finally:
+        if source:
+            source.close()
+
+
+def download(info, selector, out, progress=None, rate_limit=None):
+    """Writes the selected formats to ``out`` (a binary file object) and reports
+    yt-dlp style progress dicts to ``progress`` every 100 ms."""
+    formats = select_formats(info, selector)
+    total = sum(f['filesize'] for f in formats)
+    done = 0
+    started = last_report = time.monotonic()
+    for fmt in formats:
+        for chunk in _chunks(fmt, rate_limit):
+            out.write(chunk)
+            done += len(chunk)
+            now = time.monotonic()
+            if progress and (now - last_report >= PROGRESS_INTERVAL or done == total):
+                last_report = now
+                elapsed = now - started
+                speed = done / elapsed if elapsed else None
+                progress({
+                    'status': 'downloading', 'downloaded_bytes': done, 'total_bytes': total,
+                    'speed': speed, 'eta': int((total - done) / speed) if speed else None, 'elapsed': elapsed,
+                })
+    if progress:
+        progress({'status': 'finished', 'downloaded_bytes': done, 'total_bytes': total,
+                  'elapsed': time.monotonic() - started})
+    return formats
+
+
+def output_path(template, info, formats):
+    ext = formats[0]['ext'] if len(formats) == 1 else 'mp4'
+    fields = dict(info, ext=ext, format_id='+'.join(f['format_id'] for f in formats))
+    return re.sub(r'%\((\w+)\)s', lambda m: str(fields.get(m.group(1), 'NA')), template)
+
+
+def parse_rate(text):
+    if not text:
+        return None
+    match = re.match(r'([\d.]+)([KMG]?)', text, re.I)
+    factor = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}[match.group(2).upper()]
+    return float(match.group(1)) * factor
+
+
+class YoutubeDL:
+    def __init__(self, params=None):
+        self.params = params or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def extract_info(self, url, download=True):
+        time.sleep(EXTRACT_SECONDS)
+        if self.params.get('extract_flat') and 'list=' in url:
+            return fake_playlist(url)
+        info = fake_info(url)
+        if download and not self.params.get('skip_download'):
+            self._download(info)
+        return info
+
+    def _download(self, info):
+        hooks = self.params.get('progress_hooks') or []
+        selector = self.params.get('format') or 'best'
+        path = output_path(self.params.get('outtmpl') or '%(id)s.%(ext)s', info, select_formats(info, selector))
+        try:
+            with open(path, 'wb') as out:
+                download(info, selector, out, progress=lambda d: [hook(d) for hook in hooks],
+                         rate_limit=self.params.get('ratelimit'))
+        except (OSError, DownloadError) as e:
+            raise DownloadError(f"ERROR: {e}") from None
+        for hook in self.params.get('postprocessor_hooks') or []:
+            hook({'status': 'finished', 'info_dict': dict(info, filepath=path)})
+        info['requested_downloads'] = [{'filepath': path}]
+
+    def sanitize_info(self, info):
+        return info
+
+
+def _option(argv, name, default=None):
+    return argv[argv.index(name) + 1] if name in argv else default
+
+
+def _render_progress(template, d):
+    def field(match):
+        value = d.get(match.group(1))
+        if value is None:
+            return match.group(2) or 'NA'
+        return str(value)
+    return re.sub(r'%\(progress\.(\w+)(?:\|(\w*))?\)s', field, template)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    urls = [a for a in argv if a.startswith('http')]
+    if not urls:
+        print('ERROR: no URL given', file=sys.stderr)
+        return 2
+    url = urls[-1]
+    ydl = YoutubeDL()
+
+    if '--dump-single-json' in argv and '--flat-playlist' in argv:
+        print(json.dumps(fake_playlist(url) if 'list=' in url else ydl.extract_info(url, download=False)))
+        return 0
+    if '--dump-json' in argv:
+        print(json.dumps(ydl.extract_info(url, download=False)))
+        return 0
+
+    info = ydl.extract_info(url, download=False)
+    selector = _option(argv, '-f', 'best')
+    template = _option(argv, '-o', '%(id)s.%(ext)s')
+    progress_template = _option(argv, '--progress-template', '')
+    progress_template = progress_template.split(':', 1)[1] if progress_template.startswith('download:') else None
+    rate_limit = parse_rate(_option(argv, '--limit-rate'))
+
+    def report(d):
+        if progress_template and d['status'] == 'downloading':
+            print(_render_progress(progress_template, d), flush=True)
+
+    try:
+        if template == '-':
+            download(info, selector, sys.stdout.buffer, rate_limit=rate_limit)
+            sys.stdout.buffer.flush()
+            return 0
+        formats = select_formats(info, selector)
+        path = output_path(template, info, formats)
+        with open(path + '.part', 'wb') as out:
+            download(info, selector, out, progress=report, rate_limit=rate_limit)
+        os.replace(path + '.part', path)
+    except (OSError, DownloadError) as e:
+        print(f"ERROR: {e}", file=sys.stderr if template == '-' else sys.stdout, flush=True)
+        return 1
+
+    printed = _option(argv, '--print')
+    if printed and printed.startswith('after_move:'):
+        print(re.sub(r'%\(filepath\)s', path, printed.split(':', 1)[1]), flush=True)
+    return 0
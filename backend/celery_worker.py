@@ -0,0 +1,37 @@
+import os
+
+from celery import Celery
+
+from redis_client import REDIS_URL
+
+# Large video downloads and small audio-only downloads run on separate worker
+# pools so a burst of long videos cannot hold up quick audio rips:
+#   celery -A celery_worker.celery_app worker -Q video --concurrency=2
+#   celery -A celery_worker.celery_app worker -Q audio --concurrency=8
+VIDEO_QUEUE = os.environ.get('CELERY_VIDEO_QUEUE', 'video')
+AUDIO_QUEUE = os.environ.get('CELERY_AUDIO_QUEUE', 'audio')
+
+celery_app = Celery('creator_tools', broker=REDIS_URL, backend=REDIS_URL)
+celery_app.conf.update(
+    task_default_queue=VIDEO_QUEUE,
+    # A download is only acknowledged once it finished, and a worker takes one
+    # job at a time, so jobs of a crashed node are redelivered to another one.
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    worker_prefetch_multiplier=1,
+    result_expires=24 * 3600,
+)
+
+
+def _backend():
+    """Imports the Flask app module lazily; it imports this module to enqueue jobs."""
+    # Task records must go to Redis so the web nodes can read them.
+    os.environ.setdefault('DOWNLOAD_BACKEND', 'celery')
+    import app
+    return app
+
+
+@celery_app.task(name='download_video_task')
+def download_video_task(url, format_id, task_id, user_identifier='unknown', custom_filename=None):
+    """Downloads one video on a worker node; progress and the result land in Redis."""
+    return _backend().run_worker_download(task_id, url, format_id, user_identifier, custom_filename)
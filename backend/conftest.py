@@ -0,0 +1,173 @@
+import atexit
+import fnmatch
+import functools
+import os
+import shutil
+import tempfile
+import threading
+
+# app.py reads JOB_JOURNAL_PATH when it is imported; the tests' journal goes to a
+# temporary directory instead of the source tree.
+_journal_dir = tempfile.mkdtemp(prefix='creator-tools-tests-')
+atexit.register(shutil.rmtree, _journal_dir, ignore_errors=True)
+os.environ.setdefault('JOB_JOURNAL_PATH', os.path.join(_journal_dir, 'jobs.db'))
+
+from quota import RESERVE_SCRIPT  # noqa: E402
+from singleflight import RELEASE_LOCK_SCRIPT  # noqa: E402
+from task_store import UPDATE_IF_STATUS_SCRIPT  # noqa: E402
+
+
+def _command(method):
+    """Counts a FakeRedis command and runs it atomically, like the server would."""
+
+    @functools.wraps(method)
+    def run(self, *args, **kwargs):
+        with self.lock:
+            self.commands += 1
+            return method(self, *args, **kwargs)
+    return run
+
+
+class FakeRedis:
+    """The part of the Redis API the backend uses, emulated in Python with one
+    keyspace. The Lua scripts are emulated by name (``SCRIPTS``). Shared by
+    several stores, it stands in for one Redis server behind several gunicorn
+    workers."""
+
+    def __init__(self):
+        self.data = {}
+        self.expiry = {}
+        self.commands = 0
+        self.pipelines = 0
+        self.lock = threading.RLock()
+
+    def pipeline(self):
+        self.pipelines += 1
+        return FakePipeline(self)
+
+    @_command
+    def get(self, key):
+        value = self.data.get(key)
+        return str(value) if isinstance(value, int) else value
+
+    @_command
+    def mget(self, *keys):
+        if len(keys) == 1 and isinstance(keys[0], (list, tuple)):
+            keys = keys[0]
+        return [self.get(key) for key in keys]
+
+    @_command
+    def set(self, key, value, nx=False, px=None, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    @_command
+    def exists(self, key):
+        return int(key in self.data)
+
+    @_command
+    def incrby(self, key, amount):
+        self.data[key] = int(self.data.get(key, 0)) + int(amount)
+        return self.data[key]
+
+    def decrby(self, key, amount):
+        return self.incrby(key, -amount)
+
+    @_command
+    def expire(self, key, seconds):
+        self.expiry[key] = int(seconds)
+        return True
+
+    @_command
+    def ttl(self, key):
+        return self.expiry.get(key, -1) if key in self.data else -2
+
+    @_command
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+            self.expiry.pop(key, None)
+
+    @_command
+    def scan_iter(self, match='*', count=None):
+        return [key for key in list(self.data) if fnmatch.fnmatch(key, match)]
+
+    @_command
+    def hset(self, key, mapping):
+        self.data.setdefault(key, {}).update(mapping)
+
+    @_command
+    def hsetnx(self, key, field, value):
+        self.data.setdefault(key, {}).setdefault(field, value)
+
+    @_command
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    @_command
+    def sadd(self, key, *members):
+        self.data.setdefault(key, set()).update(members)
+
+    @_command
+    def srem(self, key, *members):
+        self.data.get(key, set()).difference_update(members)
+
+    @_command
+    def smembers(self, key):
+        return set(self.data.get(key, ()))
+
+    @_command
+    def eval(self, script, numkeys, *keys_and_args):
+        return SCRIPTS[script](self, keys_and_args[:numkeys], keys_and_args[numkeys:])
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((getattr(self.redis, name), args, kwargs))
+
+    def execute(self):
+        with self.redis.lock:
+            return [method(*args, **kwargs) for method, args, kwargs in self.calls]
+
+
+def _reserve(redis, keys, args):
+    amount, limit, ttl = args
+    used = int(redis.data.get(keys[0], 0))
+    if used >= limit or (amount > 0 and used + amount > limit):
+        return -1
+    total = redis.incrby(keys[0], amount)
+    redis.expire(keys[0], ttl)
+    return total
+
+
+def _release_lock(redis, keys, args):
+    if redis.data.get(keys[0]) == args[0]:
+        redis.delete(keys[0])
+        return 1
+    return 0
+
+
+def _update_if_status(redis, keys, args):
+    ttl, exclude, count, *rest = args
+    fields = redis.data.get(keys[0])
+    if not fields or 'status' not in fields:
+        return 0
+    statuses, pairs = rest[:int(count)], rest[int(count):]
+    if (fields['status'] in statuses) == (str(exclude) == '1'):
+        return 0
+    fields.update(zip(pairs[::2], pairs[1::2]))
+    redis.expire(keys[0], ttl)
+    return 1
+
+
+SCRIPTS = {
+    RESERVE_SCRIPT: _reserve,
+    RELEASE_LOCK_SCRIPT: _release_lock,
+    UPDATE_IF_STATUS_SCRIPT: _update_if_status,
+}
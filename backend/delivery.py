@@ -0,0 +1,121 @@
+import mimetypes
+import os
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from flask import Response, request
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+OFFLOAD_NONE = 'none'
+OFFLOAD_X_ACCEL = 'x-accel'        # nginx: X-Accel-Redirect to an internal location
+OFFLOAD_X_SENDFILE = 'x-sendfile'  # Apache mod_xsendfile / lighttpd: X-Sendfile with the absolute path
+
+CHUNK_SIZE = 256 * 1024
+
+
+def content_disposition(name):
+    ascii_name = name.encode('ascii', 'ignore').decode('ascii').replace('"', '') or 'download'
+    return f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(name)}"
+
+
+def _read_range(path, start, length):
+    """Fallback body for servers without ``wsgi.file_wrapper`` (e.g. the dev server)."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+class FileDelivery:
+    """Serves finished artifacts as downloads.
+
+    Supports single HTTP byte ranges (resume), ``ETag``/``Last-Modified``
+    with conditional 304 responses, and hands the open file to the server's
+    ``wsgi.file_wrapper`` so gunicorn can use ``sendfile()``; the file
+    position and Content-Length bound ranged responses. In an offload mode
+    the response carries only headers and the front proxy streams the file,
+    handling ranges and conditionals itself.
+    """
+
+    def __init__(self, directory, offload=OFFLOAD_NONE, accel_prefix='/internal-downloads/'):
+        if offload not in (OFFLOAD_NONE, OFFLOAD_X_ACCEL, OFFLOAD_X_SENDFILE):
+            raise ValueError(f"Unknown file offload mode: {offload}")
+        self.directory = directory
+        self.offload = offload
+        self.accel_prefix = accel_prefix.rstrip('/') + '/'
+
+    def serve(self, filename, download_name=None):
+        path = safe_join(self.directory, filename)
+        if path is None or not os.path.isfile(path):
+            raise NotFound()
+
+        st = os.stat(path)
+        # Artifacts are never rewritten in place, so size + mtime identify the content.
+        etag = f"{st.st_size:x}-{st.st_mtime_ns:x}"
+        last_modified = datetime.fromtimestamp(int(st.st_mtime), tz=timezone.utc)
+        headers = {
+            'Content-Disposition': content_disposition(download_name or filename),
+            'Accept-Ranges': 'bytes',
+            'Cache-Control': 'private, max-age=3600',
+        }
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+        if self.offload == OFFLOAD_X_ACCEL:
+            headers['X-Accel-Redirect'] = self.accel_prefix + quote(filename)
+            return Response(status=200, headers=headers, mimetype=mimetype)
+        if self.offload == OFFLOAD_X_SENDFILE:
+            headers['X-Sendfile'] = os.path.abspath(path)
+            return Response(status=200, headers=headers, mimetype=mimetype)
+
+        response = Response(status=200, headers=headers, mimetype=mimetype)
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        if self._not_modified(etag, last_modified):
+            response.status_code = 304
+            return response
+
+        start, length = 0, st.st_size
+        byte_range = request.range if self._range_applies(etag, last_modified) else None
+        if byte_range is not None:
+            bounds = byte_range.range_for_length(st.st_size)
+            if bounds is None:
+                response.status_code = 416
+                response.headers['Content-Range'] = f"bytes */{st.st_size}"
+                return response
+            start, stop = bounds
+            length = stop - start
+            response.status_code = 206
+            response.headers['Content-Range'] = f"bytes {start}-{stop - 1}/{st.st_size}"
+
+        response.content_length = length
+        response.response = self._body(path, start, length)
+        response.direct_passthrough = True
+        return response
+
+    def _not_modified(self, etag, last_modified):
+        if request.if_none_match:
+            return request.if_none_match.contains_weak(etag)
+        since = request.if_modified_since
+        return since is not None and last_modified <= since
+
+    def _range_applies(self, etag, last_modified):
+        """A Range request only applies when its If-Range validator still matches."""
+        if_range = request.if_range
+        if if_range.etag is not None:
+            return if_range.etag == etag
+        if if_range.date is not None:
+            return if_range.date >= last_modified
+        return True
+
+    def _body(self, path, start, length):
+        file_wrapper = request.environ.get('wsgi.file_wrapper')
+        if file_wrapper is None:
+            return _read_range(path, start, length)
+        f = open(path, 'rb')
+        f.seek(start)
+        return file_wrapper(f, CHUNK_SIZE)
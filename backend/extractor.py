@@ -0,0 +1,270 @@
+import json
+import logging
+import multiprocessing
+import queue
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger(__name__)
+
+MODE_POOL = 'pool'
+MODE_SUBPROCESS = 'subprocess'
+
+# Options shared by every YoutubeDL instance living in a pool worker.
+BASE_YDL_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'noprogress': True,
+}
+
+
+class ExtractionError(Exception):
+    """yt-dlp could not extract or download the requested URL."""
+
+    @property
+    def stderr(self):
+        return str(self)
+
+
+def ytdlp_module_available():
+    try:
+        import yt_dlp  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+# --- Pool worker side -------------------------------------------------------
+# These run inside the pool processes. The YoutubeDL instance (and with it the
+# yt-dlp import and extractor registry) is created once per worker process.
+
+_worker_ydl = None
+
+
+def _init_worker():
+    global _worker_ydl
+    import yt_dlp
+    _worker_ydl = yt_dlp.YoutubeDL(dict(BASE_YDL_OPTS, skip_download=True))
+
+
+def _worker_ping():
+    return _worker_ydl is not None
+
+
+def _worker_extract(url):
+    try:
+        info = _worker_ydl.extract_info(url, download=False)
+        return _worker_ydl.sanitize_info(info)
+    except Exception as e:
+        # yt-dlp exceptions carry exc_info and do not always pickle cleanly.
+        raise ExtractionError(str(e)) from None
+
+
+def _worker_extract_flat(url):
+    import yt_dlp
+    try:
+        with yt_dlp.YoutubeDL(dict(BASE_YDL_OPTS, skip_download=True, extract_flat='in_playlist')) as ydl:
+            return ydl.sanitize_info(ydl.extract_info(url, download=False))
+    except Exception as e:
+        raise ExtractionError(str(e)) from None
+
+
+def _worker_download(url, ydl_opts, progress_queue):
+    import yt_dlp
+
+    final_paths = []
+
+    def progress_hook(d):
+        if progress_queue is None:
+            return
+        progress_queue.put(('progress', {
+            'status': d.get('status'),
+            'downloaded_bytes': d.get('downloaded_bytes'),
+            'total_bytes': d.get('total_bytes') or d.get('total_bytes_estimate'),
+            'speed': d.get('speed'),
+            'eta': d.get('eta'),
+            'fragment_index': d.get('fragment_index'),
+            'fragment_count': d.get('fragment_count'),
+        }))
+
+    def postprocessor_hook(d):
+        if d.get('status') == 'finished' and d.get('info_dict', {}).get('filepath'):
+            final_paths.append(d['info_dict']['filepath'])
+
+    params = dict(BASE_YDL_OPTS, **ydl_opts)
+    params['progress_hooks'] = [progress_hook]
+    params['postprocessor_hooks'] = [postprocessor_hook]
+    try:
+        with yt_dlp.YoutubeDL(params) as ydl:
+            info = ydl.extract_info(url, download=True)
+    except Exception as e:
+        raise ExtractionError(str(e)) from None
+
+    requested = [d['filepath'] for d in (info or {}).get('requested_downloads') or [] if d.get('filepath')]
+    if len(requested) > 1:
+        # Several formats ("a,b") downloaded side by side, one file each.
+        return requested
+    if final_paths:
+        return [final_paths[-1]]
+    return requested
+
+
+def _download_process(url, ydl_opts, events):
+    """Entry point of a download worker process; reports progress and the
+    outcome on ``events``."""
+    try:
+        events.put(('done', _worker_download(url, ydl_opts, events)))
+    except Exception as e:
+        events.put(('error', str(e)))
+
+
+# --- Web process side -------------------------------------------------------
+
+class ExtractionEngine:
+    """Runs yt-dlp metadata extraction and downloads.
+
+    In ``pool`` mode a bounded set of worker processes keeps ``yt_dlp.YoutubeDL``
+    warm, so a lookup only pays for the extractor's network I/O. Downloads run
+    in a process of their own (at most ``download_pool_size`` at once) that a
+    timeout or cancel terminates. ``subprocess``
+    mode spawns the ``yt-dlp`` CLI per call and is used when the yt_dlp package
+    is not importable or when explicitly configured.
+    """
+
+    def __init__(self, mode='auto', pool_size=2, download_pool_size=3, ytdlp_bin='yt-dlp', timeout=120,
+                 kill_grace=5.0):
+        if mode == 'auto':
+            mode = MODE_POOL if ytdlp_module_available() else MODE_SUBPROCESS
+        if mode not in (MODE_POOL, MODE_SUBPROCESS):
+            raise ValueError(f"Unknown extractor mode: {mode}")
+        self.mode = mode
+        self.pool_size = pool_size
+        self.download_pool_size = download_pool_size
+        self.ytdlp_bin = ytdlp_bin
+        self.timeout = timeout
+        self.kill_grace = kill_grace
+        self._info_pool = None
+        self._download_slots = threading.BoundedSemaphore(download_pool_size)
+        self._downloads = set()
+        self._lock = threading.Lock()
+
+    def _get_info_pool(self):
+        with self._lock:
+            if self._info_pool is None:
+                self._info_pool = ProcessPoolExecutor(max_workers=self.pool_size, initializer=_init_worker)
+            return self._info_pool
+
+    def warm_up(self):
+        """Starts every info worker and waits until its YoutubeDL instance is loaded."""
+        if self.mode != MODE_POOL:
+            return
+        pool = self._get_info_pool()
+        futures = [pool.submit(_worker_ping) for _ in range(self.pool_size)]
+        for future in futures:
+            future.result(timeout=self.timeout)
+
+    def extract_info(self, url):
+        """Returns the yt-dlp info dict for ``url`` (equivalent of ``--dump-json``)."""
+        if self.mode == MODE_POOL:
+            return self._run_in_pool(_worker_extract, url)
+        return self._run_cli("--dump-json", "--no-warnings", url)
+
+    def extract_flat(self, url):
+        """Returns a playlist's info dict whose ``entries`` are unresolved stubs
+        (id, url, title), the equivalent of ``--flat-playlist --dump-single-json``.
+        """
+        if self.mode == MODE_POOL:
+            return self._run_in_pool(_worker_extract_flat, url)
+        return self._run_cli("--flat-playlist", "--dump-single-json", "--no-warnings", url)
+
+    def _run_in_pool(self, fn, url):
+        try:
+            return self._get_info_pool().submit(fn, url).result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise ExtractionError(f"Extraction timed out after {self.timeout}s") from None
+
+    def _run_cli(self, *args):
+        command = [self.ytdlp_bin, *args]
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, check=True,
+                                    encoding='utf-8', timeout=self.timeout)
+        except subprocess.CalledProcessError as e:
+            raise ExtractionError(e.stderr or str(e)) from None
+        except subprocess.TimeoutExpired:
+            raise ExtractionError(f"Extraction timed out after {self.timeout}s") from None
+        return json.loads(result.stdout)
+
+    def download(self, url, ydl_opts, progress_callback=None, timeout=None, cancel_event=None):
+        """Downloads ``url`` in a worker process and returns the final file paths
+        (one per format of an ``a,b`` selection, otherwise just one).
+
+        ``progress_callback`` receives yt-dlp progress-hook dicts in this process.
+        Past ``timeout`` or once ``cancel_event`` is set the worker is terminated,
+        so it stops writing the partial files and frees its slot.
+        Only available in pool mode; subprocess downloads are driven by the caller.
+        """
+        if self.mode != MODE_POOL:
+            raise RuntimeError("In-process downloads require pool mode")
+
+        deadline = time.time() + timeout if timeout else None
+
+        def stop_requested():
+            if cancel_event is not None and cancel_event.is_set():
+                raise ExtractionError("Download cancelled")
+            if deadline and time.time() > deadline:
+                raise TimeoutError(f"Download timed out (exceeded {timeout} seconds)")
+
+        while not self._download_slots.acquire(timeout=0.5):
+            stop_requested()
+        try:
+            events = multiprocessing.Queue()
+            process = multiprocessing.Process(target=_download_process, args=(url, ydl_opts, events),
+                                              name='ytdlp-download', daemon=True)
+            process.start()
+            with self._lock:
+                self._downloads.add(process)
+            try:
+                while True:
+                    stop_requested()
+                    try:
+                        kind, payload = events.get(timeout=0.5)
+                    except queue.Empty:
+                        if not process.is_alive() and events.empty():
+                            raise ExtractionError(f"Download worker exited with code {process.exitcode}") from None
+                        continue
+                    if kind == 'progress':
+                        if progress_callback is not None:
+                            progress_callback(payload)
+                    elif kind == 'error':
+                        raise ExtractionError(payload)
+                    else:
+                        process.join(self.kill_grace)
+                        return payload
+            finally:
+                self._stop(process)
+                events.close()
+        finally:
+            self._download_slots.release()
+
+    def _stop(self, process):
+        """Terminates a download worker (SIGTERM, then SIGKILL after ``kill_grace``)."""
+        if process.is_alive():
+            process.terminate()
+            process.join(self.kill_grace)
+            if process.is_alive():
+                process.kill()
+        process.join()
+        with self._lock:
+            self._downloads.discard(process)
+
+    def shutdown(self):
+        with self._lock:
+            if self._info_pool is not None:
+                self._info_pool.shutdown(wait=False, cancel_futures=True)
+            self._info_pool = None
+            downloads = list(self._downloads)
+        for process in downloads:
+            self._stop(process)
@@ -0,0 +1,8 @@
+# Read by gunicorn when it is started from this directory (gunicorn app:app).
+
+
+def post_worker_init(worker):
+    # Resume interrupted jobs as soon as the worker is up rather than on its first
+    # request; app.py leaves this to the hook so a --preload master never does it.
+    from app import job_journal
+    job_journal.ensure_watcher()
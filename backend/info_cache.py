@@ -0,0 +1,257 @@
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlparse
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY_PREFIX = 'info_cache:'
+ALIAS_KEY_PREFIX = 'info_cache:alias:'
+
+# Format URLs are signed and expire; never serve an entry this close to expiry.
+EXPIRY_MARGIN_SECONDS = 300
+
+# Keys that make up most of a --dump-json payload but are never read by the app.
+BULKY_INFO_KEYS = ('automatic_captions', 'subtitles', 'heatmap', 'requested_formats', 'thumbnails')
+BULKY_FORMAT_KEYS = ('fragments', 'http_headers', 'downloader_options')
+
+_YOUTUBE_PATH_ID = re.compile(r'^/(?:shorts|embed|live|v)/([\w-]{11})')
+_TIKTOK_VIDEO_ID = re.compile(r'/video/(\d+)')
+_FACEBOOK_VIDEO_ID = re.compile(r'/(?:videos|reel|watch)/(?:[^/]+/)?(\d+)')
+_TWITTER_STATUS_ID = re.compile(r'/status(?:es)?/(\d+)')
+_INSTAGRAM_CODE = re.compile(r'^/(?:p|reels?|tv)/([\w-]+)')
+
+
+def _strip_www(host):
+    for prefix in ('www.', 'm.', 'mobile.', 'web.'):
+        if host.startswith(prefix):
+            return host[len(prefix):]
+    return host
+
+
+def canonical_video_id(url):
+    """Normalizes a supported URL to a per-platform key such as ``youtube:dQw4w9WgXcQ``.
+
+    Short links that can only be resolved by following a redirect (vm.tiktok.com,
+    fb.watch) get a ``<platform>-short:`` key; once the extractor has run the
+    cache links them to the canonical ID reported by yt-dlp.
+    """
+    parsed = urlparse(url.strip())
+    host = _strip_www((parsed.hostname or '').lower())
+    path = parsed.path.rstrip('/')
+    query = parse_qs(parsed.query)
+
+    if host == 'youtu.be':
+        video_id = path.lstrip('/').split('/')[0]
+        if video_id:
+            return f"youtube:{video_id}"
+    elif host == 'youtube.com':
+        if query.get('v'):
+            return f"youtube:{query['v'][0]}"
+        match = _YOUTUBE_PATH_ID.match(path)
+        if match:
+            return f"youtube:{match.group(1)}"
+    elif host in ('vm.tiktok.com', 'vt.tiktok.com'):
+        return f"tiktok-short:{path.lstrip('/')}"
+    elif host == 'tiktok.com':
+        match = _TIKTOK_VIDEO_ID.search(path)
+        if match:
+            return f"tiktok:{match.group(1)}"
+    elif host == 'fb.watch':
+        return f"facebook-short:{path.lstrip('/')}"
+    elif host == 'facebook.com':
+        if query.get('v'):
+            return f"facebook:{query['v'][0]}"
+        match = _FACEBOOK_VIDEO_ID.search(path)
+        if match:
+            return f"facebook:{match.group(1)}"
+    elif host in ('twitter.com', 'x.com'):
+        match = _TWITTER_STATUS_ID.search(path)
+        if match:
+            return f"twitter:{match.group(1)}"
+    elif host == 'instagram.com':
+        match = _INSTAGRAM_CODE.match(path)
+        if match:
+            return f"instagram:{match.group(1)}"
+    elif host == 'soundcloud.com':
+        return f"soundcloud:{path.lower().lstrip('/')}"
+
+    normalized_query = '&'.join(f"{k}={v}" for k, values in sorted(query.items()) for v in values)
+    return f"url:{host}{path}?{normalized_query}" if normalized_query else f"url:{host}{path}"
+
+
+def info_video_id(video_info):
+    """Returns the canonical key for an extracted info dict, e.g. ``tiktok:7251...``."""
+    extractor = (video_info.get('extractor_key') or video_info.get('extractor') or '').lower()
+    video_id = video_info.get('id')
+    if not extractor or not video_id:
+        return None
+    return f"{extractor}:{video_id}"
+
+
+def _format_url_expiry(video_info):
+    """Earliest expiry timestamp embedded in the signed format URLs, if any."""
+    earliest = None
+    for f in video_info.get('formats') or []:
+        url = f.get('url')
+        if not url:
+            continue
+        query = parse_qs(urlparse(url).query)
+        expires = None
+        try:
+            if query.get('expire'):
+                expires = int(query['expire'][0])
+            elif query.get('oe'):
+                # Facebook/Instagram CDNs encode expiry as hex seconds.
+                expires = int(query['oe'][0], 16)
+        except ValueError:
+            continue
+        if expires and (earliest is None or expires < earliest):
+            earliest = expires
+    return earliest
+
+
+def _compact_info(video_info):
+    compact = {k: v for k, v in video_info.items() if k not in BULKY_INFO_KEYS}
+    compact['formats'] = [
+        {k: v for k, v in f.items() if k not in BULKY_FORMAT_KEYS}
+        for f in video_info.get('formats') or []
+    ]
+    return compact
+
+
+class InfoCache:
+    """Two-tier (in-process LRU + optional Redis) cache of yt-dlp metadata.
+
+    Entries are keyed by canonical video ID and expire after ``ttl`` seconds or
+    shortly before the signed format URLs inside them do, whichever is sooner.
+    Expired entries are reported as misses so the caller re-extracts them.
+    """
+
+    def __init__(self, max_entries=512, ttl=1800, redis_client=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.redis = redis_client
+        self._entries = OrderedDict()  # video key -> (expires_at, info)
+        self._aliases = OrderedDict()  # url key -> video key
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        self.redis_hits = 0
+
+    def _resolve(self, url_key):
+        with self._lock:
+            return self._aliases.get(url_key, url_key)
+
+    def video_key(self, url):
+        """Canonical video key for ``url``, following short links already resolved by an extraction."""
+        return self._resolve(canonical_video_id(url))
+
+    def get(self, url):
+        """Returns cached info for ``url`` or None on a miss or stale entry."""
+        url_key = canonical_video_id(url)
+        video_key = self._resolve(url_key)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(video_key)
+            if entry is not None:
+                expires_at, info = entry
+                if expires_at > now:
+                    self._entries.move_to_end(video_key)
+                    self.hits += 1
+                    return info
+                del self._entries[video_key]
+                self.stale += 1
+
+        info = self._redis_get(url_key)
+        if info is not None:
+            with self._lock:
+                self.hits += 1
+                self.redis_hits += 1
+            return info
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, url, video_info):
+        """Caches ``video_info`` under its canonical ID and links ``url`` to it."""
+        url_key = canonical_video_id(url)
+        video_key = info_video_id(video_info) or url_key
+        now = time.time()
+
+        expires_at = now + self.ttl
+        url_expiry = _format_url_expiry(video_info)
+        if url_expiry:
+            expires_at = min(expires_at, url_expiry - EXPIRY_MARGIN_SECONDS)
+        if expires_at <= now:
+            return
+
+        info = _compact_info(video_info)
+        self._store(url_key, video_key, expires_at, info)
+        self._redis_set(url_key, video_key, expires_at - now, info)
+
+    def _store(self, url_key, video_key, expires_at, info):
+        with self._lock:
+            self._entries[video_key] = (expires_at, info)
+            self._entries.move_to_end(video_key)
+            if url_key != video_key:
+                self._aliases[url_key] = video_key
+                self._aliases.move_to_end(url_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            while len(self._aliases) > self.max_entries:
+                self._aliases.popitem(last=False)
+
+    def _redis_get(self, url_key):
+        if self.redis is None:
+            return None
+        try:
+            video_key = self.redis.get(f"{ALIAS_KEY_PREFIX}{url_key}") or url_key
+            payload = self.redis.get(f"{CACHE_KEY_PREFIX}{video_key}")
+            if not payload:
+                return None
+            ttl_left = self.redis.ttl(f"{CACHE_KEY_PREFIX}{video_key}")
+        except redis.RedisError as e:
+            logger.warning(f"Info cache Redis lookup failed: {e}")
+            return None
+
+        info = json.loads(payload)
+        if ttl_left and ttl_left > 0:
+            self._store(url_key, video_key, time.time() + ttl_left, info)
+        return info
+
+    def _redis_set(self, url_key, video_key, ttl_left, info):
+        if self.redis is None:
+            return
+        ttl_left = max(1, int(ttl_left))
+        try:
+            pipe = self.redis.pipeline()
+            pipe.set(f"{CACHE_KEY_PREFIX}{video_key}", json.dumps(info), ex=ttl_left)
+            if url_key != video_key:
+                pipe.set(f"{ALIAS_KEY_PREFIX}{url_key}", video_key, ex=ttl_left)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Info cache Redis write failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale,
+                'evictions': self.evictions,
+                'redis_hits': self.redis_hits,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,226 @@
+import json
+import logging
+import os
+import re
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from artifacts import ARTIFACT_NAME_RE
+
+logger = logging.getLogger(__name__)
+
+# Files named after an artifact key that are not the finished artifact itself:
+# yt-dlp's .part/.ytdl/fragment files, parts of a merged format, ffmpeg output.
+PARTIAL_NAME_RE = re.compile(r'^([0-9a-f]{32})\.')
+
+JournaledJob = namedtuple('JournaledJob', ['task_id', 'key', 'params', 'state', 'attempts'])
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    task_id TEXT PRIMARY KEY,
+    key TEXT NOT NULL,
+    params TEXT NOT NULL,
+    state TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    heartbeat REAL NOT NULL
+)
+'''
+
+
+def _pid_running(pid):
+    if os.name == 'nt':
+        # os.kill() terminates the process there; the heartbeat going stale decides instead.
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobJournal:
+    """Download jobs that have not finished yet, in a SQLite file shared by every
+    process of the app.
+
+    Each job is written when it is queued, updated on every state change and
+    deleted once it completed, failed or was cancelled. The owning process
+    heartbeats its jobs; jobs whose owner stopped (crash, restart, killed
+    worker) are taken over by the next process to notice and handed to the
+    ``on_orphan`` callback of :meth:`watch` to be resumed.
+
+    The owner ID, the database connection and the watcher thread belong to one
+    process and are set up on first use in it, so a journal created before
+    gunicorn forks its workers (``--preload``) works in each of them.
+    """
+
+    def __init__(self, path, stale_after=30):
+        self.path = path
+        self.stale_after = stale_after
+        self.resumed = 0
+        self.partials_removed = 0
+        self._pid = None
+        self._owner = None
+        self._db = None
+        self._lock = threading.Lock()
+        self._setup_lock = threading.Lock()
+        self._watch_args = None
+        self._watcher_pid = None
+
+    def _process(self):
+        """Sets up this process's owner ID and connection, again in a forked child."""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._setup_lock:
+            if self._pid == pid:
+                return
+            # The parent's connection and lock must not be used across a fork.
+            self._lock = threading.Lock()
+            # Unique per process lifetime, so a restarted process reusing a PID
+            # (common in containers) does not look like the previous owner.
+            self._owner = f"{socket.gethostname()}:{pid}:{uuid.uuid4().hex[:8]}"
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(SCHEMA)
+            self._pid = pid
+
+    @property
+    def owner(self):
+        self._process()
+        return self._owner
+
+    @owner.setter
+    def owner(self, value):
+        self._process()
+        self._owner = value
+
+    def _execute(self, sql, params=()):
+        """Runs one statement; returns the number of rows it changed."""
+        self._process()
+        with self._lock:
+            return self._db.execute(sql, params).rowcount
+
+    def _query(self, sql, params=()):
+        self._process()
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def record(self, task_id, key, **params):
+        """Journals a newly queued job; ``params`` must be JSON-serializable."""
+        now = time.time()
+        self._execute('INSERT OR REPLACE INTO jobs (task_id, key, params, state, owner, created_at, updated_at, '
+                      'heartbeat) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                      (task_id, key, json.dumps(params), 'queued', self.owner, now, now, now))
+
+    def transition(self, task_id, state):
+        self._execute('UPDATE jobs SET state = ?, updated_at = ? WHERE task_id = ?', (state, time.time(), task_id))
+
+    def finish(self, task_id):
+        self._execute('DELETE FROM jobs WHERE task_id = ?', (task_id,))
+
+    def jobs(self):
+        rows = self._query('SELECT task_id, key, params, state, attempts FROM jobs ORDER BY created_at')
+        return [JournaledJob(task_id, key, json.loads(params), state, attempts)
+                for task_id, key, params, state, attempts in rows]
+
+    def keys(self):
+        return {key for (key,) in self._query('SELECT DISTINCT key FROM jobs')}
+
+    def heartbeat(self):
+        self._execute('UPDATE jobs SET heartbeat = ? WHERE owner = ?', (time.time(), self.owner))
+
+    def _owner_gone(self, owner, heartbeat, now):
+        if heartbeat < now - self.stale_after:
+            return True
+        host, pid, _ = owner.rsplit(':', 2)
+        # On this host a vanished PID settles it without waiting for the heartbeat to go stale.
+        return host == socket.gethostname() and pid.isdigit() and not _pid_running(int(pid))
+
+    def take_orphans(self):
+        """Takes over the jobs of processes that are gone and returns them. Of several
+        processes noticing at once, exactly one gets each job."""
+        now = time.time()
+        rows = self._query('SELECT task_id, owner, heartbeat FROM jobs WHERE owner != ?', (self.owner,))
+        taken = []
+        for task_id, owner, heartbeat in rows:
+            if not self._owner_gone(owner, heartbeat, now):
+                continue
+            if self._execute('UPDATE jobs SET owner = ?, heartbeat = ?, attempts = attempts + 1 '
+                             'WHERE task_id = ? AND owner = ?', (self.owner, now, task_id, owner)):
+                taken.append(task_id)
+        return [job for job in self.jobs() if job.task_id in taken]
+
+    def sweep_partials(self, directory, min_age):
+        """Deletes partial files whose job is no longer journaled and that nothing
+        wrote to for ``min_age`` seconds. Returns the number of files removed."""
+        live = self.keys()
+        cutoff = time.time() - min_age
+        removed = 0
+        for name in os.listdir(directory):
+            match = PARTIAL_NAME_RE.match(name)
+            if not match or ARTIFACT_NAME_RE.match(name) or match.group(1) in live:
+                continue
+            path = os.path.join(directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+        if removed:
+            logger.info(f"Removed {removed} orphaned partial download files")
+            self.partials_removed += removed
+        return removed
+
+    def watch(self, on_orphan, directory=None, partial_max_age=600, interval=10):
+        """Sets up the watcher that :meth:`ensure_watcher` runs in each process:
+        every ``interval`` seconds (the first time right away) it heartbeats the
+        process's jobs, passes jobs taken over from dead processes to
+        ``on_orphan`` and sweeps orphaned partial files from ``directory``.
+        """
+        self._watch_args = (on_orphan, directory, partial_max_age, interval)
+
+    def ensure_watcher(self):
+        """Starts the watcher in this process unless it already runs here. Cheap
+        enough to call on every request."""
+        pid = os.getpid()
+        if self._watch_args is None or self._watcher_pid == pid:
+            return
+        with self._setup_lock:
+            if self._watcher_pid == pid:
+                return
+            self._watcher_pid = pid
+        on_orphan, directory, partial_max_age, interval = self._watch_args
+
+        def watch():
+            while True:
+                try:
+                    self.heartbeat()
+                    for job in self.take_orphans():
+                        logger.info(f"[{job.task_id}] Resuming job left in state '{job.state}'")
+                        self.resumed += 1
+                        on_orphan(job)
+                    if directory is not None and os.path.isdir(directory):
+                        self.sweep_partials(directory, partial_max_age)
+                except Exception:
+                    logger.exception("Job journal watch failed")
+                time.sleep(interval)
+
+        threading.Thread(target=watch, name='job-journal', daemon=True).start()
+
+    def stats(self):
+        states = dict(self._query('SELECT state, COUNT(*) FROM jobs GROUP BY state'))
+        return {'jobs': sum(states.values()), 'states': states, 'resumed': self.resumed,
+                'partials_removed': self.partials_removed}
@@ -0,0 +1,139 @@
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+NAMESPACE = 'creator_tools'
+
+EXTRACTION_SECONDS = Histogram(
+    'extraction_duration_seconds', 'yt-dlp metadata extraction latency (cache misses only).',
+    ['domain', 'kind'], namespace=NAMESPACE,
+    buckets=(0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    'queue_wait_seconds', 'Time downloads spend queued before a slot picks them up.',
+    namespace=NAMESPACE, buckets=(0.1, 1, 5, 15, 30, 60, 120, 300, 600, 1800)
+)
+DOWNLOAD_SECONDS = Histogram(
+    'download_duration_seconds', 'Wall time of finished downloads.',
+    ['downloader'], namespace=NAMESPACE, buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 3600)
+)
+DOWNLOAD_THROUGHPUT = Histogram(
+    'download_throughput_bytes_per_second', 'Mean throughput of finished downloads.',
+    ['downloader'], namespace=NAMESPACE,
+    buckets=tuple(2 ** i * 64 * 1024 for i in range(12))  # 64 KiB/s .. 128 MiB/s
+)
+SERVED_BYTES = Histogram(
+    'served_bytes', 'Bytes sent to clients per response.',
+    ['kind'], namespace=NAMESPACE,
+    buckets=tuple(4 ** i * 1024 * 1024 for i in range(7))  # 1 MiB .. 4 GiB
+)
+REJECTIONS = Counter(
+    'rejections', 'Requests turned away, by reason (quota, rate_limit, captcha, queue_full, storage_full).',
+    ['reason'], namespace=NAMESPACE
+)
+YTDLP_FAILURES = Counter(
+    'ytdlp_failures', 'yt-dlp failures by stage and error class.',
+    ['stage', 'error_class'], namespace=NAMESPACE
+)
+
+# Ordered: the first matching pattern names the class.
+ERROR_CLASSES = (
+    ('timeout', re.compile(r'timed out|timeout', re.I)),
+    ('too_large', re.compile(r'larger than|exceeded maximum allowed size', re.I)),
+    ('private', re.compile(r'private|sign in|login required|members-only', re.I)),
+    ('geo_blocked', re.compile(r'not available in your country|geo.?restrict', re.I)),
+    ('unavailable', re.compile(r'unavailable|removed|does not exist|404', re.I)),
+    ('forbidden', re.compile(r'403|forbidden', re.I)),
+    ('rate_limited', re.compile(r'429|too many requests', re.I)),
+    ('unsupported', re.compile(r'unsupported url|no video formats|requested format', re.I)),
+    ('network', re.compile(r'connection|network|resolve|ssl', re.I)),
+)
+
+
+def classify_error(message):
+    for name, pattern in ERROR_CLASSES:
+        if pattern.search(message or ''):
+            return name
+    return 'other'
+
+
+@contextmanager
+def time_extraction(domain, kind='video'):
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        EXTRACTION_SECONDS.labels(domain, kind).observe(time.monotonic() - started)
+
+
+def observe_queue_wait(seconds):
+    QUEUE_WAIT_SECONDS.observe(max(0.0, seconds))
+
+
+def observe_download(downloader, size, seconds):
+    DOWNLOAD_SECONDS.labels(downloader).observe(seconds)
+    if seconds > 0:
+        DOWNLOAD_THROUGHPUT.labels(downloader).observe(size / seconds)
+
+
+def observe_served(kind, nbytes):
+    SERVED_BYTES.labels(kind).observe(nbytes)
+
+
+def count_rejection(reason):
+    REJECTIONS.labels(reason).inc()
+
+
+def count_ytdlp_failure(stage, message):
+    YTDLP_FAILURES.labels(stage, classify_error(message)).inc()
+
+
+class _LiveGauges:
+    """Gauges read from the app's own state at scrape time instead of being
+    updated on every change (queue lengths, disk usage, ...)."""
+
+    def __init__(self):
+        self._sources = []
+        self._lock = threading.Lock()
+
+    def add(self, name, documentation, read):
+        with self._lock:
+            self._sources.append((name, documentation, read))
+
+    def collect(self):
+        with self._lock:
+            sources = list(self._sources)
+        for name, documentation, read in sources:
+            value = read()
+            if value is not None:
+                yield GaugeMetricFamily(f"{NAMESPACE}_{name}", documentation, value=value)
+
+
+_live_gauges = _LiveGauges()
+REGISTRY.register(_live_gauges)
+
+
+def register_gauge(name, documentation, read):
+    """Exposes ``read()`` (a number, or None to skip) as a gauge on every scrape."""
+    _live_gauges.add(name, documentation, read)
+
+
+def render_metrics():
+    """Returns ``(body, content type)`` for the /metrics endpoint.
+
+    Under gunicorn with several workers set PROMETHEUS_MULTIPROC_DIR so the
+    counters and histograms of all workers are aggregated; the live gauges
+    then describe the worker answering the scrape.
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_live_gauges)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
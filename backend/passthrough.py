@@ -0,0 +1,107 @@
+import logging
+import os
+import subprocess
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+# Protocols yt-dlp can write to stdout without a temporary file or a merge step.
+STREAMABLE_PROTOCOLS = ('https', 'http', 'm3u8', 'm3u8_native')
+
+
+def passthrough_format(video_info, format_id):
+    """Returns the format dict when ``format_id`` can be piped straight to the client.
+
+    Only a single, already muxed (or audio-only) format qualifies; selectors
+    that merge streams (``a+b``) or formats that are not in the cached
+    metadata need the on-disk path.
+    """
+    if not video_info or '+' in format_id:
+        return None
+    for f in video_info.get('formats') or []:
+        if f.get('format_id') != format_id:
+            continue
+        if f.get('protocol', 'https') not in STREAMABLE_PROTOCOLS:
+            return None
+        if f.get('acodec') == 'none':
+            # Video-only: yt-dlp would have to merge an audio track.
+            return None
+        return f
+    return None
+
+
+class PassthroughStream:
+    """Runs ``yt-dlp -o -`` and yields its stdout in chunks.
+
+    ``on_close(bytes_sent, ok, error)`` is called exactly once, when the
+    download ended or the client disconnected (the generator is closed and
+    yt-dlp is killed), or from :meth:`close` when the stream never started.
+    ``ok`` is True only if yt-dlp exited cleanly.
+    ``pace(nbytes)``, when given, is called before each chunk and may sleep to
+    throttle the stream; yt-dlp then blocks on the full pipe.
+    """
+
+    def __init__(self, ytdlp_bin, url, format_id, on_close, max_filesize=None, pace=None):
+        command = [ytdlp_bin, '-f', format_id, '-o', '-', '--no-part', '--no-progress']
+        if max_filesize:
+            command += ['--max-filesize', str(max_filesize)]
+        command.append(url)
+        self.command = command
+        self.on_close = on_close
+        self.pace = pace
+        self.bytes_sent = 0
+        self._stderr_tail = deque(maxlen=5)
+        self._closed = False
+        self._close_lock = threading.Lock()
+
+    def _drain_stderr(self, stream):
+        for line in stream:
+            line = line.decode('utf-8', 'ignore').strip()
+            if line:
+                self._stderr_tail.append(line)
+
+    def __iter__(self):
+        process = subprocess.Popen(
+            self.command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+        )
+        drain = threading.Thread(target=self._drain_stderr, args=(process.stderr,), daemon=True)
+        drain.start()
+
+        ok = False
+        try:
+            while True:
+                chunk = process.stdout.read1(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if self.pace is not None:
+                    self.pace(len(chunk))
+                self.bytes_sent += len(chunk)
+                yield chunk
+            ok = process.wait() == 0
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            drain.join(timeout=1)
+            self._finish(ok, None if ok else (" | ".join(self._stderr_tail) or 'Stream interrupted'))
+
+    def close(self):
+        """Ends a stream the client left before the first chunk was read; a no-op
+        once the generator reported the outcome. Meant for Response.call_on_close."""
+        self._finish(False, 'Client disconnected before the stream started')
+
+    def _finish(self, ok, error):
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+        try:
+            self.on_close(self.bytes_sent, ok, error)
+        except Exception:
+            logger.exception("Passthrough close callback failed")
@@ -0,0 +1,62 @@
+import os
+
+# Containers the parts' codecs can be copied into as-is, like yt-dlp picks its
+# merge format: MP4 for the MPEG family, WebM for VP8/VP9/AV1 + Vorbis/Opus,
+# Matroska (which holds anything) otherwise.
+MP4_EXTS = {'mp4', 'm4a', 'm4v', 'mov', 'mp3'}
+WEBM_EXTS = {'webm', 'weba'}
+# Output of the fallback when stream copy fails (broken timestamps, odd codecs).
+TRANSCODE_EXT = 'mp4'
+
+
+class PostprocessError(Exception):
+    pass
+
+
+def split_format(format_id):
+    """The component formats of a merged selection ("137+140"), or None for a single
+    format. Selectors with fallbacks ("bv*+ba/b"), groups or several downloads are
+    not split either: which parts they stand for is only known once yt-dlp resolved
+    them, so they are downloaded and merged in one run.
+    """
+    if any(char in format_id for char in '/,()'):
+        return None
+    parts = [part for part in format_id.split('+') if part]
+    return parts if len(parts) > 1 else None
+
+
+def part_template(directory, key):
+    """yt-dlp output template for the separately downloaded parts of ``key``."""
+    return os.path.join(directory, f"{key}.f%(format_id)s.%(ext)s")
+
+
+def merge_extension(paths):
+    """Container the downloaded parts can be stream-copied into."""
+    exts = {os.path.splitext(path)[1].lstrip('.').lower() for path in paths}
+    if exts <= MP4_EXTS:
+        return 'mp4'
+    if exts <= WEBM_EXTS:
+        return 'webm'
+    return 'mkv'
+
+
+def merge_command(ffmpeg_path, inputs, output, copy=True):
+    """ffmpeg arguments muxing every stream of ``inputs`` into ``output``, either
+    stream-copied or, with ``copy=False``, re-encoded to H.264/AAC. ffmpeg writes
+    ``output + '.part'``; the caller moves it into place once ffmpeg succeeded.
+    """
+    cmd = [ffmpeg_path, '-v', 'error', '-nostdin', '-y']
+    for path in inputs:
+        cmd += ['-i', path]
+    for i in range(len(inputs)):
+        cmd += ['-map', str(i)]
+    if copy:
+        cmd += ['-c', 'copy']
+    else:
+        cmd += ['-c:v', 'libx264', '-preset', 'veryfast', '-c:a', 'aac']
+    ext = os.path.splitext(output)[1].lstrip('.')
+    if ext in ('mp4', 'mov'):
+        # Index up front so players can start before the whole file arrived.
+        cmd += ['-movflags', '+faststart']
+    # The output name ends in .part until it is complete, so the muxer is given explicitly.
+    return cmd + ['-f', {'mkv': 'matroska'}.get(ext, ext), f"{output}.part"]
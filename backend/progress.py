@@ -0,0 +1,142 @@
+import json
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_PREFIX = '[progress] '
+
+# Passed to yt-dlp as ``--progress-template download:<template>`` together with
+# ``--newline``: every progress hook call prints one JSON line. Missing numeric
+# fields (e.g. total_bytes for HLS) are rendered as ``null``.
+_NUMERIC_FIELDS = ('downloaded_bytes', 'total_bytes', 'total_bytes_estimate', 'speed', 'eta',
+                   'elapsed', 'fragment_index', 'fragment_count')
+PROGRESS_TEMPLATE = PROGRESS_PREFIX + '{"status": "%(progress.status)s", ' + ', '.join(
+    f'"{name}": %(progress.{name}|null)s' for name in _NUMERIC_FIELDS) + '}'
+
+_SIZE_UNITS = {'B': 1, 'KiB': 1024, 'MiB': 1024 ** 2, 'GiB': 1024 ** 3, 'TiB': 1024 ** 4}
+# aria2c summary line, e.g. "[#2089b0 400.0KiB/33.2MiB(1%) CN:16 DL:1.2MiB ETA:27s]"
+_ARIA2C_SUMMARY = re.compile(
+    r'\[#\w+ ([\d.]+)(\w+)/([\d.]+)(\w+)\((\d+)%\)(?: CN:(\d+))?(?: DL:([\d.]+)(\w+))?(?: ETA:(\w+))?\]')
+_ETA_PART = re.compile(r'(\d+)([hms])')
+
+
+def _parse_eta(text):
+    if not text:
+        return None
+    factors = {'h': 3600, 'm': 60, 's': 1}
+    return sum(int(n) * factors[unit] for n, unit in _ETA_PART.findall(text))
+
+
+def parse_aria2c_progress(line):
+    """Converts an aria2c summary line into a yt-dlp style progress dict, or None."""
+    match = _ARIA2C_SUMMARY.search(line)
+    if not match:
+        return None
+    done, done_unit, total, total_unit, _, connections, speed, speed_unit, eta = match.groups()
+    return {
+        'status': 'downloading',
+        'downloaded_bytes': int(float(done) * _SIZE_UNITS.get(done_unit, 1)),
+        'total_bytes': int(float(total) * _SIZE_UNITS.get(total_unit, 1)),
+        'speed': float(speed) * _SIZE_UNITS.get(speed_unit, 1) if speed else None,
+        'eta': _parse_eta(eta),
+        'connections': int(connections) if connections else None,
+    }
+
+
+def ytdlp_progress_args():
+    """Command line options that switch yt-dlp to one JSON progress line per update."""
+    return ['--newline', '--progress-template', f"download:{PROGRESS_TEMPLATE}"]
+
+
+class ProgressParser:
+    """Turns yt-dlp progress (template lines or progress hook dicts) into task updates.
+
+    ``callback(fields)`` receives a dict with ``percentage``, ``downloaded_bytes``,
+    ``total_bytes``, ``speed``, ``eta``, ``fragment_index`` and ``fragment_count``.
+    Calls are throttled to ``max_rate`` per second; the latest sample is always
+    delivered by :meth:`flush` so the final state is never lost.
+    """
+
+    def __init__(self, callback, max_rate=2.0):
+        self.callback = callback
+        self.min_interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.started_at = time.monotonic()
+        self._last_emit = 0.0
+        self._pending = None
+        # Merged formats download several files; bytes of finished ones are kept here.
+        self._finished_bytes = 0
+        self._current_bytes = 0
+
+    def feed(self, line):
+        """Consumes one stdout line; returns False if it is not a progress line.
+        Understands the yt-dlp progress template and aria2c summary lines.
+        """
+        if not line.startswith(PROGRESS_PREFIX):
+            progress = parse_aria2c_progress(line)
+            if progress is None:
+                return False
+            self.update(progress)
+            return True
+        try:
+            progress = json.loads(line[len(PROGRESS_PREFIX):])
+        except ValueError:
+            logger.debug(f"Unparseable progress line: {line!r}")
+            return True
+        self.update(progress)
+        return True
+
+    def update(self, progress):
+        """Consumes one progress dict, as passed to a yt-dlp progress hook."""
+        if progress.get('status') not in ('downloading', 'finished'):
+            return
+
+        downloaded = progress.get('downloaded_bytes') or 0
+        total = progress.get('total_bytes') or progress.get('total_bytes_estimate')
+        fragment_index = progress.get('fragment_index')
+        fragment_count = progress.get('fragment_count')
+
+        if progress['status'] == 'finished':
+            percentage = 100.0
+        elif total:
+            percentage = min(100.0, round(downloaded * 100 / total, 1))
+        elif fragment_index and fragment_count:
+            # HLS/DASH without a size estimate: fragments are the only measure.
+            percentage = round(fragment_index * 100 / fragment_count, 1)
+        else:
+            percentage = None
+
+        if progress['status'] == 'finished':
+            self._finished_bytes += downloaded
+            self._current_bytes = 0
+        else:
+            self._current_bytes = downloaded
+        self._pending = {
+            'percentage': percentage,
+            'downloaded_bytes': downloaded,
+            'total_bytes': int(total) if total else None,
+            'speed': round(progress['speed']) if progress.get('speed') else None,
+            'eta': int(progress['eta']) if progress.get('eta') is not None else None,
+            'fragment_index': fragment_index,
+            'fragment_count': fragment_count,
+        }
+
+        now = time.monotonic()
+        if progress['status'] == 'finished' or now - self._last_emit >= self.min_interval:
+            self._emit(now)
+
+    def flush(self):
+        if self._pending is not None:
+            self._emit(time.monotonic())
+
+    def _emit(self, now):
+        fields, self._pending = self._pending, None
+        self._last_emit = now
+        self.callback(fields)
+
+    def average_speed(self):
+        """Mean throughput in bytes per second since the parser was created."""
+        elapsed = time.monotonic() - self.started_at
+        total = self._finished_bytes + self._current_bytes
+        return round(total / elapsed) if elapsed > 0 else None
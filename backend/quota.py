@@ -1,69 +1,261 @@
-import os
-import redis
+import atexit
 import json
-from datetime import datetime
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from redis_client import get_redis
 
-DAILY_LIMIT = 15 * 1024 * 1024 * 1024 # 15 GB
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies.
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DAILY_LIMIT = 15 * 1024 * 1024 * 1024  # 15 GB
 QUOTA_KEY_PREFIX = 'download_quota:'
+# Day buckets outlive their day so reservations made before midnight can still be settled.
+BUCKET_TTL_SECONDS = 2 * 24 * 3600
+
+# Adds ARGV[1] bytes to the bucket unless that pushes it over the limit ARGV[2].
+# A reservation of 0 bytes (unknown size) only requires usage to be under the limit.
+RESERVE_SCRIPT = """
+local used = tonumber(redis.call('GET', KEYS[1]) or '0')
+local amount = tonumber(ARGV[1])
+if used >= tonumber(ARGV[2]) or (amount > 0 and used + amount > tonumber(ARGV[2])) then
+    return -1
+end
+local total = redis.call('INCRBY', KEYS[1], amount)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return total
+"""
+
+
+def today_str():
+    return datetime.now().strftime('%Y-%m-%d')
+
+
+class QuotaBackend:
+    """Daily download quota per user.
+
+    Usage is bucketed per day, so the daily reset is implicit. A download
+    first :meth:`reserve`\\ s its estimated size; once it finished the
+    reservation is settled with :meth:`commit` (actual size) or returned with
+    :meth:`refund`. Reservations are plain dicts so they can be stored in task
+    records and settled by another process.
+    """
+
+    def __init__(self, daily_limit=DAILY_LIMIT):
+        self.daily_limit = daily_limit
 
-class QuotaManager:
-    def __init__(self):
-        redis_url = os.environ.get('REDIS_BROKER_URL', 'redis://localhost:6379/0')
-        # Use decode_responses=True to get strings instead of bytes
-        self.r = redis.from_url(redis_url, decode_responses=True)
+    def _used(self, day, user_id):
+        raise NotImplementedError
 
-    def _get_today_str(self):
-        return datetime.now().strftime('%Y-%m-%d')
+    def _add(self, day, user_id, amount):
+        raise NotImplementedError
+
+    def _try_reserve(self, day, user_id, amount):
+        """Atomically adds ``amount`` unless it exceeds the limit; returns success."""
+        raise NotImplementedError
+
+    def usage_report(self, day=None):
+        """Returns ``{user_id: bytes_used}`` for every user with usage on ``day``."""
+        raise NotImplementedError
 
     def check_quota(self, user_id):
         """Returns True if user is within quota, False otherwise."""
-        today = self._get_today_str()
-        key = f"{QUOTA_KEY_PREFIX}{user_id}"
-        
-        # Get current usage data from Redis
-        user_data_str = self.r.hget(key, 'data')
-        if user_data_str:
-            user_data = json.loads(user_data_str)
-        else:
-            user_data = {'date': today, 'bytes_used': 0}
-
-        # Reset if new day
-        if user_data.get('date') != today:
-            user_data = {'date': today, 'bytes_used': 0}
-            self.r.hset(key, 'data', json.dumps(user_data)) # Update Redis
-        
-        return user_data['bytes_used'] < DAILY_LIMIT
+        return self._used(today_str(), user_id) < self.daily_limit
 
     def add_usage(self, user_id, bytes_used):
         """Adds bytes to user's daily usage."""
-        today = self._get_today_str()
-        key = f"{QUOTA_KEY_PREFIX}{user_id}"
-        
-        # Get current usage data from Redis
-        user_data_str = self.r.hget(key, 'data')
-        if user_data_str:
-            user_data = json.loads(user_data_str)
-        else:
-            user_data = {'date': today, 'bytes_used': 0}
-
-        # Reset if new day (edge case where check wasn't called or day changed during dl)
-        if user_data.get('date') != today:
-            user_data = {'date': today, 'bytes_used': 0}
-        
-        user_data['bytes_used'] += bytes_used
-        self.r.hset(key, 'data', json.dumps(user_data)) # Update Redis
+        self._add(today_str(), user_id, bytes_used)
 
     def get_remaining(self, user_id):
-        today = self._get_today_str()
-        key = f"{QUOTA_KEY_PREFIX}{user_id}"
-        
-        user_data_str = self.r.hget(key, 'data')
-        if user_data_str:
-            user_data = json.loads(user_data_str)
-        else:
-            user_data = {'date': today, 'bytes_used': 0}
-        
-        if user_data.get('date') != today:
-            return DAILY_LIMIT
-            
-        return max(0, DAILY_LIMIT - user_data['bytes_used'])
+        return max(0, self.daily_limit - self._used(today_str(), user_id))
+
+    def reserve(self, user_id, estimated_bytes=0):
+        """Reserves quota for a download; returns a reservation or None if over quota."""
+        day = today_str()
+        amount = max(0, int(estimated_bytes or 0))
+        if not self._try_reserve(day, user_id, amount):
+            return None
+        return {'user': user_id, 'day': day, 'bytes': amount}
+
+    def commit(self, reservation, actual_bytes):
+        """Charges the actual size of a finished download against its reservation."""
+        delta = actual_bytes - reservation['bytes']
+        if delta:
+            self._add(reservation['day'], reservation['user'], delta)
+
+    def refund(self, reservation):
+        if reservation['bytes']:
+            self._add(reservation['day'], reservation['user'], -reservation['bytes'])
+
+
+class RedisQuota(QuotaBackend):
+    """One integer key per user and day (``download_quota:<day>:<user>``), updated with INCRBY."""
+
+    def __init__(self, redis_client=None, daily_limit=DAILY_LIMIT):
+        super().__init__(daily_limit)
+        self.r = redis_client or get_redis()
+
+    def _key(self, day, user_id):
+        return f"{QUOTA_KEY_PREFIX}{day}:{user_id}"
+
+    def _used(self, day, user_id):
+        return int(self.r.get(self._key(day, user_id)) or 0)
+
+    def _add(self, day, user_id, amount):
+        key = self._key(day, user_id)
+        pipe = self.r.pipeline()
+        pipe.incrby(key, amount)
+        pipe.expire(key, BUCKET_TTL_SECONDS)
+        pipe.execute()
+
+    def _try_reserve(self, day, user_id, amount):
+        return self.r.eval(RESERVE_SCRIPT, 1, self._key(day, user_id),
+                           amount, self.daily_limit, BUCKET_TTL_SECONDS) >= 0
+
+    def usage_report(self, day=None):
+        prefix = f"{QUOTA_KEY_PREFIX}{day or today_str()}:"
+        report = {}
+        batch = []
+        for key in self.r.scan_iter(match=f"{prefix}*", count=1000):
+            batch.append(key)
+            if len(batch) >= 1000:
+                self._collect(batch, prefix, report)
+                batch = []
+        if batch:
+            self._collect(batch, prefix, report)
+        return report
+
+    def _collect(self, keys, prefix, report):
+        for key, value in zip(keys, self.r.mget(keys)):
+            if value is not None:
+                report[key[len(prefix):]] = int(value)
+
+
+class FileQuota(QuotaBackend):
+    """JSON-file quota for local development.
+
+    Usage is kept in memory; changes are written behind every
+    ``flush_interval`` seconds. A flush takes an exclusive lock on the file,
+    re-reads it and adds this process' changes, so several processes sharing
+    the file do not overwrite each other.
+    """
+
+    def __init__(self, filepath='quota_tracker.json', daily_limit=DAILY_LIMIT, flush_interval=5.0):
+        super().__init__(daily_limit)
+        self.filepath = filepath
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._usage = self._read()   # day -> {user_id: bytes}
+        self._pending = {}           # (day, user_id) -> bytes not yet written
+        self._flush_lock = threading.Lock()
+        threading.Thread(target=self._flush_loop, name='quota-flush', daemon=True).start()
+        atexit.register(self._flush_quietly)
+
+    def _read(self):
+        try:
+            with open(self.filepath, 'r') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        if any(isinstance(v, dict) and 'date' in v for v in data.values()):
+            # Pre-bucket format: {user_id: {"date": ..., "bytes_used": ...}}.
+            usage = {}
+            for user_id, entry in data.items():
+                usage.setdefault(entry['date'], {})[user_id] = entry['bytes_used']
+            return usage
+        return data
+
+    def _used(self, day, user_id):
+        with self._lock:
+            return self._usage.get(day, {}).get(user_id, 0)
+
+    def _add(self, day, user_id, amount):
+        with self._lock:
+            self._apply(day, user_id, amount)
+
+    def _apply(self, day, user_id, amount):
+        bucket = self._usage.setdefault(day, {})
+        bucket[user_id] = bucket.get(user_id, 0) + amount
+        self._pending[(day, user_id)] = self._pending.get((day, user_id), 0) + amount
+
+    def _try_reserve(self, day, user_id, amount):
+        with self._lock:
+            used = self._usage.get(day, {}).get(user_id, 0)
+            if used >= self.daily_limit or (amount and used + amount > self.daily_limit):
+                return False
+            self._apply(day, user_id, amount)
+            return True
+
+    def usage_report(self, day=None):
+        with self._lock:
+            return dict(self._usage.get(day or today_str(), {}))
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self._flush_quietly()
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except OSError as e:
+            logger.warning(f"Quota file flush failed: {e}")
+
+    def flush(self):
+        """Merges pending changes into the file and refreshes the in-memory view."""
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        try:
+            usage = self._write(pending)
+        except OSError:
+            with self._lock:
+                for entry, amount in pending.items():
+                    self._pending[entry] = self._pending.get(entry, 0) + amount
+            raise
+
+        with self._lock:
+            # Re-apply changes made while the file was being written.
+            for (day, user_id), amount in self._pending.items():
+                bucket = usage.setdefault(day, {})
+                bucket[user_id] = bucket.get(user_id, 0) + amount
+            self._usage = usage
+
+    def _write(self, pending):
+        with open(f"{self.filepath}.lock", 'w') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            usage = self._read()
+            for (day, user_id), amount in pending.items():
+                bucket = usage.setdefault(day, {})
+                bucket[user_id] = bucket.get(user_id, 0) + amount
+
+            oldest = (datetime.now() - timedelta(seconds=BUCKET_TTL_SECONDS)).strftime('%Y-%m-%d')
+            usage = {day: bucket for day, bucket in usage.items() if day >= oldest}
+            tmp_path = f"{self.filepath}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(usage, f)
+            os.replace(tmp_path, self.filepath)
+        return usage
+
+
+def create_quota_backend(kind, filepath):
+    if kind == 'redis':
+        return RedisQuota()
+    if kind == 'file':
+        return FileQuota(filepath=filepath)
+    raise ValueError(f"Unknown quota backend: {kind}")
+
@@ -0,0 +1,183 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+from limits.storage import SlidingWindowCounterSupport, Storage
+
+STORAGE_SCHEME = 'tiered+redis'
+KEY_PREFIX = 'rate_limit:'
+
+
+class _Lease:
+    __slots__ = ('window', 'tokens', 'denied_until')
+
+    def __init__(self, window):
+        self.window = window
+        self.tokens = 0
+        self.denied_until = 0.0
+
+
+class TieredRedisStorage(Storage, SlidingWindowCounterSupport):
+    """Rate-limit counters shared by every gunicorn worker and web node, with a
+    per-process token cache in front of them.
+
+    Redis holds one sliding-window counter per limit and window, updated with a
+    pipelined INCRBY/EXPIRE/GET. Instead of one hit at a time a process leases
+    ``lease_fraction`` of the limit in a single round trip and decides the next
+    hits locally until the lease runs out or the window rolls over. Leased
+    tokens count as used, so the limit is never exceeded; in exchange a client
+    spreading requests over several processes may be refused up to
+    ``processes - 1`` leases early. Limits too small to lease from (5 per
+    minute with the default fraction) go to Redis on every hit. Refusals are
+    remembered for ``deny_seconds`` so a client hammering a full limit does not
+    cost a round trip per request either.
+
+    Registered with limits as ``tiered+redis://host:port/db``.
+    """
+
+    STORAGE_SCHEME = [STORAGE_SCHEME]
+
+    def __init__(self, uri, wrap_exceptions=False, lease_fraction=0.1, deny_seconds=1.0, max_keys=10000,
+                 redis_client=None, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions)
+        if redis_client is None:
+            redis_client = redis.from_url(uri.split('+', 1)[1], decode_responses=True)
+        self.redis = redis_client
+        self.lease_fraction = float(lease_fraction)
+        self.deny_seconds = float(deny_seconds)
+        self.max_keys = int(max_keys)
+        self._leases = OrderedDict()  # key -> _Lease, least recently used first
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.local_denials = 0
+        self.round_trips = 0
+
+    @property
+    def base_exceptions(self):
+        return redis.RedisError
+
+    # --- Sliding window counter, used by the "sliding-window-counter" strategy ---
+
+    def acquire_sliding_window_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+        now = time.time()
+        window = int(now // expiry)
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is not None and lease.window == window:
+                self._leases.move_to_end(key)
+                if lease.tokens >= amount:
+                    lease.tokens -= amount
+                    self.local_hits += 1
+                    return True
+                if lease.denied_until > now:
+                    self.local_denials += 1
+                    return False
+
+        size = max(amount, int(limit * self.lease_fraction))
+        granted = self._reserve(key, limit, expiry, window, now, size, amount)
+
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is None or lease.window != window:
+                lease = self._leases[key] = _Lease(window)
+            self._leases.move_to_end(key)
+            self.round_trips += 1 if granted == size else 2
+            if granted:
+                # Tokens left from an earlier lease of this window stay usable.
+                lease.tokens += granted - amount
+                lease.denied_until = 0.0
+            else:
+                lease.denied_until = now + self.deny_seconds
+            while len(self._leases) > self.max_keys:
+                self._leases.popitem(last=False)
+        return bool(granted)
+
+    def _reserve(self, key, limit, expiry, window, now, size, amount):
+        """Takes ``size`` hits off the Redis counter and returns how many were
+        granted: ``size`` when they all fit, fewer when only part of them did,
+        0 (and nothing taken) when not even ``amount`` fit.
+        """
+        previous_key, current_key = self._window_keys(key, expiry, window)
+        pipe = self.redis.pipeline()
+        pipe.incrby(current_key, size)
+        pipe.expire(current_key, 2 * expiry)
+        pipe.get(previous_key)
+        current, _, previous = pipe.execute()
+
+        weighted = math.floor(int(previous or 0) * self._previous_weight(now, expiry) + int(current))
+        granted = size - max(0, weighted - limit)
+        if granted < amount:
+            granted = 0
+        if granted < size:
+            self.redis.decrby(current_key, size - granted)
+        return granted
+
+    def get_sliding_window(self, key, expiry):
+        now = time.time()
+        previous_key, current_key = self._window_keys(key, expiry, int(now // expiry))
+        previous, current = self.redis.mget(previous_key, current_key)
+        previous, current = int(previous or 0), int(current or 0)
+        previous_ttl = self._previous_weight(now, expiry) * expiry if previous else 0.0
+        current_ttl = (1 - (now / expiry) % 1) * expiry + expiry
+        return previous, previous_ttl, current, current_ttl
+
+    def clear_sliding_window(self, key, expiry):
+        with self._lock:
+            self._leases.pop(key, None)
+        self.redis.delete(*self._window_keys(key, expiry, int(time.time() // expiry)))
+
+    @staticmethod
+    def _window_keys(key, expiry, window):
+        return f"{KEY_PREFIX}{key}/{window - 1}", f"{KEY_PREFIX}{key}/{window}"
+
+    @staticmethod
+    def _previous_weight(now, expiry):
+        """Share of the previous window that still lies inside the sliding window."""
+        return 1 - (now % expiry) / expiry
+
+    # --- Plain counters, used by the "fixed-window" strategy ---
+
+    def incr(self, key, expiry, amount=1):
+        value = self.redis.incrby(f"{KEY_PREFIX}{key}", amount)
+        if value == amount:
+            self.redis.expire(f"{KEY_PREFIX}{key}", int(expiry))
+        return value
+
+    def get(self, key):
+        return int(self.redis.get(f"{KEY_PREFIX}{key}") or 0)
+
+    def get_expiry(self, key):
+        return time.time() + max(self.redis.ttl(f"{KEY_PREFIX}{key}"), 0)
+
+    def check(self):
+        try:
+            return self.redis.ping()
+        except redis.RedisError:
+            return False
+
+    def reset(self):
+        with self._lock:
+            self._leases.clear()
+        keys = list(self.redis.scan_iter(match=f"{KEY_PREFIX}*"))
+        if keys:
+            self.redis.delete(*keys)
+        return len(keys)
+
+    def clear(self, key):
+        with self._lock:
+            self._leases.pop(key, None)
+        self.redis.delete(f"{KEY_PREFIX}{key}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': STORAGE_SCHEME,
+                'cached_keys': len(self._leases),
+                'local_hits': self.local_hits,
+                'local_denials': self.local_denials,
+                'redis_round_trips': self.round_trips,
+            }
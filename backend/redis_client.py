@@ -0,0 +1,20 @@
+import os
+import redis
+
+REDIS_URL = os.environ.get('REDIS_BROKER_URL', 'redis://localhost:6379/0')
+
+_client = None
+
+
+def get_redis():
+    """Returns the process-wide Redis client shared by quota, caches and workers."""
+    global _client
+    if _client is None:
+        # Use decode_responses=True to get strings instead of bytes
+        _client = redis.from_url(REDIS_URL, decode_responses=True)
+    return _client
+
+
+def redis_configured():
+    """True when a Redis URL was explicitly configured for this deployment."""
+    return 'REDIS_BROKER_URL' in os.environ
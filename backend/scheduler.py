@@ -0,0 +1,200 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """The scheduler cannot accept more queued jobs (globally or for this user)."""
+
+
+class Job:
+    __slots__ = ('job_id', 'user', 'priority', 'fn', 'args', 'enqueued_at', 'started_at')
+
+    def __init__(self, job_id, user, priority, fn, args):
+        self.job_id = job_id
+        self.user = user
+        self.priority = priority
+        self.fn = fn
+        self.args = args
+        self.enqueued_at = time.time()
+        self.started_at = None
+
+
+class FairScheduler:
+    """Bounded job queue served by ``workers`` slots.
+
+    Jobs are grouped by priority (higher first). Within a priority level users
+    are served round-robin, so one user queueing ten downloads cannot starve
+    the next user's single download. Every worker slot is used; jobs that do
+    not fit wait in the queue instead of being rejected.
+
+    A job that returns a ``concurrent.futures.Future`` keeps its slot until
+    the future is done but hands its thread back immediately, so ``threads``
+    (default: one per slot) can be far fewer than the slots.
+    """
+
+    def __init__(self, workers=3, max_queued=100, max_queued_per_user=10, default_duration=60.0, name='download',
+                 on_start=None, threads=None):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_queued_per_user = max_queued_per_user
+        self._levels = {}        # priority -> OrderedDict(user -> deque[Job]), in rotation order
+        self._queued = {}        # job_id -> Job
+        self._user_counts = {}   # user -> number of queued jobs
+        self._running = {}       # job_id -> Job
+        self._cond = threading.Condition()
+        # Exponentially weighted average job duration, used for start-time estimates.
+        self._avg_duration = default_duration
+        self.completed = 0
+        # Called with each Job as a worker picks it up (e.g. to record its queue wait).
+        self.on_start = on_start
+        for i in range(threads or workers):
+            threading.Thread(target=self._worker, name=f"{name}-worker-{i}", daemon=True).start()
+
+    def submit(self, job_id, user, fn, *args, priority=0):
+        """Queues ``fn(*args)``; raises QueueFull when the queue or the user's share is full."""
+        with self._cond:
+            if len(self._queued) >= self.max_queued:
+                raise QueueFull(f"Download queue is full ({self.max_queued} jobs). Please try again later.")
+            if self._user_counts.get(user, 0) >= self.max_queued_per_user:
+                raise QueueFull(f"You already have {self.max_queued_per_user} downloads queued.")
+
+            job = Job(job_id, user, priority, fn, args)
+            level = self._levels.setdefault(priority, OrderedDict())
+            level.setdefault(user, deque()).append(job)
+            self._queued[job_id] = job
+            self._user_counts[user] = self._user_counts.get(user, 0) + 1
+            self._cond.notify()
+            return job
+
+    def _next_job(self):
+        priority = max(self._levels)
+        level = self._levels[priority]
+        user, jobs = next(iter(level.items()))
+        job = jobs.popleft()
+        if jobs:
+            level.move_to_end(user)
+        else:
+            del level[user]
+            if not level:
+                del self._levels[priority]
+
+        del self._queued[job.job_id]
+        self._user_counts[user] -= 1
+        if not self._user_counts[user]:
+            del self._user_counts[user]
+        return job
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._levels or len(self._running) >= self.workers:
+                    self._cond.wait()
+                job = self._next_job()
+                job.started_at = time.time()
+                self._running[job.job_id] = job
+
+            if self.on_start is not None:
+                try:
+                    self.on_start(job)
+                except Exception:
+                    logger.exception(f"[{job.job_id}] on_start hook failed")
+            try:
+                result = job.fn(*job.args)
+            except Exception:
+                logger.exception(f"[{job.job_id}] Scheduled job crashed")
+                result = None
+            if isinstance(result, Future):
+                result.add_done_callback(lambda future, job=job: self._finish(job, future))
+            else:
+                self._finish(job)
+
+    def _finish(self, job, future=None):
+        if future is not None and not future.cancelled() and future.exception() is not None:
+            logger.error(f"[{job.job_id}] Scheduled job crashed", exc_info=future.exception())
+        with self._cond:
+            del self._running[job.job_id]
+            duration = time.time() - job.started_at
+            self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+            self.completed += 1
+            self._cond.notify_all()
+
+    def cancel(self, job_id):
+        """Removes a queued job; returns it, or None when it is not queued (anymore)."""
+        with self._cond:
+            job = self._queued.pop(job_id, None)
+            if job is None:
+                return None
+            level = self._levels[job.priority]
+            jobs = level[job.user]
+            jobs.remove(job)
+            if not jobs:
+                del level[job.user]
+                if not level:
+                    del self._levels[job.priority]
+            self._user_counts[job.user] -= 1
+            if not self._user_counts[job.user]:
+                del self._user_counts[job.user]
+            return job
+
+    def _position(self, job_id):
+        job = self._queued.get(job_id)
+        if job is None:
+            return None
+
+        ahead = sum(
+            len(jobs)
+            for priority, level in self._levels.items() if priority > job.priority
+            for jobs in level.values()
+        )
+        level = self._levels[job.priority]
+        index = level[job.user].index(job)
+        # Round r of the rotation serves the r-th job of every user, in rotation order.
+        before_user = True
+        for user, jobs in level.items():
+            if user == job.user:
+                before_user = False
+                ahead += index
+                continue
+            ahead += min(len(jobs), index + 1 if before_user else index)
+        return ahead
+
+    def position(self, job_id):
+        """Number of queued jobs that will start before ``job_id``, or None if it is not queued."""
+        with self._cond:
+            return self._position(job_id)
+
+    def queue_estimate(self, job_id):
+        """``(position, estimated_start)`` of ``job_id`` read at one instant, or None
+        if it is not queued. See :meth:`position` and :meth:`estimated_start`."""
+        with self._cond:
+            ahead = self._position(job_id)
+            if ahead is None:
+                return None
+            idle = self.workers - len(self._running)
+            avg = self._avg_duration
+        now = time.time()
+        if ahead < idle:
+            return ahead, now
+        rounds = (ahead - idle) // max(self.workers, 1) + 1
+        return ahead, now + rounds * avg
+
+    def estimated_start(self, job_id):
+        """Unix timestamp at which ``job_id`` is expected to start, or None if it is not queued."""
+        estimate = self.queue_estimate(job_id)
+        return estimate[1] if estimate is not None else None
+
+    def stats(self):
+        with self._cond:
+            return {
+                'workers': self.workers,
+                'running': len(self._running),
+                'queued': len(self._queued),
+                'queued_users': len(self._user_counts),
+                'completed': self.completed,
+                'avg_duration': round(self._avg_duration, 1),
+            }
@@ -0,0 +1,172 @@
+import json
+import logging
+import threading
+import time
+import uuid
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY_PREFIX = 'singleflight:lock:'
+RESULT_KEY_PREFIX = 'singleflight:result:'
+
+# Deletes the lock only if we still own it, so a leader whose lock already
+# expired cannot release the lock of the leader that replaced it.
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlightError(Exception):
+    """Raised to waiters when the shared call failed in another worker process."""
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time and shares its outcome with everyone waiting.
+
+    Inside a process, concurrent callers for the same key wait on the leader's
+    thread. With a Redis client, the leader additionally holds a ``SET NX`` lock
+    and publishes its JSON-serializable result (or error message) under a result
+    key, so callers in other gunicorn workers wait for it instead of repeating
+    the call.
+    """
+
+    def __init__(self, redis_client=None, lock_ttl=120, result_ttl=30, error_ttl=5, poll_interval=0.1):
+        self.redis = redis_client
+        self.lock_ttl = lock_ttl
+        self.result_ttl = result_ttl
+        self.error_ttl = error_ttl
+        self.poll_interval = poll_interval
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+        self.remote_coalesced = 0
+
+    def do(self, key, fn):
+        """Returns ``fn()``, or the result of an identical call already in flight."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._do_shared(key, fn)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def _do_shared(self, key, fn):
+        if self.redis is None:
+            return self._execute(fn)
+
+        lock_key = f"{LOCK_KEY_PREFIX}{key}"
+        result_key = f"{RESULT_KEY_PREFIX}{key}"
+        token = uuid.uuid4().hex
+        deadline = time.time() + self.lock_ttl
+
+        while True:
+            try:
+                acquired = self.redis.set(lock_key, token, nx=True, px=self.lock_ttl * 1000)
+            except redis.RedisError as e:
+                logger.warning(f"Single-flight lock unavailable, running {key} locally: {e}")
+                return self._execute(fn)
+
+            if acquired:
+                return self._lead(fn, lock_key, result_key, token)
+
+            outcome = self._wait_for_result(lock_key, result_key, deadline)
+            if outcome is not None:
+                with self._lock:
+                    self.remote_coalesced += 1
+                if 'error' in outcome:
+                    raise SingleFlightError(outcome['error'])
+                return outcome['result']
+            if time.time() >= deadline:
+                # The other leader is stuck; stop waiting and do the work ourselves.
+                return self._execute(fn)
+            # The lock was released without a result (leader crashed): try to lead.
+
+    def _lead(self, fn, lock_key, result_key, token):
+        try:
+            self._publish(result_key, None, 0)
+            try:
+                result = self._execute(fn)
+            except Exception as e:
+                message = getattr(e, 'stderr', None) or str(e)
+                self._publish(result_key, {'error': message}, self.error_ttl)
+                raise
+            self._publish(result_key, {'result': result}, self.result_ttl)
+            return result
+        finally:
+            try:
+                self.redis.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+            except redis.RedisError:
+                pass
+
+    def _publish(self, result_key, outcome, ttl):
+        """Stores the outcome for waiting workers; ``None`` clears a previous one."""
+        try:
+            if outcome is None:
+                self.redis.delete(result_key)
+            else:
+                self.redis.set(result_key, json.dumps(outcome), ex=ttl)
+        except redis.RedisError as e:
+            logger.warning(f"Single-flight could not publish result: {e}")
+
+    def _wait_for_result(self, lock_key, result_key, deadline):
+        while time.time() < deadline:
+            try:
+                payload = self.redis.get(result_key)
+                if payload:
+                    return json.loads(payload)
+                if not self.redis.exists(lock_key):
+                    # Leader may have published between our two reads.
+                    payload = self.redis.get(result_key)
+                    return json.loads(payload) if payload else None
+            except redis.RedisError as e:
+                logger.warning(f"Single-flight wait interrupted: {e}")
+                return None
+            time.sleep(self.poll_interval)
+        return None
+
+    def _execute(self, fn):
+        with self._lock:
+            self.executions += 1
+        return fn()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+                'remote_coalesced': self.remote_coalesced,
+            }
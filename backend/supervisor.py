@@ -0,0 +1,125 @@
+import asyncio
+import os
+import subprocess
+import threading
+from collections import namedtuple
+
+# ``stopped`` is True when on_line() asked for the process to be stopped early.
+ProcessExit = namedtuple('ProcessExit', ['returncode', 'stopped'])
+
+
+class DownloadSupervisor:
+    """Runs download jobs as coroutines on one event loop in a dedicated thread.
+
+    Jobs watch their yt-dlp children through ``asyncio.create_subprocess_exec``,
+    so hundreds of supervised downloads cost one thread rather than one each.
+    Flask routes and worker threads talk to it through ``submit()``, ``run()``
+    and ``cancel()``, which are thread-safe.
+    """
+
+    def __init__(self, kill_grace=5.0, name='download-supervisor'):
+        self.kill_grace = kill_grace
+        self.name = name
+        self._loop = None
+        self._jobs = {}  # job_id -> asyncio.Task, only touched on the loop thread
+        self._lock = threading.Lock()
+        self.cancelled = 0
+
+    def _get_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name=self.name, daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, job_id, coro):
+        """Schedules ``coro`` under ``job_id``; returns a concurrent.futures.Future of its result."""
+        return asyncio.run_coroutine_threadsafe(self._track(job_id, coro), self._get_loop())
+
+    def run(self, job_id, coro):
+        """Runs ``coro`` on the supervisor's loop and blocks the calling thread until it finished."""
+        return self.submit(job_id, coro).result()
+
+    async def _track(self, job_id, coro):
+        task = asyncio.current_task()
+        self._jobs[job_id] = task
+        try:
+            return await coro
+        finally:
+            if self._jobs.get(job_id) is task:
+                del self._jobs[job_id]
+
+    def cancel(self, job_id, timeout=None):
+        """Cancels a running job; its coroutine sees CancelledError and its child is
+        terminated. Returns False when no such job is running. With ``timeout`` the
+        call waits up to that long for the job to wind down.
+        """
+        if self._loop is None:
+            return False
+
+        async def cancel():
+            task = self._jobs.get(job_id)
+            if task is None:
+                return False
+            task.cancel()
+            self.cancelled += 1
+            await asyncio.wait([task], timeout=timeout or 0)
+            return True
+
+        return asyncio.run_coroutine_threadsafe(cancel(), self._loop).result()
+
+    def is_running(self, job_id):
+        return job_id in self._jobs
+
+    def stats(self):
+        return {'jobs': len(self._jobs), 'cancelled': self.cancelled}
+
+    async def run_process(self, argv, on_line, deadline=None):
+        """Runs ``argv`` with stdout and stderr merged and feeds every non-empty line
+        (stripped) to ``on_line``; a truthy return stops the process early.
+
+        ``deadline`` is a ``loop.time()`` value; past it the child is killed and
+        TimeoutError raised. On cancellation the child gets SIGTERM, then SIGKILL
+        after ``kill_grace`` seconds.
+        """
+        process = await asyncio.create_subprocess_exec(
+            *argv,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+        )
+        loop = asyncio.get_running_loop()
+        stopped = False
+        try:
+            while True:
+                raw = await asyncio.wait_for(process.stdout.readline(), self._remaining(loop, deadline))
+                if not raw:
+                    break
+                line = raw.decode('utf-8', errors='ignore').strip()
+                if line and on_line(line):
+                    stopped = True
+                    break
+            if not stopped:
+                await asyncio.wait_for(process.wait(), self._remaining(loop, deadline))
+        except asyncio.TimeoutError:
+            # Before Python 3.11 asyncio.TimeoutError is not the builtin.
+            raise TimeoutError("Process exceeded its deadline") from None
+        finally:
+            if process.returncode is None:
+                await self._stop(process)
+        return ProcessExit(process.returncode, stopped)
+
+    @staticmethod
+    def _remaining(loop, deadline):
+        return None if deadline is None else max(0.0, deadline - loop.time())
+
+    async def _stop(self, process):
+        try:
+            process.terminate()
+            await asyncio.wait_for(asyncio.shield(process.wait()), self.kill_grace)
+        except ProcessLookupError:
+            pass
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            process.kill()
+            await process.wait()
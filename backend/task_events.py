@@ -0,0 +1,101 @@
+import logging
+import threading
+import time
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'task_events'
+
+
+class TaskEventBus:
+    """Wakes status streams when a task's progress changes.
+
+    Every publish bumps a global sequence number and records it against the
+    task. Waiters block on one condition variable until any task they follow
+    has a newer sequence, so a stream for an attached task can follow its
+    leader too. With Redis, publishes are fanned out over pub/sub to every
+    web process; each process subscribes once, on the first wait.
+    """
+
+    def __init__(self, redis_client=None, max_tasks=10000):
+        self.redis = redis_client
+        self.max_tasks = max_tasks
+        self._seq = 0
+        self._task_seq = {}  # task_id -> seq of its latest event
+        self._cond = threading.Condition()
+        self._listener = None
+        self.published = 0
+        self.remote_events = 0
+
+    @property
+    def seq(self):
+        with self._cond:
+            return self._seq
+
+    def publish(self, task_id):
+        self._notify(task_id)
+        if self.redis is not None:
+            try:
+                self.redis.publish(CHANNEL, task_id)
+            except redis.RedisError as e:
+                logger.warning(f"[{task_id}] Task event publish failed: {e}")
+
+    def _notify(self, task_id, remote=False):
+        with self._cond:
+            self._seq += 1
+            self._task_seq.pop(task_id, None)
+            self._task_seq[task_id] = self._seq
+            while len(self._task_seq) > self.max_tasks:
+                del self._task_seq[next(iter(self._task_seq))]
+            if remote:
+                self.remote_events += 1
+            else:
+                self.published += 1
+            self._cond.notify_all()
+
+    def wait(self, task_ids, after_seq, timeout):
+        """Blocks until one of ``task_ids`` has an event newer than ``after_seq``.
+
+        Returns the current sequence number; the caller passes it back as
+        ``after_seq`` on the next call. Returns on timeout as well.
+        """
+        self._ensure_listener()
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not any(self._task_seq.get(t, 0) > after_seq for t in task_ids):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return self._seq
+
+    def _ensure_listener(self):
+        if self.redis is None or self._listener is not None:
+            return
+        with self._cond:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='task-events', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CHANNEL)
+                for message in pubsub.listen():
+                    if message.get('type') == 'message':
+                        self._notify(message['data'], remote=True)
+            except redis.RedisError as e:
+                logger.warning(f"Task event subscription lost, reconnecting: {e}")
+                time.sleep(1)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'seq': self._seq,
+                'tracked_tasks': len(self._task_seq),
+                'published': self.published,
+                'remote_events': self.remote_events,
+            }
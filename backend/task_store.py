@@ -0,0 +1,354 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+
+from redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+TASK_KEY_PREFIX = 'download_task:'
+USER_KEY_PREFIX = 'download_task_user:'
+TERMINAL_STATUSES = ('Completed', 'Failed', 'Cancelled')
+# Fields whose changes wake status watchers (see update()).
+TRACKED_FIELDS = ('status', 'percentage')
+_MISSING = object()
+
+# KEYS[1]: task hash. ARGV: ttl, 1 to exclude rather than require the statuses,
+# number of statuses, the statuses, then field/value pairs. Values are JSON,
+# like every field of the hash.
+UPDATE_IF_STATUS_SCRIPT = """
+local status = redis.call('HGET', KEYS[1], 'status')
+if not status then return 0 end
+local listed = false
+for i = 4, 3 + tonumber(ARGV[3]) do
+    if ARGV[i] == status then listed = true end
+end
+if listed == (ARGV[2] == '1') then return 0 end
+for i = 4 + tonumber(ARGV[3]), #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+
+def is_active(fields):
+    return fields.get('status') not in TERMINAL_STATUSES
+
+
+class TaskRecord:
+    """One task's fields. The ones every task has live in slots; the rest
+    (collection items, archive paths, ...) in a dict created on first use."""
+
+    SLOTS = ('status', 'percentage', 'message', 'mode', 'user', 'url', 'format_id', 'filename',
+             'download_name', 'attached_to', 'parent', 'quota_reservation', 'downloader', 'rate_limit',
+             'downloaded_bytes', 'total_bytes', 'speed', 'eta', 'fragment_index', 'fragment_count',
+             'average_speed')
+    __slots__ = SLOTS + ('extra', 'created_at', 'updated_at')
+
+    def __init__(self):
+        self.extra = None
+        self.created_at = time.time()
+        self.updated_at = 0.0
+
+    def get(self, name, default=None):
+        if name in self.SLOTS:
+            return getattr(self, name, default)
+        return (self.extra or {}).get(name, default)
+
+    def update(self, fields):
+        for name, value in fields.items():
+            if name in self.SLOTS:
+                setattr(self, name, value)
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[name] = value
+
+    def as_dict(self):
+        fields = {}
+        for name in self.SLOTS:
+            value = getattr(self, name, _MISSING)
+            if value is not _MISSING:
+                fields[name] = value
+        if self.extra:
+            fields.update(self.extra)
+        return fields
+
+
+class MemoryTaskStore:
+    """Task records of this process.
+
+    Records expire ``ttl`` seconds after their last update, and once there
+    are more than ``max_tasks`` the least recently updated ones are evicted,
+    so memory stays bounded however many tasks were ever started.
+    """
+
+    def __init__(self, ttl=24 * 3600, max_tasks=10000):
+        self.ttl = ttl
+        self.max_tasks = max_tasks
+        self._records = OrderedDict()  # least recently updated first
+        self._active_by_user = {}  # user -> {task_id: None}, insertion ordered
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def get(self, task_id):
+        with self._lock:
+            record = self._records.get(task_id)
+            if record is None:
+                return None
+            if time.monotonic() - record.updated_at > self.ttl:
+                self._remove(task_id)
+                return None
+            return record.as_dict()
+
+    def update(self, task_id, fields, defer=False):
+        """Merges ``fields`` into the task's record (creating it) and returns True
+        when one of TRACKED_FIELDS changed. ``defer`` marks a progress sample,
+        which is dropped once the task finished; memory writes are never batched.
+        """
+        with self._lock:
+            record = self._records.get(task_id)
+            if defer and record is not None and record.get('status') in TERMINAL_STATUSES:
+                return False
+            return self._apply(task_id, self._records.pop(task_id, None) or TaskRecord(), fields)
+
+    def update_if_status(self, task_id, statuses, fields, exclude=False):
+        """Merges ``fields`` into an existing record only while its status is one of
+        ``statuses`` (with ``exclude``: none of them), atomically; returns whether it did."""
+        with self._lock:
+            record = self._records.get(task_id)
+            if record is None or (record.get('status') in statuses) == exclude:
+                return False
+            self._apply(task_id, self._records.pop(task_id), fields)
+            return True
+
+    def _apply(self, task_id, record, fields):
+        changed = any(record.get(name, _MISSING) != fields[name] for name in TRACKED_FIELDS if name in fields)
+        if 'user' in fields and record.get('user') not in (None, fields['user']):
+            self._unindex(task_id, record.get('user'))
+        record.update(fields)
+        record.updated_at = time.monotonic()
+        self._records[task_id] = record
+        user = record.get('user')
+        if user is not None:
+            if record.get('status') not in TERMINAL_STATUSES:
+                self._active_by_user.setdefault(user, {})[task_id] = None
+            else:
+                self._unindex(task_id, user)
+        self._evict()
+        return changed
+
+    def delete(self, task_id):
+        with self._lock:
+            self._remove(task_id)
+
+    def active_tasks(self, user):
+        """``{task_id: fields}`` of the user's tasks that have not completed or failed,
+        oldest first."""
+        with self._lock:
+            records = sorted(((task_id, self._records[task_id]) for task_id in self._active_by_user.get(user, ())),
+                             key=lambda item: item[1].created_at)
+            return {task_id: record.as_dict() for task_id, record in records}
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'tasks': len(self._records),
+                'max_tasks': self.max_tasks,
+                'users_with_active_tasks': len(self._active_by_user),
+                'evicted': self.evicted,
+            }
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._records:
+            task_id, record = next(iter(self._records.items()))
+            if len(self._records) <= self.max_tasks and now - record.updated_at <= self.ttl:
+                break
+            self._remove(task_id)
+            self.evicted += 1
+
+    def _remove(self, task_id):
+        record = self._records.pop(task_id, None)
+        if record is not None and record.get('user') is not None:
+            self._unindex(task_id, record.get('user'))
+
+    def _unindex(self, task_id, user):
+        tasks = self._active_by_user.get(user)
+        if tasks is not None:
+            tasks.pop(task_id, None)
+            if not tasks:
+                del self._active_by_user[user]
+
+
+class RedisTaskStore:
+    """Task records in Redis, one hash per task, shared by every gunicorn worker,
+    web node and Celery worker. Keys expire ``ttl`` seconds after the last write.
+
+    Progress samples (``update(..., defer=True)``) are buffered and written
+    for all tasks in one pipeline at most every ``flush_interval`` seconds;
+    any other update writes immediately, together with what is buffered.
+    Samples only land while the task has not finished, so a late flush
+    cannot undo a cancellation made by another process. A set per user
+    lists their active tasks.
+    """
+
+    def __init__(self, redis_client, ttl=24 * 3600, flush_interval=1.0, max_tracked=10000):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.max_tracked = max_tracked
+        self._pending = {}  # task_id -> fields not written yet
+        self._samples = {}  # task_id -> progress sample fields not written yet
+        self._flushed_at = 0.0
+        self._seen = OrderedDict()  # task_id -> tracked fields as last written by this process
+        self._lock = threading.Lock()
+        self.batches = 0
+
+    def get(self, task_id):
+        try:
+            raw = self.redis.hgetall(f"{TASK_KEY_PREFIX}{task_id}")
+        except redis.RedisError as e:
+            logger.warning(f"[{task_id}] Task state read from Redis failed: {e}")
+            return None
+        return {name: json.loads(value) for name, value in raw.items()} if raw else None
+
+    def update(self, task_id, fields, defer=False):
+        """Writes ``fields`` into the task's hash and returns True when one of
+        TRACKED_FIELDS differs from what this process last wrote for the task.
+        """
+        with self._lock:
+            changed = self._remember(task_id, fields)
+            buffer = self._samples if defer else self._pending
+            pending = buffer.pop(task_id, {})
+            pending.update(fields)
+            buffer[task_id] = pending
+            if not defer or time.monotonic() - self._flushed_at >= self.flush_interval:
+                self._flush()
+        return changed
+
+    def update_if_status(self, task_id, statuses, fields, exclude=False):
+        """Writes ``fields`` only while the task's status is one of ``statuses`` (with
+        ``exclude``: none of them), checked and written in one Lua script so
+        concurrent writers cannot both succeed."""
+        with self._lock:
+            # Buffered writes for the task must land before its status is compared.
+            self._flush()
+            try:
+                applied = bool(self.redis.eval(UPDATE_IF_STATUS_SCRIPT, 1, f"{TASK_KEY_PREFIX}{task_id}",
+                                               *self._script_args(statuses, fields, exclude)))
+            except redis.RedisError as e:
+                logger.warning(f"[{task_id}] Conditional task update in Redis failed: {e}")
+                return False
+            if applied:
+                self._remember(task_id, fields)
+        return applied
+
+    def _script_args(self, statuses, fields, exclude):
+        args = [self.ttl, int(exclude), len(statuses), *(json.dumps(status) for status in statuses)]
+        for name, value in fields.items():
+            args += [name, json.dumps(value)]
+        return args
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        # Runs under the lock so batches reach Redis in the order they were taken.
+        batch, self._pending = self._pending, {}
+        samples, self._samples = self._samples, {}
+        self._flushed_at = time.monotonic()
+        if batch or samples:
+            self._write(batch, samples)
+
+    def delete(self, task_id):
+        with self._lock:
+            self._pending.pop(task_id, None)
+            self._samples.pop(task_id, None)
+            self._seen.pop(task_id, None)
+        try:
+            self.redis.delete(f"{TASK_KEY_PREFIX}{task_id}")
+        except redis.RedisError as e:
+            logger.warning(f"[{task_id}] Task state delete from Redis failed: {e}")
+
+    def active_tasks(self, user):
+        """``{task_id: fields}`` of the user's tasks that have not completed or failed,
+        oldest first. Members that expired or finished are dropped from the user's
+        set on the way.
+        """
+        user_key = f"{USER_KEY_PREFIX}{user}"
+        try:
+            task_ids = list(self.redis.smembers(user_key))
+            pipe = self.redis.pipeline()
+            for task_id in task_ids:
+                pipe.hgetall(f"{TASK_KEY_PREFIX}{task_id}")
+            records = pipe.execute()
+            tasks = {}
+            stale = []
+            for task_id, raw in zip(task_ids, records):
+                fields = {name: json.loads(value) for name, value in raw.items()} if raw else None
+                if fields and is_active(fields):
+                    tasks[task_id] = fields
+                else:
+                    stale.append(task_id)
+            if stale:
+                self.redis.srem(user_key, *stale)
+            # Task IDs are random, so the order comes from the hash's creation time.
+            return dict(sorted(tasks.items(), key=lambda item: (item[1].get('created_at') or 0, item[0])))
+        except redis.RedisError as e:
+            logger.warning(f"Active task lookup for {user} failed: {e}")
+            return {}
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'redis',
+                'pending_writes': len(self._pending) + len(self._samples),
+                'write_batches': self.batches,
+            }
+
+    def _remember(self, task_id, fields):
+        seen = self._seen.pop(task_id, {})
+        changed = any(seen.get(name, _MISSING) != fields[name] for name in TRACKED_FIELDS if name in fields)
+        seen.update((name, fields[name]) for name in TRACKED_FIELDS if name in fields)
+        self._seen[task_id] = seen
+        while len(self._seen) > self.max_tracked:
+            self._seen.popitem(last=False)
+        return changed
+
+    def _write(self, batch, samples):
+        try:
+            pipe = self.redis.pipeline()
+            # Samples are older than the updates buffered with them, so they go first.
+            for task_id, fields in samples.items():
+                pipe.eval(UPDATE_IF_STATUS_SCRIPT, 1, f"{TASK_KEY_PREFIX}{task_id}",
+                          *self._script_args(TERMINAL_STATUSES, fields, exclude=True))
+            for task_id, fields in batch.items():
+                key = f"{TASK_KEY_PREFIX}{task_id}"
+                pipe.hset(key, mapping={name: json.dumps(value) for name, value in fields.items()})
+                # Only the first write of a task sets it, whichever process makes it.
+                pipe.hsetnx(key, 'created_at', json.dumps(time.time()))
+                pipe.expire(key, self.ttl)
+                if fields.get('user') is not None and is_active(fields):
+                    user_key = f"{USER_KEY_PREFIX}{fields['user']}"
+                    pipe.sadd(user_key, task_id)
+                    pipe.expire(user_key, self.ttl)
+            pipe.execute()
+            self.batches += 1
+        except redis.RedisError as e:
+            logger.warning(f"Task state write to Redis failed for {', '.join([*samples, *batch])}: {e}")
+
+
+def create_task_store(kind, ttl, max_tasks=10000, flush_interval=1.0):
+    if kind == 'redis':
+        return RedisTaskStore(get_redis(), ttl=ttl, flush_interval=flush_interval)
+    if kind == 'memory':
+        return MemoryTaskStore(ttl=ttl, max_tasks=max_tasks)
+    raise ValueError(f"Unknown task store: {kind}")
@@ -0,0 +1,85 @@
+import time
+import unittest
+
+from analytics import AnalyticsEngine, KeywordIndex
+
+
+def video(**fields):
+    return dict({'title': 'Plain title', 'categories': ['Gaming'], 'duration': 600,
+                 'view_count': 10000, 'like_count': 200, 'comment_count': 50}, **fields)
+
+
+class TestAnalyticsEngine(unittest.TestCase):
+    def test_scores_match_the_former_browser_rules(self):
+        engine = AnalyticsEngine()
+        short_tutorial, passive = engine.score([
+            video(title='How to speedrun', duration=100, view_count=1000, like_count=60, comment_count=0),
+            video(categories=[], view_count=0),
+        ])
+
+        self.assertEqual(short_tutorial['cpm'], 1.5)
+        self.assertEqual(short_tutorial['estimated_revenue'], 1.5)
+        self.assertEqual(short_tutorial['audience']['age'], {'13-17': 41, '18-24': 41, '25-34': 17, '35+': 1})
+        self.assertEqual(short_tutorial['audience']['gender'], {'male': 81, 'female': 19})
+
+        self.assertEqual(passive['category'], 'General')
+        self.assertEqual((passive['cpm'], passive['estimated_revenue']), (2.5, 0))
+        self.assertEqual(passive['audience']['age'], {'13-17': 22, '18-24': 30, '25-34': 26, '35+': 22})
+        self.assertEqual(passive['audience']['gender'], {'male': 50, 'female': 50})
+
+    def test_first_matching_rule_wins(self):
+        index = KeywordIndex([('tech',), ('science', 'news')])
+        self.assertEqual(index.match('Science & Technology'), 0)
+        self.assertEqual(list(index.match_many(['News', 'Comedy', 'news'])), [1, 2, 1])
+
+        science, boxing = AnalyticsEngine().score([video(categories=['Science & Technology']),
+                                                   video(title='Boxing day routine')])
+        self.assertEqual(science['cpm'], 12.0)
+        self.assertEqual(science['audience']['gender'], {'male': 85, 'female': 15})
+        # "routine" comes before "boxing" in the title rules.
+        self.assertEqual(boxing['audience']['gender'], {'male': 70, 'female': 30})
+
+    def test_results_are_memoized_per_video_id_while_inputs_match(self):
+        engine = AnalyticsEngine()
+        engine.score([video(id='a'), video(id='b')])
+        engine.score([video(id='a'), video(id='b', view_count=20000), video()])
+
+        self.assertEqual(engine.stats(), {'memoized': 2, 'hits': 1, 'misses': 4})
+
+    def test_channel_export_is_scored_in_well_under_a_second(self):
+        categories = ['Gaming', 'Music', 'News & Politics', 'Science & Technology', 'People & Blogs', 'Howto & Style']
+        titles = ['My morning routine', 'Boxing highlights', 'Beginner guide', 'Weekly update']
+        videos = [video(id=f"v{i}", title=f"{titles[i % 4]} #{i}", categories=[categories[i % 6]],
+                        duration=i * 7 % 3600, view_count=i * 1013, like_count=i * 7, comment_count=i)
+                  for i in range(1000)]
+        started = time.perf_counter()
+        results = AnalyticsEngine().score(videos)
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertEqual(len(results), 1000)
+        self.assertTrue(all(sum(r['audience']['gender'].values()) in (99, 100, 101) for r in results))
+
+
+class TestAnalyticsEndpoint(unittest.TestCase):
+    def setUp(self):
+        import app as backend
+        self.backend = backend
+        self.client = backend.app.test_client()
+
+    def test_bulk_results_come_back_in_order(self):
+        response = self.client.post('/api/analytics', json={'videos': [
+            video(id='x1', categories=['Music']), video(id='x2', categories=['Education'])]})
+        self.assertEqual(response.status_code, 200)
+        results = response.get_json()['results']
+        self.assertEqual([(r['id'], r['cpm']) for r in results], [('x1', 1.2), ('x2', 6.5)])
+
+        self.assertEqual(self.client.post('/api/analytics', json={'videos': []}).status_code, 400)
+        self.assertEqual(self.client.post('/api/analytics', json={'videos': ['x']}).status_code, 400)
+
+    def test_info_response_includes_analytics(self):
+        info = self.backend.describe_video(video(id='abc', extractor_key='Youtube', formats=[]))
+        self.assertEqual(info['analytics']['cpm'], 1.5)
+        self.assertEqual(self.backend.analytics_key({'id': 'abc', 'extractor_key': 'Youtube'}), 'youtube:abc')
+
+
+if __name__ == '__main__':
+    unittest.main()
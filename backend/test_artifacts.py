@@ -0,0 +1,262 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from artifacts import LOCK_DIR, ArtifactStore, StorageFull, artifact_key
+
+
+class TestArtifactStore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.store = ArtifactStore(self.dir)
+        self.key = artifact_key('youtube:dQw4w9WgXcQ', '18')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def download(self, flight, content=b'video-bytes'):
+        path = os.path.join(self.dir, f"{flight.key}.mp4")
+        with open(path, 'wb') as f:
+            f.write(content)
+        return self.store.publish(flight, path)
+
+    def test_key_depends_on_video_and_format(self):
+        self.assertEqual(self.key, artifact_key('youtube:dQw4w9WgXcQ', '18'))
+        self.assertNotEqual(self.key, artifact_key('youtube:dQw4w9WgXcQ', '22'))
+
+    def test_repeat_claim_reuses_published_file(self):
+        claim, flight = self.store.claim(self.key, 'task-1')
+        self.assertEqual(claim, ArtifactStore.CLAIM_LEAD)
+        artifact = self.download(flight)
+
+        claim, reused = self.store.claim(self.key, 'task-2')
+        self.assertEqual(claim, ArtifactStore.CLAIM_READY)
+        self.assertIs(reused, artifact)
+        self.assertEqual(self.store.stats()['reuse_hits'], 1)
+
+    def test_second_task_attaches_to_in_flight_download(self):
+        _, flight = self.store.claim(self.key, 'task-1')
+        claim, attached = self.store.claim(self.key, 'task-2')
+        self.assertEqual(claim, ArtifactStore.CLAIM_ATTACH)
+        self.assertEqual(attached.task_id, 'task-1')
+
+        threading.Timer(0.05, self.download, args=(flight,)).start()
+        self.assertTrue(attached.event.wait(2))
+        self.assertEqual(attached.artifact.filename, f"{self.key}.mp4")
+
+    def test_failure_is_shared_and_key_can_be_retried(self):
+        _, flight = self.store.claim(self.key, 'task-1')
+        _, attached = self.store.claim(self.key, 'task-2')
+        self.store.fail(flight, 'HTTP Error 403')
+
+        self.assertEqual(attached.error, 'HTTP Error 403')
+        self.assertEqual(self.store.claim(self.key, 'task-3')[0], ArtifactStore.CLAIM_LEAD)
+
+    def test_alias_is_a_hardlink(self):
+        _, flight = self.store.claim(self.key, 'task-1')
+        artifact = self.download(flight)
+
+        alias = self.store.alias(artifact, 'my video')
+        self.assertEqual(alias, 'my video.mp4')
+        self.assertTrue(os.path.samefile(os.path.join(self.dir, alias), self.store.path(artifact)))
+
+    def test_referenced_artifact_survives_expiry(self):
+        _, flight = self.store.claim(self.key, 'task-1')
+        artifact = self.download(flight)
+        self.store.alias(artifact, 'named')
+
+        held = self.store.acquire('named.mp4')
+        with patch('artifacts.time.time', return_value=time.time() + 3600):
+            self.assertEqual(self.store.expire(60), [])
+            self.store.release(held)
+            self.assertEqual(self.store.expire(60), [self.key])
+        self.assertEqual(os.listdir(self.dir), [LOCK_DIR])
+        self.assertEqual(os.listdir(os.path.join(self.dir, LOCK_DIR)), [])
+
+    def test_index_is_rebuilt_from_disk(self):
+        _, flight = self.store.claim(self.key, 'task-1')
+        self.download(flight)
+
+        restarted = ArtifactStore(self.dir)
+        self.assertEqual(restarted.claim(self.key, 'task-2')[0], ArtifactStore.CLAIM_READY)
+
+    def test_aliases_survive_a_restart(self):
+        _, flight = self.store.claim(self.key, 'task-1')
+        self.store.alias(self.download(flight), 'my video')
+
+        restarted = ArtifactStore(self.dir)
+        artifact = restarted.acquire('my video.mp4')
+        self.assertEqual(artifact.key, self.key)
+        restarted.release(artifact)
+        self.assertEqual(restarted.expire(-1), [self.key])
+        self.assertFalse(os.path.exists(os.path.join(self.dir, 'my video.mp4')))
+
+
+class TestSharedDirectory(unittest.TestCase):
+    """Two stores on one directory stand in for two worker processes."""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.first = ArtifactStore(self.dir, max_bytes=100)
+        self.second = ArtifactStore(self.dir, max_bytes=100)
+        self.key = artifact_key('youtube:dQw4w9WgXcQ', '18')
+
+    def publish(self, store, flight, size=10):
+        path = os.path.join(self.dir, f"{flight.key}.tmp")
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        return store.publish(flight, path)
+
+    def test_other_process_attaches_to_the_download(self):
+        claim, flight = self.first.claim(self.key, 'task-1')
+        self.assertEqual(claim, ArtifactStore.CLAIM_LEAD)
+        claim, attached = self.second.claim(self.key, 'task-2')
+        self.assertEqual(claim, ArtifactStore.CLAIM_ATTACH)
+        self.assertEqual(attached.task_id, 'task-1')
+
+        self.publish(self.first, flight)
+        self.assertTrue(attached.event.wait(2))
+        self.assertEqual(attached.artifact.filename, f"{self.key}.tmp")
+        self.assertEqual(self.second.claim(self.key, 'task-3')[0], ArtifactStore.CLAIM_READY)
+
+    def test_failed_download_elsewhere_fails_attached_tasks(self):
+        _, flight = self.first.claim(self.key, 'task-1')
+        _, attached = self.second.claim(self.key, 'task-2')
+        self.first.fail(flight, 'HTTP Error 403')
+        self.assertTrue(attached.event.wait(2))
+        self.assertIsNone(attached.artifact)
+        self.assertEqual(self.second.claim(self.key, 'task-3')[0], ArtifactStore.CLAIM_LEAD)
+
+    def test_budget_and_eviction_span_processes(self):
+        _, flight = self.first.claim(self.key, 'task-1', 60)
+        with self.assertRaises(StorageFull):
+            self.second.claim(artifact_key('other', '18'), 'task-2', 60)
+
+        artifact = self.publish(self.first, flight, 60)
+        served = self.second.acquire(artifact.filename)
+        self.assertIsNotNone(served)
+        # Served by the second process, so the first cannot evict it.
+        with self.assertRaises(StorageFull):
+            self.first.claim(artifact_key('other', '18'), 'task-2', 60)
+        self.assertTrue(os.path.exists(self.first.path(artifact)))
+
+        self.second.release(served)
+        self.assertEqual(self.first.claim(artifact_key('other', '18'), 'task-2', 60)[0], ArtifactStore.CLAIM_LEAD)
+        self.assertFalse(os.path.exists(self.first.path(artifact)))
+        self.assertIsNone(self.second.acquire(artifact.filename))
+
+
+class TestSharedDirectoryWithoutFcntl(TestSharedDirectory):
+    """Where fcntl is missing (Windows) the key locks still coordinate the stores of one process."""
+
+    def setUp(self):
+        patcher = patch('artifacts.fcntl', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        super().setUp()
+
+
+class TestDiskBudget(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.store = ArtifactStore(self.dir, max_bytes=100)
+
+    def add(self, name, size, estimated=0):
+        _, flight = self.store.claim(artifact_key(name, '18'), name, estimated)
+        path = os.path.join(self.dir, f"{name}.tmp")
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        return self.store.publish(flight, path)
+
+    def test_lru_artifact_is_evicted_to_admit_new_download(self):
+        old = self.add('old', 40)
+        recent = self.add('recent', 40)
+        with patch('artifacts.time.time', return_value=time.time() + 10):
+            self.store.acquire(recent.filename)
+            self.store.release(recent)
+
+        self.add('new', 40, estimated=40)
+        self.assertFalse(os.path.exists(self.store.path(old)))
+        self.assertTrue(os.path.exists(self.store.path(recent)))
+        self.assertEqual(self.store.stats()['evictions'], 1)
+
+    def test_download_that_cannot_fit_is_refused(self):
+        held = self.add('held', 80)
+        self.store.acquire(held.filename)
+        with self.assertRaises(StorageFull):
+            self.store.claim(artifact_key('big', '18'), 'big', 50)
+        self.assertEqual(self.store.stats()['in_flight'], 0)
+
+    def test_in_flight_reservations_count_against_budget(self):
+        self.store.claim(artifact_key('a', '18'), 'a', 60)
+        with self.assertRaises(StorageFull):
+            self.store.claim(artifact_key('b', '18'), 'b', 60)
+
+    def test_enforce_budget_after_oversized_download(self):
+        self.add('first', 60)
+        self.add('second', 60)
+        self.store.enforce_budget()
+        self.assertLessEqual(self.store.stats()['bytes'], 100)
+
+
+class TestDownloadReuse(unittest.TestCase):
+    @patch('app.quota_manager')
+    def test_repeat_request_completes_without_downloading(self, mock_quota):
+        import app as backend
+        dir_ = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dir_)
+        calls = []
+
+        async def fake_download(task_id, url, format_id, output_template, downloader=None, lease=None):
+            calls.append(task_id)
+            path = os.path.join(dir_, os.path.basename(output_template).replace('%(ext)s', 'mp4'))
+            with open(path, 'wb') as f:
+                f.write(b'x' * 10)
+            return [path]
+
+        def run_now(job_id, user, fn, *args, **kwargs):
+            fn(*args).result(timeout=5)
+
+        with patch.object(backend, 'supervise_ytdlp', fake_download), \
+                patch.object(backend, 'artifact_store', ArtifactStore(dir_)), \
+                patch.object(backend.extraction_engine, 'mode', 'subprocess'), \
+                patch.object(backend.download_scheduler, 'submit', side_effect=run_now):
+            backend.start_download('reuse-1', 'https://youtu.be/reuse000001', '18')
+            backend.start_download('reuse-2', 'https://www.youtube.com/watch?v=reuse000001', '18', custom_filename='clip')
+
+        self.assertEqual(calls, ['reuse-1'])
+        self.assertEqual(backend.get_task('reuse-2')['status'], 'Completed')
+        self.assertEqual(backend.get_task('reuse-2')['filename'], 'clip.mp4')
+        self.assertEqual(mock_quota.add_usage.call_count, 2)
+
+    @patch('app.quota_manager')
+    def test_attached_task_completes_with_leader(self, mock_quota):
+        import app as backend
+        dir_ = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dir_)
+        store = ArtifactStore(dir_)
+
+        with patch.object(backend, 'artifact_store', store), \
+                patch.object(backend.download_scheduler, 'submit') as mock_submit:
+            backend.start_download('lead-1', 'https://youtu.be/attach00001', '18')
+            backend.start_download('follow-1', 'https://youtu.be/attach00001', '18')
+            self.assertEqual(mock_submit.call_count, 1)
+            self.assertEqual(backend.get_task('follow-1')['attached_to'], 'lead-1')
+
+            flight = mock_submit.call_args[0][-1]
+            path = os.path.join(dir_, 'tmp.mp4')
+            with open(path, 'wb') as f:
+                f.write(b'x')
+            store.publish(flight, path)
+
+        self.assertEqual(backend.get_task('follow-1')['status'], 'Completed')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from bandwidth import MIN_RATE, BandwidthGovernor, Tier, mbps_to_bytes, parse_tiers, parse_user_tiers
+
+MB = 1_000_000
+
+FAKE_YTDLP = '''import json, os, sys, time
+log = os.path.join(os.path.dirname(sys.argv[0]), 'runs.log')
+with open(log, 'a') as f:
+    f.write(sys.argv[sys.argv.index('--limit-rate') + 1] + '\\n')
+runs = len(open(log).read().split())
+print('[progress] ' + json.dumps({"status": "downloading", "downloaded_bytes": 100 * runs,
+      "total_bytes": 1000}), flush=True)
+if runs == 1:
+    time.sleep(10)
+    sys.exit(1)
+out = sys.argv[sys.argv.index('-o') + 1].replace('%(ext)s', 'mp4')
+open(out, 'wb').write(b'x' * 1000)
+print(sys.argv[sys.argv.index('--print') + 1].split(':', 1)[1].replace('%(filepath)s', out), flush=True)
+'''
+
+
+class TestConfig(unittest.TestCase):
+    def test_parse_tiers(self):
+        tiers = parse_tiers('premium:3:80, default:1')
+        self.assertEqual(tiers['premium'], Tier(3.0, 10 * MB))
+        self.assertEqual(tiers['default'], Tier(1.0, 0))
+        self.assertIn('default', parse_tiers(''))
+
+    def test_parse_user_tiers(self):
+        self.assertEqual(parse_user_tiers('203.0.113.7=premium,::1=premium'),
+                         {'203.0.113.7': 'premium', '::1': 'premium'})
+
+
+class TestBandwidthGovernor(unittest.TestCase):
+    def setUp(self):
+        self.governor = BandwidthGovernor(
+            limit=mbps_to_bytes(80),
+            tiers={'default': Tier(1.0, 0), 'premium': Tier(3.0, 0), 'capped': Tier(1.0, 1 * MB)},
+            user_tiers={'paul': 'premium', 'carl': 'capped', 'ghost': 'missing'}
+        )
+
+    def test_single_job_gets_whole_budget(self):
+        lease = self.governor.acquire('1', 'alice')
+        self.assertEqual(lease.rate, 10 * MB)
+
+    def test_users_share_by_weight_and_jobs_split_user_share(self):
+        alice = [self.governor.acquire(str(i), 'alice') for i in range(3)]
+        paul = self.governor.acquire('p', 'paul')
+        self.assertEqual(paul.rate, int(7.5 * MB))
+        self.assertEqual([lease.rate for lease in alice], [int(2.5 * MB / 3)] * 3)
+
+    def test_capped_tier_leaves_the_rest_to_others(self):
+        carl = self.governor.acquire('c', 'carl')
+        alice = self.governor.acquire('a', 'alice')
+        self.assertEqual(carl.rate, 1 * MB)
+        self.assertEqual(alice.rate, 9 * MB)
+
+    def test_release_rebalances(self):
+        first = self.governor.acquire('1', 'alice')
+        second = self.governor.acquire('2', 'bob')
+        self.assertEqual(first.rate, 5 * MB)
+        self.governor.release(second)
+        self.assertEqual(first.rate, 10 * MB)
+        self.assertEqual(len(self.governor.allocation()['jobs']), 1)
+
+    def test_unknown_tier_falls_back_to_default_and_rate_has_a_floor(self):
+        self.assertEqual(self.governor.tier_for('ghost'), 'default')
+        leases = [self.governor.acquire(str(i), 'alice') for i in range(500)]
+        self.assertEqual(leases[0].rate, MIN_RATE)
+
+    def test_without_limit_only_tier_caps_apply(self):
+        governor = BandwidthGovernor(tiers={'default': Tier(1.0, 0), 'capped': Tier(1.0, MB)},
+                                     user_tiers={'carl': 'capped'})
+        self.assertIsNone(governor.acquire('a', 'alice').rate)
+        self.assertEqual(governor.acquire('c', 'carl').rate, MB)
+
+    def test_restart_needs_a_large_enough_change(self):
+        self.governor.restart_interval = 0
+        lease = self.governor.acquire('1', 'alice')
+        lease.apply()
+        self.assertFalse(lease.should_restart())
+        crowd = [self.governor.acquire(str(i), f"user{i}") for i in range(2, 5)]
+        self.assertTrue(lease.should_restart())
+        lease.apply()
+        self.governor.release(crowd[0])  # 2.5 MB/s -> 3.33 MB/s is above the 25% threshold
+        self.assertTrue(lease.should_restart())
+
+    def test_pace_throttles_to_the_current_rate(self):
+        lease = self.governor.acquire('1', 'alice')
+        lease.rate = 100 * 1024
+        started = time.monotonic()
+        for _ in range(3):
+            lease.pace(50 * 1024)
+        # One second of burst is allowed, so 1.5 seconds' worth takes about half a second.
+        self.assertGreater(time.monotonic() - started, 0.4)
+
+
+class TestRateChangeRestartsDownload(unittest.TestCase):
+    def test_ytdlp_restarts_with_the_new_limit(self):
+        import app as backend
+        dir_ = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dir_)
+        script = os.path.join(dir_, 'fake-yt-dlp')
+        with open(script, 'w') as f:
+            f.write(f"#!{sys.executable}\n{FAKE_YTDLP}")
+        os.chmod(script, os.stat(script).st_mode | stat.S_IEXEC)
+
+        governor = BandwidthGovernor(limit=mbps_to_bytes(16), restart_interval=0)
+        lease = governor.acquire('bw-1', 'alice')
+        should_restart = lease.should_restart
+
+        def crowded():
+            # Another user starts downloading while yt-dlp is running.
+            if len(governor.allocation()['jobs']) == 1:
+                governor.acquire('bw-2', 'bob')
+            return should_restart()
+
+        lease.should_restart = crowded
+        with patch.object(backend, 'YTDLP_PATH', script), \
+                patch.object(backend, 'PROGRESS_UPDATES_PER_SECOND', 0):
+            path, = backend.run_subprocess_download('bw-1', 'https://youtu.be/abc', '18',
+                                                    os.path.join(dir_, 'key.%(ext)s'), lease=lease)
+
+        task = backend.get_task('bw-1')
+        backend.forget_task('bw-1')
+        self.assertTrue(os.path.isfile(path))
+        with open(os.path.join(dir_, 'runs.log')) as f:
+            self.assertEqual(f.read().split(), ['2000000', '1000000'])
+        self.assertEqual(task['rate_limit'], 1 * MB)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import json
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from batch import BatchRunner, domain_key, is_playlist_url
+from extractor import ExtractionError
+
+
+class TestUrls(unittest.TestCase):
+    def test_domain_key_merges_platform_aliases(self):
+        self.assertEqual(domain_key('https://youtu.be/abc'), 'youtube.com')
+        self.assertEqual(domain_key('https://m.youtube.com/watch?v=abc'), 'youtube.com')
+        self.assertEqual(domain_key('https://vm.tiktok.com/xyz/'), 'tiktok.com')
+        self.assertEqual(domain_key('https://x.com/u/status/1'), 'twitter.com')
+
+    def test_playlist_detection(self):
+        self.assertTrue(is_playlist_url('https://www.youtube.com/playlist?list=PL123'))
+        self.assertFalse(is_playlist_url('https://www.youtube.com/watch?v=abc&list=PL123'))
+        self.assertTrue(is_playlist_url('https://soundcloud.com/artist/sets/album'))
+        self.assertFalse(is_playlist_url('https://soundcloud.com/artist/track'))
+
+
+class TestBatchRunner(unittest.TestCase):
+    def test_limits_total_and_per_domain_concurrency(self):
+        lock = threading.Lock()
+        active = {}
+        peaks = {'total': 0}
+
+        def work(url):
+            domain = domain_key(url)
+            with lock:
+                active[domain] = active.get(domain, 0) + 1
+                peaks[domain] = max(peaks.get(domain, 0), active[domain])
+                peaks['total'] = max(peaks['total'], sum(active.values()))
+            time.sleep(0.02)
+            with lock:
+                active[domain] -= 1
+            return url
+
+        urls = [f'https://youtu.be/{i}' for i in range(6)] + [f'https://www.tiktok.com/@a/video/{i}' for i in range(3)]
+        results = list(BatchRunner(max_workers=3, per_domain=2).run(work, urls))
+
+        self.assertEqual(sorted(index for index, _, _, _ in results), list(range(9)))
+        self.assertLessEqual(peaks['youtube.com'], 2)
+        self.assertLessEqual(peaks['total'], 3)
+        self.assertGreaterEqual(peaks['tiktok.com'], 1)
+
+    def test_results_arrive_in_completion_order_with_errors(self):
+        def work(url):
+            if url.endswith('bad'):
+                raise ExtractionError('Video unavailable')
+            time.sleep(0.1 if url.endswith('slow') else 0)
+            return url.upper()
+
+        urls = ['https://youtu.be/slow', 'https://soundcloud.com/bad', 'https://www.tiktok.com/fast']
+        results = list(BatchRunner(max_workers=3).run(work, urls))
+
+        self.assertEqual(results[-1][:3], (0, urls[0], 'HTTPS://YOUTU.BE/SLOW'))
+        errors = [error for _, _, _, error in results if error is not None]
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], ExtractionError)
+
+
+class TestBatchEndpoint(unittest.TestCase):
+    def setUp(self):
+        import app as backend
+        self.backend = backend
+        backend.limiter.enabled = False
+        self.addCleanup(setattr, backend.limiter, 'enabled', True)
+        self.client = backend.app.test_client()
+
+    def test_streams_one_line_per_url(self):
+        info = {'title': 'Clip', 'formats': [
+            {'format_id': '18', 'ext': 'mp4', 'resolution': '640x360', 'filesize': 10},
+            {'format_id': '22', 'ext': 'mp4', 'resolution': '1280x720', 'filesize': 20},
+            {'format_id': 'sb0', 'ext': 'mhtml'},
+        ]}
+        playlist = {'title': 'Mix', 'entries': [
+            {'id': 'a', 'url': 'https://www.youtube.com/watch?v=a', 'title': 'A'},
+            {'id': 'b', 'url': 'https://evil.example/b', 'title': 'B'},
+        ]}
+
+        def fetch(url):
+            if url.endswith('broken'):
+                raise ExtractionError('ERROR: Private video')
+            return info
+
+        urls = ['https://youtu.be/one', 'https://example.com/nope', 'https://youtu.be/broken',
+                'https://www.youtube.com/playlist?list=PL1']
+        with patch.object(self.backend, 'fetch_video_info', side_effect=fetch), \
+                patch.object(self.backend.extraction_engine, 'extract_flat', return_value=playlist) as flat:
+            response = self.client.post('/api/download/batch', json={'urls': urls})
+            lines = [json.loads(line) for line in response.data.decode().splitlines()]
+
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        by_index = {line['index']: line for line in lines if 'index' in line}
+        self.assertEqual([f['format_id'] for f in by_index[0]['formats']], ['22', '18'])
+        self.assertEqual(by_index[0]['type'], 'video')
+        self.assertEqual(by_index[1]['error'], 'Invalid or restricted URL domain')
+        self.assertEqual(by_index[2]['details'], 'ERROR: Private video')
+        self.assertEqual(by_index[3]['type'], 'playlist')
+        self.assertEqual([e['id'] for e in by_index[3]['entries']], ['a'])
+        flat.assert_called_once_with(urls[3])
+        self.assertEqual(lines[-1], {'done': True, 'count': 4})
+
+    def test_rejects_oversized_batches(self):
+        urls = ['https://youtu.be/x'] * (self.backend.BATCH_MAX_URLS + 1)
+        self.assertEqual(self.client.post('/api/download/batch', json={'urls': urls}).status_code, 400)
+        self.assertEqual(self.client.post('/api/download/batch', json={}).status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import json
+import unittest
+from unittest.mock import patch
+
+import app as backend
+from celery_worker import AUDIO_QUEUE, VIDEO_QUEUE, download_video_task
+from conftest import FakeRedis
+from task_store import RedisTaskStore
+
+
+class TestSharedTaskState(unittest.TestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        self.store = RedisTaskStore(self.redis, ttl=backend.TASK_TTL_SECONDS, flush_interval=60)
+        patcher = patch.object(backend, 'task_store', self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_other_web_node_reads_progress_from_redis(self):
+        backend.update_task('t-1', status='Downloading', percentage=42.5, message='42.5% completed')
+        # As seen from a node that never ran the task.
+        backend.task_store = RedisTaskStore(self.redis, ttl=backend.TASK_TTL_SECONDS)
+
+        self.assertEqual(backend.get_task('t-1')['percentage'], 42.5)
+        self.assertEqual(self.redis.expiry['download_task:t-1'], backend.TASK_TTL_SECONDS)
+
+        backend.limiter.enabled = False
+        self.addCleanup(setattr, backend.limiter, 'enabled', True)
+        response = backend.app.test_client().get('/api/status/t-1')
+        self.assertEqual(json.loads(response.data)['status'], 'Downloading')
+
+    def test_values_keep_their_types(self):
+        backend.update_task('t-2', status='Completed', percentage=100, filename='a.mp4')
+        self.assertIsInstance(json.loads(self.redis.data['download_task:t-2']['percentage']), int)
+
+    def test_progress_samples_are_written_in_batches(self):
+        backend.update_task('t-3', status='Queued', percentage=0, message='', user='u')
+        backend.update_task('t-4', status='Queued', percentage=0, message='', user='u')
+        writes = self.redis.pipelines
+        for percentage in (10, 20, 30):
+            backend.update_task_progress('t-3', status='Downloading', percentage=percentage)
+            backend.update_task_progress('t-4', status='Downloading', percentage=percentage)
+        self.assertEqual(self.redis.pipelines, writes)
+        self.assertEqual(backend.get_task('t-3')['status'], 'Queued')
+
+        # The next regular update writes the buffered samples of every task along with it.
+        backend.update_task('t-3', status='Completed', percentage=100)
+        self.assertEqual(self.redis.pipelines, writes + 1)
+        self.assertEqual(backend.get_task('t-4')['percentage'], 30)
+        self.assertEqual(list(self.store.active_tasks('u')), ['t-4'])
+
+    def test_active_tasks_are_listed_in_creation_order(self):
+        # Task IDs are random hex, so their order says nothing about creation.
+        with patch('task_store.time.time', side_effect=[300.0, 100.0, 200.0]):
+            for task_id in ('a1', 'f2', 'c3'):
+                backend.update_task(task_id, status='Queued', percentage=0, message='', user='u')
+        backend.update_task('a1', status='Downloading')
+        self.assertEqual(list(self.store.active_tasks('u')), ['f2', 'c3', 'a1'])
+
+
+class TestCeleryRouting(unittest.TestCase):
+    def test_audio_only_format_goes_to_audio_queue(self):
+        info = {'formats': [{'format_id': '140', 'vcodec': 'none'}, {'format_id': '22', 'vcodec': 'avc1'}]}
+        with patch.object(backend.info_cache, 'get', return_value=info):
+            self.assertEqual(backend.choose_download_queue('https://youtu.be/x', '140'), AUDIO_QUEUE)
+            self.assertEqual(backend.choose_download_queue('https://youtu.be/x', '22'), VIDEO_QUEUE)
+
+    def test_format_selector_without_cached_info(self):
+        with patch.object(backend.info_cache, 'get', return_value=None):
+            self.assertEqual(backend.choose_download_queue('https://youtu.be/x', 'bestaudio'), AUDIO_QUEUE)
+            self.assertEqual(backend.choose_download_queue('https://youtu.be/x', 'bestvideo+bestaudio'), VIDEO_QUEUE)
+
+    @patch('celery_worker.download_video_task.apply_async')
+    def test_celery_backend_enqueues_instead_of_running_locally(self, mock_apply):
+        with patch.object(backend, 'DOWNLOAD_BACKEND', 'celery'), \
+                patch.object(backend.download_scheduler, 'submit') as mock_submit, \
+                patch.object(backend.info_cache, 'get', return_value=None):
+            backend.start_download('celery-1', 'https://youtu.be/celery00001', 'bestaudio', 'user-a', 'clip')
+
+        mock_submit.assert_not_called()
+        mock_apply.assert_called_once_with(
+            args=('https://youtu.be/celery00001', 'bestaudio', 'celery-1', 'user-a', 'clip'), queue=AUDIO_QUEUE,
+            task_id='celery-1')
+        self.assertEqual(backend.get_task('celery-1')['status'], 'Queued')
+
+    @patch('app.run_worker_download', return_value='Completed')
+    def test_task_runs_the_download_pipeline(self, mock_run):
+        status = download_video_task.run('https://youtu.be/x', '18', 'task-9')
+        self.assertEqual(status, 'Completed')
+        mock_run.assert_called_once_with('task-9', 'https://youtu.be/x', '18', 'unknown', None)
+
+
+if __name__ == '__main__':
+    unittest.main()
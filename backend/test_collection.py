@@ -0,0 +1,113 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from unittest.mock import patch
+
+import app as backend
+from zip_stream import stream_zip, unique_names
+
+
+class TestStreamZip(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def write(self, name, data):
+        path = os.path.join(self.dir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_archive_is_valid_and_stored(self):
+        first = self.write('a.mp4', os.urandom(700 * 1024))
+        second = self.write('b.m4a', b'audio')
+        chunks = list(stream_zip([('01 - A.mp4', first), ('02 - B.m4a', second)]))
+
+        self.assertGreater(len(chunks), 2)  # streamed while built, not in one piece
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual([i.compress_type for i in archive.infolist()], [zipfile.ZIP_STORED] * 2)
+        self.assertEqual(archive.read('02 - B.m4a'), b'audio')
+
+    def test_unique_names(self):
+        self.assertEqual(list(unique_names(['a.mp4', 'b.mp4', 'A.mp4'])), ['a.mp4', 'b.mp4', 'A (2).mp4'])
+
+
+class TestCollectionJob(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        for p in (patch.object(backend, 'DOWNLOADS_DIR', self.dir),
+                  patch.object(backend, 'COLLECTION_PARALLEL_ITEMS', 2)):
+            p.start()
+            self.addCleanup(p.stop)
+        backend.limiter.enabled = False
+        self.addCleanup(setattr, backend.limiter, 'enabled', True)
+
+    def fake_start(self, task_id, url, format_id, user_identifier="unknown", custom_filename=None,
+                   quota_reservation=None, parent=None):
+        backend.update_task(task_id, status='Queued', percentage=0, message='', parent=parent)
+        if url.endswith('broken'):
+            backend.fail_task(task_id, user_identifier, 'Error: Private video')
+        else:
+            with open(os.path.join(self.dir, f"{task_id}.mp4"), 'wb') as f:
+                f.write(b'x' * 100)
+            backend.update_task(task_id, status='Completed', percentage=100, filename=f"{task_id}.mp4")
+
+    def start_collection(self, urls):
+        items = [{'url': url, 'format_id': '18', 'title': f"Clip {i}", 'task_id': f"col-1-{i + 1}"}
+                 for i, url in enumerate(urls)]
+        reservation = {'user': 'u', 'day': '2024-01-01', 'bytes': 500}
+        backend.update_task('col-1', status='Queued', percentage=0, message='', mode='collection', items=items,
+                            user='u', quota_reservation=reservation, download_name='Mix.zip')
+        for task_id in ['col-1'] + [item['task_id'] for item in items]:
+            self.addCleanup(backend.forget_task, task_id)
+        return items, reservation
+
+    @patch('app.quota_manager')
+    def test_items_run_under_one_task_and_quota_is_charged_once(self, mock_quota):
+        items, reservation = self.start_collection(
+            ['https://youtu.be/a', 'https://youtu.be/broken', 'https://youtu.be/c'])
+        with patch.object(backend, 'start_download', side_effect=self.fake_start):
+            backend.run_collection('col-1', items, 'u')
+
+        mock_quota.add_usage.assert_not_called()
+        mock_quota.commit.assert_called_once_with(reservation, 200)
+        status, _ = backend.build_status('col-1')
+        self.assertEqual(status['status'], 'Completed')
+        self.assertEqual([item['status'] for item in status['items']], ['Completed', 'Failed', 'Completed'])
+        self.assertEqual(status['download_link'], '/api/collection/col-1/zip')
+
+        response = backend.app.test_client().get(status['download_link'])
+        archive = zipfile.ZipFile(io.BytesIO(response.data))
+        self.assertEqual(archive.namelist(), ['01 - Clip 0.mp4', '03 - Clip 2.mp4'])
+        self.assertEqual(response.mimetype, 'application/zip')
+
+    @patch('app.quota_manager')
+    def test_collection_without_any_file_fails_and_refunds(self, mock_quota):
+        items, reservation = self.start_collection(['https://youtu.be/broken'])
+        with patch.object(backend, 'start_download', side_effect=self.fake_start):
+            backend.run_collection('col-1', items, 'u')
+
+        mock_quota.refund.assert_called_once_with(reservation)
+        self.assertEqual(backend.get_task('col-1')['status'], 'Failed')
+        self.assertEqual(backend.app.test_client().get('/api/collection/col-1/zip').status_code, 409)
+
+    def test_non_numeric_limit_is_rejected(self):
+        self.addCleanup(backend.app.config.__setitem__, 'WTF_CSRF_ENABLED',
+                        backend.app.config.get('WTF_CSRF_ENABLED', True))
+        backend.app.config['WTF_CSRF_ENABLED'] = False
+        with patch.object(backend, 'expand_playlist') as mock_expand:
+            for limit in ('ten', [5], {'n': 1}):
+                response = backend.app.test_client().post('/api/process-collection', json={
+                    'url': 'https://www.youtube.com/playlist?list=PL1', 'limit': limit})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.get_json()['error'], 'limit must be an integer')
+        self.assertFalse(mock_expand.called)
+
+
+if __name__ == '__main__':
+    unittest.main()
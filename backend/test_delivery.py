@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from flask import Flask
+
+from delivery import OFFLOAD_X_ACCEL, OFFLOAD_X_SENDFILE, FileDelivery
+
+CONTENT = bytes(range(256)) * 40  # 10 KiB
+
+
+class TestFileDelivery(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        with open(os.path.join(self.dir, 'clip.mp4'), 'wb') as f:
+            f.write(CONTENT)
+        self.use(FileDelivery(self.dir))
+
+    def use(self, delivery):
+        app = Flask(__name__)
+        app.add_url_rule('/f/<name>', 'serve', lambda name: delivery.serve(name, download_name='Mein Video.mp4'))
+        self.client = app.test_client()
+
+    def test_full_download_with_validators(self):
+        response = self.client.get('/f/clip.mp4')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, CONTENT)
+        self.assertEqual(response.headers['Accept-Ranges'], 'bytes')
+        self.assertIn('ETag', response.headers)
+        self.assertIn('Last-Modified', response.headers)
+        self.assertIn("filename*=UTF-8''Mein%20Video.mp4", response.headers['Content-Disposition'])
+
+    def test_range_resumes_download(self):
+        response = self.client.get('/f/clip.mp4', headers={'Range': 'bytes=1000-1999'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, CONTENT[1000:2000])
+        self.assertEqual(response.headers['Content-Range'], f"bytes 1000-1999/{len(CONTENT)}")
+
+    def test_suffix_range(self):
+        response = self.client.get('/f/clip.mp4', headers={'Range': 'bytes=-100'})
+        self.assertEqual(response.data, CONTENT[-100:])
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get('/f/clip.mp4', headers={'Range': f"bytes={len(CONTENT) + 10}-"})
+        self.assertEqual(response.status_code, 416)
+
+    def test_stale_if_range_sends_whole_file(self):
+        response = self.client.get('/f/clip.mp4', headers={'Range': 'bytes=0-9', 'If-Range': '"other"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), len(CONTENT))
+
+    def test_conditional_requests_return_304(self):
+        first = self.client.get('/f/clip.mp4')
+        by_etag = self.client.get('/f/clip.mp4', headers={'If-None-Match': first.headers['ETag']})
+        by_date = self.client.get('/f/clip.mp4', headers={'If-Modified-Since': first.headers['Last-Modified']})
+        self.assertEqual(by_etag.status_code, 304)
+        self.assertEqual(by_date.status_code, 304)
+        self.assertEqual(by_etag.data, b'')
+
+    def test_missing_file(self):
+        self.assertEqual(self.client.get('/f/missing.mp4').status_code, 404)
+
+    def test_x_accel_offload_sends_no_body(self):
+        self.use(FileDelivery(self.dir, offload=OFFLOAD_X_ACCEL, accel_prefix='/internal'))
+        response = self.client.get('/f/clip.mp4')
+        self.assertEqual(response.headers['X-Accel-Redirect'], '/internal/clip.mp4')
+        self.assertEqual(response.data, b'')
+
+    def test_x_sendfile_offload_uses_absolute_path(self):
+        self.use(FileDelivery(self.dir, offload=OFFLOAD_X_SENDFILE))
+        response = self.client.get('/f/clip.mp4')
+        self.assertEqual(response.headers['X-Sendfile'], os.path.join(os.path.abspath(self.dir), 'clip.mp4'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+from unittest.mock import patch
+
+from downloaders import DOWNLOADER_ARIA2C, DOWNLOADER_NATIVE, DownloaderPolicy, ThroughputStats
+
+MB = 1024 * 1024
+PROGRESSIVE = {'format_id': '18', 'protocol': 'https'}
+HLS = {'format_id': 'hls-720', 'protocol': 'm3u8_native'}
+
+
+@patch('downloaders.shutil.which', return_value='/usr/bin/aria2c')
+class TestDownloaderPolicy(unittest.TestCase):
+    def test_large_progressive_file_uses_aria2c(self, _):
+        policy = DownloaderPolicy(min_size=50 * MB)
+        self.assertEqual(policy.choose(PROGRESSIVE, 200 * MB), DOWNLOADER_ARIA2C)
+
+    def test_small_or_fragmented_download_stays_native(self, _):
+        policy = DownloaderPolicy(min_size=50 * MB)
+        self.assertEqual(policy.choose(PROGRESSIVE, 5 * MB), DOWNLOADER_NATIVE)
+        self.assertEqual(policy.choose(HLS, 500 * MB), DOWNLOADER_NATIVE)
+        self.assertEqual(policy.choose(None, 0), DOWNLOADER_NATIVE)
+
+    def test_forced_modes(self, _):
+        self.assertEqual(DownloaderPolicy(mode='aria2c').choose(HLS, 0), DOWNLOADER_ARIA2C)
+        self.assertEqual(DownloaderPolicy(mode='native').choose(PROGRESSIVE, 500 * MB), DOWNLOADER_NATIVE)
+
+    def test_cli_args_carry_tuning(self, _):
+        policy = DownloaderPolicy(connections=8, split=4, min_split_size='2M')
+        args = policy.cli_args(DOWNLOADER_ARIA2C)
+        self.assertEqual(args[:2], ['--downloader', '/usr/bin/aria2c'])
+        self.assertIn('--max-connection-per-server=8', args[3])
+        self.assertIn('--split=4', args[3])
+        self.assertIn('--min-split-size=2M', args[3])
+        self.assertEqual(policy.cli_args(DOWNLOADER_NATIVE), [])
+
+
+@patch('downloaders.shutil.which', return_value='/usr/bin/aria2c')
+class TestMergedFormats(unittest.TestCase):
+    def test_choice_follows_the_largest_part(self, _):
+        import app as backend
+        info = {'formats': [
+            {'format_id': '137', 'protocol': 'https', 'filesize': 300 * MB},
+            {'format_id': '140', 'protocol': 'https', 'filesize': 5 * MB},
+            {'format_id': '400', 'protocol': 'm3u8_native', 'filesize': 300 * MB},
+        ]}
+        policy = DownloaderPolicy(min_size=50 * MB)
+        with patch.object(backend, 'info_cache', {'u': info}), patch.object(backend, 'downloader_policy', policy):
+            self.assertEqual(backend.choose_downloader('u', '137+140'), DOWNLOADER_ARIA2C)
+            self.assertEqual(backend.choose_downloader('u', '140'), DOWNLOADER_NATIVE)
+            self.assertEqual(backend.choose_downloader('u', '400+140'), DOWNLOADER_NATIVE)
+
+
+class TestMissingAria2c(unittest.TestCase):
+    @patch('downloaders.shutil.which', return_value=None)
+    def test_falls_back_to_native(self, _):
+        self.assertEqual(DownloaderPolicy(mode='aria2c').choose(PROGRESSIVE, 500 * MB), DOWNLOADER_NATIVE)
+
+
+class TestThroughputStats(unittest.TestCase):
+    def test_totals_per_downloader(self):
+        stats = ThroughputStats()
+        stats.record(DOWNLOADER_ARIA2C, 100 * MB, 10)
+        stats.record(DOWNLOADER_ARIA2C, 100 * MB, 10)
+        stats.record(DOWNLOADER_NATIVE, 100 * MB, 50)
+        report = stats.stats()
+        self.assertEqual(report['aria2c']['bytes_per_second'], 10 * MB)
+        self.assertEqual(report['native']['downloads'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from extractor import MODE_POOL, MODE_SUBPROCESS, ExtractionEngine, ExtractionError
+
+STUB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'stub')
+
+
+class TestSubprocessMode(unittest.TestCase):
+    @patch('extractor.subprocess.run')
+    def test_extract_info_parses_dump_json(self, mock_run):
+        mock_run.return_value = MagicMock(stdout='{"id": "abc", "title": "T"}')
+        engine = ExtractionEngine(mode=MODE_SUBPROCESS, ytdlp_bin='/opt/yt-dlp')
+
+        self.assertEqual(engine.extract_info('https://youtu.be/abc')['title'], 'T')
+        self.assertEqual(mock_run.call_args[0][0][0], '/opt/yt-dlp')
+
+    @patch('extractor.subprocess.run')
+    def test_cli_failure_becomes_extraction_error(self, mock_run):
+        mock_run.side_effect = subprocess.CalledProcessError(1, 'yt-dlp', stderr='ERROR: Video unavailable')
+        engine = ExtractionEngine(mode=MODE_SUBPROCESS)
+
+        with self.assertRaises(ExtractionError) as ctx:
+            engine.extract_info('https://youtu.be/abc')
+        self.assertEqual(ctx.exception.stderr, 'ERROR: Video unavailable')
+
+    @patch('extractor.subprocess.run')
+    def test_extract_flat_uses_flat_playlist(self, mock_run):
+        mock_run.return_value = MagicMock(stdout='{"title": "Mix", "entries": [{"id": "a"}]}')
+        engine = ExtractionEngine(mode=MODE_SUBPROCESS)
+
+        self.assertEqual(engine.extract_flat('https://www.youtube.com/playlist?list=PL1')['entries'], [{'id': 'a'}])
+        self.assertIn('--flat-playlist', mock_run.call_args[0][0])
+
+    def test_pool_download_requires_pool_mode(self):
+        with self.assertRaises(RuntimeError):
+            ExtractionEngine(mode=MODE_SUBPROCESS).download('https://youtu.be/abc', {})
+
+
+class TestPoolMode(unittest.TestCase):
+    def setUp(self):
+        os.environ['STUB_YTDLP_IMPORT_SECONDS'] = '0'
+        os.environ['STUB_YTDLP_EXTRACT_SECONDS'] = '0'
+        sys.path.insert(0, STUB_DIR)
+
+    def tearDown(self):
+        sys.path.remove(STUB_DIR)
+
+    def test_warm_workers_serve_lookups(self):
+        engine = ExtractionEngine(mode=MODE_POOL, pool_size=1)
+        try:
+            engine.warm_up()
+            first = engine.extract_info('https://www.youtube.com/watch?v=aaaaaaaaaaa')
+            second = engine.extract_info('https://www.youtube.com/watch?v=bbbbbbbbbbb')
+        finally:
+            engine.shutdown()
+        self.assertEqual(first['id'], 'aaaaaaaaaaa')
+        self.assertEqual(second['id'], 'bbbbbbbbbbb')
+
+    def download_dir(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        return path
+
+    def test_download_returns_the_final_path(self):
+        outtmpl = os.path.join(self.download_dir(), '%(id)s.%(ext)s')
+        progress = []
+        engine = ExtractionEngine(mode=MODE_POOL)
+        paths = engine.download('https://www.youtube.com/watch?v=aaaaaaaaaaa',
+                                {'format': '140', 'outtmpl': outtmpl}, progress_callback=progress.append)
+
+        self.assertEqual(paths, [outtmpl.replace('%(id)s', 'aaaaaaaaaaa').replace('%(ext)s', 'm4a')])
+        self.assertTrue(progress)
+        self.assertEqual(multiprocessing.active_children(), [])
+
+    def test_cancel_terminates_the_worker(self):
+        directory = self.download_dir()
+        ydl_opts = {'format': '18', 'outtmpl': os.path.join(directory, '%(id)s.%(ext)s'), 'ratelimit': 64 * 1024}
+        cancel = threading.Event()
+        engine = ExtractionEngine(mode=MODE_POOL, download_pool_size=1, kill_grace=1)
+
+        def on_progress(d):
+            cancel.set()
+        with self.assertRaises(ExtractionError):
+            engine.download('https://www.youtube.com/watch?v=aaaaaaaaaaa', ydl_opts,
+                            progress_callback=on_progress, cancel_event=cancel)
+
+        self.assertEqual(multiprocessing.active_children(), [])
+        path = os.path.join(directory, 'aaaaaaaaaaa.mp4')
+        size = os.path.getsize(path)
+        time.sleep(0.3)
+        self.assertEqual(os.path.getsize(path), size)
+        # The only slot is free again.
+        self.assertTrue(engine.download('https://www.youtube.com/watch?v=bbbbbbbbbbb',
+                                        dict(ydl_opts, format='140', ratelimit=None), timeout=10))
+
+
+if __name__ == '__main__':
+    unittest.main()
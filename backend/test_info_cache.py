@@ -0,0 +1,128 @@
+import json
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from info_cache import InfoCache, canonical_video_id
+
+
+def make_info(video_id='dQw4w9WgXcQ', extractor_key='Youtube', expire=None):
+    url = 'https://rr1.googlevideo.com/videoplayback?itag=18'
+    if expire:
+        url += f'&expire={expire}'
+    return {
+        'id': video_id,
+        'extractor_key': extractor_key,
+        'title': 'Test Video',
+        'formats': [{'format_id': '18', 'ext': 'mp4', 'url': url, 'fragments': [{'path': 'x'}]}],
+        'automatic_captions': {'en': []},
+    }
+
+
+class TestCanonicalVideoId(unittest.TestCase):
+    def test_youtube_variants(self):
+        for url in (
+            'https://youtu.be/dQw4w9WgXcQ',
+            'https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=42',
+            'https://m.youtube.com/watch?v=dQw4w9WgXcQ',
+            'https://youtube.com/shorts/dQw4w9WgXcQ',
+        ):
+            self.assertEqual(canonical_video_id(url), 'youtube:dQw4w9WgXcQ')
+
+    def test_twitter_and_x_share_key(self):
+        self.assertEqual(canonical_video_id('https://x.com/user/status/123'), 'twitter:123')
+        self.assertEqual(canonical_video_id('https://twitter.com/other/status/123?s=20'), 'twitter:123')
+
+    def test_facebook_and_short_links(self):
+        self.assertEqual(canonical_video_id('https://www.facebook.com/watch/?v=284023933944537'), 'facebook:284023933944537')
+        self.assertEqual(canonical_video_id('https://fb.watch/abcDEF/'), 'facebook-short:abcDEF')
+        self.assertEqual(canonical_video_id('https://vm.tiktok.com/ZM123/'), 'tiktok-short:ZM123')
+        self.assertEqual(canonical_video_id('https://www.tiktok.com/@user/video/7251'), 'tiktok:7251')
+
+
+class TestInfoCache(unittest.TestCase):
+    def test_hit_after_set_and_counters(self):
+        cache = InfoCache(max_entries=4, ttl=60)
+        self.assertIsNone(cache.get('https://youtu.be/dQw4w9WgXcQ'))
+        cache.set('https://youtu.be/dQw4w9WgXcQ', make_info())
+
+        info = cache.get('https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+        self.assertEqual(info['title'], 'Test Video')
+        self.assertNotIn('automatic_captions', info)
+        self.assertNotIn('fragments', info['formats'][0])
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_short_link_is_aliased_to_canonical_id(self):
+        cache = InfoCache(ttl=60)
+        cache.set('https://vm.tiktok.com/ZM123/', make_info('7251', 'TikTok'))
+        self.assertIsNotNone(cache.get('https://vm.tiktok.com/ZM123'))
+        self.assertIsNotNone(cache.get('https://www.tiktok.com/@someone/video/7251'))
+
+    def test_lru_eviction(self):
+        cache = InfoCache(max_entries=2, ttl=60)
+        cache.set('https://youtu.be/aaaaaaaaaaa', make_info('aaaaaaaaaaa'))
+        cache.set('https://youtu.be/bbbbbbbbbbb', make_info('bbbbbbbbbbb'))
+        cache.get('https://youtu.be/aaaaaaaaaaa')
+        cache.set('https://youtu.be/ccccccccccc', make_info('ccccccccccc'))
+
+        self.assertIsNotNone(cache.get('https://youtu.be/aaaaaaaaaaa'))
+        self.assertIsNone(cache.get('https://youtu.be/bbbbbbbbbbb'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_ttl_expiry_is_a_miss(self):
+        cache = InfoCache(ttl=10)
+        cache.set('https://youtu.be/dQw4w9WgXcQ', make_info())
+        with patch('info_cache.time.time', return_value=time.time() + 11):
+            self.assertIsNone(cache.get('https://youtu.be/dQw4w9WgXcQ'))
+        self.assertEqual(cache.stats()['stale'], 1)
+
+    def test_entry_never_outlives_format_urls(self):
+        cache = InfoCache(ttl=3600)
+        cache.set('https://youtu.be/dQw4w9WgXcQ', make_info(expire=int(time.time()) + 60))
+        # Expiry is inside the safety margin, so the entry is not worth caching.
+        self.assertIsNone(cache.get('https://youtu.be/dQw4w9WgXcQ'))
+
+    def test_redis_tier_is_read_through(self):
+        store = {}
+        fake_redis = MagicMock()
+        fake_redis.get.side_effect = store.get
+        fake_redis.ttl.return_value = 30
+        pipe = fake_redis.pipeline.return_value
+        pipe.set.side_effect = lambda key, value, ex=None: store.__setitem__(key, value)
+
+        InfoCache(ttl=60, redis_client=fake_redis).set('https://youtu.be/dQw4w9WgXcQ', make_info())
+        other_worker = InfoCache(ttl=60, redis_client=fake_redis)
+        info = other_worker.get('https://youtu.be/dQw4w9WgXcQ')
+
+        self.assertEqual(info['title'], 'Test Video')
+        self.assertEqual(other_worker.stats()['redis_hits'], 1)
+        self.assertEqual(json.loads(store['info_cache:youtube:dQw4w9WgXcQ'])['id'], 'dQw4w9WgXcQ')
+
+
+class TestDownloadInfoCaching(unittest.TestCase):
+    def setUp(self):
+        from app import app, extraction_engine, limiter
+        self.app = app.test_client()
+        self.limiter = limiter
+        self.limiter.enabled = False
+        # Force the CLI path so the test never needs the yt_dlp package.
+        self.mode_patch = patch.object(extraction_engine, 'mode', 'subprocess')
+        self.mode_patch.start()
+
+    def tearDown(self):
+        self.limiter.enabled = True
+        self.mode_patch.stop()
+
+    @patch('extractor.subprocess.run')
+    def test_second_lookup_skips_yt_dlp(self, mock_run):
+        mock_run.return_value = MagicMock(stdout=json.dumps(make_info('cached00001')))
+        for url in ('https://youtu.be/cached00001', 'https://www.youtube.com/watch?v=cached00001'):
+            res = self.app.post('/api/download', json={'url': url})
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res.get_json()['title'], 'Test Video')
+        self.assertEqual(mock_run.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+import os
+import runpy
+import shutil
+import socket
+import stat
+import sys
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from artifacts import ArtifactStore
+from journal import JobJournal, _pid_running
+
+KEY = 'a' * 32
+
+# Finishes the .part file it finds (like --continue), or starts one. With
+# "stall" in the URL the first run hangs until it is killed.
+FAKE_YTDLP = '''import os, sys, time
+assert "--continue" in sys.argv
+out = sys.argv[sys.argv.index('-o') + 1].replace('%(ext)s', 'mp4')
+marker = out + '.started'
+if "stall" in sys.argv[-1] and not os.path.exists(marker):
+    open(marker, 'w').close()
+    open(out + '.part', 'ab').write(b'first-run ')
+    time.sleep(30)
+with open(out + '.part', 'ab') as f:
+    f.write(b'rest')
+os.replace(out + '.part', out)
+template = sys.argv[sys.argv.index('--print') + 1]
+print(template.split(':', 1)[1].replace('%(filepath)s', out), flush=True)
+'''
+
+
+class TestJobJournal(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'jobs.db')
+
+    def test_finished_jobs_leave_the_journal(self):
+        journal = JobJournal(self.path)
+        journal.record('t1', KEY, url='https://youtu.be/x', format_id='18')
+        journal.record('t2', 'b' * 32, url='https://youtu.be/y', format_id='18')
+        journal.transition('t1', 'downloading')
+        journal.finish('t2')
+
+        job, = journal.jobs()
+        self.assertEqual((job.task_id, job.state, job.params['format_id']), ('t1', 'downloading', '18'))
+        self.assertEqual(journal.stats()['states'], {'downloading': 1})
+
+    def test_jobs_of_a_dead_process_are_taken_over_once(self):
+        crashed = JobJournal(self.path)
+        crashed.record('t1', KEY, url='https://youtu.be/x', format_id='18')
+        crashed.owner = f"{socket.gethostname()}:999999999:dead"
+        crashed._execute('UPDATE jobs SET owner = ?', (crashed.owner,))
+
+        first, second = JobJournal(self.path), JobJournal(self.path)
+        taken = first.take_orphans()
+        self.assertEqual([(job.task_id, job.attempts) for job in taken], [('t1', 1)])
+        self.assertEqual(second.take_orphans(), [])
+        # The new owner is alive, so nobody takes the job from it.
+        self.assertEqual(JobJournal(self.path).take_orphans(), [])
+
+    def test_silent_owners_lose_their_jobs(self):
+        other_host = JobJournal(self.path, stale_after=30)
+        other_host.record('t1', KEY, url='https://youtu.be/x', format_id='18')
+        other_host._execute('UPDATE jobs SET owner = ?, heartbeat = ?', ('elsewhere:1:x', time.time() - 5))
+
+        journal = JobJournal(self.path, stale_after=30)
+        self.assertEqual(journal.take_orphans(), [])
+        journal.stale_after = 1
+        self.assertEqual(len(journal.take_orphans()), 1)
+
+    def test_forked_process_gets_its_own_owner_and_watcher(self):
+        journal = JobJournal(self.path)
+        self.assertFalse(os.path.exists(self.path))
+        journal.record('t1', KEY, url='https://youtu.be/x', format_id='18')
+        parent = journal.owner
+        journal.watch(lambda job: None, interval=3600)
+        with patch('journal.threading.Thread') as thread:
+            journal.ensure_watcher()
+            journal.ensure_watcher()
+            with patch('journal.os.getpid', return_value=os.getpid() + 1):
+                self.assertNotEqual(journal.owner, parent)
+                journal.record('t2', KEY, url='https://youtu.be/y', format_id='18')
+                journal.ensure_watcher()
+        self.assertEqual(thread.return_value.start.call_count, 2)
+        self.assertEqual(len(journal.jobs()), 2)
+
+    def test_liveness_is_left_to_the_heartbeat_on_windows(self):
+        with patch('journal.os.name', 'nt'), patch('journal.os.kill') as kill:
+            self.assertTrue(_pid_running(999999999))
+        kill.assert_not_called()
+
+    def test_gunicorn_workers_start_the_watcher(self):
+        import app as backend
+        hooks = runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py'))
+        with patch.object(backend.job_journal, 'ensure_watcher') as ensure_watcher:
+            hooks['post_worker_init'](worker=None)
+        ensure_watcher.assert_called_once_with()
+
+    def test_partials_without_a_job_are_swept(self):
+        journal = JobJournal(self.path)
+        journal.record('t1', KEY, url='https://youtu.be/x', format_id='18')
+        names = [f"{KEY}.mp4.part", f"{'b' * 32}.mp4.part", f"{'b' * 32}.f137.mp4", f"{'c' * 32}.mp4",
+                 f"{'d' * 32}.mp4.part"]
+        for name in names:
+            open(os.path.join(self.dir, name), 'wb').close()
+        old = time.time() - 3600
+        for name in names[:4]:
+            os.utime(os.path.join(self.dir, name), (old, old))
+
+        self.assertEqual(journal.sweep_partials(self.dir, min_age=600), 2)
+        # The journaled job's partial, finished artifacts and fresh partials stay.
+        self.assertEqual(sorted(n for n in os.listdir(self.dir) if n != 'jobs.db' and not n.startswith('jobs.db-')),
+                         sorted([names[0], names[3], names[4]]))
+
+
+class TestResume(unittest.TestCase):
+    def setUp(self):
+        import app as backend
+        self.backend = backend
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        script = os.path.join(self.dir, 'fake-yt-dlp')
+        with open(script, 'w') as f:
+            f.write(f"#!{sys.executable}\n{FAKE_YTDLP}")
+        os.chmod(script, os.stat(script).st_mode | stat.S_IEXEC)
+        self.journal = JobJournal(os.path.join(self.dir, 'jobs.db'))
+        patchers = [
+            patch.object(backend, 'YTDLP_PATH', script),
+            patch.object(backend, 'DOWNLOADS_DIR', self.dir),
+            patch.object(backend, 'artifact_store', ArtifactStore(self.dir)),
+            patch.object(backend, 'job_journal', self.journal),
+            patch.object(backend.extraction_engine, 'mode', 'subprocess'),
+            patch.object(backend, 'quota_manager'),
+            patch.object(backend.download_scheduler, 'submit', side_effect=self.run_now),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def run_now(job_id, user, fn, *args, **kwargs):
+        fn(*args).result(timeout=20)
+
+    def test_restarted_job_continues_from_its_partial_file(self):
+        self.journal.record('resume-1', KEY, url='https://youtu.be/resume00001', format_id='18', user='alice',
+                            custom_filename=None, quota_reservation=None)
+        self.addCleanup(self.backend.forget_task, 'resume-1')
+        with open(os.path.join(self.dir, f"{KEY}.mp4.part"), 'wb') as f:
+            f.write(b'before-crash ')
+
+        job, = self.journal.jobs()
+        self.backend.resume_download(job)
+
+        task = self.backend.get_task('resume-1')
+        self.assertEqual(task['status'], 'Completed')
+        with open(os.path.join(self.dir, task['filename']), 'rb') as f:
+            self.assertEqual(f.read(), b'before-crash rest')
+        self.assertEqual(self.journal.jobs(), [])
+
+    def test_timed_out_download_resumes_in_place(self):
+        self.addCleanup(self.backend.forget_task, 'timeout-1')
+        with patch.object(self.backend, 'TIMEOUT_SECONDS', 1), \
+                patch.object(self.backend.download_supervisor, 'kill_grace', 0.5):
+            self.backend.start_download('timeout-1', 'https://youtu.be/stall000001', '18', 'alice')
+
+        task = self.backend.get_task('timeout-1')
+        self.assertEqual(task['status'], 'Completed')
+        with open(os.path.join(self.dir, task['filename']), 'rb') as f:
+            self.assertEqual(f.read(), b'first-run rest')
+        self.assertEqual(self.journal.jobs(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
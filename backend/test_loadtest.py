@@ -0,0 +1,75 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+import urllib.request
+
+BENCHMARKS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks')
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from media_server import MediaServer, media_bytes  # noqa: E402
+
+
+class TestMediaServer(unittest.TestCase):
+    def setUp(self):
+        self.server = MediaServer()
+        self.url = self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def test_serves_requested_size_and_ranges(self):
+        with urllib.request.urlopen(f"{self.url}/media/abc-18-200000.mp4") as response:
+            body = response.read()
+            self.assertEqual(response.headers['Content-Type'], 'video/mp4')
+        self.assertEqual(body, b''.join(media_bytes(0, 200000)))
+
+        request = urllib.request.Request(f"{self.url}/media/abc-18-200000.mp4", headers={'Range': 'bytes=70000-70009'})
+        with urllib.request.urlopen(request) as response:
+            self.assertEqual(response.status, 206)
+            self.assertEqual(response.headers['Content-Range'], 'bytes 70000-70009/200000')
+            self.assertEqual(response.read(), body[70000:70010])
+
+
+class TestStubDownload(unittest.TestCase):
+    def test_cli_download_prints_progress_and_artifact(self):
+        workdir = tempfile.mkdtemp()
+        env = dict(os.environ, STUB_YTDLP_IMPORT_SECONDS='0', STUB_YTDLP_EXTRACT_SECONDS='0',
+                   STUB_YTDLP_SIZE_SCALE='0.01', STUB_YTDLP_MEDIA_URL='')
+        template = '[progress] {"status": "%(progress.status)s", "downloaded_bytes": %(progress.downloaded_bytes|null)s}'
+        result = subprocess.run(
+            [sys.executable, os.path.join(BENCHMARKS_DIR, 'stub', 'yt-dlp'), '-f', '18',
+             '-o', os.path.join(workdir, '%(id)s.%(ext)s'), '--newline', '--progress-template', f'download:{template}',
+             '--print', 'after_move:[artifact] %(filepath)s', 'https://www.youtube.com/watch?v=abcdefghijk'],
+            capture_output=True, text=True, env=env, timeout=30
+        )
+        lines = result.stdout.splitlines()
+        progress = [json.loads(line[len('[progress] '):]) for line in lines if line.startswith('[progress] ')]
+        self.assertEqual(progress[-1], {'status': 'downloading', 'downloaded_bytes': 140000})
+        self.assertEqual(lines[-1], f"[artifact] {os.path.join(workdir, 'abcdefghijk.mp4')}")
+        self.assertEqual(os.path.getsize(os.path.join(workdir, 'abcdefghijk.mp4')), 140000)
+
+
+class TestLoadTest(unittest.TestCase):
+    def test_reports_latency_and_resources_per_endpoint(self):
+        result = subprocess.run(
+            [sys.executable, os.path.join(BENCHMARKS_DIR, 'loadtest.py'), '--scenarios', 'download,status',
+             '--duration', '0.5', '--concurrency', '2', '--extractor-mode', 'subprocess',
+             '--import-seconds', '0', '--extract-seconds', '0', '--json'],
+            capture_output=True, text=True, timeout=120
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        report = json.loads(result.stdout)
+
+        self.assertEqual(list(report['scenarios']), ['download', 'status'])
+        download = report['scenarios']['download']['endpoints']
+        for endpoint in ('POST /api/process-video', 'GET /api/status (long-poll)', 'GET /downloads/'):
+            self.assertEqual(download[endpoint]['errors'], 0)
+            self.assertLessEqual(download[endpoint]['p50_ms'], download[endpoint]['p99_ms'])
+        self.assertGreater(report['scenarios']['status']['endpoints']['GET /api/status']['throughput_rps'], 0)
+        self.assertGreater(report['scenarios']['status']['resources']['peak_threads'], 0)
+        self.assertIn('git_commit', report['meta'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+from prometheus_client import REGISTRY
+
+from extractor import ExtractionError
+from metrics import classify_error
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class TestClassifyError(unittest.TestCase):
+    def test_known_classes(self):
+        self.assertEqual(classify_error('ERROR: [youtube] abc: Private video. Sign in if you have access'), 'private')
+        self.assertEqual(classify_error('ERROR: Video unavailable'), 'unavailable')
+        self.assertEqual(classify_error('Download timed out (exceeded 1 hour)'), 'timeout')
+        self.assertEqual(classify_error('HTTP Error 403: Forbidden'), 'forbidden')
+        self.assertEqual(classify_error('something odd'), 'other')
+        self.assertEqual(classify_error(None), 'other')
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        import app as backend
+        self.backend = backend
+        self.client = backend.app.test_client()
+
+    def test_endpoint_exposes_live_gauges(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        body = response.data.decode()
+        self.assertIn(f'creator_tools_download_slots {float(self.backend.MAX_CONCURRENT_DOWNLOADS)}', body)
+        self.assertIn('creator_tools_downloads_queued', body)
+        self.assertIn('creator_tools_downloads_dir_bytes', body)
+
+    def test_extraction_latency_and_failures_are_recorded(self):
+        before = sample('creator_tools_extraction_duration_seconds_count', domain='youtube.com', kind='video')
+        failures = sample('creator_tools_ytdlp_failures_total', stage='extract', error_class='unavailable')
+        with patch.object(self.backend.extraction_engine, 'extract_info', return_value={'id': 'abc'}):
+            self.backend.extract_video_info('https://youtu.be/metrics01')
+        with patch.object(self.backend.extraction_engine, 'extract_info',
+                          side_effect=ExtractionError('ERROR: Video unavailable')):
+            with self.assertRaises(ExtractionError):
+                self.backend.extract_video_info('https://youtu.be/metrics02')
+
+        self.assertEqual(sample('creator_tools_extraction_duration_seconds_count',
+                                domain='youtube.com', kind='video'), before + 2)
+        self.assertEqual(sample('creator_tools_ytdlp_failures_total',
+                                stage='extract', error_class='unavailable'), failures + 1)
+
+    def test_queue_wait_is_observed_when_a_slot_picks_the_job_up(self):
+        before = sample('creator_tools_queue_wait_seconds_count')
+        done = threading.Event()
+        self.backend.download_scheduler.submit('metrics-job', 'u', done.set)
+        self.assertTrue(done.wait(5))
+        self.assertEqual(sample('creator_tools_queue_wait_seconds_count'), before + 1)
+
+    def test_rate_limit_hits_are_counted(self):
+        before = sample('creator_tools_rejections_total', reason='rate_limit')
+        for _ in range(6):
+            response = self.client.post('/api/download', json={'url': 'https://example.com/x'},
+                                        environ_base={'REMOTE_ADDR': '198.51.100.17'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(sample('creator_tools_rejections_total', reason='rate_limit'), before + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
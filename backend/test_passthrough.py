@@ -0,0 +1,118 @@
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from passthrough import PassthroughStream, passthrough_format
+
+INFO = {'formats': [
+    {'format_id': '140', 'ext': 'm4a', 'protocol': 'https', 'vcodec': 'none', 'acodec': 'mp4a'},
+    {'format_id': '18', 'ext': 'mp4', 'protocol': 'https', 'vcodec': 'avc1', 'acodec': 'mp4a'},
+    {'format_id': '137', 'ext': 'mp4', 'protocol': 'https', 'vcodec': 'avc1', 'acodec': 'none'},
+    {'format_id': 'dash-1', 'ext': 'mp4', 'protocol': 'http_dash_segments', 'vcodec': 'avc1', 'acodec': 'mp4a'},
+]}
+
+FAKE_YTDLP = '''import sys
+for _ in range(50):
+    sys.stdout.buffer.write(b'x' * 4096)
+    sys.stdout.buffer.flush()
+sys.stderr.write('done\\n')
+sys.exit(int(__import__('os').environ.get('FAKE_EXIT', '0')))
+'''
+
+
+def make_fake_ytdlp(test):
+    dir_ = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, dir_)
+    script = os.path.join(dir_, 'fake-yt-dlp')
+    with open(script, 'w') as f:
+        f.write(f"#!{sys.executable}\n{FAKE_YTDLP}")
+    os.chmod(script, os.stat(script).st_mode | stat.S_IEXEC)
+    return script
+
+
+class TestPassthroughFormat(unittest.TestCase):
+    def test_single_file_formats_qualify(self):
+        self.assertEqual(passthrough_format(INFO, '140')['ext'], 'm4a')
+        self.assertEqual(passthrough_format(INFO, '18')['ext'], 'mp4')
+
+    def test_merge_and_segmented_formats_use_disk(self):
+        self.assertIsNone(passthrough_format(INFO, '137+140'))
+        self.assertIsNone(passthrough_format(INFO, '137'))
+        self.assertIsNone(passthrough_format(INFO, 'dash-1'))
+        self.assertIsNone(passthrough_format(None, '18'))
+
+
+class TestPassthroughStream(unittest.TestCase):
+    def setUp(self):
+        self.script = make_fake_ytdlp(self)
+        self.closed = []
+
+    def test_streams_all_bytes(self):
+        stream = PassthroughStream(self.script, 'https://youtu.be/x', '18', lambda *a: self.closed.append(a))
+        self.assertEqual(sum(len(chunk) for chunk in stream), 50 * 4096)
+        self.assertEqual(self.closed, [(50 * 4096, True, None)])
+
+    def test_client_disconnect_kills_ytdlp_and_reports_bytes_sent(self):
+        stream = iter(PassthroughStream(self.script, 'https://youtu.be/x', '18', lambda *a: self.closed.append(a)))
+        first = next(stream)
+        stream.close()
+        sent, ok, _ = self.closed[0]
+        self.assertEqual(sent, len(first))
+        self.assertFalse(ok)
+
+    def test_close_before_the_first_chunk_reports_once(self):
+        stream = PassthroughStream(self.script, 'https://youtu.be/x', '18', lambda *a: self.closed.append(a))
+        stream.close()
+        stream.close()
+        self.assertEqual(self.closed, [(0, False, 'Client disconnected before the stream started')])
+
+    def test_failure_reports_stderr(self):
+        with patch.dict(os.environ, {'FAKE_EXIT': '1'}):
+            list(PassthroughStream(self.script, 'https://youtu.be/x', '18', lambda *a: self.closed.append(a)))
+        self.assertEqual(self.closed[0][1:], (False, 'done'))
+
+
+class TestStreamEndpoint(unittest.TestCase):
+    @patch('app.quota_manager')
+    def test_stream_charges_bytes_sent(self, mock_quota):
+        import app as backend
+        backend.limiter.enabled = False
+        self.addCleanup(setattr, backend.limiter, 'enabled', True)
+        reservation = {'user': '127.0.0.1', 'day': '2024-01-01', 'bytes': 1000}
+        backend.update_task('stream-9', status='Ready', percentage=0, message='', mode='stream',
+                            url='https://youtu.be/x', format_id='18', user='127.0.0.1',
+                            quota_reservation=reservation, download_name='clip.mp4')
+        self.addCleanup(backend.forget_task, 'stream-9')
+
+        client = backend.app.test_client()
+        with patch.object(backend, 'YTDLP_PATH', make_fake_ytdlp(self)):
+            response = client.get('/api/stream/stream-9')
+            self.assertEqual(len(response.data), 50 * 4096)
+            self.assertEqual(response.mimetype, 'video/mp4')
+
+        mock_quota.commit.assert_called_once_with(reservation, 50 * 4096)
+        self.assertEqual(backend.get_task('stream-9')['status'], 'Completed')
+        self.assertEqual(client.get('/api/stream/stream-9').status_code, 409)
+
+    @patch('app.quota_manager')
+    def test_unfetched_stream_expires_and_refunds(self, mock_quota):
+        import app as backend
+        reservation = {'user': '127.0.0.1', 'day': '2024-01-01', 'bytes': 1000}
+        backend.update_task('stream-10', status='Ready', percentage=0, message='', mode='stream',
+                            url='https://youtu.be/x', format_id='18', user='127.0.0.1',
+                            quota_reservation=reservation, download_name='clip.mp4')
+        self.addCleanup(backend.forget_task, 'stream-10')
+
+        self.assertTrue(backend.cancel_ready_stream('stream-10', '127.0.0.1', 'Stream link expired.'))
+        self.assertFalse(backend.cancel_ready_stream('stream-10', '127.0.0.1'))
+        mock_quota.refund.assert_called_once_with(reservation)
+        self.assertEqual(backend.get_task('stream-10')['status'], 'Cancelled')
+        self.assertEqual(backend.app.test_client().get('/api/stream/stream-10').status_code, 409)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from artifacts import LOCK_DIR, ArtifactStore
+from postprocess import merge_command, merge_extension, split_format
+
+# Downloads every format of "-f a,b" as its own file, like yt-dlp without merging.
+FAKE_YTDLP = '''import sys
+formats = sys.argv[sys.argv.index('-f') + 1].split(',')
+template = sys.argv[sys.argv.index('-o') + 1]
+exts = {"137": "mp4", "140": "m4a", "248": "webm"}
+printed = sys.argv[sys.argv.index('--print') + 1].split(':', 1)[1]
+for format_id in formats:
+    out = template.replace('%(format_id)s', format_id).replace('%(ext)s', exts[format_id])
+    open(out, 'wb').write(format_id.encode() * 10)
+    print(printed.replace('%(filepath)s', out), flush=True)
+'''
+
+# Concatenates its inputs into the output; stream copy fails when told to.
+FAKE_FFMPEG = '''import os, sys
+args = sys.argv[1:]
+if "-c" in args and os.environ.get("FAKE_FFMPEG_COPY_FAILS"):
+    print("Could not find tag for codec in stream #0", flush=True)
+    sys.exit(1)
+inputs = [args[i + 1] for i, arg in enumerate(args) if arg == "-i"]
+with open(args[-1], "wb") as f:
+    for path in inputs:
+        f.write(open(path, "rb").read())
+'''
+
+
+def write_script(dir_, name, body):
+    path = os.path.join(dir_, name)
+    with open(path, 'w') as f:
+        f.write(f"#!{sys.executable}\n{body}")
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return path
+
+
+class TestMergePlan(unittest.TestCase):
+    def test_only_merged_selections_are_split(self):
+        self.assertEqual(split_format('137+140'), ['137', '140'])
+        self.assertIsNone(split_format('18'))
+        self.assertIsNone(split_format('best'))
+        self.assertEqual(split_format('bv*+ba'), ['bv*', 'ba'])
+
+    def test_selectors_with_fallbacks_are_not_split(self):
+        self.assertIsNone(split_format('bv*+ba/b'))
+        self.assertIsNone(split_format('137+140/18'))
+        self.assertIsNone(split_format('(137/136)+140'))
+
+    def test_container_allows_stream_copy(self):
+        self.assertEqual(merge_extension(['k.f137.mp4', 'k.f140.m4a']), 'mp4')
+        self.assertEqual(merge_extension(['k.f248.webm', 'k.f251.webm']), 'webm')
+        self.assertEqual(merge_extension(['k.f248.webm', 'k.f140.m4a']), 'mkv')
+
+        copy = merge_command('ffmpeg', ['a.mp4', 'b.m4a'], 'out.mp4')
+        self.assertIn('copy', copy)
+        self.assertEqual(copy[-3:], ['-f', 'mp4', 'out.mp4.part'])
+        self.assertEqual(merge_command('ffmpeg', ['a.webm', 'b.m4a'], 'out.mkv')[-2], 'matroska')
+        self.assertIn('libx264', merge_command('ffmpeg', ['a.webm', 'b.m4a'], 'out.mp4', copy=False))
+
+
+class TestPostprocessStage(unittest.TestCase):
+    def setUp(self):
+        import app as backend
+        self.backend = backend
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        patchers = [
+            patch.object(backend, 'YTDLP_PATH', write_script(self.dir, 'fake-yt-dlp', FAKE_YTDLP)),
+            patch.object(backend, 'FFMPEG_PATH', write_script(self.dir, 'fake-ffmpeg', FAKE_FFMPEG)),
+            patch.object(backend, 'DOWNLOADS_DIR', self.dir),
+            patch.object(backend, 'artifact_store', ArtifactStore(self.dir)),
+            patch.object(backend.extraction_engine, 'mode', 'subprocess'),
+            patch.object(backend, 'quota_manager'),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def download(self, task_id, format_id, handoff=True):
+        backend = self.backend
+        backend.update_task(task_id, status='Queued', percentage=0, message='', user='alice')
+        self.addCleanup(backend.forget_task, task_id)
+        flight = backend.claim_download(task_id, f"https://youtu.be/{task_id:0<11}", format_id, 'alice')
+        backend.download_supervisor.run(task_id, backend.supervise_download(
+            task_id, f"https://youtu.be/{task_id:0<11}", format_id, 'alice', None, flight, handoff=handoff))
+        return flight
+
+    def test_download_slot_hands_the_parts_to_the_processing_queue(self):
+        with patch.object(self.backend.postprocess_scheduler, 'submit') as mock_submit:
+            flight = self.download('pp1', '137+140')
+
+        task = self.backend.get_task('pp1')
+        self.assertEqual(task['status'], 'Queued for processing')
+        job_args = mock_submit.call_args[0][2:]
+        parts = job_args[2]
+        self.assertEqual([os.path.basename(p) for p in parts], [f"{flight.key}.f137.mp4", f"{flight.key}.f140.m4a"])
+
+        self.backend.dispatch_postprocess(*job_args[1:]).result(timeout=10)
+        task = self.backend.get_task('pp1')
+        self.assertEqual(task['status'], 'Completed')
+        self.assertEqual(task['filename'], f"{flight.key}.mp4")
+        with open(os.path.join(self.dir, task['filename']), 'rb') as f:
+            self.assertEqual(f.read(), b'137' * 10 + b'140' * 10)
+        # The parts are gone once merged.
+        self.assertEqual(sorted(os.listdir(self.dir)), sorted(['fake-yt-dlp', 'fake-ffmpeg', f"{flight.key}.mp4", LOCK_DIR]))
+
+    def test_failed_stream_copy_falls_back_to_transcoding(self):
+        with patch.dict(os.environ, {'FAKE_FFMPEG_COPY_FAILS': '1'}):
+            flight = self.download('pp2', '248+140', handoff=False)
+
+        task = self.backend.get_task('pp2')
+        self.assertEqual(task['status'], 'Completed')
+        self.assertEqual(task['filename'], f"{flight.key}.mp4")
+
+    def test_single_formats_skip_processing(self):
+        with patch.object(self.backend.postprocess_scheduler, 'submit') as mock_submit:
+            flight = self.download('pp3', '137')
+        self.assertFalse(mock_submit.called)
+        self.assertEqual(self.backend.get_task('pp3')['filename'], f"{flight.key}.mp4")
+
+    def test_queued_processing_can_be_cancelled(self):
+        with patch.object(self.backend.postprocess_scheduler, 'workers', 0):
+            flight = self.download('pp4', '137+140')
+            self.assertEqual(self.backend.postprocess_scheduler.position('pp4'), 0)
+            self.assertTrue(self.backend.cancel_download('pp4', 'alice'))
+
+        self.assertEqual(self.backend.get_task('pp4')['status'], 'Cancelled')
+        self.assertFalse([name for name in os.listdir(self.dir) if name.startswith(flight.key)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from progress import PROGRESS_PREFIX, PROGRESS_TEMPLATE, ProgressParser
+
+
+def progress_line(**fields):
+    return PROGRESS_PREFIX + json.dumps(fields)
+
+
+class TestProgressParser(unittest.TestCase):
+    def setUp(self):
+        self.samples = []
+        self.parser = ProgressParser(self.samples.append, max_rate=0)
+
+    def test_template_covers_throughput_fields(self):
+        for name in ('downloaded_bytes', 'total_bytes', 'speed', 'eta', 'fragment_index'):
+            self.assertIn(f'%(progress.{name}|null)s', PROGRESS_TEMPLATE)
+
+    def test_sized_download(self):
+        self.assertTrue(self.parser.feed(progress_line(
+            status='downloading', downloaded_bytes=250, total_bytes=1000, speed=512.4, eta=3)))
+        self.assertEqual(self.samples[-1]['percentage'], 25.0)
+        self.assertEqual(self.samples[-1]['speed'], 512)
+        self.assertEqual(self.samples[-1]['eta'], 3)
+
+    def test_fragmented_download_without_size(self):
+        self.parser.feed(progress_line(status='downloading', downloaded_bytes=4096,
+                                       total_bytes=None, fragment_index=3, fragment_count=12))
+        self.assertEqual(self.samples[-1]['percentage'], 25.0)
+        self.assertEqual(self.samples[-1]['fragment_index'], 3)
+
+    def test_other_lines_are_ignored(self):
+        self.assertFalse(self.parser.feed('[youtube] dQw4w9WgXcQ: Downloading webpage'))
+        self.assertEqual(self.samples, [])
+
+    def test_aria2c_summary_line(self):
+        self.assertTrue(self.parser.feed('[#2089b0 16.0MiB/64.0MiB(25%) CN:16 DL:4.0MiB ETA:1m12s]'))
+        sample = self.samples[-1]
+        self.assertEqual(sample['percentage'], 25.0)
+        self.assertEqual(sample['total_bytes'], 64 * 1024 * 1024)
+        self.assertEqual(sample['speed'], 4 * 1024 * 1024)
+        self.assertEqual(sample['eta'], 72)
+
+    def test_updates_are_throttled_but_last_sample_is_flushed(self):
+        samples = []
+        parser = ProgressParser(samples.append, max_rate=1)
+        for done in range(1, 6):
+            parser.update({'status': 'downloading', 'downloaded_bytes': done * 100, 'total_bytes': 1000})
+        self.assertEqual(len(samples), 1)
+
+        parser.flush()
+        self.assertEqual(samples[-1]['downloaded_bytes'], 500)
+
+    def test_finished_is_always_delivered(self):
+        samples = []
+        parser = ProgressParser(samples.append, max_rate=1)
+        parser.update({'status': 'downloading', 'downloaded_bytes': 1, 'total_bytes': 10})
+        parser.update({'status': 'finished', 'downloaded_bytes': 10, 'total_bytes': 10})
+        self.assertEqual(samples[-1]['percentage'], 100.0)
+
+
+FAKE_YTDLP = '''import json, sys
+out = sys.argv[sys.argv.index('-o') + 1].replace('%(ext)s', 'mp4')
+print('[youtube] abc: Downloading webpage', flush=True)
+for done in (250, 500, 1000):
+    print('[progress] ' + json.dumps({"status": "downloading", "downloaded_bytes": done,
+          "total_bytes": 1000, "speed": 2048.0, "eta": 1, "fragment_index": None}), flush=True)
+open(out, 'wb').write(b'x' * 1000)
+template = sys.argv[sys.argv.index('--print') + 1]
+print(template.split(':', 1)[1].replace('%(filepath)s', out), flush=True)
+'''
+
+
+class TestSubprocessProgress(unittest.TestCase):
+    def test_task_record_gets_bytes_speed_and_eta(self):
+        import app as backend
+        dir_ = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dir_)
+        script = os.path.join(dir_, 'fake-yt-dlp')
+        with open(script, 'w') as f:
+            f.write(f"#!{sys.executable}\n{FAKE_YTDLP}")
+        os.chmod(script, os.stat(script).st_mode | stat.S_IEXEC)
+
+        with patch.object(backend, 'YTDLP_PATH', script), \
+                patch.object(backend, 'DOWNLOADS_DIR', dir_), \
+                patch.object(backend, 'PROGRESS_UPDATES_PER_SECOND', 0):
+            path, = backend.run_subprocess_download(
+                'progress-1', 'https://youtu.be/abc', '18', os.path.join(dir_, 'key.%(ext)s'))
+
+        task = backend.get_task('progress-1')
+        backend.forget_task('progress-1')
+        self.assertEqual(os.path.basename(path), 'key.mp4')
+        self.assertEqual(task['percentage'], 100.0)
+        self.assertEqual(task['downloaded_bytes'], 1000)
+        self.assertEqual(task['speed'], 2048)
+        self.assertIn('average_speed', task)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from conftest import FakeRedis
+from quota import FileQuota, RedisQuota
+
+
+class QuotaContract:
+    """Behaviour shared by every quota backend."""
+
+    def make(self, daily_limit):
+        raise NotImplementedError
+
+    def test_usage_and_remaining(self):
+        quota = self.make(1000)
+        quota.add_usage('alice', 400)
+        self.assertTrue(quota.check_quota('alice'))
+        self.assertEqual(quota.get_remaining('alice'), 600)
+        quota.add_usage('alice', 600)
+        self.assertFalse(quota.check_quota('alice'))
+
+    def test_reservation_blocks_overcommit_until_refunded(self):
+        quota = self.make(1000)
+        first = quota.reserve('alice', 700)
+        self.assertIsNotNone(first)
+        self.assertIsNone(quota.reserve('alice', 400))
+
+        quota.refund(first)
+        self.assertIsNotNone(quota.reserve('alice', 400))
+
+    def test_commit_charges_actual_size(self):
+        quota = self.make(1000)
+        reservation = quota.reserve('alice', 500)
+        quota.commit(reservation, 200)
+        self.assertEqual(quota.get_remaining('alice'), 800)
+
+    def test_concurrent_reservations_never_exceed_limit(self):
+        quota = self.make(1000)
+        granted = []
+        threads = [threading.Thread(target=lambda: granted.append(quota.reserve('bob', 100)))
+                   for _ in range(30)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len([r for r in granted if r]), 10)
+
+    def test_new_day_starts_empty(self):
+        quota = self.make(1000)
+        quota.add_usage('alice', 1000)
+        with patch('quota.today_str', return_value='2999-01-01'):
+            self.assertEqual(quota.get_remaining('alice'), 1000)
+
+    def test_usage_report(self):
+        quota = self.make(1000)
+        quota.add_usage('alice', 10)
+        quota.add_usage('bob', 20)
+        self.assertEqual(quota.usage_report(), {'alice': 10, 'bob': 20})
+
+
+class TestRedisQuota(QuotaContract, unittest.TestCase):
+    def make(self, daily_limit):
+        self.redis = FakeRedis()
+        return RedisQuota(redis_client=self.redis, daily_limit=daily_limit)
+
+    def test_day_buckets_expire(self):
+        quota = self.make(1000)
+        quota.add_usage('alice', 1)
+        self.assertTrue(all(ttl > 0 for ttl in self.redis.expiry.values()))
+
+
+class TestFileQuota(QuotaContract, unittest.TestCase):
+    def make(self, daily_limit):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'quota_tracker.json')
+        return self.open(daily_limit)
+
+    def open(self, daily_limit=1000):
+        quota = FileQuota(filepath=self.path, daily_limit=daily_limit, flush_interval=3600)
+        # Flush before the directory is removed so the exit hook has nothing to write.
+        self.addCleanup(quota.flush)
+        return quota
+
+    def test_writes_are_deferred_and_merged(self):
+        quota = self.make(1000)
+        other = self.open()
+        quota.add_usage('alice', 10)
+        self.assertFalse(os.path.exists(self.path))
+
+        quota.flush()
+        other.add_usage('alice', 5)
+        other.flush()
+        self.assertEqual(self.open().usage_report(), {'alice': 15})
+
+    def test_reads_legacy_format(self):
+        self.make(1000)
+        with open(self.path, 'w') as f:
+            json.dump({'alice': {'date': '2024-05-01', 'bytes_used': 42}}, f)
+        legacy = self.open()
+        self.assertEqual(legacy.usage_report('2024-05-01'), {'alice': 42})
+
+
+if __name__ == '__main__':
+    unittest.main()
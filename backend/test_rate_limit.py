@@ -0,0 +1,79 @@
+import unittest
+from unittest.mock import patch
+
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import SlidingWindowCounterRateLimiter
+
+from conftest import FakeRedis
+from rate_limit import TieredRedisStorage
+
+NOW = 1_700_000_080.0  # 40 s into minute window 28333334
+
+
+class TestTieredRedisStorage(unittest.TestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        patcher = patch('rate_limit.time.time', return_value=NOW)
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def storage(self, **options):
+        return TieredRedisStorage('tiered+redis://localhost:6379/0', redis_client=self.redis, **options)
+
+    def test_hits_are_decided_locally_from_a_lease(self):
+        storage = self.storage(lease_fraction=0.1)
+        for _ in range(10):
+            self.assertTrue(storage.acquire_sliding_window_entry('k', 100, 60))
+
+        self.assertEqual(storage.stats()['redis_round_trips'], 1)
+        self.assertEqual(storage.stats()['local_hits'], 9)
+        self.assertEqual(storage.get_sliding_window('k', 60)[2], 10)
+
+    def test_workers_sharing_redis_never_exceed_the_limit(self):
+        workers = [self.storage(lease_fraction=0.25) for _ in range(3)]
+        allowed = 0
+        for i in range(60):
+            allowed += workers[i % 3].acquire_sliding_window_entry('k', 20, 60)
+
+        # Leases held by the other workers may be refused early, never granted twice.
+        self.assertLessEqual(allowed, 20)
+        self.assertGreaterEqual(allowed, 20 - 2 * 4)
+        self.assertLessEqual(self.redis.data['rate_limit:k/28333334'], 20)
+
+    def test_small_limits_go_to_redis_and_refusals_are_cached(self):
+        storage = self.storage(lease_fraction=0.1, deny_seconds=1)
+        for _ in range(5):
+            self.assertTrue(storage.acquire_sliding_window_entry('k', 5, 60))
+        self.assertFalse(storage.acquire_sliding_window_entry('k', 5, 60))
+        commands = self.redis.commands
+
+        self.assertFalse(storage.acquire_sliding_window_entry('k', 5, 60))
+        self.assertEqual(self.redis.commands, commands)
+        self.assertEqual(storage.stats()['local_denials'], 1)
+        self.assertEqual(self.redis.data['rate_limit:k/28333334'], 5)
+
+    def test_previous_window_counts_by_its_overlap(self):
+        storage = self.storage(lease_fraction=0)
+        self.redis.data['rate_limit:k/28333333'] = 9
+        # 40 s into the window a third of the previous one still overlaps: 3 of 10 are used.
+        allowed = sum(storage.acquire_sliding_window_entry('k', 10, 60) for _ in range(10))
+        self.assertEqual(allowed, 7)
+
+    def test_lease_ends_with_its_window(self):
+        storage = self.storage(lease_fraction=0.5)
+        self.assertTrue(storage.acquire_sliding_window_entry('k', 10, 60))
+        self.clock.return_value = NOW + 60
+        self.assertTrue(storage.acquire_sliding_window_entry('k', 10, 60))
+        self.assertEqual(storage.stats()['redis_round_trips'], 2)
+
+    def test_registered_as_limits_storage(self):
+        storage = storage_from_string('tiered+redis://localhost:6379/0', redis_client=self.redis)
+        limiter = SlidingWindowCounterRateLimiter(storage)
+        limit = parse('3 per minute')
+        self.assertEqual([limiter.hit(limit, '127.0.0.1') for _ in range(4)], [True, True, True, False])
+        self.assertFalse(limiter.test(limit, '127.0.0.1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
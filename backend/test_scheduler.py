@@ -0,0 +1,124 @@
+import threading
+import time
+import unittest
+from concurrent.futures import Future
+
+from scheduler import FairScheduler, QueueFull
+
+
+class TestFairScheduler(unittest.TestCase):
+    def setUp(self):
+        self.gate = threading.Event()
+        self.order = []
+
+    def tearDown(self):
+        self.gate.set()
+
+    def blocking_job(self, name):
+        self.gate.wait(5)
+        self.order.append(name)
+
+    def test_users_are_served_round_robin(self):
+        scheduler = FairScheduler(workers=1, max_queued=20)
+        scheduler.submit('blocker', 'x', self.gate.wait, 5)
+        time.sleep(0.05)
+        for i in range(3):
+            scheduler.submit(f'a{i}', 'alice', self.order.append, f'a{i}')
+        scheduler.submit('b0', 'bob', self.order.append, 'b0')
+        scheduler.submit('c0', 'carol', self.order.append, 'c0')
+
+        self.assertEqual(scheduler.position('a0'), 0)
+        self.assertEqual(scheduler.position('b0'), 1)
+        self.assertEqual(scheduler.position('c0'), 2)
+        self.assertEqual(scheduler.position('a1'), 3)
+
+        self.gate.set()
+        deadline = time.time() + 2
+        while len(self.order) < 5 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.order, ['a0', 'b0', 'c0', 'a1', 'a2'])
+
+    def test_higher_priority_jumps_the_queue(self):
+        scheduler = FairScheduler(workers=1)
+        scheduler.submit('blocker', 'x', self.gate.wait, 5)
+        time.sleep(0.05)
+        scheduler.submit('low', 'alice', self.order.append, 'low')
+        scheduler.submit('high', 'bob', self.order.append, 'high', priority=5)
+        self.assertEqual(scheduler.position('high'), 0)
+        self.assertEqual(scheduler.position('low'), 1)
+
+    def test_all_worker_slots_are_used(self):
+        scheduler = FairScheduler(workers=3)
+        for i in range(3):
+            scheduler.submit(f'j{i}', 'alice', self.blocking_job, f'j{i}')
+        time.sleep(0.1)
+        self.assertEqual(scheduler.stats()['running'], 3)
+        self.assertEqual(scheduler.stats()['queued'], 0)
+
+    def test_queue_bounds(self):
+        scheduler = FairScheduler(workers=1, max_queued=3, max_queued_per_user=2)
+        scheduler.submit('blocker', 'x', self.gate.wait, 5)
+        time.sleep(0.05)
+        scheduler.submit('a0', 'alice', self.order.append, 'a0')
+        scheduler.submit('a1', 'alice', self.order.append, 'a1')
+        with self.assertRaises(QueueFull):
+            scheduler.submit('a2', 'alice', self.order.append, 'a2')
+        scheduler.submit('b0', 'bob', self.order.append, 'b0')
+        with self.assertRaises(QueueFull):
+            scheduler.submit('c0', 'carol', self.order.append, 'c0')
+
+    def test_estimated_start_grows_with_position(self):
+        scheduler = FairScheduler(workers=1, default_duration=30)
+        scheduler.submit('blocker', 'x', self.gate.wait, 5)
+        time.sleep(0.05)
+        scheduler.submit('a0', 'alice', self.order.append, 'a0')
+        scheduler.submit('a1', 'alice', self.order.append, 'a1')
+
+        first = scheduler.estimated_start('a0')
+        second = scheduler.estimated_start('a1')
+        self.assertAlmostEqual(first - time.time(), 30, delta=1)
+        self.assertAlmostEqual(second - first, 30, delta=1)
+        self.assertIsNone(scheduler.estimated_start('blocker'))
+
+        position, start = scheduler.queue_estimate('a1')
+        self.assertEqual(position, 1)
+        self.assertAlmostEqual(start, second, delta=1)
+        self.assertIsNone(scheduler.queue_estimate('blocker'))
+
+    def test_future_jobs_hold_their_slot_but_not_a_thread(self):
+        scheduler = FairScheduler(workers=2, threads=1)
+        futures = [Future(), Future()]
+        scheduler.submit('f0', 'alice', lambda: futures[0])
+        scheduler.submit('f1', 'bob', lambda: futures[1])
+        scheduler.submit('a0', 'alice', self.order.append, 'a0')
+        time.sleep(0.1)
+        self.assertEqual(scheduler.stats()['running'], 2)
+        self.assertEqual(self.order, [])
+
+        futures[0].set_result(None)
+        deadline = time.time() + 2
+        while not self.order and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.order, ['a0'])
+
+    def test_cancel_removes_a_queued_job(self):
+        scheduler = FairScheduler(workers=1)
+        scheduler.submit('blocker', 'x', self.gate.wait, 5)
+        time.sleep(0.05)
+        scheduler.submit('a0', 'alice', self.order.append, 'a0')
+        scheduler.submit('a1', 'alice', self.order.append, 'a1')
+
+        self.assertEqual(scheduler.cancel('a0').args, ('a0',))
+        self.assertIsNone(scheduler.cancel('a0'))
+        self.assertIsNone(scheduler.cancel('blocker'))
+        self.assertEqual(scheduler.position('a1'), 0)
+        self.gate.set()
+        deadline = time.time() + 2
+        while not self.order and time.time() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        self.assertEqual(self.order, ['a1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
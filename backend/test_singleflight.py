@@ -0,0 +1,91 @@
+import json
+import threading
+import time
+import unittest
+
+from conftest import FakeRedis
+from singleflight import SingleFlight, SingleFlightError
+
+
+class TestSingleFlight(unittest.TestCase):
+    def run_concurrently(self, flight, fn, callers=8):
+        results, errors = [], []
+        start = threading.Barrier(callers)
+
+        def worker():
+            start.wait()
+            try:
+                results.append(flight.do('youtube:abc', fn))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(callers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results, errors
+
+    def test_concurrent_callers_share_one_execution(self):
+        calls = []
+
+        def extract():
+            calls.append(1)
+            time.sleep(0.2)
+            return {'title': 'shared'}
+
+        flight = SingleFlight()
+        results, errors = self.run_concurrently(flight, extract)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(errors, [])
+        self.assertEqual(results, [{'title': 'shared'}] * 8)
+        self.assertEqual(flight.stats()['coalesced'], 7)
+        self.assertEqual(flight.stats()['in_flight'], 0)
+
+    def test_error_is_shared_with_waiters(self):
+        def extract():
+            time.sleep(0.2)
+            raise ValueError('unavailable')
+
+        results, errors = self.run_concurrently(SingleFlight(), extract, callers=4)
+        self.assertEqual(results, [])
+        self.assertEqual(len(errors), 4)
+        self.assertTrue(all(isinstance(e, ValueError) for e in errors))
+
+    def test_other_worker_waits_for_published_result(self):
+        fake_redis = FakeRedis()
+        leader = SingleFlight(redis_client=fake_redis, poll_interval=0.01)
+        follower = SingleFlight(redis_client=fake_redis, poll_interval=0.01)
+        follower_calls = []
+        started = threading.Event()
+
+        def slow_extract():
+            started.set()
+            time.sleep(0.2)
+            return {'title': 'from leader'}
+
+        t = threading.Thread(target=leader.do, args=('youtube:abc', slow_extract))
+        t.start()
+        started.wait()
+        result = follower.do('youtube:abc', lambda: follower_calls.append(1))
+        t.join()
+
+        self.assertEqual(result, {'title': 'from leader'})
+        self.assertEqual(follower_calls, [])
+        self.assertEqual(follower.stats()['remote_coalesced'], 1)
+        self.assertNotIn('singleflight:lock:youtube:abc', fake_redis.data)
+
+    def test_remote_error_is_raised_to_other_worker(self):
+        fake_redis = FakeRedis()
+        fake_redis.set('singleflight:lock:youtube:abc', 'someone-else')
+        fake_redis.set('singleflight:result:youtube:abc', json.dumps({'error': 'Video unavailable'}))
+
+        flight = SingleFlight(redis_client=fake_redis, poll_interval=0.01)
+        with self.assertRaises(SingleFlightError) as ctx:
+            flight.do('youtube:abc', lambda: None)
+        self.assertIn('Video unavailable', str(ctx.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
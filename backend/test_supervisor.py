@@ -0,0 +1,262 @@
+import asyncio
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from artifacts import ArtifactStore
+from conftest import FakeRedis
+from extractor import ExtractionError
+from supervisor import DownloadSupervisor
+from task_store import RedisTaskStore
+
+FAKE_YTDLP = '''import sys, time
+print("[download] starting", flush=True)
+for i in range(int(sys.argv[1])):
+    print(f"line {i}", flush=True)
+    time.sleep(float(sys.argv[2]))
+sys.exit(int(sys.argv[3]))
+'''
+
+
+class TestDownloadSupervisor(unittest.TestCase):
+    def setUp(self):
+        dir_ = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dir_)
+        self.script = os.path.join(dir_, 'fake-yt-dlp')
+        with open(self.script, 'w') as f:
+            f.write(f"#!{sys.executable}\n{FAKE_YTDLP}")
+        os.chmod(self.script, os.stat(self.script).st_mode | stat.S_IEXEC)
+        self.supervisor = DownloadSupervisor(kill_grace=1)
+
+    def run_process(self, *args, on_line=None, timeout=None):
+        async def job():
+            deadline = asyncio.get_running_loop().time() + timeout if timeout else None
+            return await self.supervisor.run_process([self.script, *map(str, args)], on_line or self.lines.append,
+                                                     deadline)
+        return job()
+
+    def test_lines_and_exit_code_are_reported(self):
+        self.lines = []
+        result = self.supervisor.run('job-1', self.run_process(3, 0, 2))
+        self.assertEqual(self.lines, ['[download] starting', 'line 0', 'line 1', 'line 2'])
+        self.assertEqual(result, (2, False))
+
+    def test_on_line_can_stop_the_process(self):
+        result = self.supervisor.run('job-2', self.run_process(100, 0.05, 0, on_line=lambda line: line == 'line 1'))
+        self.assertTrue(result.stopped)
+        self.assertNotEqual(result.returncode, 0)
+
+    def test_deadline_kills_a_stalled_child(self):
+        self.lines = []
+        started = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            self.supervisor.run('job-3', self.run_process(1, 30, 0, timeout=0.3))
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_cancel_terminates_the_child(self):
+        self.lines = []
+        future = self.supervisor.submit('job-4', self.run_process(100, 0.05, 0))
+        while len(self.lines) < 2:
+            time.sleep(0.01)
+        self.assertTrue(self.supervisor.cancel('job-4', timeout=2))
+        self.assertTrue(future.cancelled())
+        self.assertFalse(self.supervisor.is_running('job-4'))
+        self.assertFalse(self.supervisor.cancel('job-4'))
+
+    def test_many_jobs_share_one_thread(self):
+        self.lines = []
+        threads = threading.active_count()
+        futures = [self.supervisor.submit(f'job-{i}', self.run_process(2, 0.1, 0)) for i in range(20)]
+        for future in futures:
+            self.assertEqual(future.result(timeout=10).returncode, 0)
+        self.assertLessEqual(threading.active_count(), threads + 2)
+
+
+class TestCancelEndpoint(unittest.TestCase):
+    def setUp(self):
+        import app as backend
+        self.backend = backend
+        backend.limiter.enabled = False
+        self.addCleanup(setattr, backend.limiter, 'enabled', True)
+        self.addCleanup(backend.app.config.__setitem__, 'WTF_CSRF_ENABLED',
+                        backend.app.config.get('WTF_CSRF_ENABLED', True))
+        backend.app.config['WTF_CSRF_ENABLED'] = False
+        self.client = backend.app.test_client()
+
+    @patch('app.quota_manager')
+    def test_queued_download_is_removed_and_refunded(self, mock_quota):
+        backend = self.backend
+        reservation = {'user': '127.0.0.1', 'day': '2024-01-01', 'bytes': 100}
+        self.addCleanup(backend.forget_task, 'cancel-1')
+        dir_ = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dir_)
+        store = ArtifactStore(dir_)
+        with patch.object(backend, 'download_scheduler') as scheduler, \
+                patch.object(backend, 'artifact_store', store), \
+                patch.object(backend, 'DOWNLOADS_DIR', dir_):
+            backend.start_download('cancel-1', 'https://youtu.be/cancel00001', '18', '127.0.0.1',
+                                   quota_reservation=reservation)
+            flight = scheduler.submit.call_args[0][-1]
+            scheduler.cancel.return_value.args = (flight,)
+            scheduler.queue_estimate.return_value = (1, 0)
+            partial = os.path.join(dir_, f"{flight.key}.mp4.part")
+            with open(partial, 'w'):
+                pass
+
+            self.assertEqual(self.client.get('/api/tasks').get_json()['tasks'][0]['task_id'], 'cancel-1')
+            response = self.client.delete('/api/tasks/cancel-1')
+
+        self.assertEqual(response.get_json()['status'], 'Cancelled')
+        mock_quota.refund.assert_called_once_with(reservation)
+        self.assertFalse(os.path.exists(partial))
+        # The claim was released: the next request for the video leads a new download.
+        self.assertEqual(store.claim(flight.key, 'other', 0)[0], ArtifactStore.CLAIM_LEAD)
+        self.assertEqual(self.client.delete('/api/tasks/cancel-1').status_code, 409)
+        self.assertEqual(self.client.get('/api/tasks').get_json()['tasks'], [])
+
+    def test_other_users_tasks_are_off_limits(self):
+        backend = self.backend
+        backend.update_task('cancel-2', status='Queued', percentage=0, message='', user='198.51.100.9')
+        self.addCleanup(backend.forget_task, 'cancel-2')
+        self.assertEqual(self.client.delete('/api/tasks/cancel-2').status_code, 403)
+        self.assertEqual(self.client.delete('/api/tasks/missing').status_code, 404)
+
+    @patch('app.quota_manager')
+    def test_running_celery_download_stops_on_cancel(self, mock_quota):
+        backend = self.backend
+        reservation = {'user': '127.0.0.1', 'day': '2024-01-01', 'bytes': 100}
+        backend.update_task('cancel-3', status='Queued', percentage=0, message='', user='127.0.0.1',
+                            quota_reservation=reservation)
+        self.addCleanup(backend.forget_task, 'cancel-3')
+        dir_ = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dir_)
+        started = threading.Event()
+
+        async def slow_download(*args, **kwargs):
+            started.set()
+            await asyncio.sleep(30)
+
+        result = []
+        with patch.object(backend, 'supervise_ytdlp', slow_download), \
+                patch.object(backend, 'artifact_store', ArtifactStore(dir_)), \
+                patch.object(backend, 'DOWNLOADS_DIR', dir_), \
+                patch.object(backend.extraction_engine, 'mode', 'subprocess'), \
+                patch('celery_worker.celery_app.control.revoke') as revoke, \
+                patch.object(backend, 'DOWNLOAD_BACKEND', 'celery'):
+            worker = threading.Thread(target=lambda: result.append(backend.run_worker_download(
+                'cancel-3', 'https://youtu.be/cancel00003', '18', '127.0.0.1')))
+            worker.start()
+            self.assertTrue(started.wait(5))
+            self.assertEqual(self.client.delete('/api/tasks/cancel-3').status_code, 200)
+            worker.join(5)
+
+        self.assertFalse(worker.is_alive())
+        revoke.assert_called_once_with('cancel-3')
+        self.assertEqual(result, ['Cancelled'])
+        mock_quota.refund.assert_called_once_with(reservation)
+        mock_quota.commit.assert_not_called()
+
+    @patch('app.quota_manager')
+    def test_cancel_stops_a_pool_download(self, mock_quota):
+        backend = self.backend
+        backend.update_task('cancel-6', status='Queued', percentage=0, message='', user='127.0.0.1')
+        self.addCleanup(backend.forget_task, 'cancel-6')
+        dir_ = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dir_)
+        started = threading.Event()
+        stopped = threading.Event()
+
+        def pool_download(url, ydl_opts, progress_callback=None, timeout=None, cancel_event=None):
+            # Stands in for the worker process, which keeps going until it is terminated.
+            started.set()
+            self.assertTrue(cancel_event.wait(5))
+            stopped.set()
+            raise ExtractionError("Download cancelled")
+
+        result = []
+        with patch.object(backend.extraction_engine, 'download', pool_download), \
+                patch.object(backend.extraction_engine, 'mode', 'pool'), \
+                patch.object(backend, 'artifact_store', ArtifactStore(dir_)), \
+                patch.object(backend, 'DOWNLOADS_DIR', dir_), \
+                patch('celery_worker.celery_app.control.revoke'), \
+                patch.object(backend, 'DOWNLOAD_BACKEND', 'celery'):
+            worker = threading.Thread(target=lambda: result.append(backend.run_worker_download(
+                'cancel-6', 'https://youtu.be/cancel00006', '18', '127.0.0.1')))
+            worker.start()
+            self.assertTrue(started.wait(5))
+            self.assertEqual(self.client.delete('/api/tasks/cancel-6').status_code, 200)
+            worker.join(5)
+
+        self.assertTrue(stopped.is_set())
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(result, ['Cancelled'])
+        mock_quota.commit.assert_not_called()
+
+    @patch('app.quota_manager')
+    def test_progress_after_a_cancel_does_not_revive_the_task(self, mock_quota):
+        backend = self.backend
+        # Samples reach Redis right away, like a worker's flush landing after the cancel.
+        store = RedisTaskStore(FakeRedis(), flush_interval=0)
+        reservation = {'user': '127.0.0.1', 'day': '2024-01-01', 'bytes': 100}
+        dir_ = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dir_)
+        started = threading.Event()
+        stop = threading.Event()
+        self.addCleanup(stop.set)
+
+        def emit_progress():
+            # Like yt-dlp's output reader, which goes on for a moment after the cancel.
+            while not stop.is_set():
+                backend.update_task_progress('cancel-5', status='Downloading', percentage=50, message='50%')
+                time.sleep(0.005)
+
+        async def slow_download(*args, **kwargs):
+            threading.Thread(target=emit_progress, daemon=True).start()
+            started.set()
+            await asyncio.sleep(30)
+
+        result = []
+        with patch.object(backend, 'task_store', store), \
+                patch.object(backend, 'supervise_ytdlp', slow_download), \
+                patch.object(backend, 'artifact_store', ArtifactStore(dir_)), \
+                patch.object(backend, 'DOWNLOADS_DIR', dir_), \
+                patch.object(backend.extraction_engine, 'mode', 'subprocess'), \
+                patch('celery_worker.celery_app.control.revoke'), \
+                patch.object(backend, 'DOWNLOAD_BACKEND', 'celery'):
+            backend.update_task('cancel-5', status='Queued', percentage=0, message='', user='127.0.0.1',
+                                quota_reservation=reservation)
+            worker = threading.Thread(target=lambda: result.append(backend.run_worker_download(
+                'cancel-5', 'https://youtu.be/cancel00005', '18', '127.0.0.1')))
+            worker.start()
+            self.assertTrue(started.wait(5))
+            time.sleep(0.05)
+            self.assertEqual(self.client.delete('/api/tasks/cancel-5').status_code, 200)
+            worker.join(5)
+            time.sleep(0.05)
+            stop.set()
+            status = backend.get_task('cancel-5')['status']
+
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(result, ['Cancelled'])
+        self.assertEqual(status, 'Cancelled')
+        mock_quota.commit.assert_not_called()
+
+    @patch('app.quota_manager')
+    def test_completion_does_not_overwrite_a_cancellation(self, mock_quota):
+        backend = self.backend
+        backend.update_task('cancel-4', status='Cancelled', percentage=40, message='', user='127.0.0.1')
+        self.addCleanup(backend.forget_task, 'cancel-4')
+        artifact = MagicMock(filename='a.mp4', size=100)
+        backend.complete_download('cancel-4', artifact, '127.0.0.1')
+        self.assertEqual(backend.get_task('cancel-4')['status'], 'Cancelled')
+        mock_quota.add_usage.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import json
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from task_events import TaskEventBus
+
+
+class TestTaskEventBus(unittest.TestCase):
+    def test_wait_returns_on_event_for_followed_task(self):
+        bus = TaskEventBus()
+        seq = bus.seq
+        threading.Timer(0.05, bus.publish, args=('task-1',)).start()
+
+        started = time.monotonic()
+        new_seq = bus.wait({'task-1'}, seq, timeout=2)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertGreater(new_seq, seq)
+
+    def test_events_of_other_tasks_do_not_wake_waiter(self):
+        bus = TaskEventBus()
+        seq = bus.seq
+        bus.publish('task-2')
+
+        started = time.monotonic()
+        bus.wait({'task-1'}, seq, timeout=0.1)
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+
+    def test_event_before_wait_is_not_missed(self):
+        bus = TaskEventBus()
+        seq = bus.seq
+        bus.publish('task-1')
+        self.assertEqual(bus.wait({'task-1'}, seq, timeout=0), seq + 1)
+
+
+class TestStatusStreaming(unittest.TestCase):
+    def setUp(self):
+        import app as backend
+        self.backend = backend
+        backend.limiter.enabled = False
+        self.addCleanup(setattr, backend.limiter, 'enabled', True)
+        self.client = backend.app.test_client()
+        backend.update_task('stream-1', status='Downloading', percentage=10.0, message='10.0% completed')
+        self.addCleanup(backend.forget_task, 'stream-1')
+
+    def finish_later(self, delay=0.1):
+        def finish():
+            self.backend.update_task('stream-1', status='Downloading', percentage=55.0, message='55.0% completed')
+            self.backend.update_task('stream-1', status='Failed', message='Error: boom')
+        threading.Timer(delay, finish).start()
+
+    def test_stream_pushes_changes_until_final_state(self):
+        self.finish_later()
+        response = self.client.get('/api/status/stream-1/stream')
+        self.assertEqual(response.mimetype, 'text/event-stream')
+
+        events = [json.loads(line[len('data: '):]) for line in response.get_data(as_text=True).splitlines()
+                  if line.startswith('data: ')]
+        self.assertEqual(events[0]['percentage'], 10.0)
+        self.assertEqual(events[-1]['status'], 'Failed')
+
+    def test_long_poll_returns_when_status_changes(self):
+        self.finish_later()
+        started = time.monotonic()
+        response = self.client.get('/api/status/stream-1?wait=5&status=Downloading&percentage=10.0')
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertNotEqual(json.loads(response.data)['percentage'], 10.0)
+
+    def test_long_poll_times_out_with_current_status(self):
+        with patch.object(self.backend, 'LONG_POLL_MAX_SECONDS', 0.1):
+            response = self.client.get('/api/status/stream-1?wait=5&status=Downloading&percentage=10.0')
+        self.assertEqual(json.loads(response.data)['percentage'], 10.0)
+
+    def test_unknown_task_stream_reports_error_event(self):
+        body = self.client.get('/api/status/missing/stream').get_data(as_text=True)
+        self.assertIn('event: error', body)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import unittest
+from unittest.mock import patch
+
+from conftest import FakeRedis
+from task_store import MemoryTaskStore, RedisTaskStore, TaskRecord
+
+
+class TestMemoryTaskStore(unittest.TestCase):
+    def test_records_are_slotted_and_keep_unknown_fields(self):
+        store = MemoryTaskStore()
+        store.update('t-1', {'status': 'Queued', 'percentage': 0, 'items': [{'url': 'u'}]})
+
+        self.assertEqual(store.get('t-1'), {'status': 'Queued', 'percentage': 0, 'items': [{'url': 'u'}]})
+        self.assertFalse(hasattr(TaskRecord(), '__dict__'))
+
+    def test_update_reports_tracked_changes_only(self):
+        store = MemoryTaskStore()
+        self.assertTrue(store.update('t-1', {'status': 'Downloading', 'percentage': 10}))
+        self.assertFalse(store.update('t-1', {'percentage': 10, 'speed': 5000}))
+        self.assertTrue(store.update('t-1', {'percentage': 11}))
+
+    def test_least_recently_updated_records_are_evicted(self):
+        store = MemoryTaskStore(max_tasks=2)
+        store.update('t-1', {'status': 'Queued'})
+        store.update('t-2', {'status': 'Queued'})
+        store.update('t-1', {'percentage': 5})
+        store.update('t-3', {'status': 'Queued'})
+
+        self.assertIsNone(store.get('t-2'))
+        self.assertIsNotNone(store.get('t-1'))
+        self.assertEqual(store.stats()['evicted'], 1)
+
+    def test_records_expire_after_ttl(self):
+        store = MemoryTaskStore(ttl=60)
+        with patch('task_store.time.monotonic', return_value=1000.0):
+            store.update('t-1', {'status': 'Completed'})
+        with patch('task_store.time.monotonic', return_value=1059.0):
+            self.assertIsNotNone(store.get('t-1'))
+        with patch('task_store.time.monotonic', return_value=1061.0):
+            self.assertIsNone(store.get('t-1'))
+            self.assertEqual(store.stats()['tasks'], 0)
+
+    def test_active_tasks_are_indexed_per_user(self):
+        store = MemoryTaskStore()
+        store.update('t-1', {'status': 'Queued', 'user': 'alice'})
+        store.update('t-2', {'status': 'Queued', 'user': 'bob'})
+        store.update('t-3', {'status': 'Downloading', 'user': 'alice'})
+        store.update('t-1', {'status': 'Completed'})
+
+        self.assertEqual(list(store.active_tasks('alice')), ['t-3'])
+        store.delete('t-3')
+        self.assertEqual(store.active_tasks('alice'), {})
+        self.assertEqual(store.stats()['users_with_active_tasks'], 1)
+
+    def test_active_tasks_are_listed_in_creation_order(self):
+        store = MemoryTaskStore()
+        with patch('task_store.time.time', side_effect=[300.0, 100.0, 200.0]):
+            for task_id in ('t-c', 't-a', 't-b'):
+                store.update(task_id, {'status': 'Queued', 'user': 'alice'})
+        store.update('t-a', {'status': 'Downloading'})
+        self.assertEqual(list(store.active_tasks('alice')), ['t-a', 't-b', 't-c'])
+
+    def test_progress_samples_do_not_revive_a_finished_task(self):
+        store = MemoryTaskStore()
+        store.update('t-1', {'status': 'Cancelled', 'user': 'alice'})
+        self.assertFalse(store.update('t-1', {'status': 'Downloading', 'percentage': 50}, defer=True))
+        self.assertEqual(store.get('t-1')['status'], 'Cancelled')
+        self.assertEqual(store.active_tasks('alice'), {})
+
+    def test_conditional_update_applies_only_from_the_expected_status(self):
+        store = MemoryTaskStore()
+        store.update('t-1', {'status': 'Ready', 'user': 'alice'})
+        self.assertTrue(store.update_if_status('t-1', ('Ready',), {'status': 'Streaming'}))
+        self.assertFalse(store.update_if_status('t-1', ('Ready',), {'status': 'Streaming'}))
+        self.assertFalse(store.update_if_status('missing', ('Ready',), {'status': 'Streaming'}))
+        self.assertEqual(store.get('t-1')['status'], 'Streaming')
+
+
+class TestRedisTaskStore(unittest.TestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        self.store = RedisTaskStore(self.redis, ttl=60, flush_interval=3600)
+
+    def test_progress_samples_are_batched_until_the_next_write(self):
+        self.store.update('t-1', {'status': 'Downloading', 'user': 'alice'})
+        self.store.update('t-2', {'status': 'Downloading', 'user': 'alice'})
+        writes = self.redis.pipelines
+        for percentage in (10, 20, 30):
+            self.store.update('t-1', {'percentage': percentage}, defer=True)
+            self.store.update('t-2', {'percentage': percentage}, defer=True)
+
+        self.assertEqual(self.redis.pipelines, writes)
+        self.assertNotIn('percentage', self.store.get('t-1'))
+        self.assertEqual(self.store.stats()['pending_writes'], 2)
+
+        self.store.update('t-2', {'message': 'Almost there'})
+        self.assertEqual(self.redis.pipelines, writes + 1)
+        self.assertEqual(self.store.get('t-1')['percentage'], 30)
+        self.assertEqual(self.store.get('t-2')['percentage'], 30)
+        self.assertEqual(self.store.stats()['pending_writes'], 0)
+
+    def test_samples_flushed_after_a_cancel_do_not_revive_the_task(self):
+        self.store.update('t-1', {'status': 'Downloading', 'user': 'alice'})
+        self.store.update('t-1', {'status': 'Downloading', 'percentage': 50}, defer=True)
+        # Cancelled by another process while this one still buffers the sample.
+        RedisTaskStore(self.redis).update('t-1', {'status': 'Cancelled'})
+        self.store.flush()
+
+        self.assertEqual(self.store.get('t-1')['status'], 'Cancelled')
+        self.assertNotIn('percentage', self.store.get('t-1'))
+        self.assertEqual(self.store.active_tasks('alice'), {})
+
+    def test_conditional_update_applies_only_from_the_expected_status(self):
+        self.store.update('t-1', {'status': 'Ready', 'user': 'alice'})
+        other = RedisTaskStore(self.redis)
+        self.assertTrue(self.store.update_if_status('t-1', ('Ready',), {'status': 'Streaming'}))
+        self.assertFalse(other.update_if_status('t-1', ('Ready',), {'status': 'Streaming'}))
+        self.assertFalse(self.store.update_if_status('missing', ('Ready',), {'status': 'Streaming'}))
+        self.assertEqual(self.store.get('t-1')['status'], 'Streaming')
+        self.assertEqual(self.redis.expiry['download_task:t-1'], 60)
+
+        self.assertFalse(self.store.update_if_status('t-1', ('Streaming',), {'percentage': 5}, exclude=True))
+        self.assertTrue(self.store.update_if_status('t-1', ('Cancelled',), {'percentage': 5}, exclude=True))
+        self.assertEqual(self.store.get('t-1')['percentage'], 5)
+
+    def test_active_tasks_are_listed_in_creation_order(self):
+        with patch('task_store.time.time', side_effect=[300.0, 100.0, 200.0]):
+            for task_id in ('t-c', 't-a', 't-b'):
+                self.store.update(task_id, {'status': 'Queued', 'user': 'alice'})
+        # Later writes, from any process, keep the creation time.
+        RedisTaskStore(self.redis).update('t-a', {'status': 'Downloading', 'user': 'alice'})
+        self.store.update('t-b', {'status': 'Completed'})
+
+        self.assertEqual(list(self.store.active_tasks('alice')), ['t-a', 't-c'])
+        self.assertEqual(self.redis.smembers('download_task_user:alice'), {'t-a', 't-c'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from thumbnails import ThumbnailError, ThumbnailStore, thumbnail_key
+
+# Writes "<source bytes>:<map label>" to every output, like ffmpeg's one-decode split.
+FAKE_FFMPEG = '''import sys
+source = sys.stdin.buffer.read()
+if not source.startswith(b"JPEG"):
+    sys.stderr.write("Invalid data found when processing input")
+    sys.exit(1)
+args = sys.argv[1:]
+label = None
+for i, arg in enumerate(args):
+    if arg == "-map":
+        label = args[i + 1]
+    if arg == "-f" and args[i + 1] == "webp":
+        with open(args[i + 2], "wb") as f:
+            f.write(source + b":" + label.encode())
+'''
+
+
+def fake_response(body, status=200):
+    response = MagicMock()
+    response.__enter__.return_value = response
+    response.is_redirect = 300 <= status < 400
+    response.iter_content.return_value = [body[i:i + 4] for i in range(0, len(body), 4)]
+    if status >= 400:
+        import requests
+        response.raise_for_status.side_effect = requests.HTTPError(f"{status} Forbidden")
+    return response
+
+
+class ThumbnailTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.ffmpeg = os.path.join(self.dir, 'fake-ffmpeg')
+        with open(self.ffmpeg, 'w') as f:
+            f.write(f"#!{sys.executable}\n{FAKE_FFMPEG}")
+        os.chmod(self.ffmpeg, os.stat(self.ffmpeg).st_mode | stat.S_IEXEC)
+        self.cache_dir = os.path.join(self.dir, 'thumbnails')
+
+    def store(self, **options):
+        options.setdefault('allowed_hosts', ('ytimg.com', 'cdn.example'))
+        return ThumbnailStore(self.cache_dir, ffmpeg_path=self.ffmpeg, **options)
+
+
+class TestThumbnailStore(ThumbnailTestCase):
+    @patch('thumbnails.requests.get')
+    def test_source_is_fetched_once_for_all_variants(self, mock_get):
+        mock_get.return_value = fake_response(b'JPEG-image')
+        store = self.store()
+
+        small = store.get('https://i.ytimg.com/vi/a/maxresdefault.jpg', 100)
+        large = store.get('https://i.ytimg.com/vi/a/maxresdefault.jpg', 400)
+
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertTrue(small.endswith('-160.webp'))
+        with open(large, 'rb') as f:
+            self.assertEqual(f.read(), b'JPEG-image:[v2]')
+        self.assertEqual(store.stats()['renders'], 1)
+        self.assertEqual(store.stats()['hits'], 1)
+        self.assertEqual(sorted(os.listdir(self.cache_dir)),
+                         sorted(f"{thumbnail_key('https://i.ytimg.com/vi/a/maxresdefault.jpg')}-{w}.webp"
+                                for w in (160, 320, 480)))
+
+    @patch('thumbnails.requests.get')
+    def test_least_recently_used_thumbnails_are_evicted(self, mock_get):
+        mock_get.side_effect = lambda *args, **kwargs: fake_response(b'JPEG-image')
+        # Each thumbnail's three variants take 45 bytes; two fit.
+        store = self.store(max_bytes=100)
+        store.get('https://cdn.example/a.jpg', 320)
+        store.get('https://cdn.example/b.jpg', 320)
+        store.get('https://cdn.example/a.jpg', 320)
+        store.get('https://cdn.example/c.jpg', 320)
+
+        self.assertFalse(os.path.exists(store.path(thumbnail_key('https://cdn.example/b.jpg'), 160)))
+        self.assertTrue(os.path.exists(store.path(thumbnail_key('https://cdn.example/a.jpg'), 160)))
+        self.assertEqual(store.stats()['evictions'], 1)
+        # The index survives a restart.
+        self.assertEqual(self.store(max_bytes=100).stats()['thumbnails'], 2)
+
+    @patch('thumbnails.requests.get')
+    def test_failures_are_not_retried_immediately(self, mock_get):
+        mock_get.return_value = fake_response(b'<html>hotlinking not allowed</html>')
+        store = self.store()
+        with self.assertRaises(ThumbnailError):
+            store.get('https://cdn.example/a.jpg', 320)
+        with self.assertRaises(ThumbnailError):
+            store.get('https://cdn.example/a.jpg', 320)
+
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertFalse([name for name in os.listdir(self.cache_dir) if name.endswith('.part')])
+
+    @patch('thumbnails.requests.get')
+    def test_only_platform_image_hosts_are_fetched(self, mock_get):
+        store = self.store()
+        for url in ('http://169.254.169.254/latest/meta-data', 'https://cdn.example.evil.com/a.jpg',
+                    'https://cdn.example@internal/a.jpg', 'file:///etc/passwd', 'ftp://cdn.example/a.jpg'):
+            with self.assertRaises(ThumbnailError):
+                store.get(url, 320)
+        self.assertFalse(mock_get.called)
+        self.assertTrue(store.allows('https://i.ytimg.com/vi/a/hq.jpg'))
+
+    @patch('thumbnails.requests.get')
+    def test_redirects_are_not_followed(self, mock_get):
+        mock_get.return_value = fake_response(b'', status=302)
+        with self.assertRaises(ThumbnailError):
+            self.store().get('https://cdn.example/moved.jpg', 320)
+        self.assertIs(mock_get.call_args[1]['allow_redirects'], False)
+
+
+class TestThumbnailEndpoint(ThumbnailTestCase):
+    def setUp(self):
+        super().setUp()
+        import app as backend
+        self.backend = backend
+        for patcher in (patch.object(backend, 'thumbnail_store', self.store()),
+                        patch.object(backend, 'THUMBNAIL_PROXY', True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = backend.app.test_client()
+
+    @patch('thumbnails.requests.get')
+    def test_variants_are_served_with_long_lived_cache_headers(self, mock_get):
+        mock_get.return_value = fake_response(b'JPEG-image')
+        info = self.backend.describe_video({'thumbnail': 'https://i.ytimg.com/vi/a/hq.jpg', 'formats': []})
+        self.assertIn(' 480w', info['thumbnail_srcset'])
+
+        response = self.client.get(info['thumbnail'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/webp')
+        self.assertEqual(response.data, b'JPEG-image:[v1]')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertIn('max-age=2592000', response.headers['Cache-Control'])
+
+        etag = response.headers['ETag']
+        self.assertEqual(self.client.get(info['thumbnail'], headers={'If-None-Match': etag}).status_code, 304)
+
+    @patch('thumbnails.requests.get')
+    def test_unconvertible_source_redirects_to_the_original(self, mock_get):
+        mock_get.return_value = fake_response(b'', status=403)
+        url = self.backend.thumbnail_url('https://cdn.example/blocked.jpg')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.headers['Location'], 'https://cdn.example/blocked.jpg')
+
+    def test_tampered_tokens_are_rejected(self):
+        token = self.backend.thumbnail_url('https://cdn.example/a.jpg').split('/')[-1]
+        self.assertEqual(self.client.get(f"/api/thumbnail/x{token}").status_code, 404)
+        self.assertIsNone(self.backend.describe_video({'thumbnail': 'file:///etc/passwd', 'formats': []})['thumbnail'])
+
+    def test_sources_on_other_hosts_are_neither_proxied_nor_redirected_to(self):
+        info = self.backend.describe_video({'thumbnail': 'https://elsewhere.example/a.jpg', 'formats': []})
+        self.assertEqual(info['thumbnail'], 'https://elsewhere.example/a.jpg')
+        self.assertIsNone(info['thumbnail_srcset'])
+        url = self.backend.thumbnail_url('http://127.0.0.1:6379/')
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_default_secret_key_disables_the_proxy(self):
+        url = self.backend.thumbnail_url('https://i.ytimg.com/vi/a/hq.jpg')
+        with patch.object(self.backend, 'THUMBNAIL_PROXY', False):
+            info = self.backend.describe_video({'thumbnail': 'https://i.ytimg.com/vi/a/hq.jpg', 'formats': []})
+            self.assertEqual(info['thumbnail'], 'https://i.ytimg.com/vi/a/hq.jpg')
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
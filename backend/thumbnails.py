@@ -0,0 +1,206 @@
+import hashlib
+import logging
+import os
+import re
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import requests
+
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_WIDTHS = (160, 320, 480)
+VARIANT_NAME_RE = re.compile(r'^([0-9a-f]{32})-(\d+)\.webp$')
+USER_AGENT = 'Mozilla/5.0 (compatible; creator-tools thumbnail proxy)'
+# Image CDNs of the supported platforms (YouTube, TikTok, Instagram/Facebook,
+# SoundCloud, Twitter/X); sources on any other host, or their subdomains, are not fetched.
+THUMBNAIL_HOSTS = ('ytimg.com', 'tiktokcdn.com', 'tiktokcdn-us.com', 'tiktokcdn-eu.com', 'ibyteimg.com',
+                   'cdninstagram.com', 'fbcdn.net', 'sndcdn.com', 'twimg.com')
+
+
+class ThumbnailError(Exception):
+    pass
+
+
+def thumbnail_key(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+
+
+class ThumbnailStore:
+    """Small WebP variants of platform thumbnails, cached on disk.
+
+    The source image is fetched once and ffmpeg scales it to every width in
+    ``widths`` in a single run (never upscaling). Concurrent requests for the
+    same thumbnail share that work. Least recently used thumbnails are
+    evicted, all variants together, to keep the directory under ``max_bytes``;
+    sources that could not be fetched or decoded are not retried for
+    ``failure_ttl`` seconds. Only http(s) sources on ``allowed_hosts`` are
+    fetched, and redirects are not followed.
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, widths=THUMBNAIL_WIDTHS, ffmpeg_path='ffmpeg',
+                 quality=75, max_source_bytes=5 * 1024 * 1024, fetch_timeout=10, failure_ttl=600,
+                 allowed_hosts=THUMBNAIL_HOSTS):
+        self.directory = directory
+        self.allowed_hosts = tuple(allowed_hosts)
+        self.max_bytes = max_bytes
+        self.widths = tuple(sorted(widths))
+        self.ffmpeg_path = ffmpeg_path
+        self.quality = quality
+        self.max_source_bytes = max_source_bytes
+        self.fetch_timeout = fetch_timeout
+        self.failure_ttl = failure_ttl
+        self._entries = OrderedDict()  # key -> bytes of all its variants, least recently used first
+        self._failures = {}  # key -> monotonic time until which the source is not retried
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._stored_bytes = 0
+        self.hits = 0
+        self.renders = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        """Rebuilds the index from variants left on disk, oldest first."""
+        sizes = {}
+        mtimes = {}
+        for name in os.listdir(self.directory):
+            match = VARIANT_NAME_RE.match(name)
+            if match:
+                st = os.stat(os.path.join(self.directory, name))
+                key = match.group(1)
+                sizes[key] = sizes.get(key, 0) + st.st_size
+                mtimes[key] = max(mtimes.get(key, 0), st.st_mtime)
+        for key in sorted(sizes, key=mtimes.get):
+            self._entries[key] = sizes[key]
+            self._stored_bytes += sizes[key]
+
+    def path(self, key, width):
+        return os.path.join(self.directory, f"{key}-{width}.webp")
+
+    def allows(self, url):
+        """Whether ``url`` is an http(s) URL on one of the allowed hosts."""
+        try:
+            parts = urlsplit(url)
+            host = (parts.hostname or '').lower()
+        except ValueError:
+            return False
+        return parts.scheme in ('http', 'https') and any(
+            host == allowed or host.endswith(f".{allowed}") for allowed in self.allowed_hosts)
+
+    def fit_width(self, width):
+        """The smallest variant at least ``width`` pixels wide (the largest one beyond that)."""
+        return next((w for w in self.widths if w >= width), self.widths[-1])
+
+    def get(self, url, width):
+        """Returns the path of ``url``'s variant for ``width``, rendering all of
+        its variants first when they are not cached. Raises ThumbnailError when
+        the source cannot be fetched or converted.
+        """
+        if not self.allows(url):
+            raise ThumbnailError("Thumbnail host not allowed")
+        key = thumbnail_key(url)
+        path = self.path(key, self.fit_width(width))
+        with self._lock:
+            if key in self._entries and os.path.exists(path):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return path
+            if self._failures.get(key, 0) > time.monotonic():
+                raise ThumbnailError("Thumbnail unavailable")
+        self._flight.do(key, lambda: self._render(key, url))
+        return path
+
+    def _render(self, key, url):
+        if os.path.exists(self.path(key, self.widths[-1])):
+            # Rendered by another gunicorn worker sharing the directory.
+            self._register(key)
+            return
+        try:
+            self._encode(key, self._fetch(url))
+        except ThumbnailError as e:
+            logger.warning(f"Thumbnail {url} failed: {e}")
+            with self._lock:
+                self._failures[key] = time.monotonic() + self.failure_ttl
+            raise
+        self._register(key)
+        with self._lock:
+            self.renders += 1
+
+    def _fetch(self, url):
+        try:
+            with requests.get(url, stream=True, timeout=self.fetch_timeout, headers={'User-Agent': USER_AGENT},
+                              allow_redirects=False) as r:
+                r.raise_for_status()
+                if r.is_redirect:
+                    # The target was not checked against the allowed hosts.
+                    raise ThumbnailError("Source redirects elsewhere")
+                data = bytearray()
+                for chunk in r.iter_content(64 * 1024):
+                    data += chunk
+                    if len(data) > self.max_source_bytes:
+                        raise ThumbnailError("Source image too large")
+                return bytes(data)
+        except requests.RequestException as e:
+            raise ThumbnailError(f"Fetching the source failed: {e}") from None
+
+    def _encode(self, key, source):
+        # One decode, scaled to every width; variants appear under their final
+        # names only once complete.
+        split = ''.join(f"[s{i}]" for i in range(len(self.widths)))
+        scales = ';'.join(f"[s{i}]scale='min({w},iw)':-2[v{i}]" for i, w in enumerate(self.widths))
+        cmd = [self.ffmpeg_path, '-v', 'error', '-y', '-i', 'pipe:0',
+               '-filter_complex', f"[0:v]split={len(self.widths)}{split};{scales}"]
+        temps = []
+        for i, w in enumerate(self.widths):
+            temp = f"{self.path(key, w)}.part"
+            temps.append(temp)
+            cmd += ['-map', f"[v{i}]", '-frames:v', '1', '-c:v', 'libwebp', '-quality', str(self.quality),
+                    '-f', 'webp', temp]
+        try:
+            result = subprocess.run(cmd, input=source, capture_output=True, timeout=30)
+            if result.returncode != 0:
+                raise ThumbnailError(result.stderr.decode('utf-8', errors='ignore').strip() or 'ffmpeg failed')
+            for temp in temps:
+                os.replace(temp, temp[:-len('.part')])
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise ThumbnailError(f"Encoding failed: {e}") from None
+        finally:
+            for temp in temps:
+                if os.path.exists(temp):
+                    os.remove(temp)
+
+    def _register(self, key):
+        size = sum(os.path.getsize(self.path(key, w)) for w in self.widths if os.path.exists(self.path(key, w)))
+        with self._lock:
+            self._stored_bytes += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._evict()
+
+    def _evict(self):
+        while self._stored_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._stored_bytes -= size
+            self.evictions += 1
+            for w in self.widths:
+                try:
+                    os.remove(self.path(key, w))
+                except FileNotFoundError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'thumbnails': len(self._entries),
+                'bytes': self._stored_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'renders': self.renders,
+                'evictions': self.evictions,
+            }
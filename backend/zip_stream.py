@@ -0,0 +1,75 @@
+import os
+import time
+import zipfile
+
+CHUNK_SIZE = 256 * 1024
+
+
+class _Sink:
+    """Write-only file object collecting what ZipFile writes until it is drained.
+
+    It has ``tell()`` but no ``seek()``, so ZipFile writes each entry's CRC
+    and sizes in a data descriptor after the data instead of seeking back.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(entries):
+    """Yields a ZIP archive of ``entries`` (``(name in archive, file path)`` pairs)
+    while it is being built; nothing is buffered beyond one chunk.
+
+    Entries are stored, not deflated: media files are already compressed, and
+    stored entries cost no CPU. Files over 4 GiB get ZIP64 records.
+    """
+    sink = _Sink()
+    for _ in _write_archive(sink, entries):
+        data = sink.drain()
+        if data:
+            yield data
+
+
+def _write_archive(sink, entries):
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for name, path in entries:
+            st = os.stat(path)
+            info = zipfile.ZipInfo(name, date_time=time.localtime(st.st_mtime)[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            info.file_size = st.st_size
+            with open(path, 'rb') as src, archive.open(info, 'w') as dest:
+                while True:
+                    chunk = src.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    yield
+            yield
+    yield
+
+
+def unique_names(names):
+    """Appends " (2)", " (3)", ... to repeated archive names."""
+    seen = {}
+    for name in names:
+        stem, ext = os.path.splitext(name)
+        count = seen.get(name.lower(), 0) + 1
+        seen[name.lower()] = count
+        yield name if count == 1 else f"{stem} ({count}){ext}"
@@ -75,7 +75,9 @@ document.addEventListener('DOMContentLoaded', () => {
 
         videoTitle.textContent = data.title;
         videoAuthor.textContent = data.uploader || 'Unknown Creator';
-        thumbnail.src = data.thumbnail;
+        // Resized WebP variants served by the backend; the browser picks one for its pixel density.
+        thumbnail.srcset = data.thumbnail_srcset || '';
+        thumbnail.src = data.thumbnail || '';
         
         // Populate Stats
         const views = data.view_count || 0;
@@ -86,39 +88,18 @@ document.addEventListener('DOMContentLoaded', () => {
         statLikes.textContent = formatNumber(likes);
         statComments.textContent = formatNumber(comments);
         
-        // --- Revenue Calculation ---
-        const category = (data.categories && data.categories.length > 0) ? data.categories[0] : 'General';
-        let cpm = 2.50; // Default CPM ($)
-
-        const catLower = category.toLowerCase();
-        if (catLower.includes('finance') || catLower.includes('money') || catLower.includes('business') || catLower.includes('tech')) {
-            cpm = 12.00; // High CPM
-        } else if (catLower.includes('education') || catLower.includes('news') || catLower.includes('auto')) {
-            cpm = 6.50;  // Mid-High CPM
-        } else if (catLower.includes('gaming') || catLower.includes('game')) {
-            cpm = 1.50;  // Low CPM
-        } else if (catLower.includes('music') || catLower.includes('dance')) {
-            cpm = 1.20;  // Lowest CPM
-        } else if (catLower.includes('beauty') || catLower.includes('vlog') || catLower.includes('entertainment')) {
-            cpm = 3.00;  // Average
-        }
-
-        // Calculate Revenue: (Views / 1000) * CPM
-        let estimatedRevenue = 0;
-        if (views > 0) {
-            estimatedRevenue = (views / 1000) * cpm;
-        }
+        // --- Revenue & Audience (estimated by the backend, see analytics.py) ---
+        const analytics = data.analytics;
 
         // Format Currency
         const currencyFormatter = new Intl.NumberFormat('en-US', { style: 'currency', currency: 'USD' });
-        statRevenue.textContent = currencyFormatter.format(estimatedRevenue);
-        statCpm.textContent = `CPM: ${cpm.toFixed(2)}`;
+        statRevenue.textContent = currencyFormatter.format(analytics.estimated_revenue);
+        statCpm.textContent = `CPM: ${analytics.cpm.toFixed(2)}`;
 
         // Render Charts
         renderChart(views, likes, comments);
         
-        // Generate Audience Insights based on Category + Metrics
-        generateAudienceInsights(category, data.title, data.duration, views, likes, comments);
+        renderAudienceInsights(analytics.audience);
 
         formatLinks.innerHTML = '';
 
@@ -204,89 +185,10 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
-    function generateAudienceInsights(category, title, duration, views, likes, comments) {
-        // 1. Base Profile (Category Based)
-        // Format Age: [13-17, 18-24, 25-34, 35+]
-        // Format Gender: [Male, Female]
-        
-        let ageWeights = [25, 35, 25, 15]; // Default Balanced
-        let genderWeights = [50, 50];      // Default Balanced
-        
-        const cat = category.toLowerCase();
-        const tit = title.toLowerCase();
-        
-        // --- Base Category Logic ---
-        if (cat.includes('gaming') || cat.includes('game')) {
-            ageWeights = [35, 40, 20, 5];
-            genderWeights = [80, 20];
-        } else if (cat.includes('beauty') || cat.includes('style') || cat.includes('makeup')) {
-            ageWeights = [20, 45, 25, 10];
-            genderWeights = [10, 90];
-        } else if (cat.includes('tech') || cat.includes('science') || cat.includes('gadget')) {
-            ageWeights = [15, 35, 40, 10];
-            genderWeights = [85, 15];
-        } else if (cat.includes('news') || cat.includes('politics') || cat.includes('finance')) {
-            ageWeights = [5, 15, 35, 45];
-            genderWeights = [60, 40];
-        } else if (cat.includes('kids') || cat.includes('cartoon') || cat.includes('animation')) {
-            ageWeights = [60, 20, 10, 10]; // Parents viewing for kids count as kids demographic usually
-            genderWeights = [50, 50];
-        } else if (cat.includes('music')) {
-             ageWeights = [20, 30, 30, 20];
-        }
-
-        // --- 2. Duration Modifier (Attention Span Logic) ---
-        // Short videos (< 3 mins) attract younger audiences (TikTok Gen)
-        // Long videos (> 15 mins) attract older audiences (Podcast/Docu fans)
-        if (duration > 0) {
-            if (duration < 180) { // < 3 mins
-                ageWeights[0] += 15; // Boost 13-17
-                ageWeights[1] += 10; // Boost 18-24
-                ageWeights[3] -= 10; // Reduce 35+
-            } else if (duration > 900) { // > 15 mins
-                ageWeights[0] -= 10;
-                ageWeights[2] += 10; // Boost 25-34
-                ageWeights[3] += 10; // Boost 35+
-            }
-        }
-
-        // --- 3. Engagement Modifier (Passion Logic) ---
-        // High engagement rate usually means younger, more active community (Gen Z)
-        let engagementRate = 0;
-        if (views > 0) engagementRate = ((likes + comments) / views);
-        
-        if (engagementRate > 0.05) { // > 5% is very high
-            ageWeights[0] += 10; 
-            ageWeights[1] += 10;
-        } else if (engagementRate < 0.01) { // < 1% is passive
-            ageWeights[2] += 5;
-            ageWeights[3] += 10;
-        }
-
-        // --- 4. Title Keyword Modifier (Content Specifics) ---
-        if (tit.includes('tutorial') || tit.includes('how to') || tit.includes('guide')) {
-             // Tutorials are slightly more male dominated or older
-             ageWeights[2] += 5;
-             genderWeights[0] += 5;
-        } else if (tit.includes('asmr') || tit.includes('routine') || tit.includes('haul')) {
-             genderWeights[1] += 15; // Shift Female
-        } else if (tit.includes('football') || tit.includes('soccer') || tit.includes('fight') || tit.includes('boxing')) {
-             genderWeights[0] += 20; // Shift Male
-        }
-
-        // --- 5. Normalization (Make sure sums to 100) ---
-        const normalize = (arr) => {
-            const sum = arr.reduce((a, b) => a + b, 0);
-            return arr.map(val => Math.round((val / sum) * 100));
-        };
-
-        // Apply Softmax-like normalization logic simply (clamping negative values first)
-        ageWeights = ageWeights.map(v => Math.max(v, 1)); // Ensure no negative
-        genderWeights = genderWeights.map(v => Math.max(v, 1));
-
-        ageWeights = normalize(ageWeights);
-        genderWeights = normalize(genderWeights);
-
+    function renderAudienceInsights(audience) {
+        // Percentages per band, estimated from category, duration, engagement and title.
+        const ageWeights = ['13-17', '18-24', '25-34', '35+'].map(band => audience.age[band]);
+        const genderWeights = [audience.gender.male, audience.gender.female];
 
         // Render Age Chart
         const ctxAge = document.getElementById('ageChart').getContext('2d');
@@ -376,6 +278,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 body: JSON.stringify({ 
                     url, 
                     format_id: formatId,
+                    passthrough: true,
                     'g-recaptcha-response': captchaToken 
                 })
             });
@@ -383,6 +286,20 @@ document.addEventListener('DOMContentLoaded', () => {
 
             if (!res.ok) throw new Error(data.error);
 
+            if (data.stream_url) {
+                // Single-file format: the browser receives the bytes while yt-dlp downloads them.
+                const link = document.createElement('a');
+                link.href = data.stream_url;
+                link.setAttribute('download', '');
+                document.body.appendChild(link);
+                link.click();
+                link.remove();
+                progressBar.style.width = '100%';
+                statusText.textContent = 'Streaming to your browser...';
+                btn.textContent = 'Done';
+                return;
+            }
+
             // Start polling
             pollStatus(data.task_id, btn, statusText, progressBar);
 
@@ -393,41 +310,89 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     function pollStatus(taskId, btn, statusText, progressBar) {
-        const interval = setInterval(async () => {
+        // Returns true once the task reached a final state.
+        const render = (data) => {
+            if (data.percentage) {
+                progressBar.style.width = `${data.percentage}%`;
+                statusText.textContent = `${data.percentage}% - ${data.status}`;
+                if (data.speed) {
+                    statusText.textContent += ` (${(data.speed / 1048576).toFixed(1)} MB/s`
+                        + (data.eta != null ? `, ${data.eta}s left)` : ')');
+                }
+            } else if (data.queue_position) {
+                const waitSeconds = Math.max(0, Math.round(data.estimated_start - Date.now() / 1000));
+                statusText.textContent = `Queued #${data.queue_position} (starts in ~${waitSeconds}s)`;
+            } else {
+                statusText.textContent = data.status;
+            }
+
+            if (data.status === 'Completed') {
+                statusText.innerHTML = `<a href="${data.download_link}" class="download-ready" download>Save File</a>`;
+                btn.textContent = 'Done';
+                // Keep button disabled or enable if you want allow re-download logic
+                return true;
+            } else if (data.status === 'Failed' || data.status === 'Cancelled') {
+                statusText.textContent = `${data.status}: ${data.message}`;
+                progressBar.style.backgroundColor = '#f44336'; // Red
+                btn.disabled = false;
+                return true;
+            }
+            return false;
+        };
+
+        const fail = (err) => {
+            statusText.textContent = 'Error polling: ' + err.message;
+            btn.disabled = false;
+        };
+
+        // Fallback: long-poll, the server answers as soon as the status changes.
+        const longPoll = async (last) => {
             try {
-                const res = await fetch(`${API_BASE}/status/${taskId}`);
+                const params = new URLSearchParams({ wait: 25 });
+                if (last) {
+                    params.set('status', last.status);
+                    params.set('percentage', last.percentage);
+                    if (last.queue_position) params.set('queue_position', last.queue_position);
+                }
+                const res = await fetch(`${API_BASE}/status/${taskId}?${params}`);
                 if (!res.ok) {
-                    clearInterval(interval);
                     throw new Error('Connection lost');
                 }
                 const data = await res.json();
-
-                // Update Progress Bar
-                if (data.percentage) {
-                    progressBar.style.width = `${data.percentage}%`;
-                    statusText.textContent = `${data.percentage}% - ${data.status}`;
-                } else {
-                    statusText.textContent = data.status;
+                if (!render(data)) {
+                    longPoll(data);
                 }
+            } catch (err) {
+                fail(err);
+            }
+        };
 
-                if (data.status === 'Completed') {
-                    clearInterval(interval);
-                    statusText.innerHTML = `<a href="${data.download_link}" class="download-ready" download>Save File</a>`;
-                    btn.textContent = 'Done';
-                    // Keep button disabled or enable if you want allow re-download logic
-                } else if (data.status === 'Failed') {
-                    clearInterval(interval);
-                    statusText.textContent = 'Failed: ' + data.message;
-                    progressBar.style.backgroundColor = '#f44336'; // Red
-                    btn.disabled = false;
-                }
+        if (!window.EventSource) {
+            longPoll(null);
+            return;
+        }
 
-            } catch (err) {
-                clearInterval(interval);
-                statusText.textContent = 'Error polling: ' + err.message;
-                btn.disabled = false;
+        // Server-Sent Events: one connection, pushed only when progress changes.
+        let finished = false;
+        let received = null;
+        const source = new EventSource(`${API_BASE}/status/${taskId}/stream`);
+        source.onmessage = (event) => {
+            received = JSON.parse(event.data);
+            if (render(received)) {
+                finished = true;
+                source.close();
             }
-        }, 1000); // Poll every 1 second
+        };
+        source.addEventListener('error', (event) => {
+            if (finished) return;
+            if (event.data) {
+                // Named "error" event sent by the server, e.g. unknown task.
+                source.close();
+                fail(new Error(JSON.parse(event.data).status));
+            } else if (source.readyState === EventSource.CLOSED) {
+                longPoll(received);
+            }
+        });
     }
 
     function resetUI() {